@@ -0,0 +1,70 @@
+#************
+# Imports
+#************
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import tempfile
+import time
+
+import BenchContext
+from BenchContext import CSVtoQIF
+import StatementGenerator
+
+#******************
+# Constants/Enums
+#******************
+DEFAULT_SIZES = [ "1m" ]
+DEFAULT_RUNS = 3
+
+
+#*************
+# Functions
+#*************
+def timeConversion(CsvFileName: str, CfgFileName: str, Options: list, Runs: int) -> float:
+    """ Returns the fastest of several whole conversions through the command line """
+    seconds = []
+    for _ in range(Runs):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            CSVtoQIF.main([ CsvFileName, CfgFileName ] + Options)
+        seconds.append(time.perf_counter() - start)
+    return(min(seconds))
+
+def main() -> None:
+    """ Times every conversion engine on synthetic statements and checks their output is identical """
+    parser = argparse.ArgumentParser(description = "--engine benchmark")
+    parser.add_argument("--sizes", nargs = "+", default = DEFAULT_SIZES,
+                        help = "Statement sizes, as row counts or {}".format(", ".join(StatementGenerator.STATEMENT_SIZES)))
+    parser.add_argument("--runs", type = int, default = DEFAULT_RUNS, help = "Runs of each conversion, the fastest is reported")
+    parser.add_argument("--accounts", type = int, default = StatementGenerator.DEFAULT_ACCOUNTS, help = "qifFiles routing rules and output files")
+    args = parser.parse_args()
+
+    print("{:>10} {:>6} {:>10} {:>10} {:>14} {:>9}".format("rows", "reader", "engine", "seconds", "rows/s", "speedup"))
+    for size in args.sizes:
+        rows = StatementGenerator.statementRows(size)
+        with tempfile.TemporaryDirectory() as tempDir:
+            csvFileName = os.path.join(tempDir, "Statement.csv")
+            cfgFileName = os.path.join(tempDir, "Config.json")
+            StatementGenerator.writeStatement(csvFileName, rows, Accounts = args.accounts)
+            for reader, readerOptions in (("csv", []), ("mmap", [ "--mmap" ])):
+                rowsNames = None
+                rowsSeconds = None
+                for engine in CSVtoQIF.ENGINES:
+                    outputDir = os.path.join(tempDir, "{}-{}".format(reader, engine))
+                    os.makedirs(outputDir)
+                    names = StatementGenerator.writeConfig(cfgFileName, outputDir, args.accounts)
+                    seconds = timeConversion(csvFileName, cfgFileName, readerOptions + [ "--engine", engine ], args.runs)
+                    if (rowsNames is None):
+                        rowsNames = names
+                        rowsSeconds = seconds
+                    for rowsName, name in zip(rowsNames, names):
+                        assert filecmp.cmp(rowsName, name, shallow = False), "{} differs from {}".format(name, rowsName)
+                    print("{:>10,} {:>6} {:>10} {:>10.2f} {:>14,.0f} {:>8.2f}x".format(rows, reader, engine, seconds, rows / seconds,
+                                                                                       rowsSeconds / seconds))
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+#************
+# Imports
+#************
+import os
+import sys
+
+# Append the system path to include the source directory, then import the modules being benchmarked.
+# Benchmark files can import this module then import the modules imported below.
+sys.path.insert(0, os.path.normpath(os.path.abspath(os.path.join(os.path.dirname(__file__), '../Source'))))
+import MoneyParser
+import CSVtoQIF
+import CompiledConfig
+import QifPipeline
+import MappedCsvReader
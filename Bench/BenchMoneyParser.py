@@ -0,0 +1,120 @@
+#************
+# Imports
+#************
+import argparse
+import random
+import re
+import timeit
+
+import BenchContext
+from BenchContext import MoneyParser
+
+#******************
+# Constants/Enums
+#******************
+DEFAULT_CELLS = 1000000
+DEFAULT_DISTINCT = 5000
+
+
+#*************
+# Functions
+#*************
+def legacyCsvFloatToQuickenFloat(CsvFloatText: str, ForcePositive: bool = False) -> float:
+    """ The original regex based conversion function, kept here as the benchmark baseline """
+    match = re.search("([\\d]*\\.{0,1}[\\d]+)", CsvFloatText)
+    if(match == None):
+        raise Exception("Cannot find monetary value in string '{}'".format(CsvFloatText))
+    value = float(match.group())
+    if(not ForcePositive):
+        match = re.search("[-()]", CsvFloatText)
+        if (match != None):
+            value = value * -1.0
+    return(value)
+
+def makeCorpus(Cells: int, Distinct: int, Seed: int = 0) -> list:
+    """ Builds a list of money strings in the forms found in fund statements.
+
+    Parameters
+    ----------
+    Cells: Total number of strings in the corpus.
+    Distinct: Number of distinct strings the corpus is drawn from.  Prices and amounts repeat heavily in real
+        statements, so the corpus is sampled from a limited pool.
+    Seed: Random seed so runs are comparable.
+
+    Returns
+    -------
+    list: The corpus of money strings.
+    """
+    rand = random.Random(Seed)
+    formats = [ "{:.2f}", "${:.2f}", "-{:.2f}", "-${:.2f}", "(${:.2f})", "{:.4f}", "{:.0f}" ]
+    pool = [ rand.choice(formats).format(rand.random() * 1000.0) for _ in range(Distinct) ]
+    return([ rand.choice(pool) for _ in range(Cells) ])
+
+def timeParser(Name: str, ParseFunction, Corpus: list, Repeat: int) -> float:
+    """ Times a parse function over the corpus and prints the best result in cells per second """
+    def run():
+        for cell in Corpus:
+            ParseFunction(cell)
+        return
+    best = min(timeit.repeat(run, number = 1, repeat = Repeat))
+    print("{:<28} {:>8.3f} s  {:>12,.0f} cells/s".format(Name, best, len(Corpus) / best))
+    return(best)
+
+def floatFields(Parser: MoneyParser.MoneyParser):
+    """ Returns a function rendering a cell as QIF I, T and Q text the float way, as the pipeline did before """
+    parse = Parser.parse
+    def render(Cell: str) -> tuple:
+        value = parse(Cell)
+        return(("{}".format(value), "{:,.2f}".format(value), "{:,}".format(abs(value))))
+    return(render)
+
+def fixedFields(Parser: MoneyParser.MoneyParser):
+    """ Returns a function rendering a cell as QIF I, T and Q text through the fixed-point formatters """
+    def render(Cell: str) -> tuple:
+        return((Parser.formatPrice(Cell), Parser.formatValue(Cell), Parser.formatQuantity(Cell)))
+    return(render)
+
+def main() -> None:
+    """ Benchmarks the money parser against the original regex function, and the fixed-point field text against floats """
+    parser = argparse.ArgumentParser(description = "Money parser micro-benchmark")
+    parser.add_argument("--cells", type = int, default = DEFAULT_CELLS, help = "Number of cells in the corpus")
+    parser.add_argument("--distinct", type = int, default = DEFAULT_DISTINCT, help = "Number of distinct cell strings")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Timing repetitions, the best is reported")
+    args = parser.parse_args()
+
+    corpus = makeCorpus(args.cells, args.distinct)
+    uniqueCorpus = makeCorpus(args.cells, args.cells, Seed = 1)
+
+    # Both functions must agree on the benchmark corpus, which has no thousands separators
+    moneyParser = MoneyParser.MoneyParser()
+    for cell in corpus[:args.distinct]:
+        assert moneyParser.parse(cell) == legacyCsvFloatToQuickenFloat(cell), cell
+
+    print("{:,} cells, {:,} distinct".format(args.cells, args.distinct))
+    legacy = timeParser("legacy regex", legacyCsvFloatToQuickenFloat, corpus, args.repeat)
+    cached = timeParser("MoneyParser (cached)", MoneyParser.MoneyParser().parse, corpus, args.repeat)
+    print("{:<28} {:>8.2f}x".format("speedup", legacy / cached))
+
+    print("\n{:,} cells, all distinct".format(args.cells))
+    legacy = timeParser("legacy regex", legacyCsvFloatToQuickenFloat, uniqueCorpus, 1)
+    uncached = timeParser("MoneyParser (cache misses)", MoneyParser.MoneyParser().parse, uniqueCorpus, 1)
+    print("{:<28} {:>8.2f}x".format("speedup", legacy / uncached))
+
+    # The I, T and Q text of both paths must agree on the corpus, whose values have few enough digits for a float
+    checkParser = MoneyParser.MoneyParser()
+    for cell in corpus[:args.distinct] + uniqueCorpus[:args.distinct]:
+        assert floatFields(checkParser)(cell) == fixedFields(checkParser)(cell), cell
+
+    print("\nQIF field text, {:,} cells, {:,} distinct".format(args.cells, args.distinct))
+    floatTime = timeParser("float parse + format", floatFields(MoneyParser.MoneyParser()), corpus, args.repeat)
+    fixedTime = timeParser("fixed-point (cached)", fixedFields(MoneyParser.MoneyParser()), corpus, args.repeat)
+    print("{:<28} {:>8.2f}x".format("speedup", floatTime / fixedTime))
+
+    print("\nQIF field text, {:,} cells, all distinct".format(args.cells))
+    floatTime = timeParser("float parse + format", floatFields(MoneyParser.MoneyParser()), uniqueCorpus, 1)
+    fixedTime = timeParser("fixed-point (cache misses)", fixedFields(MoneyParser.MoneyParser()), uniqueCorpus, 1)
+    print("{:<28} {:>8.2f}x".format("speedup", floatTime / fixedTime))
+    return
+
+if __name__ == "__main__":
+    main()
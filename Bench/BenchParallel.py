@@ -0,0 +1,92 @@
+#************
+# Imports
+#************
+import argparse
+import contextlib
+import csv
+import filecmp
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+import BenchContext
+from BenchContext import CSVtoQIF
+
+#******************
+# Constants/Enums
+#******************
+DEFAULT_ROWS = 1000000
+DEFAULT_JOBS = [ 1, 2, 4, 8 ]
+
+
+#*************
+# Functions
+#*************
+def writeStatement(FileName: str, Rows: int, Seed: int = 0) -> None:
+    """ Writes a synthetic fund statement CSV file routed to two QIF destinations """
+    rand = random.Random(Seed)
+    with open(FileName, "wt", newline = "") as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow([ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Category" ])
+        for row in range(Rows):
+            price = rand.random() * 1000.0
+            quantity = (rand.random() * 200.0) - 100.0
+            writer.writerow([ "{}/{}/2021".format(rand.randint(1, 12), rand.randint(1, 28)), rand.choice([ "Buy", "Sell" ]),
+                              "Fund {}".format(rand.randint(1, 40)), "${:.2f}".format(price), "{:.4f}".format(quantity),
+                              "${:,.2f}".format(price * quantity), "Contribution {}".format(row), rand.choice([ "Roth", "Safe Harbor Match" ]) ])
+    return
+
+def writeConfig(FileName: str, OutputPrefix: str) -> list:
+    """ Writes a config file whose output file names carry a prefix, returning those names """
+    names = [ "{}Roth.qif".format(OutputPrefix), "{}SafeHarbor.qif".format(OutputPrefix) ]
+    config = {
+        "csvFile": {
+            "headerRowMap": { "dateColumn": "Date", "actionColumn": "Action", "securityColumn": "Fund", "priceColumn": "Price",
+                              "quantityColumn": "Quantity", "valueColumn": "Amount", "memoColumn": "Memo" },
+            "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+        },
+        "qifFiles": [
+            { "name": names[0], "matchColumn": "Category", "matchRegEx": "Roth" },
+            { "name": names[1], "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+        ]
+    }
+    with open(FileName, "wt") as cfgFile:
+        json.dump(config, cfgFile)
+    return(names)
+
+def main() -> None:
+    """ Times the conversion at several worker counts and checks every run matches the serial output """
+    parser = argparse.ArgumentParser(description = "--jobs scaling benchmark")
+    parser.add_argument("--rows", type = int, default = DEFAULT_ROWS, help = "Number of rows in the synthetic statement")
+    parser.add_argument("--jobs", type = int, nargs = "+", default = DEFAULT_JOBS, help = "Worker counts to time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        csvFileName = os.path.join(tempDir, "Statement.csv")
+        cfgFileName = os.path.join(tempDir, "Config.json")
+        writeStatement(csvFileName, args.rows)
+        print("{:,} rows, {:,} bytes, {} CPUs".format(args.rows, os.path.getsize(csvFileName), os.cpu_count()))
+        print("{:>6} {:>10} {:>14} {:>9}".format("jobs", "seconds", "rows/s", "speedup"))
+
+        serialNames = None
+        serialTime = None
+        for jobs in args.jobs:
+            names = writeConfig(cfgFileName, os.path.join(tempDir, "Jobs{}".format(jobs)))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                CSVtoQIF.main([ csvFileName, cfgFileName, "--jobs", str(jobs) ])
+            elapsed = time.perf_counter() - start
+
+            if (serialNames is None):
+                serialNames = names
+                serialTime = elapsed
+            for serialName, name in zip(serialNames, names):
+                assert filecmp.cmp(serialName, name, shallow = False), "{} differs from {}".format(name, serialName)
+            print("{:>6} {:>10.2f} {:>14,.0f} {:>8.2f}x".format(jobs, elapsed, args.rows / elapsed, serialTime / elapsed))
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#************
+# Imports
+#************
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import BenchContext
+from BenchContext import CSVtoQIF, CompiledConfig, MappedCsvReader, MoneyParser, QifPipeline
+import StatementGenerator
+
+#******************
+# Constants/Enums
+#******************
+DEFAULT_SIZES = [ "10k", "1m" ]
+
+# Rows read and pushed through each stage at a time
+DEFAULT_BLOCK_ROWS = 50000
+
+# A stage is flagged as a regression when its rows/s falls by more than this fraction from the compared run
+DEFAULT_THRESHOLD = 0.10
+
+# Pipeline stages timed separately, in pipeline order
+STAGES = [ "csvParse", "moneyParse", "actionLookup", "routing", "formatting", "write" ]
+
+# Bumped whenever the layout of the results file changes
+RESULTS_VERSION = 2
+
+
+#*************
+# Functions
+#*************
+def timeStages(CsvFileName: str, CfgFileName: str, BlockRows: int, MapFile: bool = False) -> Dict[str, float]:
+    """ Times each stage of the conversion pipeline separately.
+
+    The CSV file is read a block of rows at a time, and each stage is run over the whole block before the next, so
+    the clock can be read between stages without timing every row.  The stages do the same work as
+    QifPipeline.formatRecords and routeRecords.
+
+    Parameters
+    ----------
+    CsvFileName: The CSV statement.
+    CfgFileName: The configuration file.  Its QIF files are written.
+    BlockRows: Rows per block.
+    MapFile: When set True, the CSV file is read by MappedCsvReader rather than the csv module.
+
+    Returns
+    -------
+    Dict[str, float]: Seconds spent in each of STAGES.
+    """
+    config = CompiledConfig.CompiledConfig.load(CfgFileName)
+    money = MoneyParser.MoneyParser()
+    actionLine = config.symbols.action.lookup
+    recordFormat = QifPipeline.QIF_RECORD_FORMAT.format
+    clock = time.perf_counter
+    seconds = dict.fromkeys(STAGES, 0.0)
+
+    writers = QifPipeline.openOutputFiles(config.qifNames)
+    csvData = MappedCsvReader.mapCsvFile(CsvFileName) if (MapFile) else None
+    with open(CsvFileName, "rt") as csvFile:
+        start = clock()
+        if (csvData is not None):
+            reader = MappedCsvReader.MappedCsvReader(csvData)
+            header = reader.readRow()
+            rows = reader.rows(max(config.resolveColumns(header).values()) + 1)
+        else:
+            header, rows = QifPipeline.readCsvRows(csvFile)
+        layout = config.bindHeader(header)
+        seconds["csvParse"] = seconds["csvParse"] + (clock() - start)
+        dateColumn, actionColumn, securityColumn, priceColumn, valueColumn, quantityColumn, memoColumn = layout.columns
+        route = layout.router.route
+
+        while (True):
+            start = clock()
+            block = list(itertools.islice(rows, BlockRows))
+            now = clock()
+            seconds["csvParse"] = seconds["csvParse"] + (now - start)
+            if (not block):
+                break
+
+            start = now
+            fields = [ (money.formatPrice(row[priceColumn]), money.formatValue(row[valueColumn]), money.formatQuantity(row[quantityColumn]))
+                       for row in block ]
+            now = clock()
+            seconds["moneyParse"] = seconds["moneyParse"] + (now - start)
+
+            start = now
+            actions = [ actionLine(row[actionColumn]) for row in block ]
+            now = clock()
+            seconds["actionLookup"] = seconds["actionLookup"] + (now - start)
+
+            start = now
+            fileIndexes = [ route(row) for row in block ]
+            now = clock()
+            seconds["routing"] = seconds["routing"] + (now - start)
+
+            start = now
+            records = [ recordFormat(row[dateColumn], action, row[securityColumn], price, value, quantity, row[memoColumn])
+                        for row, action, (price, value, quantity) in zip(block, actions, fields) ]
+            now = clock()
+            seconds["formatting"] = seconds["formatting"] + (now - start)
+
+            start = now
+            for fileIndex, record in zip(fileIndexes, records):
+                writers[fileIndex].write(record)
+            seconds["write"] = seconds["write"] + (clock() - start)
+
+    start = clock()
+    QifPipeline.closeOutputFiles(writers)
+    seconds["write"] = seconds["write"] + (clock() - start)
+    if (csvData is not None):
+        csvData.close()
+    return(seconds)
+
+def timeConversion(CsvFileName: str, CfgFileName: str, MapFile: bool = False) -> Dict[str, Any]:
+    """ Times a whole conversion in a fresh process, so its peak memory is not mixed up with this one's """
+    output = subprocess.run([ sys.executable, os.path.abspath(__file__), "--child", CsvFileName, CfgFileName ] + ([ "--mmap" ] if MapFile else []),
+                            check = True, stdout = subprocess.PIPE, text = True).stdout
+    return(json.loads(output.splitlines()[-1]))
+
+def peakMemoryBytes() -> Optional[int]:
+    """ Returns this process's peak resident memory, or None where the platform does not report it """
+    # Linux carries ru_maxrss over from the parent process across exec, so prefer the kernel's own high water mark
+    try:
+        with open("/proc/self/status", "rt") as statusFile:
+            for line in statusFile:
+                if (line.startswith("VmHWM:")):
+                    return(int(line.split()[1]) * 1024)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return(None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return(peak if (sys.platform == "darwin") else peak * 1024)
+
+def runChild(CsvFileName: str, CfgFileName: str, MapFile: bool = False) -> None:
+    """ Converts the statement with CSVtoQIF.main and prints the timing as JSON """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        CSVtoQIF.main([ CsvFileName, CfgFileName ] + ([ "--mmap" ] if MapFile else []))
+    seconds = time.perf_counter() - start
+    print(json.dumps({ "seconds": seconds, "peakMemoryBytes": peakMemoryBytes() }))
+    return
+
+def benchSize(Size: str, TempDir: str, BlockRows: int, MapFile: bool = False, ExtraColumns: int = 0) -> Dict[str, Any]:
+    """ Writes a statement of one size, then times its stages and a whole conversion """
+    rows = StatementGenerator.statementRows(Size)
+    csvFileName = os.path.join(TempDir, "Statement-{}.csv".format(Size))
+    cfgFileName = os.path.join(TempDir, "Config.json")
+    StatementGenerator.writeStatement(csvFileName, rows, ExtraColumns = ExtraColumns)
+    StatementGenerator.writeConfig(cfgFileName, TempDir)
+
+    stageSeconds = timeStages(csvFileName, cfgFileName, BlockRows, MapFile)
+    conversion = timeConversion(csvFileName, cfgFileName, MapFile)
+    result = {
+        "rows": rows,
+        "csvBytes": os.path.getsize(csvFileName),
+        "stages": { stage: { "seconds": seconds, "rowsPerSecond": rows / seconds if seconds else None }
+                    for stage, seconds in stageSeconds.items() },
+        "endToEnd": { "seconds": conversion["seconds"], "rowsPerSecond": rows / conversion["seconds"] },
+        "peakMemoryBytes": conversion["peakMemoryBytes"]
+    }
+    os.remove(csvFileName)
+    return(result)
+
+def compareResults(Current: Dict[str, Any], Previous: Dict[str, Any], Threshold: float) -> List[str]:
+    """ Lists the stages whose rows/s fell by more than Threshold from a previous run, for sizes both runs cover """
+    regressions = []
+    for size, result in Current["sizes"].items():
+        previous = Previous.get("sizes", {}).get(size)
+        if (previous is None):
+            continue
+        timings = dict(result["stages"], endToEnd = result["endToEnd"])
+        previousTimings = dict(previous["stages"], endToEnd = previous["endToEnd"])
+        for stage, timing in timings.items():
+            before = previousTimings.get(stage, {}).get("rowsPerSecond")
+            after = timing["rowsPerSecond"]
+            if (before and after and (after < before * (1.0 - Threshold))):
+                regressions.append("{} {}: {:,.0f} rows/s, was {:,.0f} ({:+.1%})".format(size, stage, after, before, (after / before) - 1.0))
+    return(regressions)
+
+def printResult(Size: str, Result: Dict[str, Any]) -> None:
+    """ Prints the timings of one statement size as a table """
+    print("\n{}: {:,} rows, {:,} bytes".format(Size, Result["rows"], Result["csvBytes"]))
+    print("{:>14} {:>10} {:>14}".format("stage", "seconds", "rows/s"))
+    for stage, timing in dict(Result["stages"], endToEnd = Result["endToEnd"]).items():
+        print("{:>14} {:>10.3f} {:>14,.0f}".format(stage, timing["seconds"], timing["rowsPerSecond"] or 0))
+    if (Result["peakMemoryBytes"] is not None):
+        print("{:>14} {:>10.1f} MB".format("peak memory", Result["peakMemoryBytes"] / (1024 * 1024)))
+    return
+
+def main() -> None:
+    """ Times the pipeline stages on synthetic statements, saving the results and comparing them with an earlier run """
+    parser = argparse.ArgumentParser(description = "Conversion pipeline benchmark")
+    parser.add_argument("--sizes", nargs = "+", default = DEFAULT_SIZES,
+                        help = "Statement sizes, as row counts or {}".format(", ".join(StatementGenerator.STATEMENT_SIZES)))
+    parser.add_argument("--block-rows", dest = "blockRows", type = int, default = DEFAULT_BLOCK_ROWS, help = "Rows per timed block")
+    parser.add_argument("--mmap", dest = "mapFile", action = "store_true", help = "Reads the statements through a memory map (CSVtoQIF --mmap)")
+    parser.add_argument("--extra-columns", dest = "extraColumns", type = int, default = 0,
+                        help = "Adds this many unused columns to every statement, like a wide broker export")
+    parser.add_argument("--output", help = "Writes the results to this JSON file")
+    parser.add_argument("--compare", help = "Compares the results with an earlier JSON results file")
+    parser.add_argument("--threshold", type = float, default = DEFAULT_THRESHOLD,
+                        help = "Fraction rows/s may fall before it is flagged as a regression (default: {})".format(DEFAULT_THRESHOLD))
+    parser.add_argument("--child", nargs = 2, metavar = ("CSV", "CFG"), help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if (args.child is not None):
+        runChild(*args.child, args.mapFile)
+        return
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "reader": "mmap" if args.mapFile else "csv",
+        "extraColumns": args.extraColumns,
+        "sizes": {}
+    }
+    with tempfile.TemporaryDirectory() as tempDir:
+        for size in args.sizes:
+            results["sizes"][size] = benchSize(size, tempDir, args.blockRows, args.mapFile, args.extraColumns)
+            printResult(size, results["sizes"][size])
+
+    if (args.output is not None):
+        with open(args.output, "wt") as resultsFile:
+            json.dump(results, resultsFile, indent = 3)
+
+    if (args.compare is not None):
+        with open(args.compare, "rt") as previousFile:
+            regressions = compareResults(results, json.load(previousFile), args.threshold)
+        if (regressions):
+            print("\nREGRESSIONS against {}:".format(args.compare))
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("\nNo regressions against {}".format(args.compare))
+    return
+
+if __name__ == "__main__":
+    main()
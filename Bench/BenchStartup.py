@@ -0,0 +1,110 @@
+#************
+# Imports
+#************
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Set
+
+import BenchContext
+from BenchContext import CSVtoQIF
+import StatementGenerator
+
+#******************
+# Constants/Enums
+#******************
+DEFAULT_RUNS = 15
+
+# Rows in the statement converted by the "convert" run.  Small, so the time measured is start up rather than conversion.
+STATEMENT_ROWS = 100
+
+# Command line runs timed, by name.  {csv} and {cfg} are replaced by the statement and config file names.
+RUNS = { "version": [ "-v" ], "help": [ "-h" ], "convert": [ "{csv}", "{cfg}" ] }
+
+BASELINE_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Tests", "StartupBaseline.json")
+
+# Share of the modules a run imports that the baseline allows on top, as the standard library modules behind an
+# import differ a little between Python versions
+ADDED_MODULE_SLACK = 0.15
+
+
+#*************
+# Functions
+#*************
+def importedModules(Command: List[str], Cwd: Optional[str] = None) -> Set[str]:
+    """ Runs a Python command with -X importtime and returns the names of the modules it imported """
+    stderr = subprocess.run([ Command[0], "-X", "importtime" ] + Command[1:], cwd = Cwd, check = True,
+                            stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True).stderr
+    return({ line.split("|")[2].strip() for line in stderr.splitlines() if line.startswith("import time:") and ("|" in line) } - { "package" })
+
+def bestSeconds(Command: List[str], Runs: int, Cwd: Optional[str] = None) -> float:
+    """ Returns the fastest wall time of a command over a number of runs """
+    seconds = []
+    for _ in range(Runs):
+        start = time.perf_counter()
+        subprocess.run(Command, cwd = Cwd, check = True, stdout = subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return(min(seconds))
+
+def runCommands(Program: List[str], CsvFileName: str, CfgFileName: str) -> Dict[str, List[str]]:
+    """ Builds the command of each of RUNS for a program, e.g. [ python, CSVtoQIF.py ] or [ python, CSVtoQIF.pyz ] """
+    return({ name: Program + [ arg.format(csv = CsvFileName, cfg = CfgFileName) for arg in args ] for name, args in RUNS.items() })
+
+def writeBaseline(Modules: Dict[str, Set[str]]) -> None:
+    """ Records the CSVtoQIF modules each run imports, and its module budget, in the baseline checked by Tests/TestStartup.py """
+    with open(BASELINE_FILE_NAME, "rt") as baselineFile:
+        baseline = json.load(baselineFile)
+    sourceModules = { os.path.splitext(name)[0] for name in os.listdir(os.path.dirname(CSVtoQIF.__file__)) if name.endswith(".py") }
+    baseline["modules"] = { name: sorted(modules & sourceModules) for name, modules in Modules.items() }
+    baseline["maxAddedModules"] = { name: math.ceil(len(modules) * (1 + ADDED_MODULE_SLACK)) for name, modules in Modules.items() }
+    with open(BASELINE_FILE_NAME, "wt") as baselineFile:
+        json.dump(baseline, baselineFile, indent = 3, sort_keys = True)
+        baselineFile.write("\n")
+    return
+
+def main() -> None:
+    """ Times CSVtoQIF start up from source and, optionally, from a zipapp build, and lists the modules each run imports """
+    parser = argparse.ArgumentParser(description = "CSVtoQIF start up benchmark")
+    parser.add_argument("--runs", type = int, default = DEFAULT_RUNS, help = "Runs of each command, the fastest is reported")
+    parser.add_argument("--zipapp", metavar = "PYZ", help = "Also times this zipapp build (make zipapp)")
+    parser.add_argument("--write-baseline", dest = "writeBaseline", action = "store_true",
+                        help = "Records the CSVtoQIF modules imported by each run, and its module budget, in Tests/StartupBaseline.json")
+    args = parser.parse_args()
+
+    programs = { "source": [ sys.executable, CSVtoQIF.__file__ ] }
+    if (args.zipapp is not None):
+        programs["zipapp"] = [ sys.executable, os.path.abspath(args.zipapp) ]
+
+    print("Python {} on {}".format(platform.python_version(), platform.platform()))
+    with tempfile.TemporaryDirectory() as tempDir:
+        csvFileName = os.path.join(tempDir, "Statement.csv")
+        cfgFileName = os.path.join(tempDir, "Config.json")
+        StatementGenerator.writeStatement(csvFileName, STATEMENT_ROWS)
+        StatementGenerator.writeConfig(cfgFileName, tempDir)
+
+        bare = bestSeconds([ sys.executable, "-c", "pass" ], args.runs)
+        bareModules = importedModules([ sys.executable, "-c", "pass" ])
+        print("\n{:>10} {:>10} {:>10} {:>8}".format("run", "program", "ms", "modules"))
+        print("{:>10} {:>10} {:>10.1f} {:>8}".format("python", "-c pass", bare * 1000, len(bareModules)))
+        baselineModules = {}
+        for programName, program in programs.items():
+            for runName, command in runCommands(program, csvFileName, cfgFileName).items():
+                seconds = bestSeconds(command, args.runs, tempDir)
+                modules = importedModules(command, tempDir) - bareModules
+                print("{:>10} {:>10} {:>10.1f} {:>8}".format(runName, programName, seconds * 1000, len(modules)))
+                if (programName == "source"):
+                    baselineModules[runName] = modules
+
+    if (args.writeBaseline):
+        writeBaseline(baselineModules)
+        print("\nWrote the module baseline to {}".format(os.path.normpath(BASELINE_FILE_NAME)))
+    return
+
+if __name__ == "__main__":
+    main()
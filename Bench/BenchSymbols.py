@@ -0,0 +1,108 @@
+#************
+# Imports
+#************
+import argparse
+import csv
+import itertools
+import os
+import tempfile
+import timeit
+import tracemalloc
+
+import BenchContext
+from BenchContext import CompiledConfig
+import StatementGenerator
+import SymbolTable
+import ThreadedPipeline
+
+#******************
+# Constants/Enums
+#******************
+DEFAULT_ROWS = 200000
+DEFAULT_RUNS = 5
+DEFAULT_DISTINCT = 1000000
+
+
+#*************
+# Functions
+#*************
+def readStatement(Rows: int, Accounts: int) -> tuple:
+    """ Writes a synthetic statement and returns its compiled configuration, row layout and rows """
+    with tempfile.TemporaryDirectory() as tempDir:
+        csvFileName = os.path.join(tempDir, "Statement.csv")
+        cfgFileName = os.path.join(tempDir, "Config.json")
+        StatementGenerator.writeStatement(csvFileName, Rows, Accounts = Accounts)
+        StatementGenerator.writeConfig(cfgFileName, tempDir, Accounts)
+        config = CompiledConfig.CompiledConfig.load(cfgFileName)
+        with open(csvFileName, "rt") as csvFile:
+            reader = csv.reader(csvFile)
+            layout = config.bindHeader(next(reader))
+            rows = list(reader)
+    return(config, layout, rows)
+
+def timeActions(Config: CompiledConfig.CompiledConfig, Actions: list, Runs: int) -> tuple:
+    """ Returns the fastest seconds rendering every action the original way, and through the action symbol table """
+    actionDict = Config.actionDict
+    actionLine = Config.symbols.action.lookup
+    original = min(timeit.repeat(lambda: [ "N{}\n".format(actionDict[action.upper()]) for action in Actions ], number = 1, repeat = Runs))
+    symbols = min(timeit.repeat(lambda: list(map(actionLine, Actions)), number = 1, repeat = Runs))
+    return(original, symbols)
+
+def queuedBlockBytes(Config: CompiledConfig.CompiledConfig, Layout: CompiledConfig.RowLayout, Rows: list, Intern: bool) -> int:
+    """ Returns the bytes tracemalloc finds held by as many row blocks as the threaded engine queues, read from the
+    CSV text again so no field is shared with the rows already in memory """
+    blockCount = ThreadedPipeline.THREADED_QUEUE_BLOCKS + 1
+    lines = [ ",".join(row) for row in Rows[:blockCount * ThreadedPipeline.THREADED_BLOCK_ROWS] ]
+    columns = list(dict.fromkeys(Layout.columns[1:3] + Layout.columns[6:] + list(Layout.router.columns)))
+    Config.symbols.clear()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    reader = csv.reader(lines)
+    blocks = []
+    block = list(itertools.islice(reader, ThreadedPipeline.THREADED_BLOCK_ROWS))
+    while (block):
+        if (Intern):
+            columns = Config.symbols.internColumns(block, columns)
+        blocks.append(block)
+        block = list(itertools.islice(reader, ThreadedPipeline.THREADED_BLOCK_ROWS))
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return(held)
+
+def tableBytes(Distinct: int) -> tuple:
+    """ Returns the entries and the bytes tracemalloc finds held by an interning table fed Distinct different texts """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    table = SymbolTable.SymbolTable()
+    for text in range(Distinct):
+        table.lookup("Memo {}".format(text))
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return(len(table), held)
+
+def main() -> None:
+    """ Measures what the symbol tables save on a synthetic statement """
+    parser = argparse.ArgumentParser(description = "Symbol table benchmark")
+    parser.add_argument("--rows", type = int, default = DEFAULT_ROWS, help = "Statement rows")
+    parser.add_argument("--runs", type = int, default = DEFAULT_RUNS, help = "Runs of each timing, the fastest is reported")
+    parser.add_argument("--accounts", type = int, default = StatementGenerator.DEFAULT_ACCOUNTS, help = "qifFiles routing rules and accounts")
+    parser.add_argument("--distinct", type = int, default = DEFAULT_DISTINCT, help = "Distinct texts fed to a table to check its bound")
+    args = parser.parse_args()
+
+    config, layout, rows = readStatement(args.rows, args.accounts)
+
+    original, symbols = timeActions(config, [ row[layout.columns[1]] for row in rows ], args.runs)
+    print("N lines of {:,} rows:  actionCodeMap {:.3f} s, symbol table {:.3f} s, {:.2f}x".format(len(rows), original, symbols, original / symbols))
+
+    plain = queuedBlockBytes(config, layout, rows, False)
+    interned = queuedBlockBytes(config, layout, rows, True)
+    blockRows = min(len(rows), (ThreadedPipeline.THREADED_QUEUE_BLOCKS + 1) * ThreadedPipeline.THREADED_BLOCK_ROWS)
+    print("Queued blocks of {:,} rows:  {:,} bytes, interned {:,} bytes, {:.0f}% less, {:.0f} bytes saved per row".format(
+          blockRows, plain, interned, 100.0 * (plain - interned) / plain, (plain - interned) / blockRows))
+
+    entries, held = tableBytes(args.distinct)
+    print("Table fed {:,} distinct texts:  {:,} entries, {:,} bytes".format(args.distinct, entries, held))
+    return
+
+if __name__ == "__main__":
+    main()
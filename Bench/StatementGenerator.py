@@ -0,0 +1,173 @@
+#************
+# Imports
+#************
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+#******************
+# Constants/Enums
+#******************
+
+# Named statement sizes accepted wherever a row count is
+STATEMENT_SIZES = { "10k": 10000, "1m": 1000000, "10m": 10000000 }
+
+DEFAULT_SECURITIES = 500
+DEFAULT_ACCOUNTS = 24
+
+# CSV columns, as in Tests/TestIntegration.py, plus the account column the qifFiles rules match on
+CSV_COLUMNS = [ "CsvDate", "CsvAction", "CsvSecurity", "CsvPrice", "CsvQuantity", "CsvValue", "CsvMemo", "CsvChooser" ]
+
+# Every Quicken action code mapped to its CSV text, as in Tests/TestIntegration.py
+ACTION_CODE_MAP = {
+    "Buy": "CsvBuy", "BuyX": "CsvBuyX", "Sell": "CsvSell", "SellX": "CsvSellX",
+    "CGLong": "CsvCGLong", "CGLongX": "CsvCGLongX", "CGMid": "CsvCGMid", "CGMidX": "CsvCGMidX",
+    "CGShort": "CsvCGShort", "CGShortX": "CsvCGShortX", "Div": "CsvDiv", "DivX": "CsvDivX",
+    "IntInc": "CsvIntInc", "IntIncX": "CsvIntIncX", "ReinvDiv": "CsvReinvdiv", "ReinvInt": "CsvReinvInt",
+    "ReinvLg": "CsvReinvLg", "ReinvMd": "CsvReinvMd", "ReinvSh": "CsvReinvSh", "Reprice": "CsvReprice",
+    "XIn": "CsvXIn", "XOut": "CsvXOut", "MiscExp": "CsvMiscExp", "MiscExpX": "CsvMiscExpX",
+    "MiscInc": "CsvMiscInc", "MiscIncX": "CsvMiscIncX", "MargInt": "CsvMargInt", "MargIntX": "CsvMargIntX",
+    "RtrnCap": "CsvRtrnCap", "RtrnCapX": "CsvRtrnCapX", "StkSplit": "CsvStkSplit", "ShrsOut": "CsvShrsOut",
+    "ShrsIn": "CsvShrsIn"
+}
+
+# Buys, sells and reinvestments dominate real statements, so they are drawn more often than the rest
+_COMMON_ACTIONS = [ "CsvBuy", "CsvSell", "CsvReinvdiv", "CsvDiv" ]
+_COMMON_ACTION_WEIGHT = 0.8
+
+# Money formats seen in fund statements.  Negative amounts appear with a minus sign or in accounting parenthesis.
+_PRICE_FORMATS = [ "{:.2f}", "${:.2f}", "${:,.2f}", "{:.4f}" ]
+_QUANTITY_FORMATS = [ "{:.3f}", "{:.4f}", "{:,.4f}" ]
+_POSITIVE_VALUE_FORMATS = [ "${:,.2f}", "{:,.2f}", "{:.2f}" ]
+_NEGATIVE_VALUE_FORMATS = [ "(${:,.2f})", "-${:,.2f}", "-{:.2f}", "({:,.2f})" ]
+
+_START_DATE = datetime.date(1990, 1, 1)
+_TRADING_DAYS_PER_YEAR = 250
+
+
+#*************
+# Functions
+#*************
+def statementRows(Rows: Any) -> int:
+    """ Converts a row count or a named size (see STATEMENT_SIZES) to a row count """
+    text = str(Rows).lower()
+    return(STATEMENT_SIZES[text] if (text in STATEMENT_SIZES) else int(text))
+
+def accountNames(Accounts: int) -> List[str]:
+    """ Returns the account names written to the CsvChooser column """
+    return([ "Account {:02d}".format(account + 1) for account in range(Accounts) ])
+
+def makeConfig(OutputDir: str, Accounts: int = DEFAULT_ACCOUNTS) -> Dict[str, Any]:
+    """ Builds a configuration with one qifFiles routing rule per account.
+
+    Parameters
+    ----------
+    OutputDir: Directory the QIF files are written to.
+    Accounts: Number of accounts in the statement.
+
+    Returns
+    -------
+    Dict[str, Any]: The JSON configuration object.
+    """
+    return({
+        "csvFile": {
+            "headerRowMap": {
+                "dateColumn": "CsvDate",
+                "actionColumn": "CsvAction",
+                "securityColumn": "CsvSecurity",
+                "priceColumn": "CsvPrice",
+                "quantityColumn": "CsvQuantity",
+                "valueColumn": "CsvValue",
+                "memoColumn": "CsvMemo"
+            },
+            "actionCodeMap": ACTION_CODE_MAP
+        },
+        "qifFiles": [ { "name": os.path.join(OutputDir, "{}.qif".format(name.replace(" ", ""))), "matchColumn": "CsvChooser",
+                        "matchRegEx": "^{}$".format(name) } for name in accountNames(Accounts) ]
+    })
+
+def writeConfig(FileName: str, OutputDir: str, Accounts: int = DEFAULT_ACCOUNTS) -> List[str]:
+    """ Writes the configuration built by makeConfig, returning its QIF file names """
+    config = makeConfig(OutputDir, Accounts)
+    with open(FileName, "wt") as cfgFile:
+        json.dump(config, cfgFile, indent = 3)
+    return([ fileDesc["name"] for fileDesc in config["qifFiles"] ])
+
+def writeStatement(FileName: str, Rows: int, Seed: int = 0, Securities: int = DEFAULT_SECURITIES, Accounts: int = DEFAULT_ACCOUNTS,
+                   ExtraColumns: int = 0) -> None:
+    """ Writes a synthetic fund statement CSV file in date order.
+
+    The statement follows the randomized data of Tests/TestIntegration.py, made more like a real export: each
+    security's price drifts from day to day and is shared by every row on a day, money values use a mix of
+    currency symbols, thousands separators and negative styles, and rows are spread over many accounts.  Rows are
+    written as they are generated, so statements of any size can be written.
+
+    Parameters
+    ----------
+    FileName: The CSV file to write.
+    Rows: Number of rows.
+    Seed: Random seed, so a statement can be written again identically.
+    Securities: Number of distinct securities.
+    Accounts: Number of accounts, one per qifFiles routing rule of makeConfig.
+    ExtraColumns: Number of unused columns added after CSV_COLUMNS, as in the wide exports of some brokers.
+
+    Returns
+    -------
+    None
+    """
+    rand = random.Random(Seed)
+    securities = [ "Fund {:03d} {}".format(security, rand.choice([ "Class A", "Class I", "Index", "Admiral" ])) for security in range(Securities) ]
+    basePrices = [ rand.uniform(5.0, 500.0) for _ in range(Securities) ]
+    accounts = accountNames(Accounts)
+    actions = list(ACTION_CODE_MAP.values())
+
+    # Spread the rows over trading days, about 40 rows a day like a busy 401k plan
+    rowsPerDay = 40
+    extraHeader = [ "Extra{}".format(column + 1) for column in range(ExtraColumns) ]
+    with open(FileName, "wt", newline = "") as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(CSV_COLUMNS + extraHeader)
+        for row in range(Rows):
+            day = row // rowsPerDay
+            date = _START_DATE + datetime.timedelta(days = (day * 365) // _TRADING_DAYS_PER_YEAR)
+            security = rand.randrange(Securities)
+            price = basePrices[security] * (1.0 + (((day * 7919 + security) % 200) - 100) / 1000.0)
+            if (rand.random() < _COMMON_ACTION_WEIGHT):
+                action = rand.choice(_COMMON_ACTIONS)
+            else:
+                action = rand.choice(actions)
+            quantity = rand.uniform(0.001, 250.0)
+            value = price * quantity
+            if (action in ("CsvSell", "CsvSellX", "CsvXOut", "CsvShrsOut", "CsvMiscExp")):
+                valueText = rand.choice(_NEGATIVE_VALUE_FORMATS).format(value)
+            else:
+                valueText = rand.choice(_POSITIVE_VALUE_FORMATS).format(value)
+            writer.writerow([ "{}/{}/{}".format(date.month, date.day, date.year), action, securities[security],
+                              rand.choice(_PRICE_FORMATS).format(price), rand.choice(_QUANTITY_FORMATS).format(quantity), valueText,
+                              "Test Record {}".format(row), rand.choice(accounts) ] +
+                            [ "Detail {} of {}".format(column + 1, row) for column in range(ExtraColumns) ])
+    return
+
+def main() -> None:
+    """ Writes a synthetic statement and its configuration file """
+    parser = argparse.ArgumentParser(description = "Writes a synthetic fund statement CSV file and configuration")
+    parser.add_argument("csvFile", help = "CSV file to write")
+    parser.add_argument("cfgFile", help = "Configuration JSON file to write")
+    parser.add_argument("--rows", default = "10k", help = "Row count, or one of {}".format(", ".join(STATEMENT_SIZES)))
+    parser.add_argument("--seed", type = int, default = 0, help = "Random seed")
+    parser.add_argument("--securities", type = int, default = DEFAULT_SECURITIES, help = "Number of distinct securities")
+    parser.add_argument("--accounts", type = int, default = DEFAULT_ACCOUNTS, help = "Number of accounts and routing rules")
+    parser.add_argument("--extra-columns", dest = "extraColumns", type = int, default = 0, help = "Number of unused columns to add")
+    parser.add_argument("--output-dir", dest = "outputDir", default = ".", help = "Directory the configuration writes QIF files to")
+    args = parser.parse_args()
+
+    writeStatement(args.csvFile, statementRows(args.rows), args.seed, args.securities, args.accounts, args.extraColumns)
+    writeConfig(args.cfgFile, args.outputDir, args.accounts)
+    return
+
+if __name__ == "__main__":
+    main()
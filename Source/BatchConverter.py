@@ -0,0 +1,156 @@
+#************
+# Imports
+#************
+import glob
+import os
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+from CliDefaults import DEFAULT_OUTPUT_TEMPLATE, ENGINE_ROWS
+from CompiledConfig import CompiledConfig
+from MoneyParser import MoneyParser
+from QifPipeline import abortOutputFiles, closeOutputFiles, convertCsvFile, openOutputFiles
+from QifWriter import DEFAULT_BUFFER_SIZE
+
+#******************
+# Constants/Enums
+#******************
+
+# CSV files picked up when the batch source is a directory
+BATCH_DIRECTORY_PATTERN = "*.csv"
+
+# Exception strings raised by this file
+ERROR_BATCH_NO_CSV_FILES = "No CSV files found for '{}'"
+ERROR_BATCH_OUTPUT_COLLISION = "Output file '{}' would be written by more than one conversion, add {{csvStem}} to the output template"
+ERROR_BATCH_BAD_TEMPLATE = "Bad output template '{}': {}"
+
+# The compiled configuration and output options every file of the batch is converted with.  A batch run without a
+# pool sets it in this process.
+_workerState = None
+
+
+#***********
+# Classes
+#***********
+class BatchResult(NamedTuple):
+    """ Outcome of converting one CSV file in a batch """
+    csvFile: str
+    recordsProcessed: int
+    error: Optional[str]
+
+
+#*************
+# Functions
+#*************
+def findCsvFiles(Source: str) -> List[str]:
+    """ Lists the CSV files for a batch conversion.
+
+    Parameters
+    ----------
+    Source: A directory, in which case every *.csv file in it is converted, or a glob pattern.
+
+    Returns
+    -------
+    List[str]: The CSV file names, sorted.
+    """
+    pattern = os.path.join(Source, BATCH_DIRECTORY_PATTERN) if os.path.isdir(Source) else Source
+    csvFiles = sorted(fileName for fileName in glob.glob(pattern) if os.path.isfile(fileName))
+    if (not csvFiles):
+        raise Exception(ERROR_BATCH_NO_CSV_FILES.format(Source))
+    return(csvFiles)
+
+def makeOutputNames(Template: str, CsvFileName: str, QifNames: Sequence[str]) -> List[str]:
+    """ Builds the QIF output file names for one CSV file of a batch.
+
+    Parameters
+    ----------
+    Template: Output file name template, see DEFAULT_OUTPUT_TEMPLATE for the available fields.
+    CsvFileName: The CSV file being converted.
+    QifNames: The qifFiles names from the configuration, in order.
+
+    Returns
+    -------
+    List[str]: The output file names, in qifFiles order.
+    """
+    csvDir, csvBaseName = os.path.split(CsvFileName)
+    names = []
+    for qifName in QifNames:
+        qifDir, qifBaseName = os.path.split(qifName)
+        try:
+            name = Template.format(csvDir = csvDir or ".", csvStem = os.path.splitext(csvBaseName)[0], qifName = qifBaseName,
+                                   qifStem = os.path.splitext(qifBaseName)[0], qifDir = qifDir or ".")
+        except (KeyError, IndexError, ValueError) as err:
+            raise Exception(ERROR_BATCH_BAD_TEMPLATE.format(Template, err))
+        names.append(os.path.normpath(name))
+    return(names)
+
+def convertBatch(CsvFiles: Sequence[str], Template: str, Jobs: int, Config: CompiledConfig,
+                 BufferSize: int = DEFAULT_BUFFER_SIZE, Fsync: bool = False, MapFile: bool = False,
+                 Engine: str = ENGINE_ROWS, Aggregate: bool = False) -> Iterator[BatchResult]:
+    """ Converts many CSV files with one compiled configuration.
+
+    Parameters
+    ----------
+    CsvFiles: The CSV files to convert.
+    Template: Output file name template, see DEFAULT_OUTPUT_TEMPLATE for the available fields.
+    Jobs: Number of files converted concurrently in worker processes.  With 1, files are converted in this process.
+    Config: The compiled conversion configuration.  Its qifFiles names are expanded per CSV file by the template.
+    BufferSize: Number of characters each QIF writer collects before writing them to its file.
+    Fsync: When set True, each QIF file is forced to disk before it is moved into place.
+    MapFile: When set True, CSV files are memory mapped and read by MappedCsvReader where possible.
+    Engine: The conversion engine, one of ENGINES (see QifPipeline.convertCsvFile).
+    Aggregate: When set True, the records of each day with the same action, security and QIF file are merged into one
+        by a RecordAggregator per CSV file.
+
+    Returns
+    -------
+    Iterator[BatchResult]: One result per CSV file, in CsvFiles order.  A failed file does not stop the batch.
+    """
+    # Check every output name up front so two conversions can never overwrite each other's files
+    jobs = []
+    allNames = set()
+    for csvFile in CsvFiles:
+        outputNames = makeOutputNames(Template, csvFile, Config.qifNames)
+        for name in outputNames:
+            if (name in allNames):
+                raise Exception(ERROR_BATCH_OUTPUT_COLLISION.format(name))
+            allNames.add(name)
+        jobs.append((csvFile, outputNames))
+
+    if (Jobs > 1):
+        # multiprocessing is slow to import, and not needed to convert one file at a time
+        import multiprocessing
+        with multiprocessing.Pool(min(Jobs, len(jobs)), initializer = _initWorker, initargs = (Config, BufferSize, Fsync, MapFile, Engine, Aggregate)) as pool:
+            yield from pool.imap(_convertOne, jobs)
+    else:
+        _initWorker(Config, BufferSize, Fsync, MapFile, Engine, Aggregate)
+        for job in jobs:
+            yield _convertOne(job)
+    return
+
+def _initWorker(Config: CompiledConfig, BufferSize: int, Fsync: bool, MapFile: bool, Engine: str, Aggregate: bool) -> None:
+    """ Stores the compiled configuration and output settings in a worker process """
+    global _workerState
+    _workerState = (Config, MoneyParser(), BufferSize, Fsync, MapFile, Engine, Aggregate)
+    return
+
+def _convertOne(Job: tuple) -> BatchResult:
+    """ Worker function converting one CSV file, reporting rather than raising any failure """
+    config, moneyParser, bufferSize, fsync, mapFile, engine, aggregate = _workerState
+    csvFile, outputNames = Job
+    aggregator = None
+    if (aggregate):
+        # Imported here so batches that do not merge records do not load it
+        from RecordAggregator import RecordAggregator
+        aggregator = RecordAggregator()
+    try:
+        fileHandles = openOutputFiles(outputNames, False, bufferSize, fsync, config.qifSinks)
+        try:
+            recordsProcessed = convertCsvFile(csvFile, fileHandles, config, moneyParser, MapFile = mapFile, Engine = engine,
+                                              Aggregator = aggregator)
+        except BaseException:
+            abortOutputFiles(fileHandles)
+            raise
+        closeOutputFiles(fileHandles)
+    except Exception as err:
+        return(BatchResult(csvFile, 0, str(err)))
+    return(BatchResult(csvFile, recordsProcessed, None))
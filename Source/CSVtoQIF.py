@@ -2,46 +2,57 @@
 #************
 # Imports
 #************
-import csv
-from genericpath import isfile
-import json
-import re
 import argparse
 import os
 import sys
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
+
+from CliDefaults import (DEFAULT_BUFFER_SIZE, DEFAULT_CHECKPOINT_ROWS, DEFAULT_DEBOUNCE_SECONDS, DEFAULT_OUTPUT_TEMPLATE, DEFAULT_STATE_FILE_NAME,
+                         ENGINE_ROWS, ENGINES, STATS_FORMAT_JSON, STATS_FORMATS, STREAM_FILE_NAME)
+
+# Every other module is imported by the function that needs it, so -h and -v only load argparse, and each kind of
+# conversion only loads the modules it uses.  Python's start up time is most of the run time for a small statement.
+# Tests/StartupBaseline.json records the modules each kind of run imports, and TestStartup fails if that set grows.
+if (TYPE_CHECKING):
+    from CompiledConfig import CompiledConfig
+    from MoneyParser import MoneyParser
+    from PipelineStats import PipelineStats
+    from QifWriter import QifWriter
+    from RecordAggregator import RecordAggregator
 
 #******************
 # Constants/Enums
 #******************
 PROGRAM_VERSION = "CSVtoQIF 1.0.0"
 
-# JSON config file object name strings
-JSON_OBJECT_INPUT_FILE = "csvFile"
-JSON_OBJECT_INPUT_FILE_HEADERS = "headerRowMap"
-JSON_OBJECT_INPUT_FILE_ACTIONS = "actionCodeMap"
-JSON_OBJECT_OUTPUT_FILES = "qifFiles"
-
-# Key names from the Input File object header object
-JSON_KEY_HEADER_DATE = "dateColumn"
-JSON_KEY_HEADER_ACTION = "actionColumn"
-JSON_KEY_HEADER_SECURITY = "securityColumn"
-JSON_KEY_HEADER_PRICE = "priceColumn"
-JSON_KEY_HEADER_QUANTITY = "quantityColumn"
-JSON_KEY_HEADER_VALUE = "valueColumn"
-JSON_KEY_HEADER_MEMO = "memoColumn"
-
-# Key name from the output file objects
-JSON_KEY_OUTPUT_FILE_NAME = "name"
-JSON_KEY_OUTPUT_FILE_MATCH_COLUMN = "matchColumn"
-JSON_KEY_OUTPUT_FILE_MATCH_REGEX = "matchRegEx"
-JSON_KEY_OUTPUT_FILE_HANDLE = "__fileHandle"
-
 # Exception strings raised by this file
-ERROR_BAD_MONEY_VALUE = "Cannot find monetary value in string '{}'"
-ERROR_NO_OUTPUT_FILE = "Cannot map CSV file record to an output file: {}"
 ERROR_CSV_FILES_DOES_NOT_EXIST = "CSV file '{}' does not exist"
 ERROR_CFG_FILES_DOES_NOT_EXIST = "Config file '{}' does not exist"
+ERROR_JOBS_NEED_CSV_FILE = "--jobs requires a CSV file, not a stream"
+ERROR_BAD_JOBS_COUNT = "--jobs must be at least 1"
+ERROR_BATCH_FAILED = "{} of {} CSV files failed to convert"
+ERROR_INCREMENTAL_OPTIONS = "--incremental cannot be combined with --batch or --jobs"
+ERROR_DELTA_NEEDS_INCREMENTAL = "--delta requires --incremental"
+ERROR_BAD_BUFFER_SIZE = "--buffer-size must be at least 1"
+ERROR_STATS_OPTIONS = "--stats cannot be combined with --batch or --jobs"
+ERROR_SERVE_OPTIONS = "--serve cannot be combined with csvFile, cfgFile, --batch, --incremental, --validate, --watch, --stats or --profile"
+ERROR_MISSING_FILES = "csvFile and cfgFile are required unless --serve or --watch is given"
+ERROR_ENGINE_OPTIONS = "--engine {} cannot be combined with --jobs on a single CSV file, --stats or --serve"
+ERROR_VALIDATE_OPTIONS = "--validate requires a single CSV file, not --batch or a stream"
+ERROR_VALIDATION_FAILED = "{} errors found in CSV file '{}', no QIF files were written"
+ERROR_RESUME_OPTIONS = "--resume and --skip-bad-rows cannot be combined with --batch, --jobs, --incremental, --stats, --mmap, --serve, --watch or an --engine other than rows"
+ERROR_RESUME_NEEDS_CSV_FILE = "--resume requires a CSV file, not a stream"
+ERROR_BAD_CHECKPOINT_ROWS = "--checkpoint-rows must be at least 1"
+ERROR_AGGREGATE_OPTIONS = "--aggregate cannot be combined with --jobs on a single CSV file, --stats, --resume, --skip-bad-rows, --serve, --watch or an --engine other than rows"
+ERROR_WATCH_OPTIONS = "--watch takes only cfgFile, and cannot be combined with --serve, --batch, --incremental, --validate, --stats or --profile"
+
+# --profile report sizes, and the stack depth recorded for each traced allocation
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_TOP_ALLOCATIONS = 15
+PROFILE_TRACE_FRAMES = 1
+
+# Money string parser shared by every conversion in this process so its cache persists.  It is made on first use.
+_moneyParser = None
 
 
 #**************
@@ -59,73 +70,418 @@ def main(CliArgs: list[str] = None) -> None:
     -------
     None
     """
-    print("\n\n***** CSV to QIF File Converter *****\n")
-
     # If we have been given args, pass them to the CLI parser.  Otherwise use the sys.argv args 
     # past the Python file name.
     argNamespace = _parseCommandLine(sys.argv[1:] if (CliArgs is None) else CliArgs)
 
-    # Check that the files passed to us exist
-    if (not os.path.isfile(argNamespace.csvFile)):
+    if (argNamespace.serve is not None):
+        _serve(argNamespace)
+        return
+
+    if (argNamespace.watch is not None):
+        _watch(argNamespace)
+        return
+
+    # Check that the files passed to us exist.  The CSV file may also be stdin or a named pipe, or in batch mode a directory or glob.
+    if ((not argNamespace.batch) and (argNamespace.csvFile != STREAM_FILE_NAME) and 
+        ((not os.path.exists(argNamespace.csvFile)) or os.path.isdir(argNamespace.csvFile))):
         raise Exception(ERROR_CSV_FILES_DOES_NOT_EXIST.format(argNamespace.csvFile))
     if (not os.path.isfile(argNamespace.cfgFile)):
         raise Exception(ERROR_CFG_FILES_DOES_NOT_EXIST.format(argNamespace.cfgFile))
+    if (argNamespace.jobs < 1):
+        raise Exception(ERROR_BAD_JOBS_COUNT)
+    if ((argNamespace.jobs > 1) and (argNamespace.csvFile == STREAM_FILE_NAME)):
+        raise Exception(ERROR_JOBS_NEED_CSV_FILE)
+    if ((argNamespace.incremental is not None) and (argNamespace.batch or (argNamespace.jobs > 1))):
+        raise Exception(ERROR_INCREMENTAL_OPTIONS)
+    if (argNamespace.delta and (argNamespace.incremental is None)):
+        raise Exception(ERROR_DELTA_NEEDS_INCREMENTAL)
+    if (argNamespace.bufferSize < 1):
+        raise Exception(ERROR_BAD_BUFFER_SIZE)
+    if (argNamespace.validate and (argNamespace.batch or (argNamespace.csvFile == STREAM_FILE_NAME))):
+        raise Exception(ERROR_VALIDATE_OPTIONS)
+
+    if ((argNamespace.stats is not None) and (argNamespace.batch or (argNamespace.jobs > 1))):
+        raise Exception(ERROR_STATS_OPTIONS)
+    if ((argNamespace.engine != ENGINE_ROWS) and ((argNamespace.stats is not None) or ((argNamespace.jobs > 1) and (not argNamespace.batch)))):
+        raise Exception(ERROR_ENGINE_OPTIONS.format(argNamespace.engine))
+    if ((argNamespace.resume or (argNamespace.skipBadRows is not None)) and
+        (argNamespace.batch or (argNamespace.jobs > 1) or (argNamespace.incremental is not None) or (argNamespace.stats is not None) or
+         argNamespace.mapFile or (argNamespace.engine != ENGINE_ROWS))):
+        raise Exception(ERROR_RESUME_OPTIONS)
+    if (argNamespace.resume and (argNamespace.csvFile == STREAM_FILE_NAME)):
+        raise Exception(ERROR_RESUME_NEEDS_CSV_FILE)
+    if (argNamespace.checkpointRows < 1):
+        raise Exception(ERROR_BAD_CHECKPOINT_ROWS)
+    if (argNamespace.aggregate and
+        (((argNamespace.jobs > 1) and (not argNamespace.batch)) or (argNamespace.stats is not None) or argNamespace.resume or
+         (argNamespace.skipBadRows is not None) or (argNamespace.engine != ENGINE_ROWS))):
+        raise Exception(ERROR_AGGREGATE_OPTIONS)
+
+    if (argNamespace.profile is not None):
+        _profileConversion(argNamespace)
+    else:
+        _convert(argNamespace)
+    return
+
+def _convert(ArgNamespace: argparse.Namespace) -> None:
+    """ Loads the configuration and runs the conversion selected by the command line.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed and checked command line.
+
+    Returns
+    -------
+    None
+    """
+    from CompiledConfig import CompiledConfig
+    from QifPipeline import abortOutputFiles, closeOutputFiles, convertCsvFile, openOutputFiles
+
+    # Load, validate and compile the config file, reusing a cached compilation when one is available
+    config = CompiledConfig.load(ArgNamespace.cfgFile, ArgNamespace.configCache)
+
+    # Status messages go to stderr when QIF data is streamed to stdout
+    streamingToStdout = ((not ArgNamespace.batch) and (STREAM_FILE_NAME in config.qifNames))
+    messageStream = sys.stderr if streamingToStdout else sys.stdout
+    print("\n\n***** CSV to QIF File Converter *****\n", file = messageStream)
+
+    if (ArgNamespace.validate):
+        _validate(ArgNamespace, config, messageStream)
+
+    if (ArgNamespace.batch):
+        _convertBatch(ArgNamespace, config, messageStream)
+        return
+
+    if (ArgNamespace.incremental is not None):
+        _convertIncremental(ArgNamespace, config, messageStream)
+        return
+
+    if (ArgNamespace.resume or (ArgNamespace.skipBadRows is not None)):
+        _convertResumable(ArgNamespace, config, messageStream)
+        return
+
+    # Open an output writer for each entry in the output files array.  Named pipes are opened like any other file.
+    fileHandles = openOutputFiles(config.qifNames, False, ArgNamespace.bufferSize, ArgNamespace.fsync, config.qifSinks)
+    stats = _makeStats(ArgNamespace, config.qifNames)
+    aggregator = _makeAggregator(ArgNamespace)
 
-    # Open the config file and extract its JSON contents
-    with open(argNamespace.cfgFile, "rt") as cfgFile:
-        jsonCfg = json.loads(cfgFile.read())
-    jsonHeaderMap = jsonCfg[JSON_OBJECT_INPUT_FILE][JSON_OBJECT_INPUT_FILE_HEADERS]
-    jsonActionMap = jsonCfg[JSON_OBJECT_INPUT_FILE][JSON_OBJECT_INPUT_FILE_ACTIONS]
-    jsonOutputFiles = jsonCfg[JSON_OBJECT_OUTPUT_FILES]
-
-    # Iterate the output files array and open an output file for each entry
-    for fileDesc in jsonOutputFiles:
-        fileDesc[JSON_KEY_OUTPUT_FILE_HANDLE] = open(fileDesc[JSON_KEY_OUTPUT_FILE_NAME], "wt")
-
-    # Convert the JSON action code map into a dictionary of Quicken codes (reverse the positions of the key-value pairs).
-    # Only non-empty text entries from the JSON file are in the dictionary.  Keys are converted to CAPS to prevent case dependent search failures.
-    quickenActionDict = {}
-    for quickenAction in jsonActionMap:
-        quickenActionDict[jsonActionMap[quickenAction].upper()] = quickenAction
     try:
-        quickenActionDict.pop("")   # Get rid of anything mapped to an empty string
-    except KeyError:
-        # This will happen if there is nothing mapped to an empty string (all actions mapped in the JSON config file)
-        pass
-
-    # Open the CSV file and parse it line by line
-    recordsProcessed = 0
-    with open(argNamespace.csvFile, "rt") as csvFile:
-        csvReader = csv.DictReader(csvFile)
-        for row in csvReader:
-            recordsProcessed = recordsProcessed + 1
-            qifRecord = "D{}\nN{}\nY{}\nI{}\nT{:,.2f}\nQ{:,}\nM{}\n^\n".format(
-                                    row[jsonHeaderMap[JSON_KEY_HEADER_DATE]],                                    # D
-                                    quickenActionDict[row[jsonHeaderMap[JSON_KEY_HEADER_ACTION]].upper()],       # N
-                                    row[jsonHeaderMap[JSON_KEY_HEADER_SECURITY]],                                # Y
-                                    _csvFloatToQuickenFloat(row[jsonHeaderMap[JSON_KEY_HEADER_PRICE]]),          # I
-                                    _csvFloatToQuickenFloat(row[jsonHeaderMap[JSON_KEY_HEADER_VALUE]]),          # T
-                                    _csvFloatToQuickenFloat(row[jsonHeaderMap[JSON_KEY_HEADER_QUANTITY]], True), # Q
-                                    row[jsonHeaderMap[JSON_KEY_HEADER_MEMO]])                                    # M
-
-            # Iterate the output files and write the string to the first file that matches criteria
-            dataWasWritten = False
-            for fileDesc in jsonOutputFiles:
-                if(not re.match(fileDesc[JSON_KEY_OUTPUT_FILE_MATCH_REGEX], row[fileDesc[JSON_KEY_OUTPUT_FILE_MATCH_COLUMN]]) is None):
-                    fileDesc[JSON_KEY_OUTPUT_FILE_HANDLE].write(qifRecord)
-                    dataWasWritten = True
-                    break
-
-            # Make sure the record went somewhere
-            if (not dataWasWritten):
-                raise Exception(ERROR_NO_OUTPUT_FILE.format(qifRecord))
-
-    # Clean up
-    for fileDesc in jsonOutputFiles:
-        fileDesc[JSON_KEY_OUTPUT_FILE_HANDLE].close()
-    print("{} CSV records processed".format(recordsProcessed))
+        if (ArgNamespace.jobs > 1):
+            from ParallelConverter import convertParallel
+            # Chunks come back in file order, so writing them in turn gives the same output as the serial loop
+            recordsProcessed = 0
+            for chunkOutputs, chunkRecords in convertParallel(ArgNamespace.csvFile, ArgNamespace.jobs, config, ArgNamespace.mapFile):
+                recordsProcessed = recordsProcessed + chunkRecords
+                for fileIndex, qifText in enumerate(chunkOutputs):
+                    if (qifText):
+                        fileHandles[fileIndex].write(qifText)
+        else:
+            # Open the CSV file and stream it through the read -> format -> route pipeline one record at a time
+            recordsProcessed = convertCsvFile(ArgNamespace.csvFile, fileHandles, config, _sharedMoneyParser(), Stats = stats,
+                                              MapFile = ArgNamespace.mapFile, Engine = ArgNamespace.engine, Aggregator = aggregator)
+    except BaseException:
+        # Leave any QIF files from an earlier run in place rather than replacing them with partial output
+        abortOutputFiles(fileHandles)
+        raise
+
+    # Clean up, moving the finished QIF files into place
+    closeOutputFiles(fileHandles)
+    print("{} CSV records processed".format(recordsProcessed), file = messageStream)
+    _writeAggregateCount(aggregator, messageStream)
+    _writeStats(ArgNamespace, stats, fileHandles, messageStream)
     return
 
+def _serve(ArgNamespace: argparse.Namespace) -> None:
+    """ Checks the command line for server mode and runs the conversion server until it is stopped.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed command line.  serve holds the server address.
+
+    Returns
+    -------
+    None
+    """
+    if ((ArgNamespace.csvFile is not None) or ArgNamespace.batch or (ArgNamespace.incremental is not None) or ArgNamespace.validate or
+        (ArgNamespace.watch is not None) or (ArgNamespace.stats is not None) or (ArgNamespace.profile is not None)):
+        raise Exception(ERROR_SERVE_OPTIONS)
+    if (ArgNamespace.engine != ENGINE_ROWS):
+        raise Exception(ERROR_ENGINE_OPTIONS.format(ArgNamespace.engine))
+    if (ArgNamespace.resume or (ArgNamespace.skipBadRows is not None)):
+        raise Exception(ERROR_RESUME_OPTIONS)
+    if (ArgNamespace.aggregate):
+        raise Exception(ERROR_AGGREGATE_OPTIONS)
+    if (ArgNamespace.jobs < 1):
+        raise Exception(ERROR_BAD_JOBS_COUNT)
+    if (ArgNamespace.bufferSize < 1):
+        raise Exception(ERROR_BAD_BUFFER_SIZE)
+
+    from ConversionServer import serve
+    print("\n\n***** CSV to QIF Conversion Server *****\n")
+    serve(ArgNamespace.serve, ArgNamespace.configDir, ArgNamespace.jobs, ArgNamespace.bufferSize, ArgNamespace.fsync,
+          ArgNamespace.mapFile, sys.stdout, ArgNamespace.dataDir)
+    return
+
+def _watch(ArgNamespace: argparse.Namespace) -> None:
+    """ Checks the command line for watch mode, loads the configuration and converts new CSV files until stopped.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed command line.  watch holds the watched directory.
+
+    Returns
+    -------
+    None
+    """
+    if ((ArgNamespace.csvFile is not None) or (ArgNamespace.serve is not None) or ArgNamespace.batch or ArgNamespace.validate or
+        (ArgNamespace.incremental is not None) or (ArgNamespace.stats is not None) or (ArgNamespace.profile is not None)):
+        raise Exception(ERROR_WATCH_OPTIONS)
+    if (ArgNamespace.resume or (ArgNamespace.skipBadRows is not None)):
+        raise Exception(ERROR_RESUME_OPTIONS)
+    if (ArgNamespace.aggregate):
+        raise Exception(ERROR_AGGREGATE_OPTIONS)
+    if (not os.path.isfile(ArgNamespace.cfgFile)):
+        raise Exception(ERROR_CFG_FILES_DOES_NOT_EXIST.format(ArgNamespace.cfgFile))
+    if (ArgNamespace.jobs < 1):
+        raise Exception(ERROR_BAD_JOBS_COUNT)
+    if (ArgNamespace.bufferSize < 1):
+        raise Exception(ERROR_BAD_BUFFER_SIZE)
+
+    from CompiledConfig import CompiledConfig
+    from DirectoryWatcher import DirectoryWatcher, watchDirectory
+
+    # The config is loaded once, and every CSV file found is converted with it
+    config = CompiledConfig.load(ArgNamespace.cfgFile, ArgNamespace.configCache)
+    watcher = DirectoryWatcher(ArgNamespace.watch, ArgNamespace.watchState, ArgNamespace.debounce)
+    print("\n\n***** CSV to QIF Directory Watch *****\n")
+    watchDirectory(watcher, ArgNamespace.outputTemplate, ArgNamespace.jobs, config, ArgNamespace.bufferSize, ArgNamespace.fsync,
+                   ArgNamespace.mapFile, sys.stdout, ArgNamespace.engine)
+    return
+
+def _validate(ArgNamespace: argparse.Namespace, Config: "CompiledConfig", MessageStream) -> None:
+    """ Runs the --validate pass over the whole CSV file, stopping before any QIF file is opened if it finds errors.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed and checked command line.  jobs sets the number of worker processes checking the file.
+    Config: The compiled conversion configuration.
+    MessageStream: Where the report is printed.
+
+    Returns
+    -------
+    None
+    """
+    from CsvValidator import validateCsvFile
+
+    report = validateCsvFile(ArgNamespace.csvFile, Config, ArgNamespace.jobs)
+    if (report.errorCount):
+        report.write(MessageStream)
+        raise Exception(ERROR_VALIDATION_FAILED.format(report.errorCount, ArgNamespace.csvFile))
+    print("{} CSV records validated".format(report.rowsChecked), file = MessageStream)
+    return
+
+def _profileConversion(ArgNamespace: argparse.Namespace) -> None:
+    """ Runs the conversion under cProfile and tracemalloc.
+
+    The cProfile statistics are written to the --profile file, for pstats or a viewer such as snakeviz.  The functions
+    with the most cumulative time, the peak traced memory and the largest allocation sites still live at the end of
+    the run are printed to stderr.  Tracing memory slows every allocation, so the absolute times are inflated.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed and checked command line.
+
+    Returns
+    -------
+    None
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start(PROFILE_TRACE_FRAMES)
+    try:
+        profiler.runcall(_convert, ArgNamespace)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        profiler.dump_stats(ArgNamespace.profile)
+
+        print("\n***** Profile (written to {}) *****\n".format(ArgNamespace.profile), file = sys.stderr)
+        pstats.Stats(profiler, stream = sys.stderr).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_FUNCTIONS)
+        print("Peak traced memory: {:,} bytes\n".format(peakMemory), file = sys.stderr)
+        print("Largest allocation sites at exit:", file = sys.stderr)
+        for statistic in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+            print("  {}".format(statistic), file = sys.stderr)
+    return
+
+def _makeStats(ArgNamespace: argparse.Namespace, QifNames: List[str]) -> Optional["PipelineStats"]:
+    """ Starts the --stats statistics, if they were asked for """
+    if (ArgNamespace.stats is None):
+        return(None)
+    from PipelineStats import PipelineStats
+    return(PipelineStats(QifNames, _sharedMoneyParser()))
+
+def _writeStats(ArgNamespace: argparse.Namespace, Stats: Optional["PipelineStats"], FileHandles: List["QifWriter"], MessageStream) -> None:
+    """ Completes and writes the --stats output, if statistics were gathered """
+    if (Stats is not None):
+        Stats.finish(FileHandles)
+        Stats.write(ArgNamespace.stats, ArgNamespace.statsFormat, MessageStream)
+    return
+
+def _makeAggregator(ArgNamespace: argparse.Namespace) -> Optional["RecordAggregator"]:
+    """ Starts the --aggregate stage, if it was asked for """
+    if (not ArgNamespace.aggregate):
+        return(None)
+    from RecordAggregator import RecordAggregator
+    return(RecordAggregator())
+
+def _writeAggregateCount(Aggregator: Optional["RecordAggregator"], MessageStream) -> None:
+    """ Prints the number of merged QIF records written, if records were aggregated """
+    if (Aggregator is not None):
+        print("{} QIF records written".format(Aggregator.recordsWritten), file = MessageStream)
+    return
+
+def _convertBatch(ArgNamespace: argparse.Namespace, Config: "CompiledConfig", MessageStream) -> None:
+    """ Converts every CSV file matched by the csvFile argument and prints a summary.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed command line.  csvFile holds a directory or glob pattern.
+    Config: The compiled conversion configuration.  Its qifFiles names are expanded per CSV file by the output template.
+    MessageStream: Where status messages are printed.
+
+    Returns
+    -------
+    None
+    """
+    from BatchConverter import convertBatch, findCsvFiles
+
+    csvFiles = findCsvFiles(ArgNamespace.csvFile)
+    failures = 0
+    totalRecords = 0
+    for result in convertBatch(csvFiles, ArgNamespace.outputTemplate, ArgNamespace.jobs, Config, ArgNamespace.bufferSize, ArgNamespace.fsync,
+                               ArgNamespace.mapFile, ArgNamespace.engine, ArgNamespace.aggregate):
+        if (result.error is None):
+            totalRecords = totalRecords + result.recordsProcessed
+            print("{}: {} CSV records processed".format(result.csvFile, result.recordsProcessed), file = MessageStream)
+        else:
+            failures = failures + 1
+            print("{}: FAILED: {}".format(result.csvFile, result.error), file = MessageStream)
+    print("\n{} CSV files, {} CSV records processed, {} failed".format(len(csvFiles), totalRecords, failures), file = MessageStream)
+    if (failures):
+        raise Exception(ERROR_BATCH_FAILED.format(failures, len(csvFiles)))
+    return
+
+def _convertIncremental(ArgNamespace: argparse.Namespace, Config: "CompiledConfig", MessageStream) -> None:
+    """ Converts only the CSV rows not recorded in the row index by an earlier run.
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed command line.  incremental holds the row index file name.
+    Config: The compiled conversion configuration.  New records are appended to its qifFiles, or with --delta,
+        written to delta files next to them.
+    MessageStream: Where status messages are printed.
+
+    Returns
+    -------
+    None
+    """
+    from QifPipeline import abortOutputFiles, closeOutputFiles, convertCsvFile, openOutputFiles
+    from RowIndex import RowIndex
+
+    rowIndex = RowIndex(ArgNamespace.incremental)
+    try:
+        if (ArgNamespace.delta):
+            outputNames = [ _deltaFileName(qifName) for qifName in Config.qifNames ]
+        else:
+            outputNames = Config.qifNames
+        fileHandles = openOutputFiles(outputNames, not ArgNamespace.delta, ArgNamespace.bufferSize, ArgNamespace.fsync, Config.qifSinks)
+        stats = _makeStats(ArgNamespace, Config.qifNames)
+        aggregator = _makeAggregator(ArgNamespace)
+        try:
+            recordsProcessed = convertCsvFile(ArgNamespace.csvFile, fileHandles, Config, _sharedMoneyParser(),
+                                              lambda rows, layout: rowIndex.filterNewRows(rows, layout.router, Config.qifNames), stats,
+                                              ArgNamespace.mapFile, ArgNamespace.engine, aggregator)
+        except BaseException:
+            abortOutputFiles(fileHandles)
+            raise
+        closeOutputFiles(fileHandles)
+
+        # Only mark the rows as converted once their records are safely written
+        rowIndex.commit()
+    finally:
+        rowIndex.close()
+    print("{} new CSV records processed, {} already converted".format(recordsProcessed, rowIndex.skippedRows), file = MessageStream)
+    _writeAggregateCount(aggregator, MessageStream)
+    _writeStats(ArgNamespace, stats, fileHandles, MessageStream)
+    return
+
+def _convertResumable(ArgNamespace: argparse.Namespace, Config: "CompiledConfig", MessageStream) -> None:
+    """ Converts the CSV file taking checkpoints to resume from (--resume), and setting aside the rows that cannot be
+    converted (--skip-bad-rows).
+
+    Parameters
+    ----------
+    ArgNamespace: The parsed and checked command line.  With resume set, a failed conversion keeps its output up to
+        the last checkpoint, and the next run with resume set continues from there.  skipBadRows names the CSV file
+        the rejected rows are written to.
+    Config: The compiled conversion configuration.
+    MessageStream: Where status messages are printed.
+
+    Returns
+    -------
+    None
+    """
+    from Checkpoint import Checkpoint, checkpointFileName, convertCheckpointed
+    from QifPipeline import abortOutputFiles, closeOutputFiles, openOutputFiles, suspendOutputFiles
+
+    checkpoint = None
+    offsets = None
+    if (ArgNamespace.resume):
+        checkpoint = Checkpoint(checkpointFileName(ArgNamespace.csvFile), ArgNamespace.csvFile, ArgNamespace.cfgFile, Config.qifNames,
+                                ArgNamespace.skipBadRows, ArgNamespace.fsync)
+        offsets = checkpoint.outputOffsets + [ checkpoint.rejectedOffset ]
+        if (checkpoint.resumed):
+            print("Resuming from checkpoint '{}' after {} CSV rows".format(checkpoint.fileName, checkpoint.recordsProcessed + checkpoint.rowsRejected),
+                  file = MessageStream)
+
+    # The rejected rows file is opened, resumed and closed along with the QIF files, after them
+    outputNames = list(Config.qifNames)
+    sinks = list(Config.qifSinks)
+    if (ArgNamespace.skipBadRows is not None):
+        outputNames.append(ArgNamespace.skipBadRows)
+        sinks.append(None)
+    fileHandles = openOutputFiles(outputNames, False, ArgNamespace.bufferSize, ArgNamespace.fsync, sinks, offsets)
+    rejected = fileHandles[-1] if (ArgNamespace.skipBadRows is not None) else None
+    try:
+        recordsProcessed, rowsRejected = convertCheckpointed(ArgNamespace.csvFile, fileHandles[:len(Config.qifNames)], Config,
+                                                             _sharedMoneyParser(), checkpoint, rejected, ArgNamespace.checkpointRows)
+    except BaseException:
+        if (checkpoint is not None):
+            # Keep the output up to the last checkpoint for the next run to resume from
+            suspendOutputFiles(fileHandles)
+        else:
+            abortOutputFiles(fileHandles)
+        raise
+    closeOutputFiles(fileHandles)
+    if (checkpoint is not None):
+        checkpoint.remove()
+    print("{} CSV records processed".format(recordsProcessed), file = MessageStream)
+    if (rejected is not None):
+        print("{} bad CSV rows written to {}".format(rowsRejected, ArgNamespace.skipBadRows), file = MessageStream)
+    return
+
+def _deltaFileName(QifName: str) -> str:
+    """ Returns the delta file name for a QIF output file, e.g. Roth.qif -> Roth.delta.qif """
+    if (QifName == STREAM_FILE_NAME):
+        return(QifName)
+    stem, extension = os.path.splitext(QifName)
+    return("{}.delta{}".format(stem, extension))
+
 def _parseCommandLine(Args: List[str]) -> argparse.Namespace:
     """ Builds and executes the command line parser.
     
@@ -142,12 +498,68 @@ def _parseCommandLine(Args: List[str]) -> argparse.Namespace:
     parser.version = PROGRAM_VERSION
 
     # Add positional arguments
-    parser.add_argument("csvFile", help = "Specify the input CSV file")
-    parser.add_argument("cfgFile", help = "Specify the conversion configuration JSON file")
+    parser.add_argument("csvFile", nargs = "?", help = "Specify the input CSV file, or - to read stdin")
+    parser.add_argument("cfgFile", nargs = "?", help = "Specify the conversion configuration JSON file")
 
     # Add optional arguments
     parser.add_argument("-v", action = "version", help = "Shows the version and exits")
-    return(parser.parse_args(Args))
+    parser.add_argument("-j", "--jobs", type = int, default = 1, 
+                        help = "Converts the CSV file in N worker processes, or in batch mode, N CSV files at a time")
+    parser.add_argument("-b", "--batch", action = "store_true", 
+                        help = "Treats csvFile as a directory or glob pattern and converts every matching CSV file")
+    parser.add_argument("-o", "--output-template", dest = "outputTemplate", metavar = "TEMPLATE", default = DEFAULT_OUTPUT_TEMPLATE,
+                        help = "Batch mode output file name template (default: {})".format(DEFAULT_OUTPUT_TEMPLATE))
+    parser.add_argument("-i", "--incremental", metavar = "INDEX", 
+                        help = "Converts only rows not already recorded in the INDEX database, appending them to the QIF files")
+    parser.add_argument("-d", "--delta", action = "store_true", 
+                        help = "With --incremental, writes new records to .delta QIF files instead of appending")
+    parser.add_argument("--config-cache", dest = "configCache", metavar = "CACHE", 
+                        help = "Keeps the compiled config in the CACHE file so unchanged configs are not parsed and validated again")
+    parser.add_argument("--buffer-size", dest = "bufferSize", type = int, metavar = "CHARS", default = DEFAULT_BUFFER_SIZE,
+                        help = "Collects CHARS characters of QIF records per file before writing them (default: {})".format(DEFAULT_BUFFER_SIZE))
+    parser.add_argument("--fsync", action = "store_true",
+                        help = "Forces each QIF file to disk before it replaces the previous file")
+    parser.add_argument("--mmap", dest = "mapFile", action = "store_true",
+                        help = "Memory maps the CSV file and decodes only the columns the config uses")
+    parser.add_argument("--validate", action = "store_true",
+                        help = "Checks every row before converting, reporting all errors with their line numbers and writing nothing if any are found")
+    parser.add_argument("--engine", choices = ENGINES, default = ENGINE_ROWS,
+                        help = "Converts row by row, a block of rows at a time column by column, which is faster on large files, or row by row "
+                               "reading and writing on their own threads, which is faster on slow disks (default: {})".format(ENGINE_ROWS))
+    parser.add_argument("--resume", action = "store_true",
+                        help = "Keeps a checkpoint next to the CSV file so a failed conversion, run again with --resume, continues from its last checkpoint")
+    parser.add_argument("--checkpoint-rows", dest = "checkpointRows", type = int, metavar = "ROWS", default = DEFAULT_CHECKPOINT_ROWS,
+                        help = "Rows converted between the checkpoints of --resume (default: {})".format(DEFAULT_CHECKPOINT_ROWS))
+    parser.add_argument("--skip-bad-rows", dest = "skipBadRows", metavar = "FILE",
+                        help = "Writes CSV rows that cannot be converted to the CSV file FILE, with the reason, instead of stopping the conversion")
+    parser.add_argument("--aggregate", action = "store_true",
+                        help = "Merges the records of each day with the same action, security and QIF file into one, summing their amounts and quantities")
+    parser.add_argument("--stats", metavar = "FILE",
+                        help = "Writes conversion statistics to FILE, or - for the status messages, after the run")
+    parser.add_argument("--stats-format", dest = "statsFormat", choices = STATS_FORMATS, default = STATS_FORMAT_JSON,
+                        help = "Format of the --stats output: json or a Prometheus textfile (default: {})".format(STATS_FORMAT_JSON))
+    parser.add_argument("--profile", metavar = "FILE",
+                        help = "Runs the conversion under cProfile and tracemalloc, writing the profile to FILE and a summary to stderr")
+    parser.add_argument("--serve", metavar = "ADDRESS",
+                        help = "Runs a conversion server on a localhost TCP port, or a Unix socket path containing /, instead of converting a file")
+    parser.add_argument("--config-dir", dest = "configDir", metavar = "DIR", default = ".",
+                        help = "Directory of the config files server jobs name by id (default: the current directory)")
+    parser.add_argument("--data-dir", dest = "dataDir", metavar = "DIR", default = ".",
+                        help = "Directory server jobs read CSV files from and write templated QIF files to (default: the current directory)")
+    parser.add_argument("--watch", metavar = "DIR",
+                        help = "Converts every CSV file that lands in DIR, once, like --batch does, until stopped")
+    parser.add_argument("--watch-state", dest = "watchState", metavar = "FILE",
+                        help = "Records the CSV files --watch has converted in FILE (default: {} in DIR)".format(DEFAULT_STATE_FILE_NAME))
+    parser.add_argument("--debounce", type = float, metavar = "SECONDS", default = DEFAULT_DEBOUNCE_SECONDS,
+                        help = "Seconds a new CSV file must stay unchanged before --watch converts it (default: {})".format(DEFAULT_DEBOUNCE_SECONDS))
+    argNamespace = parser.parse_args(Args)
+
+    # With --watch the only positional argument is the config file, which argparse takes as the first positional
+    if ((argNamespace.watch is not None) and (argNamespace.cfgFile is None)):
+        argNamespace.cfgFile, argNamespace.csvFile = argNamespace.csvFile, None
+    if ((argNamespace.serve is None) and (argNamespace.cfgFile is None)):
+        parser.error(ERROR_MISSING_FILES)
+    return(argNamespace)
 
 def _csvFloatToQuickenFloat(CsvFloatText: str, ForcePositive: bool = False) -> float:
     """ General function to turn a CSV floating point string into a numeric float value. 
@@ -168,26 +580,21 @@ def _csvFloatToQuickenFloat(CsvFloatText: str, ForcePositive: bool = False) -> f
     contain additional information such as a currency symbol (e.g. $), or if the number is negative,
     a minus sign.  Sometimes accounting formats are used and negative values are found within 
     parenthesis.  This function will find and return the signed floating point number in the string.
+    The parsing itself is done by the shared MoneyParser, which caches repeated strings.
     """
+    return(_sharedMoneyParser().parse(CsvFloatText, ForcePositive))
 
-    # Somewhere in the money string should be a floating point number.  The string may contain a
-    # currency character and a negative sign or be in parenthesis (accounting format) if negative.
-    # The regex string looks for a sequence of digits followed by an option decimal point with more
-    # digits.  This covers cases when the float value is actually an integer in the string.
-    match = re.search("([\d]*\.{0,1}[\d]+)", CsvFloatText)
-    if(match == None):
-        raise Exception(ERROR_BAD_MONEY_VALUE.format(CsvFloatText))
-
-    # There should be a single match. Convert it to a float.
-    value = float(match.group())
-
-    # If the money string has a negative sign or parenthesis in it, make the value negative.  Unless
-    # the caller has specified leaving it as a positive number.
-    if(not ForcePositive):
-        match = re.search("[-()]", CsvFloatText)
-        if (match != None):
-            value = value * -1.0
-    return(value)
+def _sharedMoneyParser() -> "MoneyParser":
+    """ Returns the money string parser shared by every conversion in this process, making it on first use """
+    global _moneyParser
+    if (_moneyParser is None):
+        from MoneyParser import MoneyParser
+        _moneyParser = MoneyParser()
+    return(_moneyParser)
 
 if __name__ == "__main__":
+    # Required for worker processes when running as a PyInstaller executable
+    if (getattr(sys, "frozen", False)):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
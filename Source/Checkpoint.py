@@ -0,0 +1,244 @@
+#************
+# Imports
+#************
+import csv
+import hashlib
+import json
+import os
+import sys
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from CliDefaults import DEFAULT_CHECKPOINT_ROWS
+from CompiledConfig import CompiledConfig, RowLayout
+from ConversionErrors import ConversionError
+from MoneyParser import MoneyParser
+from QifPipeline import formatRecords, readCsvRows, routeRecords, writeRecords
+from QifWriter import STREAM_FILE_NAME, QifWriter, resumeFileName, writeFileAtomically
+
+#******************
+# Constants/Enums
+#******************
+
+# Name of the checkpoint file kept next to a CSV file
+CHECKPOINT_FILE_FORMAT = "{}.checkpoint"
+
+# Bumped whenever the layout of the checkpoint file changes.  A checkpoint of another version is ignored.
+CHECKPOINT_VERSION = 1
+
+# Header of the column added to each row written to the rejected rows file, holding the reason it was rejected
+REJECTED_ERROR_COLUMN = "CSVtoQIF Error"
+
+
+#***********
+# Classes
+#***********
+class Checkpoint:
+    """ The progress of a resumable conversion, kept in a JSON file.
+
+    Every few rows, save() passes the text written so far to each output file and records how far the CSV file has
+    been read, the records written and rows rejected so far, and the size of each output file.  A conversion that fails
+    leaves its output files under their resumable temporary names (see FileSink), and when it is run again, each file
+    is cut back to its recorded size and the CSV file is read on from the recorded offset.  Only the rows since the
+    last checkpoint are converted again, and the output is that of a conversion that never failed.
+
+    A checkpoint only applies to the CSV file, config file and QIF files it was taken for.  If the CSV file or the
+    config file has changed since, or an output file is missing or shorter than recorded (as after a power failure
+    without --fsync), the conversion starts again from the first row.  A conversion that failed on a bad row can be
+    resumed with a rejected rows file it did not have, which then starts empty.
+    """
+
+    def __init__(self, FileName: str, CsvFileName: str, CfgFileName: str, OutputNames: Sequence[str],
+                 RejectedName: Optional[str] = None, Fsync: bool = False) -> None:
+        """ Reads the checkpoint file, if there is one that applies to this conversion.
+
+        Parameters
+        ----------
+        FileName: The checkpoint file name.
+        CsvFileName: The CSV file being converted.
+        CfgFileName: The config file it is converted with.
+        OutputNames: The QIF file names, in the order their writers are given to save().
+        RejectedName: The rejected rows file name, if bad rows are set aside.
+        Fsync: When set True, the output files and the checkpoint file are forced to disk at each checkpoint.
+
+        Returns
+        -------
+        None
+        """
+        self.fileName = FileName
+        self.csvOffset = None       # Where the CSV file is read on from, as given by tell(), or None to start afresh
+        self.recordsProcessed = 0
+        self.rowsRejected = 0
+        self.outputOffsets = [ 0 ] * len(OutputNames)
+        self.rejectedOffset = 0     # 0 when the rejected rows file starts afresh, and needs its header row
+        self.__mFsync = Fsync
+        self.__mIdentity = _identity(CsvFileName, CfgFileName, OutputNames)
+        self.__mRejectedName = os.path.abspath(RejectedName) if (RejectedName is not None) else None
+        state = self.__loadState(OutputNames)
+        if (state is not None):
+            self.csvOffset = state["csvOffset"]
+            self.recordsProcessed = state["recordsProcessed"]
+            self.outputOffsets = state["outputOffsets"]
+            if (state["rejectedFile"] is not None):
+                self.rowsRejected = state["rowsRejected"]
+                self.rejectedOffset = state["rejectedOffset"]
+        return
+
+    @property
+    def resumed(self) -> bool:
+        """ True when the conversion continues from the checkpoint of a failed run """
+        return(self.csvOffset is not None)
+
+    def save(self, CsvOffset: int, RecordsProcessed: int, RowsRejected: int, FileHandles: Sequence[QifWriter],
+             Rejected: Optional[QifWriter] = None) -> None:
+        """ Records the progress of the conversion, once the text written so far is in the QIF files and the rejected
+        rows file """
+        self.outputOffsets = [ fileHandle.checkpoint() for fileHandle in FileHandles ]
+        self.rejectedOffset = Rejected.checkpoint() if (Rejected is not None) else 0
+        self.csvOffset = CsvOffset
+        self.recordsProcessed = RecordsProcessed
+        self.rowsRejected = RowsRejected
+        writeFileAtomically(self.fileName, json.dumps(dict(self.__mIdentity, version = CHECKPOINT_VERSION, csvOffset = CsvOffset,
+                                                           recordsProcessed = RecordsProcessed, outputOffsets = self.outputOffsets,
+                                                           rejectedFile = self.__mRejectedName, rowsRejected = RowsRejected,
+                                                           rejectedOffset = self.rejectedOffset), indent = 3, sort_keys = True) + "\n",
+                            self.__mFsync)
+        return
+
+    def remove(self) -> None:
+        """ Deletes the checkpoint file once the conversion is complete """
+        if (os.path.isfile(self.fileName)):
+            os.remove(self.fileName)
+        return
+
+    def __loadState(self, OutputNames: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """ Reads the checkpoint file, returning None if there is none, or it does not apply to this conversion """
+        try:
+            with open(self.fileName, "rt") as checkpointFile:
+                state = json.load(checkpointFile)
+        except FileNotFoundError:
+            return(None)
+        except ValueError:
+            return(None)
+        if ((not isinstance(state, dict)) or (state.get("version") != CHECKPOINT_VERSION) or
+            any(state.get(key) != value for key, value in self.__mIdentity.items())):
+            return(None)
+        if (state["rejectedFile"] not in (None, self.__mRejectedName)):
+            return(None)
+        outputOffsets = list(zip(OutputNames, state["outputOffsets"]))
+        if (state["rejectedFile"] is not None):
+            outputOffsets.append((state["rejectedFile"], state["rejectedOffset"]))
+        for outputName, outputOffset in outputOffsets:
+            outputFileName = resumeFileName(outputName)
+            if ((not os.path.isfile(outputFileName)) or (os.path.getsize(outputFileName) < outputOffset)):
+                return(None)
+        return(state)
+
+
+#*************
+# Functions
+#*************
+def convertCheckpointed(CsvFileName: str, FileHandles: Sequence[QifWriter], Config: CompiledConfig, Money: MoneyParser,
+                        Progress: Optional[Checkpoint] = None, Rejected: Optional[QifWriter] = None,
+                        CheckpointRows: int = DEFAULT_CHECKPOINT_ROWS) -> Tuple[int, int]:
+    """ Streams a CSV file through the read -> format -> route pipeline, taking checkpoints to resume from and setting
+    aside the rows that cannot be converted.
+
+    Parameters
+    ----------
+    CsvFileName: The CSV file name, or STREAM_FILE_NAME to read stdin when there is no Progress.
+    FileHandles: The output writers in qifFiles order.  With Progress, they must be resumable (see openOutputFiles) and
+        opened with Progress.outputOffsets.
+    Config: The compiled conversion configuration.
+    Money: Parser rendering the CSV money strings as QIF field text.
+    Progress: When set, the checkpoint the conversion resumes from, if it applies, and saves every CheckpointRows rows.
+    Rejected: When set, a row that raises a ConversionError is written to this CSV file, with the error in an added
+        REJECTED_ERROR_COLUMN, rather than failing the conversion.  With Progress, it is resumable like the QIF files,
+        and opened with Progress.rejectedOffset.
+    CheckpointRows: Rows converted between checkpoints.
+
+    Returns
+    -------
+    Tuple[int, int]: The number of CSV records written and of rows rejected, including those of a resumed run.
+    """
+    recordsProcessed = 0
+    rowsRejected = 0
+    rejected = csv.writer(Rejected, lineterminator = "\n") if (Rejected is not None) else None
+    csvFile = sys.stdin if (CsvFileName == STREAM_FILE_NAME) else open(CsvFileName, "rt")
+    try:
+        # The lines are read by readline() rather than by iterating over the file, which would disable tell()
+        header, rows = readCsvRows(iter(csvFile.readline, ""))
+        if (header is None):
+            return(0, 0)
+        layout = Config.bindHeader(header)
+
+        if ((Progress is not None) and Progress.resumed):
+            recordsProcessed = Progress.recordsProcessed
+            rowsRejected = Progress.rowsRejected
+        if ((rejected is not None) and ((Progress is None) or (Progress.rejectedOffset == 0))):
+            rejected.writerow(header + [ REJECTED_ERROR_COLUMN ])
+        if (Progress is not None):
+            # The date format is chosen from the start of the file, as in the failed run, and the CSV file is then read
+            # on from the checkpoint, or again from the first row, so tell() never counts rows read ahead
+            startOffset = Progress.csvOffset if (Progress.resumed) else csvFile.tell()
+            if (layout.dates is not None):
+                layout.dates.sampleRows(rows, layout.columns[0])
+            csvFile.seek(startOffset)
+        elif (layout.dates is not None):
+            rows = layout.dates.sampleRows(rows, layout.columns[0])
+
+        chunkRows = CheckpointRows
+        while (chunkRows == CheckpointRows):
+            if (rejected is None):
+                chunkRecords, chunkRejected = writeRecords(islice(rows, CheckpointRows), layout, FileHandles, Config, Money), 0
+            else:
+                chunkRecords, chunkRejected = _writeGoodRecords(islice(rows, CheckpointRows), layout, FileHandles, Config, Money, rejected)
+            recordsProcessed = recordsProcessed + chunkRecords
+            rowsRejected = rowsRejected + chunkRejected
+            chunkRows = chunkRecords + chunkRejected
+            if ((chunkRows == CheckpointRows) and (Progress is not None)):
+                Progress.save(csvFile.tell(), recordsProcessed, rowsRejected, FileHandles, Rejected)
+    finally:
+        if (csvFile is not sys.stdin):
+            csvFile.close()
+    return(recordsProcessed, rowsRejected)
+
+def checkpointFileName(CsvFileName: str) -> str:
+    """ Returns the name of the checkpoint file kept next to a CSV file """
+    return(CHECKPOINT_FILE_FORMAT.format(CsvFileName))
+
+def _writeGoodRecords(Rows: Iterable[Any], Layout: RowLayout, FileHandles: Sequence[QifWriter], Config: CompiledConfig,
+                      Money: MoneyParser, Rejected: Any) -> Tuple[int, int]:
+    """ Runs the format and route stages over the rows like QifPipeline.writeRecords, but writes each row raising a
+    ConversionError to the Rejected csv.writer and carries on.  Returns the records written and the rows rejected. """
+    lastRow = [ None, 0 ]       # The last row the stages took, and the number of rows they took
+    rows = _trackRows(Rows, lastRow)
+    rowsRejected = 0
+    while (True):
+        try:
+            records = formatRecords(rows, Layout.columns, Config.symbols, Money, Layout.dates)
+            for fileIndex, qifRecord in routeRecords(records, Layout.router):
+                FileHandles[fileIndex].write(qifRecord)
+            break
+        except ConversionError as error:
+            # The stages take one row at a time, so the last row taken is the one that failed.  They are started again
+            # on the rows after it.
+            Rejected.writerow(lastRow[0] + [ str(error) ])
+            rowsRejected = rowsRejected + 1
+    return(lastRow[1] - rowsRejected, rowsRejected)
+
+def _trackRows(Rows: Iterable[List[str]], LastRow: List[Any]) -> Iterator[List[str]]:
+    """ Passes the rows on, keeping the last one and the number passed on in LastRow """
+    for count, row in enumerate(Rows, 1):
+        LastRow[0] = row
+        LastRow[1] = count
+        yield row
+    return
+
+def _identity(CsvFileName: str, CfgFileName: str, OutputNames: Sequence[str]) -> Dict[str, Any]:
+    """ Returns what a checkpoint records of the files it was taken for """
+    csvStat = os.stat(CsvFileName)
+    with open(CfgFileName, "rb") as cfgFile:
+        cfgDigest = hashlib.sha256(cfgFile.read()).hexdigest()
+    return({ "csvFile": os.path.abspath(CsvFileName), "csvSize": csvStat.st_size, "csvModified": csvStat.st_mtime_ns,
+             "cfgSha256": cfgDigest, "outputs": [ os.path.abspath(outputName) for outputName in OutputNames ] })
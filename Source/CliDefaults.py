@@ -0,0 +1,47 @@
+#******************
+# Constants/Enums
+#******************
+
+# Defaults of the command line options that are shown by CSVtoQIF -h.  They live here, in a module with no imports,
+# so the command line can be built (and -h and -v answered) without loading the modules that implement the options.
+# Those modules import the defaults from here, and they can still be imported from them.
+
+# Formatted records are collected until this many characters are waiting, then written in one call.  Every output
+# file has its own buffer, so this is kept modest for configurations with many qifFiles.
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+# File name used in place of a CSV file name to read stdin, or a qifFiles name to write stdout
+STREAM_FILE_NAME = "-"
+
+# Output file name template for batch conversion.  The fields are:
+#   csvDir:     Directory of the CSV file
+#   csvStem:    CSV file name without its directory or extension
+#   qifName:    qifFiles name without its directory
+#   qifStem:    qifFiles name without its directory or extension
+#   qifDir:     Directory of the qifFiles name
+DEFAULT_OUTPUT_TEMPLATE = "{csvDir}/{csvStem}-{qifName}"
+
+# Statistics output formats
+STATS_FORMAT_JSON = "json"
+STATS_FORMAT_PROMETHEUS = "prometheus"
+STATS_FORMATS = (STATS_FORMAT_JSON, STATS_FORMAT_PROMETHEUS)
+
+# Conversion engines: the streaming row by row pipeline, the columnar engine converting blocks of rows a column
+# at a time (see ColumnarEngine), or the row by row stages with reading and writing on their own threads (see
+# ThreadedPipeline)
+ENGINE_ROWS = "rows"
+ENGINE_COLUMNAR = "columnar"
+ENGINE_THREADED = "threaded"
+ENGINES = (ENGINE_ROWS, ENGINE_COLUMNAR, ENGINE_THREADED)
+
+# Rows converted between the checkpoints of a --resume conversion.  A checkpoint flushes every output file and
+# replaces the small checkpoint file, which costs about as much as converting a few hundred rows, and a resumed
+# conversion converts at most this many rows again.
+DEFAULT_CHECKPOINT_ROWS = 100000
+
+# A new CSV file is converted once its size and modification time have not changed for this many seconds, so a
+# file still being downloaded or copied is not converted part way
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+
+# The state file recording the CSV files --watch has converted, kept in the watched directory unless named on the command line
+DEFAULT_STATE_FILE_NAME = ".CSVtoQIF-watch.json"
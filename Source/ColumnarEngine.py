@@ -0,0 +1,136 @@
+#************
+# Imports
+#************
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Callable, Iterable, List, Sequence
+
+from CompiledConfig import CompiledConfig, RowLayout
+from MoneyParser import MoneyParser
+from QifPipeline import QIF_RECORD_FORMAT, formatRecords, routeRecords
+from QifWriter import QifWriter
+
+#******************
+# Constants/Enums
+#******************
+
+# Rows converted per block.  Every block costs a few calls per column, so blocks must not be too small, but the rows
+# of a block are all alive at once, and large blocks make the cyclic garbage collector scan them over and over: a
+# block of 65536 rows made the engine slower than the row by row pipeline.
+COLUMNAR_BLOCK_ROWS = 1024
+
+# A column is rendered value by value rather than through a table of its distinct values when more than
+# 1 / DISTINCT_RENDER_RATIO of its values are distinct
+DISTINCT_RENDER_RATIO = 2
+
+# Exception strings raised by this file
+ERROR_NO_OUTPUT_FILE = "No qifFiles entry matches routing value {}"
+
+
+#*************
+# Functions
+#*************
+def convertColumnar(Rows: Iterable[Any], Layout: RowLayout, FileHandles: Sequence[QifWriter], Config: CompiledConfig,
+                    Money: MoneyParser, BlockRows: int = COLUMNAR_BLOCK_ROWS) -> int:
+    """ Converts CSV rows a block at a time, working on whole columns rather than on one row at a time.
+
+    Each block of rows is split into the columns the configuration uses.  The money columns are rendered once per
+    distinct string in the block, with the currency decoration of the whole column removed at once (see
+    MoneyParser.formatValues).  The action lines come from the symbol table of the configuration (see
+    RecordSymbols), and the qifFiles rules are evaluated once per distinct routing value.  Every row then only costs C level
+    lookups and the record formatting, and each output file gets one write per block.  The output is byte for byte
+    that of the row by row pipeline (see QifPipeline.formatRecords and routeRecords).
+
+    A block holding a short row, an unknown action, a money string that cannot be parsed or a record no qifFiles
+    entry matches is converted by the row by row pipeline instead, which raises the same error at the same row.
+
+    Parameters
+    ----------
+    Rows: CSV rows from the reader stage.
+    Layout: The row layout of the CSV file.
+    FileHandles: The output writers in qifFiles order.  qifFiles entries sharing a writer share its records of a block.
+    Config: The compiled conversion configuration.
+    Money: Parser rendering the CSV money strings as QIF field text.
+    BlockRows: Rows converted per block.
+
+    Returns
+    -------
+    int: The number of CSV records written.
+    """
+    # One list of records per distinct writer, so the records of qifFiles entries sharing a writer keep their row order
+    writerSlots = {}
+    writers = []
+    for fileHandle in FileHandles:
+        if (id(fileHandle) not in writerSlots):
+            writerSlots[id(fileHandle)] = len(writers)
+            writers.append(fileHandle)
+    fileSlots = [ writerSlots[id(fileHandle)] for fileHandle in FileHandles ]
+
+    recordsProcessed = 0
+    rows = iter(Rows)
+    block = list(islice(rows, BlockRows))
+    while (block):
+        try:
+            outputs = _convertBlock(block, Layout, Config, Money, fileSlots, len(writers))
+        except Exception:
+            for fileIndex, qifRecord in routeRecords(formatRecords(block, Layout.columns, Config.symbols, Money, Layout.dates), Layout.router):
+                FileHandles[fileIndex].write(qifRecord)
+        else:
+            for slot, qifRecords in enumerate(outputs):
+                if (qifRecords):
+                    writers[slot].write("".join(qifRecords))
+        recordsProcessed = recordsProcessed + len(block)
+        block = list(islice(rows, BlockRows))
+    return(recordsProcessed)
+
+def _convertBlock(Block: List[Any], Layout: RowLayout, Config: CompiledConfig, Money: MoneyParser, FileSlots: Sequence[int],
+                  SlotCount: int) -> List[List[str]]:
+    """ Converts a block of rows, returning the QIF records of each of SlotCount writers in row order.  FileSlots gives
+    the writer of each qifFiles entry. """
+    # Take the money columns, rendered through a table of their distinct values, out of the block.  The action lines
+    # come from the configuration's symbol table, which outlives the block, and the security and memo fields, and the
+    # dates unless they are normalized, are copied as they are, so those fields are read from the rows as the records
+    # are formatted.  A short row raises IndexError.
+    dateColumn, actionColumn, securityColumn, priceColumn, valueColumn, quantityColumn, memoColumn = Layout.columns
+    prices, values, quantities = [ list(map(itemgetter(column), Block)) for column in (priceColumn, valueColumn, quantityColumn) ]
+    dates = map(itemgetter(dateColumn), Block)
+    if (Layout.dates is not None):
+        dates = _lookup(list(dates), lambda distinct: list(map(Layout.dates.formatDate, distinct)))
+    records = map(QIF_RECORD_FORMAT.format,
+                  dates,                                                                                    # D
+                  map(Config.symbols.action.lookup, map(itemgetter(actionColumn), Block)),                  # N
+                  map(itemgetter(securityColumn), Block),                                                   # Y
+                  _lookup(prices, Money.formatPrices),                                                      # I
+                  _lookup(values, Money.formatValues),                                                      # T
+                  _lookup(quantities, Money.formatQuantities),                                              # Q
+                  map(itemgetter(memoColumn), Block))                                                       # M
+
+    # Route each distinct routing value once.  The bound router takes any row indexable by the routing column
+    # positions, so it is given a dictionary of just those fields.
+    routingColumns = Layout.router.columns
+    if (len(routingColumns) == 1):
+        routingKeys = list(map(itemgetter(routingColumns[0]), Block))
+    else:
+        routingKeys = list(map(itemgetter(*routingColumns), Block)) if (routingColumns) else ([ () ] * len(Block))
+    outputs = [ [] for _ in range(SlotCount) ]
+    appends = {}
+    for key in dict.fromkeys(routingKeys):
+        fileIndex = Layout.router.route(dict(zip(routingColumns, key if (len(routingColumns) != 1) else (key,))))
+        if (fileIndex is None):
+            raise Exception(ERROR_NO_OUTPUT_FILE.format(key))
+        appends[key] = outputs[FileSlots[fileIndex]].append
+
+    # Hand each record to its output file's list.  This is the only Python loop run per row.
+    for append, qifRecord in zip(map(appends.__getitem__, routingKeys), records):
+        append(qifRecord)
+    return(outputs)
+
+def _lookup(Values: List[str], Render: Callable[[List[str]], List[str]]) -> Iterable[str]:
+    """ Renders a column, passing its distinct values to Render once and looking the results up for every row.  A
+    column of mostly distinct values, such as the amounts of a large statement, is rendered whole instead, since
+    looking its few repeats up costs more than rendering them again. """
+    distinct = list(dict.fromkeys(Values))
+    if ((len(distinct) * DISTINCT_RENDER_RATIO) > len(Values)):
+        return(Render(Values))
+    table = dict(zip(distinct, Render(distinct)))
+    return(map(table.__getitem__, Values))
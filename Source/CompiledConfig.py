@@ -0,0 +1,318 @@
+#************
+# Imports
+#************
+import json
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+from ConversionErrors import ConfigError, CsvFormatError
+from QifRouter import QifRouter
+from SymbolTable import RecordSymbols
+from QifWriter import BYTES_PER_MEGABYTE, SINK_FILE, SINK_MEMORY, SINKS, SinkSpec
+
+if (TYPE_CHECKING):
+    from DateParser import DateParser
+
+#******************
+# Constants/Enums
+#******************
+
+# JSON config file object name strings
+JSON_OBJECT_INPUT_FILE = "csvFile"
+JSON_OBJECT_INPUT_FILE_HEADERS = "headerRowMap"
+JSON_OBJECT_INPUT_FILE_ACTIONS = "actionCodeMap"
+JSON_OBJECT_OUTPUT_FILES = "qifFiles"
+
+# Key names from the Input File object header object
+JSON_KEY_HEADER_DATE = "dateColumn"
+JSON_KEY_HEADER_ACTION = "actionColumn"
+JSON_KEY_HEADER_SECURITY = "securityColumn"
+JSON_KEY_HEADER_PRICE = "priceColumn"
+JSON_KEY_HEADER_QUANTITY = "quantityColumn"
+JSON_KEY_HEADER_VALUE = "valueColumn"
+JSON_KEY_HEADER_MEMO = "memoColumn"
+
+# Key name from the Input File object giving the format of the CSV dates
+JSON_KEY_INPUT_FILE_DATE_FORMAT = "dateFormat"
+
+# Key name from the output file objects
+JSON_KEY_OUTPUT_FILE_NAME = "name"
+JSON_KEY_OUTPUT_FILE_MATCH_COLUMN = "matchColumn"
+JSON_KEY_OUTPUT_FILE_MATCH_REGEX = "matchRegEx"
+JSON_KEY_OUTPUT_FILE_SINK = "sink"
+JSON_KEY_OUTPUT_FILE_SPLIT_MEGABYTES = "splitMegabytes"
+JSON_KEY_OUTPUT_FILE_SPLIT_RECORDS = "splitRecords"
+
+# headerRowMap keys in the order the conversion pipeline takes its columns: the fields of a QIF record
+# D, N, Y, I, T and Q, then M
+HEADER_KEYS = (JSON_KEY_HEADER_DATE, JSON_KEY_HEADER_ACTION, JSON_KEY_HEADER_SECURITY, JSON_KEY_HEADER_PRICE,
+               JSON_KEY_HEADER_VALUE, JSON_KEY_HEADER_QUANTITY, JSON_KEY_HEADER_MEMO)
+
+# Keys every qifFiles entry must have
+OUTPUT_FILE_KEYS = (JSON_KEY_OUTPUT_FILE_NAME, JSON_KEY_OUTPUT_FILE_MATCH_COLUMN, JSON_KEY_OUTPUT_FILE_MATCH_REGEX)
+
+# Bumped whenever the layout of CompiledConfig changes, so stale cache entries are ignored
+CONFIG_CACHE_VERSION = 4
+
+# Exception strings raised by this file
+ERROR_CONFIG_NOT_JSON = "Config file '{}' is not valid JSON: {}"
+ERROR_CONFIG_BAD_OBJECT = "Config file '{}' must have a '{}' {}"
+ERROR_CONFIG_MISSING_HEADER_KEYS = "Config file '{}' headerRowMap is missing {}"
+ERROR_CONFIG_BAD_HEADER_VALUE = "Config file '{}' headerRowMap '{}' must name a CSV column"
+ERROR_CONFIG_BAD_ACTION_VALUE = "Config file '{}' actionCodeMap '{}' must be a string"
+ERROR_CONFIG_BAD_OUTPUT_FILE = "Config file '{}' qifFiles entry {} must have a string '{}'"
+ERROR_CONFIG_DATE_FORMAT_TYPE = "Config file '{}' csvFile 'dateFormat' must be a string"
+ERROR_CONFIG_BAD_DATE_FORMAT = "Config file '{}' csvFile 'dateFormat' is invalid: {}"
+ERROR_CONFIG_BAD_SINK = "Config file '{}' qifFiles entry {} 'sink' must be one of {}"
+ERROR_CONFIG_BAD_SPLIT = "Config file '{}' qifFiles entry {} '{}' must be a positive number"
+ERROR_CONFIG_SPLIT_MEMORY = "Config file '{}' qifFiles entry {} cannot split a memory sink"
+ERROR_CSV_MISSING_COLUMNS = "CSV file is missing the column(s) {} named in config file '{}'"
+
+
+#***********
+# Classes
+#***********
+class CompiledConfig:
+    """ A validated, ready to use conversion configuration.
+
+    The JSON configuration is checked once when it is loaded, with an error naming every missing or malformed entry,
+    rather than failing with a KeyError part way through a file.  The compiled form holds everything the conversion
+    loop needs: the CSV column for each QIF field, the inverted actionCodeMap, the precompiled routing rules and the
+    symbol tables rendering the QIF lines of repeated values (see RecordSymbols).  The JSON objects themselves are
+    never modified.
+
+    A compiled configuration can be cached in a file (see load()).  A cached configuration is reused without
+    reading, parsing or validating the JSON again.  Note that Python recompiles regular expressions when they are
+    unpickled, so the cache does not save that part of the work.
+    """
+
+    __slots__ = ("sourceName", "columns", "actionDict", "symbols", "dateFormat", "qifNames", "qifSinks", "router")
+
+    def __init__(self, JsonCfg: Any, SourceName: str = "<config>") -> None:
+        """ Validates and compiles a JSON configuration.
+
+        Parameters
+        ----------
+        JsonCfg: The parsed JSON configuration.
+        SourceName: Name of the configuration used in error messages, normally the config file name.
+
+        Returns
+        -------
+        None
+        """
+        self.sourceName = SourceName
+
+        # Check the object structure first so the detailed checks below can index freely
+        inputFile = self.__checkObject(JsonCfg, JSON_OBJECT_INPUT_FILE, dict)
+        headerMap = self.__checkObject(inputFile, JSON_OBJECT_INPUT_FILE_HEADERS, dict)
+        actionMap = self.__checkObject(inputFile, JSON_OBJECT_INPUT_FILE_ACTIONS, dict)
+        outputFiles = self.__checkObject(JsonCfg, JSON_OBJECT_OUTPUT_FILES, list)
+
+        # Every QIF field needs a CSV column.  Report all the missing keys at once.
+        missingKeys = [ key for key in HEADER_KEYS if key not in headerMap ]
+        if (missingKeys):
+            raise ConfigError(ERROR_CONFIG_MISSING_HEADER_KEYS.format(SourceName, ", ".join("'{}'".format(key) for key in missingKeys)))
+        for key in HEADER_KEYS:
+            if ((not isinstance(headerMap[key], str)) or (not headerMap[key])):
+                raise ConfigError(ERROR_CONFIG_BAD_HEADER_VALUE.format(SourceName, key))
+        self.columns = [ headerMap[key] for key in HEADER_KEYS ]
+
+        # Convert the JSON action code map into a dictionary of Quicken codes (reverse the positions of the key-value pairs).
+        # Only non-empty text entries from the JSON file are in the dictionary.  Keys are converted to CAPS to prevent case dependent search failures.
+        self.actionDict = {}
+        for quickenAction, csvAction in actionMap.items():
+            if (not isinstance(csvAction, str)):
+                raise ConfigError(ERROR_CONFIG_BAD_ACTION_VALUE.format(SourceName, quickenAction))
+            if (csvAction):
+                self.actionDict[csvAction.upper()] = quickenAction
+        self.symbols = RecordSymbols(self.actionDict)
+
+        # Dates are copied as they are unless the configuration gives their format.  The format is checked here, but
+        # DateParser is only imported by configurations that use it.
+        self.dateFormat = inputFile.get(JSON_KEY_INPUT_FILE_DATE_FORMAT)
+        if (self.dateFormat is not None):
+            from DateParser import DATE_FORMAT_AUTO, compileDateFormat
+            if (not isinstance(self.dateFormat, str)):
+                raise ConfigError(ERROR_CONFIG_DATE_FORMAT_TYPE.format(SourceName))
+            if (self.dateFormat != DATE_FORMAT_AUTO):
+                try:
+                    compileDateFormat(self.dateFormat)
+                except ConfigError as err:
+                    raise ConfigError(ERROR_CONFIG_BAD_DATE_FORMAT.format(SourceName, err))
+
+        for fileIndex, fileDesc in enumerate(outputFiles):
+            for key in OUTPUT_FILE_KEYS:
+                if ((not isinstance(fileDesc, dict)) or (not isinstance(fileDesc.get(key), str))):
+                    raise ConfigError(ERROR_CONFIG_BAD_OUTPUT_FILE.format(SourceName, fileIndex, key))
+        self.qifNames = [ fileDesc[JSON_KEY_OUTPUT_FILE_NAME] for fileDesc in outputFiles ]
+        self.qifSinks = [ self.__compileSink(fileIndex, fileDesc) for fileIndex, fileDesc in enumerate(outputFiles) ]
+        self.router = QifRouter(outputFiles)
+        return
+
+    @property
+    def routingColumns(self) -> List[str]:
+        """ The distinct CSV columns tested by the qifFiles rules """
+        return(self.router.columns)
+
+    def bindHeader(self, Header: Sequence[str]) -> "RowLayout":
+        """ Builds the positional row layout for a CSV file with the given header row.
+
+        Parameters
+        ----------
+        Header: The CSV header row.
+
+        Returns
+        -------
+        RowLayout: The column positions, routing rules and date parser for rows of that CSV file.  A parser detecting
+            the date format has yet to choose it (see DateParser.sampleRows).
+        """
+        positions = self.resolveColumns(Header)
+        dates = None
+        if (self.dateFormat is not None):
+            from DateParser import DateParser
+            dates = DateParser(self.dateFormat)
+        return(RowLayout([ positions[column] for column in self.columns ], self.router.bind(positions), dates))
+
+    def resolveColumns(self, Header: Sequence[str]) -> Dict[str, int]:
+        """ Maps every CSV column the configuration refers to onto its position in a CSV header row.
+
+        Parameters
+        ----------
+        Header: The CSV header row.
+
+        Returns
+        -------
+        Dict[str, int]: Column name to column index, for the headerRowMap columns and the qifFiles matchColumns.
+            When a name appears more than once in the header, the last one is used, as csv.DictReader would.
+        """
+        positions = { name: index for index, name in enumerate(Header) }
+        referenced = list(dict.fromkeys(self.columns + self.routingColumns))
+        missing = [ name for name in referenced if name not in positions ]
+        if (missing):
+            raise CsvFormatError(ERROR_CSV_MISSING_COLUMNS.format(", ".join("'{}'".format(name) for name in missing), self.sourceName))
+        return({ name: positions[name] for name in referenced })
+
+    @classmethod
+    def load(cls, CfgFileName: str, CacheFileName: Optional[str] = None) -> "CompiledConfig":
+        """ Loads and compiles a JSON configuration file, optionally through a cache file.
+
+        Parameters
+        ----------
+        CfgFileName: The JSON configuration file.
+        CacheFileName: Optional cache file.  One cache file can hold any number of configurations, keyed by their
+            absolute path.  An entry is reused while the config file's modification time and size are unchanged,
+            or when its contents still hash to the same value.  Otherwise the file is compiled and the entry replaced.
+
+        Returns
+        -------
+        CompiledConfig: The compiled configuration.
+        """
+        if (CacheFileName is None):
+            with open(CfgFileName, "rb") as cfgFile:
+                return(cls(_parseJson(cfgFile.read(), CfgFileName), CfgFileName))
+
+        # hashlib is imported here so configs loaded without a cache do not pay for it
+        import hashlib
+        cfgPath = os.path.abspath(CfgFileName)
+        cfgStat = os.stat(cfgPath)
+        cache = _readCache(CacheFileName)
+        entry = cache.get(cfgPath)
+        if ((entry is not None) and (entry["mtime"] == cfgStat.st_mtime_ns) and (entry["size"] == cfgStat.st_size)):
+            return(entry["config"])
+
+        with open(CfgFileName, "rb") as cfgFile:
+            content = cfgFile.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if ((entry is not None) and (entry["sha256"] == digest)):
+            config = entry["config"]
+        else:
+            config = cls(_parseJson(content, CfgFileName), CfgFileName)
+        cache[cfgPath] = { "mtime": cfgStat.st_mtime_ns, "size": cfgStat.st_size, "sha256": digest, "config": config }
+        _writeCache(CacheFileName, cache)
+        return(config)
+
+    def __compileSink(self, FileIndex: int, FileDesc: Dict[str, Any]) -> SinkSpec:
+        """ Checks the optional sink and split keys of a qifFiles entry and returns its sink specification """
+        sink = FileDesc.get(JSON_KEY_OUTPUT_FILE_SINK, SINK_FILE)
+        if (sink not in SINKS):
+            raise ConfigError(ERROR_CONFIG_BAD_SINK.format(self.sourceName, FileIndex, ", ".join(SINKS)))
+        splits = {}
+        for key, numberType in ((JSON_KEY_OUTPUT_FILE_SPLIT_MEGABYTES, (int, float)), (JSON_KEY_OUTPUT_FILE_SPLIT_RECORDS, int)):
+            value = FileDesc.get(key)
+            if (value is not None):
+                if (isinstance(value, bool) or (not isinstance(value, numberType)) or (value <= 0)):
+                    raise ConfigError(ERROR_CONFIG_BAD_SPLIT.format(self.sourceName, FileIndex, key))
+                splits[key] = value
+        if ((sink == SINK_MEMORY) and splits):
+            raise ConfigError(ERROR_CONFIG_SPLIT_MEMORY.format(self.sourceName, FileIndex))
+        splitMegabytes = splits.get(JSON_KEY_OUTPUT_FILE_SPLIT_MEGABYTES)
+        return(SinkSpec(sink, max(int(splitMegabytes * BYTES_PER_MEGABYTE), 1) if (splitMegabytes is not None) else None,
+                        splits.get(JSON_KEY_OUTPUT_FILE_SPLIT_RECORDS)))
+
+    def __checkObject(self, Parent: Any, Key: str, Type: type) -> Any:
+        """ Returns Parent[Key] after checking it exists and has the expected JSON type """
+        value = Parent.get(Key) if isinstance(Parent, dict) else None
+        if (not isinstance(value, Type)):
+            raise ConfigError(ERROR_CONFIG_BAD_OBJECT.format(self.sourceName, Key, "array" if (Type is list) else "object"))
+        return(value)
+
+
+class RowLayout:
+    """ The configured columns of one CSV file, resolved to positions in its rows.
+
+    Rows are read as plain lists from csv.reader rather than as dictionaries from csv.DictReader, which saves a
+    dictionary per row and turns every column lookup into a list index.
+    """
+
+    __slots__ = ("columns", "router", "dates")
+
+    def __init__(self, Columns: List[int], Router: QifRouter, Dates: Optional["DateParser"] = None) -> None:
+        """ Stores the layout.
+
+        Parameters
+        ----------
+        Columns: Row indexes of the date, action, security, price, value, quantity and memo columns, in that order.
+        Router: The qifFiles routing rules, bound to row indexes.
+        Dates: Parser normalizing the dates of the file, or None to copy them as they are.
+
+        Returns
+        -------
+        None
+        """
+        self.columns = Columns
+        self.router = Router
+        self.dates = Dates
+        return
+
+
+#*************
+# Functions
+#*************
+def _parseJson(Content: bytes, CfgFileName: str) -> Any:
+    """ Parses the contents of a JSON configuration file, raising ConfigError if it is not JSON """
+    try:
+        return(json.loads(Content))
+    except ValueError as err:
+        raise ConfigError(ERROR_CONFIG_NOT_JSON.format(CfgFileName, err))
+
+def _readCache(CacheFileName: str) -> Dict[str, Any]:
+    """ Reads a config cache file.  A missing, unreadable or out of date cache is treated as empty. """
+    # pickle is imported here so configs loaded without a cache do not pay for it
+    import pickle
+    try:
+        with open(CacheFileName, "rb") as cacheFile:
+            cache = pickle.load(cacheFile)
+        if ((not isinstance(cache, dict)) or (cache.get("version") != CONFIG_CACHE_VERSION)):
+            return({})
+        return(cache["entries"])
+    except Exception:
+        return({})
+
+def _writeCache(CacheFileName: str, Entries: Dict[str, Any]) -> None:
+    """ Writes a config cache file through a temporary file so a reader never sees a partial cache """
+    import pickle
+    tempFileName = "{}.{}.tmp".format(CacheFileName, os.getpid())
+    with open(tempFileName, "wb") as cacheFile:
+        pickle.dump({ "version": CONFIG_CACHE_VERSION, "entries": Entries }, cacheFile, pickle.HIGHEST_PROTOCOL)
+    os.replace(tempFileName, CacheFileName)
+    return
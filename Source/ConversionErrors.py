@@ -0,0 +1,41 @@
+#***********
+# Classes
+#***********
+#
+# Exceptions raised by the conversion modules.  Each is a plain Exception subclass carrying the same message the
+# command line prints, so the command line handles them like any other error, while programs using the converter as a
+# library (see QifConverter) can tell a bad configuration from a bad CSV row.  This module has no imports, so it
+# costs nothing at startup.
+#
+class ConversionError(Exception):
+    """ Base class of every error raised converting CSV files to QIF """
+
+
+class ConfigError(ConversionError):
+    """ The JSON configuration is invalid: a missing or malformed entry, or a matchRegEx that does not compile """
+
+
+class CsvFormatError(ConversionError):
+    """ The CSV file does not fit the configuration: a configured column is missing from its header, or a record has
+    fewer fields than the header """
+
+
+class UnknownActionError(ConversionError):
+    """ A CSV record's action is not in the actionCodeMap """
+
+
+class MoneyFormatError(ConversionError):
+    """ A CSV record's price, value or quantity cannot be read as a number """
+
+
+class RoutingError(ConversionError):
+    """ No qifFiles entry matches a CSV record """
+
+
+class DateFormatError(ConversionError):
+    """ A CSV record's date cannot be read with the configured dateFormat """
+
+
+class OutputConfigError(ConversionError):
+    """ A QIF output cannot be written the way it is configured: a split or resumable output that is not a regular
+    file, or the zstd sink without the zstandard package """
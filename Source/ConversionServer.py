@@ -0,0 +1,439 @@
+#************
+# Imports
+#************
+import http.server
+import json
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from typing import Any, Dict, NamedTuple, Optional, TextIO, Tuple
+
+from BatchConverter import makeOutputNames
+from CompiledConfig import CompiledConfig
+from MoneyParser import MoneyParser
+from QifPipeline import STREAM_FILE_NAME, abortOutputFiles, closeOutputFiles, convertCsvFile, convertCsvText, openOutputFiles
+from QifWriter import DEFAULT_BUFFER_SIZE
+
+#******************
+# Constants/Enums
+#******************
+
+# TCP servers only listen on the loopback interface
+SERVER_HOST = "127.0.0.1"
+
+# Jobs accepted per worker process, running or waiting, before further jobs are turned away as busy
+SERVER_QUEUE_PER_WORKER = 4
+
+# Largest request body accepted, which bounds the size of a CSV statement sent as csvText
+MAX_REQUEST_BYTES = 256 * 1024 * 1024
+
+# Request paths
+CONVERT_PATH = "/convert"
+STATUS_PATH = "/status"
+
+# Job object key names
+JOB_KEY_CONFIG = "config"
+JOB_KEY_CSV_FILE = "csvFile"
+JOB_KEY_CSV_TEXT = "csvText"
+JOB_KEY_OUTPUT_TEMPLATE = "outputTemplate"
+
+# A config id names a JSON file in the config directory: config "Roth401k" is the file Roth401k.json
+CONFIG_FILE_EXTENSION = ".json"
+_CONFIG_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+# Exception strings raised by this file
+ERROR_BAD_ADDRESS = "Server address '{}' must be a TCP port number or a Unix socket path containing '/'"
+ERROR_SOCKET_IN_USE = "Unix socket '{}' is in use by another server"
+ERROR_BAD_CONFIG_DIR = "Config directory '{}' does not exist"
+ERROR_BAD_DATA_DIR = "Data directory '{}' does not exist"
+ERROR_BAD_JOB = "A job must be a JSON object"
+ERROR_BAD_JOB_KEY = "Job '{}' must be a string"
+ERROR_BAD_CONFIG_ID = "Job config '{}' must be the name of a config file in the config directory, without {}"
+ERROR_JOB_NEEDS_ONE_CSV = "A job must have exactly one of '{}' or '{}'".format(JOB_KEY_CSV_FILE, JOB_KEY_CSV_TEXT)
+ERROR_TEMPLATE_NEEDS_CSV_FILE = "'{}' requires '{}'".format(JOB_KEY_OUTPUT_TEMPLATE, JOB_KEY_CSV_FILE)
+ERROR_JOB_USES_STREAM = "A server job cannot read stdin or write stdout"
+ERROR_OUTSIDE_DATA_DIR = "Job file '{}' is outside the server's data directory"
+ERROR_UNKNOWN_CONFIG = "Unknown config '{}'"
+ERROR_NOT_FOUND = "Unknown request path '{}'"
+ERROR_REQUEST_TOO_LARGE = "Request body is larger than {} bytes"
+ERROR_BAD_CONTENT_LENGTH = "Content-Length '{}' is not a number of bytes"
+ERROR_SERVER_BUSY = "Server is busy, {} jobs are already running or waiting"
+
+# A worker's directories, output settings, compiled configs by file name and money parser (see _initWorker).  The
+# configs and the parser's caches outlive each job, which is why the server keeps a pool of workers at all.
+_workerState = None
+
+
+#***********
+# Classes
+#***********
+class JobResult(NamedTuple):
+    """ Outcome of one server job """
+    recordsProcessed: int
+    error: Optional[str]
+
+
+class ConversionServer:
+    """ Resident conversion server taking convert jobs over HTTP.
+
+    Each CSVtoQIF run pays for starting Python (and for the one-file executable, unpacking itself), then loading and
+    compiling its config.  The server is started once and converts any number of jobs, each sent as a JSON object in
+    a POST to /convert:
+
+        { "config": "Roth401k", "csvFile": "/data/statement.csv" }
+
+    A job names a config file in the server's config directory by its id (the file name without .json), and gives the
+    CSV either as a file path (csvFile) or as the CSV text itself (csvText).  The QIF files are written to the config's
+    qifFiles names, or for a csvFile job, to the names built by an optional batch style outputTemplate.  A client only
+    names files inside the server's data directory: csvFile paths are taken relative to it, and a csvFile or
+    outputTemplate name that leads outside it, through .., an absolute path or a symbolic link, fails the job.  The
+    qifFiles names come from the server's own configs and are used as they are.
+
+    Jobs run in a fixed pool of worker processes, so CPU bound conversions run in parallel and at most Jobs of them run
+    at once.  Each worker keeps its compiled configs (with the routing rules and their memoized results) and its money
+    parser caches from job to job.  A config is compiled again when its file changes.  Requests are accepted on a
+    thread each, and a request arriving when SERVER_QUEUE_PER_WORKER jobs per worker are already running or waiting is
+    turned away with 503 rather than queued without bound.
+    """
+
+    def __init__(self, Address: str, ConfigDir: str, Jobs: int = 1, BufferSize: int = DEFAULT_BUFFER_SIZE,
+                 Fsync: bool = False, MapFile: bool = False, MessageStream: Optional[TextIO] = None, DataDir: str = ".") -> None:
+        """ Starts the worker pool and binds the server address.  Jobs are accepted once serveForever() is called.
+
+        Parameters
+        ----------
+        Address: A TCP port number on the loopback interface (0 picks a free port), or a Unix socket path containing '/'.
+        ConfigDir: The directory holding the config files jobs name.
+        Jobs: Number of worker processes.
+        BufferSize: Number of characters each QIF writer collects before writing them to its file.
+        Fsync: When set True, each QIF file is forced to disk before it is moved into place.
+        MapFile: When set True, csvFile jobs are read through a memory map (see MappedCsvReader).
+        MessageStream: Where a line is printed for each job.  None prints nothing.
+        DataDir: The directory holding every CSV file jobs read and QIF file their output templates name.
+
+        Returns
+        -------
+        None
+        """
+        if (not os.path.isdir(ConfigDir)):
+            raise Exception(ERROR_BAD_CONFIG_DIR.format(ConfigDir))
+        if (not os.path.isdir(DataDir)):
+            raise Exception(ERROR_BAD_DATA_DIR.format(DataDir))
+        self.configDir = ConfigDir
+        self.dataDir = os.path.realpath(DataDir)
+        self.jobs = Jobs
+        self.completedJobs = 0
+        self.failedJobs = 0
+        self.recordsProcessed = 0
+        self.__mMessageStream = MessageStream
+        self.__mLock = threading.Lock()
+        self.__mPendingJobs = 0
+        self.__mSocketPath = None
+
+        # The workers are started before any server thread, so they are not forked from a process with threads running
+        self.__mPool = multiprocessing.Pool(Jobs, initializer = _initWorker, initargs = (ConfigDir, self.dataDir, BufferSize, Fsync, MapFile))
+        try:
+            if ("/" in Address):
+                _removeStaleSocket(Address)
+                self.__mServer = _UnixHTTPServer(Address, _RequestHandler)
+                self.__mSocketPath = Address
+            elif (Address.isdigit()):
+                self.__mServer = http.server.ThreadingHTTPServer((SERVER_HOST, int(Address)), _RequestHandler)
+            else:
+                raise Exception(ERROR_BAD_ADDRESS.format(Address))
+        except BaseException:
+            self.__mPool.terminate()
+            self.__mPool.join()
+            raise
+        self.__mServer.conversionServer = self
+        return
+
+    @property
+    def address(self) -> str:
+        """ The address jobs are sent to: the Unix socket path, or host:port """
+        if (self.__mSocketPath is not None):
+            return(self.__mSocketPath)
+        return("{}:{}".format(*self.__mServer.server_address[:2]))
+
+    def serveForever(self) -> None:
+        """ Accepts requests until shutdown() is called from another thread, or the process is interrupted """
+        self.__mServer.serve_forever()
+        return
+
+    def shutdown(self) -> None:
+        """ Stops serveForever() from another thread """
+        self.__mServer.shutdown()
+        return
+
+    def close(self) -> None:
+        """ Closes the server address and stops the worker processes """
+        self.__mServer.server_close()
+        if (self.__mSocketPath is not None) and os.path.exists(self.__mSocketPath):
+            os.remove(self.__mSocketPath)
+        self.__mPool.terminate()
+        self.__mPool.join()
+        return
+
+    def status(self) -> Dict[str, int]:
+        """ Returns the job counters reported at /status """
+        with self.__mLock:
+            return({ "workers": self.jobs, "pendingJobs": self.__mPendingJobs, "completedJobs": self.completedJobs,
+                     "failedJobs": self.failedJobs, "recordsProcessed": self.recordsProcessed })
+
+    def runJob(self, Job: Any) -> Tuple[int, Dict[str, Any]]:
+        """ Runs one convert job in the worker pool.
+
+        Parameters
+        ----------
+        Job: The job object decoded from the request body.
+
+        Returns
+        -------
+        Tuple[int, Dict[str, Any]]: The HTTP status and the response object: the number of records converted, or an error.
+        """
+        error = _checkJob(Job)
+        if (error is not None):
+            return(400, { "error": error })
+        source = Job.get(JOB_KEY_CSV_FILE, "<csvText>")
+        if (JOB_KEY_CSV_FILE in Job):
+            csvFile = _confinedPath(self.dataDir, Job[JOB_KEY_CSV_FILE])
+            if (csvFile is None):
+                return(400, { "error": ERROR_OUTSIDE_DATA_DIR.format(Job[JOB_KEY_CSV_FILE]) })
+            Job = dict(Job, **{ JOB_KEY_CSV_FILE: csvFile })
+
+        with self.__mLock:
+            if (self.__mPendingJobs >= self.jobs * SERVER_QUEUE_PER_WORKER):
+                return(503, { "error": ERROR_SERVER_BUSY.format(self.__mPendingJobs) })
+            self.__mPendingJobs = self.__mPendingJobs + 1
+        try:
+            result = self.__mPool.apply(_runJob, (Job,))
+        finally:
+            with self.__mLock:
+                self.__mPendingJobs = self.__mPendingJobs - 1
+
+        with self.__mLock:
+            if (result.error is None):
+                self.completedJobs = self.completedJobs + 1
+                self.recordsProcessed = self.recordsProcessed + result.recordsProcessed
+            else:
+                self.failedJobs = self.failedJobs + 1
+        if (result.error is not None):
+            self.__printMessage("{} ({}): FAILED: {}".format(source, Job[JOB_KEY_CONFIG], result.error))
+            return(422, { "error": result.error })
+        self.__printMessage("{} ({}): {} CSV records processed".format(source, Job[JOB_KEY_CONFIG], result.recordsProcessed))
+        return(200, { "records": result.recordsProcessed })
+
+    def __printMessage(self, Message: str) -> None:
+        """ Prints a status line, if the server was given a message stream """
+        if (self.__mMessageStream is not None):
+            print(Message, file = self.__mMessageStream, flush = True)
+        return
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ HTTP server listening on a Unix socket, handling each request on its own thread """
+    daemon_threads = True
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Handles the HTTP requests of a ConversionServer """
+
+    # Keep connections open between requests, so a client can send many jobs over one connection
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        """ Reports the server status """
+        if (self.path != STATUS_PATH):
+            self.__sendJson(404, { "error": ERROR_NOT_FOUND.format(self.path) })
+            return
+        self.__sendJson(200, self.server.conversionServer.status())
+        return
+
+    def do_POST(self) -> None:
+        """ Runs a convert job """
+        lengthText = self.headers.get("Content-Length", "0")
+        if (not (lengthText.isascii() and lengthText.isdigit())):
+            # The end of the body cannot be found, so the connection cannot be used for another request
+            self.close_connection = True
+            self.__sendJson(400, { "error": ERROR_BAD_CONTENT_LENGTH.format(lengthText) })
+            return
+        length = int(lengthText)
+        if (length > MAX_REQUEST_BYTES):
+            self.close_connection = True
+            self.__sendJson(413, { "error": ERROR_REQUEST_TOO_LARGE.format(MAX_REQUEST_BYTES) })
+            return
+        body = self.rfile.read(length)
+        if (self.path != CONVERT_PATH):
+            self.__sendJson(404, { "error": ERROR_NOT_FOUND.format(self.path) })
+            return
+        try:
+            job = json.loads(body)
+        except ValueError:
+            self.__sendJson(400, { "error": ERROR_BAD_JOB })
+            return
+        self.__sendJson(*self.server.conversionServer.runJob(job))
+        return
+
+    def __sendJson(self, Status: int, Response: Dict[str, Any]) -> None:
+        """ Sends a JSON response """
+        body = (json.dumps(Response) + "\n").encode()
+        self.send_response(Status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def address_string(self) -> str:
+        """ Names the client in log messages.  Unix socket clients have no address. """
+        return(self.client_address[0] if (self.client_address) else "unix")
+
+    def log_message(self, Format: str, *Args: Any) -> None:
+        """ Leaves request logging to the job messages of the ConversionServer """
+        return
+
+
+#*************
+# Functions
+#*************
+def serve(Address: str, ConfigDir: str, Jobs: int, BufferSize: int, Fsync: bool, MapFile: bool, MessageStream: TextIO,
+          DataDir: str = ".") -> None:
+    """ Runs a ConversionServer until the process is interrupted or terminated.
+
+    Parameters
+    ----------
+    Address: A TCP port number on the loopback interface, or a Unix socket path containing '/'.
+    ConfigDir: The directory holding the config files jobs name.
+    Jobs: Number of worker processes.
+    BufferSize: Number of characters each QIF writer collects before writing them to its file.
+    Fsync: When set True, each QIF file is forced to disk before it is moved into place.
+    MapFile: When set True, csvFile jobs are read through a memory map.
+    MessageStream: Where status messages are printed.
+    DataDir: The directory holding every CSV file jobs read and QIF file their output templates name.
+
+    Returns
+    -------
+    None
+    """
+    server = ConversionServer(Address, ConfigDir, Jobs, BufferSize, Fsync, MapFile, MessageStream, DataDir)
+    previousHandler = signal.signal(signal.SIGTERM, _stopOnSignal)
+    try:
+        print("Listening on {} with {} worker(s), configs from {}, data in {}".format(server.address, Jobs, os.path.abspath(ConfigDir),
+              server.dataDir), file = MessageStream, flush = True)
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previousHandler)
+        server.close()
+    print("Server stopped: {} jobs completed, {} failed, {} CSV records processed".format(
+          server.completedJobs, server.failedJobs, server.recordsProcessed), file = MessageStream)
+    return
+
+def _stopOnSignal(Signum: int, Frame: Any) -> None:
+    """ SIGTERM handler stopping the server the same way as Ctrl+C """
+    raise KeyboardInterrupt()
+
+def _exitOnSignal(Signum: int, Frame: Any) -> None:
+    """ SIGTERM handler of the worker processes """
+    sys.exit(0)
+
+def _removeStaleSocket(SocketPath: str) -> None:
+    """ Removes a Unix socket left behind by a server that did not shut down, refusing to take over a live one """
+    if (not os.path.exists(SocketPath)):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(SocketPath)
+    except OSError:
+        os.remove(SocketPath)
+        return
+    finally:
+        probe.close()
+    raise Exception(ERROR_SOCKET_IN_USE.format(SocketPath))
+
+def _checkJob(Job: Any) -> Optional[str]:
+    """ Checks the shape of a job before it is given to a worker, returning the error message for a bad job """
+    if (not isinstance(Job, dict)):
+        return(ERROR_BAD_JOB)
+    for key in (JOB_KEY_CONFIG, JOB_KEY_CSV_FILE, JOB_KEY_CSV_TEXT, JOB_KEY_OUTPUT_TEMPLATE):
+        if ((key in Job) and (not isinstance(Job[key], str))):
+            return(ERROR_BAD_JOB_KEY.format(key))
+    if ((JOB_KEY_CONFIG not in Job) or (_CONFIG_ID.fullmatch(Job[JOB_KEY_CONFIG]) is None)):
+        return(ERROR_BAD_CONFIG_ID.format(Job.get(JOB_KEY_CONFIG), CONFIG_FILE_EXTENSION))
+    if ((JOB_KEY_CSV_FILE in Job) == (JOB_KEY_CSV_TEXT in Job)):
+        return(ERROR_JOB_NEEDS_ONE_CSV)
+    if ((JOB_KEY_OUTPUT_TEMPLATE in Job) and (JOB_KEY_CSV_FILE not in Job)):
+        return(ERROR_TEMPLATE_NEEDS_CSV_FILE)
+    if (Job.get(JOB_KEY_CSV_FILE) == STREAM_FILE_NAME):
+        return(ERROR_JOB_USES_STREAM)
+    return(None)
+
+def _confinedPath(DataDir: str, FileName: str) -> Optional[str]:
+    """ Returns the real path of a file name taken relative to the data directory, or None if it leads outside it """
+    path = os.path.realpath(os.path.join(DataDir, FileName))
+    if (os.path.commonpath([ DataDir, path ]) != DataDir):
+        return(None)
+    return(path)
+
+def _initWorker(ConfigDir: str, DataDir: str, BufferSize: int, Fsync: bool, MapFile: bool) -> None:
+    """ Stores the conversion state in a worker process.  The compiled configs and money parser caches are kept from job to job. """
+    global _workerState
+    # The server process handles Ctrl+C and stops the workers itself.  A worker sent SIGTERM exits through SystemExit
+    # rather than dying at once, so it lets go of the pool's queue lock and the pool can still be shut down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _exitOnSignal)
+    _workerState = (ConfigDir, DataDir, {}, MoneyParser(), BufferSize, Fsync, MapFile)
+    return
+
+def _loadConfig(ConfigId: str) -> CompiledConfig:
+    """ Returns the compiled config with an id, compiling it again only when its file has changed """
+    configDir, dataDir, configs, moneyParser, bufferSize, fsync, mapFile = _workerState
+    cfgFileName = os.path.join(configDir, ConfigId + CONFIG_FILE_EXTENSION)
+    try:
+        cfgStat = os.stat(cfgFileName)
+    except OSError:
+        raise Exception(ERROR_UNKNOWN_CONFIG.format(ConfigId))
+    entry = configs.get(cfgFileName)
+    if ((entry is None) or (entry[0] != cfgStat.st_mtime_ns) or (entry[1] != cfgStat.st_size)):
+        entry = (cfgStat.st_mtime_ns, cfgStat.st_size, CompiledConfig.load(cfgFileName))
+        configs[cfgFileName] = entry
+    return(entry[2])
+
+def _runJob(Job: Dict[str, str]) -> JobResult:
+    """ Worker function running one convert job, reporting rather than raising any failure """
+    configDir, dataDir, configs, moneyParser, bufferSize, fsync, mapFile = _workerState
+    try:
+        config = _loadConfig(Job[JOB_KEY_CONFIG])
+        csvFile = Job.get(JOB_KEY_CSV_FILE)
+        if (JOB_KEY_OUTPUT_TEMPLATE in Job):
+            outputNames = makeOutputNames(Job[JOB_KEY_OUTPUT_TEMPLATE], csvFile, config.qifNames)
+        else:
+            outputNames = config.qifNames
+        if (STREAM_FILE_NAME in outputNames):
+            raise Exception(ERROR_JOB_USES_STREAM)
+        if (JOB_KEY_OUTPUT_TEMPLATE in Job):
+            # The client chose these names, so they have to stay in the data directory
+            paths = [ _confinedPath(dataDir, outputName) for outputName in outputNames ]
+            if (None in paths):
+                raise Exception(ERROR_OUTSIDE_DATA_DIR.format(outputNames[paths.index(None)]))
+            outputNames = paths
+
+        fileHandles = openOutputFiles(outputNames, False, bufferSize, fsync, config.qifSinks)
+        try:
+            if (csvFile is not None):
+                recordsProcessed = convertCsvFile(csvFile, fileHandles, config, moneyParser, MapFile = mapFile)
+            else:
+                recordsProcessed = convertCsvText(Job[JOB_KEY_CSV_TEXT], fileHandles, config, moneyParser)
+        except BaseException:
+            abortOutputFiles(fileHandles)
+            raise
+        closeOutputFiles(fileHandles)
+    except Exception as err:
+        return(JobResult(0, str(err)))
+    return(JobResult(recordsProcessed, None))
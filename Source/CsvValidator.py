@@ -0,0 +1,235 @@
+#************
+# Imports
+#************
+import csv
+import io
+import os
+from typing import Any, Dict, Optional, TextIO, Tuple
+
+from CompiledConfig import CompiledConfig, RowLayout
+from MoneyParser import MoneyParser
+from QifWriter import STREAM_FILE_NAME
+
+#******************
+# Constants/Enums
+#******************
+
+# Kinds of error found by the validation pass, in the order they are reported
+VALIDATION_SHORT_ROW = "Rows with fewer fields than the header"
+VALIDATION_UNKNOWN_ACTION = "Actions missing from actionCodeMap"
+VALIDATION_BAD_MONEY = "Money values that cannot be read"
+VALIDATION_BAD_DATE = "Dates that cannot be read with the dateFormat"
+VALIDATION_NO_OUTPUT_FILE = "Rows no qifFiles entry matches"
+VALIDATION_KINDS = (VALIDATION_SHORT_ROW, VALIDATION_UNKNOWN_ACTION, VALIDATION_BAD_MONEY, VALIDATION_BAD_DATE, VALIDATION_NO_OUTPUT_FILE)
+
+# Line numbers printed for each distinct error before the rest are summarized
+VALIDATION_REPORT_LINES = 10
+
+# The file is cut into more chunks than workers so a slow chunk does not leave the other workers idle
+VALIDATION_CHUNKS_PER_JOB = 4
+
+# Exception strings raised by this file
+ERROR_VALIDATE_NEEDS_CSV_FILE = "--validate requires a CSV file, not a stream"
+
+# The CSV file name, configuration, header layout and money parser a worker checks its chunks of the file against
+_workerState = None
+
+
+#***********
+# Classes
+#***********
+class ValidationReport:
+    """ Every error found in a CSV file, grouped by kind and then by the offending value.
+
+    Each distinct error, for example one unknown action, is kept once with the line numbers of all the rows it
+    was found in, so a file with the same mistake on a million rows still gives a short report.
+    """
+
+    def __init__(self) -> None:
+        self.rowsChecked = 0
+        self.errors = {}    # (kind, detail) to the file line numbers it was found on, in file order
+        return
+
+    @property
+    def errorCount(self) -> int:
+        """ The number of errors found, counting every row of every distinct error """
+        return(sum(len(lines) for lines in self.errors.values()))
+
+    def add(self, Kind: str, Detail: str, Line: int) -> None:
+        """ Records an error of one of VALIDATION_KINDS found on a line """
+        lines = self.errors.get((Kind, Detail))
+        if (lines is None):
+            lines = self.errors[(Kind, Detail)] = []
+        lines.append(Line)
+        return
+
+    def merge(self, Other: "ValidationReport", LineOffset: int) -> None:
+        """ Adds the errors of a report on a later part of the file, whose line numbers start after LineOffset lines """
+        self.rowsChecked = self.rowsChecked + Other.rowsChecked
+        for key, lines in Other.errors.items():
+            self.errors.setdefault(key, []).extend(line + LineOffset for line in lines)
+        return
+
+    def kindCounts(self) -> Dict[str, int]:
+        """ Counts the errors of each kind found, in VALIDATION_KINDS order """
+        counts = {}
+        for kind in VALIDATION_KINDS:
+            count = sum(len(lines) for (errorKind, detail), lines in self.errors.items() if (errorKind == kind))
+            if (count):
+                counts[kind] = count
+        return(counts)
+
+    def write(self, Stream: TextIO, MaxLines: int = VALIDATION_REPORT_LINES) -> None:
+        """ Prints the report, giving up to MaxLines line numbers for each distinct error """
+        print("{:,} CSV records checked, {:,} errors".format(self.rowsChecked, self.errorCount), file = Stream)
+        for kind, count in self.kindCounts().items():
+            print("\n{}: {:,}".format(kind, count), file = Stream)
+            for (errorKind, detail), lines in self.errors.items():
+                if (errorKind == kind):
+                    more = ", ... {:,} more".format(len(lines) - MaxLines) if (len(lines) > MaxLines) else ""
+                    print("  {}: {:,} rows, lines {}{}".format(detail, len(lines), ", ".join(str(line) for line in lines[:MaxLines]), more),
+                          file = Stream)
+        return
+
+
+#*************
+# Functions
+#*************
+def validateCsvFile(CsvFileName: str, Config: CompiledConfig, Jobs: int = 1) -> ValidationReport:
+    """ Checks every row of a CSV file would convert, without writing anything.
+
+    Parameters
+    ----------
+    CsvFileName: The CSV file name.  It is read twice when it is converted after the check, so it cannot be stdin.
+    Config: The compiled conversion configuration.  A CSV file missing one of its columns raises an exception, as
+        conversion would.
+    Jobs: Number of worker processes checking chunks of the file.  With 1, the file is checked in this process.
+
+    Returns
+    -------
+    ValidationReport: Every short row, unknown action, unreadable money value or date and unroutable row, with line numbers
+        counted from 1 for the header row.  A record with a quoted newline is numbered by its first line.
+    """
+    if (CsvFileName == STREAM_FILE_NAME):
+        raise Exception(ERROR_VALIDATE_NEEDS_CSV_FILE)
+
+    report = ValidationReport()
+    if (Jobs <= 1):
+        with open(CsvFileName, "rt") as csvFile:
+            reader = csv.reader(csvFile)
+            header = next(reader, None)
+            if (header is not None):
+                layout = Config.bindHeader(header)
+                _detectDates(CsvFileName, layout)
+                _checkRows(reader, Config, layout, MoneyParser(), report)
+        return(report)
+
+    # Chunks of the file are checked in worker processes, the same byte ranges --jobs converts
+    import multiprocessing
+    from ParallelConverter import CHUNK_MAX_BYTES, mapChunks, splitCsvFile
+    chunkCount = max(Jobs * VALIDATION_CHUNKS_PER_JOB, (os.path.getsize(CsvFileName) // CHUNK_MAX_BYTES) + 1)
+    header, chunks = splitCsvFile(CsvFileName, chunkCount)
+    if (not chunks):
+        return(report)
+    layout = Config.bindHeader(header)
+    _detectDates(CsvFileName, layout)
+    with open(CsvFileName, "rt") as csvFile:
+        reader = csv.reader(csvFile)
+        next(reader)
+        lineOffset = reader.line_num
+    jobs = min(Jobs, len(chunks))
+    pool = multiprocessing.Pool(jobs, initializer = _initWorker, initargs = (CsvFileName, Config, layout))
+    try:
+        restStart = None
+        # The chunk reports come back in file order, so each one's line numbers follow the lines before it
+        for (start, end), (chunkReport, chunkLines) in mapChunks(pool, _validateChunk, chunks, jobs):
+            if (chunkReport is None):
+                restStart = start
+                break
+            report.merge(chunkReport, lineOffset)
+            lineOffset = lineOffset + chunkLines
+    finally:
+        pool.close()
+        pool.join()
+
+    if (restStart is not None):
+        # The chunk ended inside a quoted field, as a quote in an unquoted field misleads splitCsvFile, so the rest of
+        # the file is checked here from the start of the chunk, as the serial conversion reads it
+        restReport = ValidationReport()
+        with io.TextIOWrapper(open(CsvFileName, "rb")) as csvFile:
+            csvFile.buffer.seek(restStart)
+            _checkRows(csv.reader(csvFile), Config, layout, MoneyParser(), restReport)
+        report.merge(restReport, lineOffset)
+    return(report)
+
+def _checkRows(Reader: Any, Config: CompiledConfig, Layout: RowLayout, Money: MoneyParser, Report: ValidationReport) -> None:
+    """ Checks the rows left in a csv.reader, adding each error found to the report with the reader's line numbers """
+    dateColumn, actionColumn, securityColumn, priceColumn, valueColumn, quantityColumn, memoColumn = Layout.columns
+    moneyChecks = [ (priceColumn, Config.columns[3], Money.formatPrice), (valueColumn, Config.columns[4], Money.formatValue),
+                    (quantityColumn, Config.columns[5], Money.formatQuantity) ]
+    actionDict = Config.actionDict
+    dates = Layout.dates
+    router = Layout.router
+    routingNames = list(zip(router.columns, Config.routingColumns))
+    fieldCount = max(Layout.columns + router.columns) + 1
+    rowsChecked = 0
+    line = Reader.line_num + 1
+    for row in Reader:
+        if (row):
+            rowsChecked = rowsChecked + 1
+            if (len(row) < fieldCount):
+                Report.add(VALIDATION_SHORT_ROW, "{} of {} fields".format(len(row), fieldCount), line)
+            else:
+                if (row[actionColumn].upper() not in actionDict):
+                    Report.add(VALIDATION_UNKNOWN_ACTION, repr(row[actionColumn]), line)
+                for column, columnName, render in moneyChecks:
+                    try:
+                        render(row[column])
+                    except Exception:
+                        Report.add(VALIDATION_BAD_MONEY, "{} {!r}".format(columnName, row[column]), line)
+                if (dates is not None):
+                    try:
+                        dates.formatDate(row[dateColumn])
+                    except Exception:
+                        Report.add(VALIDATION_BAD_DATE, repr(row[dateColumn]), line)
+                if (router.route(row) is None):
+                    Report.add(VALIDATION_NO_OUTPUT_FILE, ", ".join("{} {!r}".format(name, row[column]) for column, name in routingNames), line)
+        line = Reader.line_num + 1
+    Report.rowsChecked = Report.rowsChecked + rowsChecked
+    return
+
+def _detectDates(CsvFileName: str, Layout: RowLayout) -> None:
+    """ Chooses the date format of a CSV file when the configuration detects it, from the dates at the start of the
+    file as conversion would, so every row and every chunk is checked with the same format """
+    if (Layout.dates is not None):
+        with open(CsvFileName, "rt") as csvFile:
+            reader = csv.reader(csvFile)
+            next(reader)
+            Layout.dates.sampleRows(reader, Layout.columns[0])
+    return
+
+def _initWorker(CsvFileName: str, Config: CompiledConfig, Layout: RowLayout) -> None:
+    """ Stores the validation state in a worker process """
+    global _workerState
+    _workerState = (CsvFileName, Config, Layout, MoneyParser())
+    return
+
+def _validateChunk(Chunk: Tuple[int, int]) -> Tuple[Optional[ValidationReport], int]:
+    """ Worker function checking the CSV records in a byte range.  Returns their report, with line numbers counted
+    from the start of the chunk, and the number of lines in the chunk.  Returns None for the report when the range
+    ends inside a quoted field, so is not a whole number of records. """
+    csvFileName, config, layout, moneyParser = _workerState
+    start, end = Chunk
+    with open(csvFileName, "rb") as csvFile:
+        csvFile.seek(start)
+        data = csvFile.read(end - start)
+
+    # Decode the bytes the same way open(..., "rt") would, including universal newline translation.  strict makes the
+    # csv module raise at the end of the data inside a quoted field (see ParallelConverter._convertChunk).
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data)), strict = True)
+    report = ValidationReport()
+    try:
+        _checkRows(reader, config, layout, moneyParser, report)
+    except csv.Error:
+        return((None, 0))
+    return((report, reader.line_num))
@@ -0,0 +1,197 @@
+#************
+# Imports
+#************
+import re
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, Optional, Pattern
+
+from ConversionErrors import ConfigError, DateFormatError
+
+#******************
+# Constants/Enums
+#******************
+
+# dateFormat value choosing the format from the dates at the start of each CSV file
+DATE_FORMAT_AUTO = "auto"
+
+# Formats tried by auto detection, in order of preference.  Month first formats come before day first ones, so dates
+# that read either way (no day above 12) are read month first, as US exports write them.
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%Y/%m/%d", "%Y%m%d", "%m-%d-%Y", "%d/%m/%Y", "%d/%m/%y", "%d.%m.%Y",
+                "%d-%b-%y", "%d-%b-%Y", "%d %b %Y", "%b %d, %Y", "%B %d, %Y")
+
+# Rows read ahead to choose the format of a CSV file with auto detection
+DATE_DETECT_ROWS = 100
+
+# Maximum number of distinct date strings remembered by a parser.  Statements have many rows per date, so a parser
+# normally converts each date once.
+DATE_CACHE_SIZE = 16384
+
+# Quicken's date form, from the month, day and four digit year
+QIF_DATE_FORMAT = "{}/{}/{}"
+
+# Two digit years below this are in the 2000s and the others in the 1900s, as datetime.strptime reads %y
+TWO_DIGIT_YEAR_PIVOT = 69
+
+# The regular expression each dateFormat directive becomes.  %b and %B read English month names by their first
+# three letters, so "Sep", "Sept" and "September" are all read.
+_DIRECTIVE_REGEX = {
+    "d": r"(?P<day>\d{1,2})",
+    "m": r"(?P<month>\d{1,2})",
+    "Y": r"(?P<year>\d{4})",
+    "y": r"(?P<shortYear>\d{2})",
+    "b": r"(?P<monthName>[A-Za-z]{3,9}\.?)",
+    "B": r"(?P<monthName>[A-Za-z]{3,9})",
+}
+_DIRECTIVE_SPLIT_REGEX = re.compile(r"(%.)")
+
+# A date may be followed by a time, as in "2021-01-05T09:30:00" or "1/5/2021 9:30 AM", which is dropped
+_TIME_REGEX = r"(?:[T ].*)?"
+
+_MONTH_NAMES = { name: month for month, name in enumerate(("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP",
+                                                              "OCT", "NOV", "DEC"), 1) }
+_DAYS_IN_MONTH = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Exception strings raised by this file
+ERROR_BAD_DATE_FORMAT = "Date format '{}' must be '{}' or have a day (%d), a month (%m, %b or %B) and a year (%Y or %y), and no other directives"
+ERROR_BAD_DATE = "Cannot read date '{}' with date format '{}'"
+ERROR_NO_DATE_FORMAT = "No known date format reads the dates {}"
+ERROR_BLANK_DATE = "Cannot read blank date '{}' before a date format has been detected from a date that is not blank"
+
+
+#***********
+# Classes
+#***********
+class DateParser:
+    """ Converts CSV dates into Quicken's M/D/YYYY form.
+
+    The configured dateFormat uses datetime.strptime directives, but is compiled once into a regular expression,
+    which reads a date several times faster than strptime.  Results are cached per string, and statements have many
+    rows on each date, so nearly every row costs one dictionary lookup.
+
+    With the format DATE_FORMAT_AUTO, the format is chosen from a sample of dates (see detect() and sampleRows()):
+    the first of DATE_FORMATS that reads the most of them.
+    """
+
+    def __init__(self, Format: str) -> None:
+        """ Compiles the format.
+
+        Parameters
+        ----------
+        Format: A date format made of strptime directives, such as "%d-%b-%y", or DATE_FORMAT_AUTO.
+
+        Returns
+        -------
+        None
+        """
+        self.format = None      # The format in use, None until an auto detecting parser has chosen one
+        self.__mRegex = None
+        self.__mCache = {}
+        if (Format != DATE_FORMAT_AUTO):
+            self.__setFormat(Format)
+        return
+
+    def formatDate(self, CsvDateText: str) -> str:
+        """ Renders a CSV date as QIF D field text.  An auto detecting parser that has not been given a sample
+        chooses the format from this first date, which must not be blank. """
+        text = self.__mCache.get(CsvDateText)
+        if (text is None):
+            if (self.__mRegex is None):
+                self.detect([ CsvDateText ])
+                if (self.__mRegex is None):
+                    raise DateFormatError(ERROR_BLANK_DATE.format(CsvDateText))
+            text = _renderDate(self.__mRegex, CsvDateText)
+            if (text is None):
+                raise DateFormatError(ERROR_BAD_DATE.format(CsvDateText, self.format))
+            if (len(self.__mCache) < DATE_CACHE_SIZE):
+                self.__mCache[CsvDateText] = text
+        return(text)
+
+    def detect(self, CsvDateTexts: Iterable[str]) -> None:
+        """ Chooses the format of an auto detecting parser from a sample of CSV dates.  A parser that already has a
+        format keeps it.  Blank dates are skipped, and a sample of only blank dates leaves the choice to formatDate(). """
+        if (self.__mRegex is not None):
+            return
+        samples = [ text for text in dict.fromkeys(CsvDateTexts) if (text.strip()) ]
+        if (not samples):
+            return
+        bestFormat, bestCount = None, 0
+        for dateFormat in DATE_FORMATS:
+            regex = compileDateFormat(dateFormat)
+            count = sum(1 for text in samples if (_renderDate(regex, text) is not None))
+            if (count > bestCount):
+                bestFormat, bestCount = dateFormat, count
+        if (bestFormat is None):
+            raise DateFormatError(ERROR_NO_DATE_FORMAT.format(", ".join("'{}'".format(text) for text in samples[:5])))
+        self.__setFormat(bestFormat)
+        return
+
+    def sampleRows(self, Rows: Iterable[Any], DateColumn: Any) -> Iterator[Any]:
+        """ Detection stage: for an auto detecting parser, reads DATE_DETECT_ROWS rows ahead and chooses the format
+        from their dates, reading on past them to the first date that is not blank.  Returns the rows, including the
+        ones read ahead. """
+        if (self.__mRegex is not None):
+            return(iter(Rows))
+        rows = iter(Rows)
+        sample = list(islice(rows, DATE_DETECT_ROWS))
+        dates = [ row[DateColumn] for row in sample if (len(row) > DateColumn) ]
+        if (not any(text.strip() for text in dates)):
+            for row in rows:
+                sample.append(row)
+                if ((len(row) > DateColumn) and row[DateColumn].strip()):
+                    dates.append(row[DateColumn])
+                    break
+        self.detect(dates)
+        return(chain(sample, rows))
+
+    def __setFormat(self, Format: str) -> None:
+        """ Starts using a format """
+        self.__mRegex = compileDateFormat(Format)
+        self.format = Format
+        return
+
+
+#*************
+# Functions
+#*************
+def compileDateFormat(Format: str) -> Pattern:
+    """ Compiles a date format of strptime directives into a regular expression matching a whole date, raising
+    ConfigError when it does not hold exactly one day, month and year """
+    pieces = []
+    directives = []
+    for piece in _DIRECTIVE_SPLIT_REGEX.split(Format):
+        if (piece.startswith("%") and (len(piece) == 2) and (piece != "%%")):
+            if (piece[1] not in _DIRECTIVE_REGEX):
+                raise ConfigError(ERROR_BAD_DATE_FORMAT.format(Format, DATE_FORMAT_AUTO))
+            directives.append(piece[1])
+            pieces.append(_DIRECTIVE_REGEX[piece[1]])
+        else:
+            pieces.append(re.escape(piece.replace("%%", "%")))
+    fields = sorted(directive.lower().replace("b", "m") for directive in directives)
+    if (fields != [ "d", "m", "y" ]):
+        raise ConfigError(ERROR_BAD_DATE_FORMAT.format(Format, DATE_FORMAT_AUTO))
+    return(re.compile("".join(pieces) + _TIME_REGEX))
+
+def _renderDate(Regex: Pattern, CsvDateText: str) -> Optional[str]:
+    """ Reads a CSV date with a compiled date format, returning it in Quicken's form, or None if it cannot be read or
+    is not a real date """
+    match = Regex.fullmatch(CsvDateText.strip())
+    if (match is None):
+        return(None)
+    fields = match.groupdict()
+    if (fields.get("monthName") is not None):
+        month = _MONTH_NAMES.get(fields["monthName"][:3].upper())
+        if (month is None):
+            return(None)
+    else:
+        month = int(fields["month"])
+    if (fields.get("year") is not None):
+        year = int(fields["year"])
+    else:
+        year = int(fields["shortYear"])
+        year = year + (2000 if (year < TWO_DIGIT_YEAR_PIVOT) else 1900)
+    day = int(fields["day"])
+    if ((month < 1) or (month > 12) or (day < 1) or (day > _DAYS_IN_MONTH[month])):
+        return(None)
+    if ((month == 2) and (day == 29) and ((year % 4 != 0) or ((year % 100 == 0) and (year % 400 != 0)))):
+        return(None)
+    return(QIF_DATE_FORMAT.format(month, day, year))
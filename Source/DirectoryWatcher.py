@@ -0,0 +1,357 @@
+#************
+# Imports
+#************
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+from BatchConverter import BATCH_DIRECTORY_PATTERN, BatchResult, convertBatch, makeOutputNames
+from CliDefaults import DEFAULT_DEBOUNCE_SECONDS, DEFAULT_STATE_FILE_NAME, ENGINE_ROWS
+from CompiledConfig import CompiledConfig
+from QifWriter import writeFileAtomically
+
+#******************
+# Constants/Enums
+#******************
+
+# Seconds between directory scans when inotify is not available
+DEFAULT_POLL_SECONDS = 5.0
+
+# Bumped whenever the layout of the state file changes.  A state file of another version is started afresh.
+STATE_VERSION = 1
+
+# inotify event flags, from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ONLYDIR = 0x01000000
+_WATCH_EVENTS = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_ONLYDIR
+
+# struct inotify_event header: watch descriptor, mask, cookie and name length
+_EVENT_HEADER = struct.Struct("iIII")
+_EVENT_BUFFER_BYTES = 64 * 1024
+
+# Exception strings raised by this file
+ERROR_BAD_WATCH_DIRECTORY = "Watch directory '{}' does not exist"
+ERROR_BAD_DEBOUNCE = "--debounce must not be negative"
+
+
+#***********
+# Classes
+#***********
+class DirectoryWatcher:
+    """ Finds the CSV files that land in a directory, each one once.
+
+    On Linux the directory is watched with inotify (through ctypes, so nothing needs installing), and only the files
+    named in its events are looked at.  Elsewhere, or when inotify cannot be used, the directory is scanned every
+    PollSeconds.  Only the directory entries matching BATCH_DIRECTORY_PATTERN are stat'ed, and hidden files, such as
+    the partial files browsers download into, are ignored.
+
+    A file is ready once its size and modification time have stayed the same for DebounceSeconds.  Writers that
+    close and reopen a file, or write it in bursts, therefore do not get it converted part way.
+
+    Each file handed out is recorded in a JSON state file by markConverted(), with the size and modification time it
+    was converted at, so a restarted watcher skips the files converted before.  A file that is later replaced with
+    different contents is converted again.  The state file is replaced in one step, and only lists files still in the
+    directory.
+    """
+
+    def __init__(self, Directory: str, StateFileName: Optional[str] = None, DebounceSeconds: float = DEFAULT_DEBOUNCE_SECONDS,
+                 PollSeconds: float = DEFAULT_POLL_SECONDS, Inotify: bool = True) -> None:
+        """ Loads the state file and starts watching.  The CSV files already in the directory are picked up like new ones.
+
+        Parameters
+        ----------
+        Directory: The directory to watch.
+        StateFileName: The state file.  Defaults to DEFAULT_STATE_FILE_NAME in Directory.
+        DebounceSeconds: Seconds a file must stay unchanged before it is ready.
+        PollSeconds: Seconds between directory scans when inotify is not used.
+        Inotify: When set False, the directory is always polled.
+
+        Returns
+        -------
+        None
+        """
+        if (not os.path.isdir(Directory)):
+            raise Exception(ERROR_BAD_WATCH_DIRECTORY.format(Directory))
+        if (DebounceSeconds < 0):
+            raise Exception(ERROR_BAD_DEBOUNCE)
+        self.directory = Directory
+        self.stateFileName = os.path.join(Directory, DEFAULT_STATE_FILE_NAME) if (StateFileName is None) else StateFileName
+        self.__mDebounceSeconds = DebounceSeconds
+        self.__mPollSeconds = PollSeconds
+        # Files not yet converted: name -> (size and modification time when last seen, when they were first seen)
+        self.__mPending = {}
+        self.__mConverted = self.__loadState()
+        self.__mInotifyFd = _startInotify(Directory) if (Inotify) else None
+        self.__mNextScan = 0.0
+        self.__scan()
+        return
+
+    @property
+    def usesInotify(self) -> bool:
+        """ Tells whether the directory is watched with inotify rather than polled """
+        return(self.__mInotifyFd is not None)
+
+    def waitForFiles(self, Timeout: Optional[float] = None) -> List[str]:
+        """ Waits until there are CSV files ready to convert.
+
+        Parameters
+        ----------
+        Timeout: The longest time to wait, in seconds.  None waits until a file is ready.
+
+        Returns
+        -------
+        List[str]: The paths of the ready files, sorted.  Empty when the timeout passed first.
+        """
+        deadline = None if (Timeout is None) else time.monotonic() + Timeout
+        while (True):
+            now = time.monotonic()
+            ready = self.__readyFiles(now)
+            if (ready):
+                return(ready)
+            if ((deadline is not None) and (now >= deadline)):
+                return([])
+
+            # Sleep until the next pending file may be ready, the next scan is due, the deadline passes or inotify wakes us
+            wakeTimes = [ since + self.__mDebounceSeconds for signature, since in self.__mPending.values() ]
+            if (deadline is not None):
+                wakeTimes.append(deadline)
+            if (self.__mInotifyFd is None):
+                wakeTimes.append(self.__mNextScan)
+            wait = max(min(wakeTimes) - now, 0.0) if (wakeTimes) else None
+            if (self.__mInotifyFd is not None):
+                if (select.select([ self.__mInotifyFd ], [], [], wait)[0]):
+                    self.__readEvents()
+            else:
+                time.sleep(wait)
+                if (time.monotonic() >= self.__mNextScan):
+                    self.__scan()
+
+    def markConverted(self, CsvFileName: str, RecordsProcessed: int, Error: Optional[str] = None) -> None:
+        """ Records that a file from waitForFiles() was converted, or failed to convert, so it is not handed out again.
+
+        Parameters
+        ----------
+        CsvFileName: The file, as returned by waitForFiles().
+        RecordsProcessed: The number of CSV records converted.
+        Error: The error message of a failed conversion.  The file is only tried again once it changes.
+
+        Returns
+        -------
+        None
+        """
+        name = os.path.basename(CsvFileName)
+        signature = self.__mPending.pop(name, ((None, None), None))[0]
+        entry = { "size": signature[0], "mtimeNs": signature[1], "records": RecordsProcessed }
+        if (Error is not None):
+            entry["error"] = Error
+        self.__mConverted[name] = entry
+        self.__saveState()
+        return
+
+    def close(self) -> None:
+        """ Stops watching the directory """
+        if (self.__mInotifyFd is not None):
+            os.close(self.__mInotifyFd)
+            self.__mInotifyFd = None
+        return
+
+    def __readyFiles(self, Now: float) -> List[str]:
+        """ Lists the pending files unchanged for the debounce time, checking each one has not changed since last seen """
+        ready = []
+        for name, (signature, since) in list(self.__mPending.items()):
+            if ((Now - since) < self.__mDebounceSeconds):
+                continue
+            # An inotify event may have been missed for a change within the same second, so look at the file once more
+            if (self.__update(name, Now) and (self.__mPending[name][1] == since)):
+                ready.append(os.path.join(self.directory, name))
+        return(sorted(ready))
+
+    def __update(self, Name: str, Now: float) -> bool:
+        """ Looks at one directory entry, adding it to the pending files when it is new or changed.  Returns whether it is pending. """
+        try:
+            fileStat = os.stat(os.path.join(self.directory, Name))
+        except OSError:
+            # The file is gone, so forget it
+            self.__mPending.pop(Name, None)
+            if (self.__mConverted.pop(Name, None) is not None):
+                self.__saveState()
+            return(False)
+        signature = (fileStat.st_size, fileStat.st_mtime_ns)
+        converted = self.__mConverted.get(Name)
+        if ((converted is not None) and ((converted["size"], converted["mtimeNs"]) == signature)):
+            self.__mPending.pop(Name, None)
+            return(False)
+        pending = self.__mPending.get(Name)
+        if ((pending is None) or (pending[0] != signature)):
+            self.__mPending[Name] = (signature, Now)
+        return(True)
+
+    def __scan(self) -> None:
+        """ Looks at every CSV file in the directory, and forgets the converted files that are gone """
+        now = time.monotonic()
+        names = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if (_isCandidate(entry.name) and entry.is_file()):
+                    names.add(entry.name)
+                    self.__update(entry.name, now)
+        for name in list(self.__mPending):
+            if (name not in names):
+                del self.__mPending[name]
+        gone = [ name for name in self.__mConverted if (name not in names) ]
+        if (gone):
+            for name in gone:
+                del self.__mConverted[name]
+            self.__saveState()
+        self.__mNextScan = now + self.__mPollSeconds
+        return
+
+    def __readEvents(self) -> None:
+        """ Reads the waiting inotify events and looks at each CSV file they name """
+        try:
+            data = os.read(self.__mInotifyFd, _EVENT_BUFFER_BYTES)
+        except BlockingIOError:
+            return
+        now = time.monotonic()
+        names = set()
+        offset = 0
+        while (offset < len(data)):
+            watch, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset = offset + _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset = offset + length
+            if (mask & _IN_Q_OVERFLOW):
+                # Events were dropped, so the directory has to be looked at in full
+                self.__scan()
+            elif (_isCandidate(name)):
+                names.add(name)
+        for name in names:
+            self.__update(name, now)
+        return
+
+    def __loadState(self) -> Dict[str, Dict[str, Any]]:
+        """ Reads the converted files from the state file, if there is one """
+        try:
+            with open(self.stateFileName, "rt") as stateFile:
+                state = json.load(stateFile)
+        except FileNotFoundError:
+            return({})
+        except ValueError:
+            return({})
+        if ((not isinstance(state, dict)) or (state.get("version") != STATE_VERSION)):
+            return({})
+        return(state.get("files", {}))
+
+    def __saveState(self) -> None:
+        """ Replaces the state file with the current list of converted files """
+        state = { "version": STATE_VERSION, "files": self.__mConverted }
+        writeFileAtomically(self.stateFileName, json.dumps(state, indent = 3, sort_keys = True) + "\n")
+        return
+
+
+#*************
+# Functions
+#*************
+def watchDirectory(Watcher: DirectoryWatcher, Template: str, Jobs: int, Config: CompiledConfig, BufferSize: int, Fsync: bool,
+                   MapFile: bool, MessageStream: TextIO, Engine: str = ENGINE_ROWS) -> None:
+    """ Converts the CSV files landing in a watched directory until the process is interrupted or terminated.  A file
+    that fails to convert is recorded as failed and the watch goes on.
+
+    Parameters
+    ----------
+    Watcher: The watched directory.  It is closed on return.
+    Template: Output file name template, see BatchConverter.DEFAULT_OUTPUT_TEMPLATE for the available fields.  A
+        template with an unknown field raises an exception before the watch starts.
+    Jobs: Number of files converted concurrently when several are ready at once.
+    Config: The compiled conversion configuration, loaded once for every file.
+    BufferSize: Number of characters each QIF writer collects before writing them to its file.
+    Fsync: When set True, each QIF file is forced to disk before it is moved into place.
+    MapFile: When set True, CSV files are memory mapped and read by MappedCsvReader where possible.
+    MessageStream: Where status messages are printed.
+    Engine: The conversion engine, one of ENGINES (see QifPipeline.convertCsvFile).
+
+    Returns
+    -------
+    None
+    """
+    previousHandler = signal.signal(signal.SIGTERM, _stopOnSignal)
+    converted = 0
+    failures = 0
+    try:
+        makeOutputNames(Template, os.path.join(Watcher.directory, "Statement.csv"), Config.qifNames)
+        print("Watching {} for CSV files ({})".format(os.path.abspath(Watcher.directory), "inotify" if Watcher.usesInotify else "polling"),
+              file = MessageStream, flush = True)
+        while (True):
+            csvFiles = Watcher.waitForFiles()
+            for result in _convertReadyFiles(csvFiles, Template, Jobs, Config, BufferSize, Fsync, MapFile, Engine):
+                Watcher.markConverted(result.csvFile, result.recordsProcessed, result.error)
+                if (result.error is None):
+                    converted = converted + 1
+                    print("{}: {} CSV records processed".format(result.csvFile, result.recordsProcessed), file = MessageStream, flush = True)
+                else:
+                    failures = failures + 1
+                    print("{}: FAILED: {}".format(result.csvFile, result.error), file = MessageStream, flush = True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previousHandler)
+        Watcher.close()
+    print("Stopped watching: {} CSV files converted, {} failed".format(converted, failures), file = MessageStream)
+    return
+
+def _convertReadyFiles(CsvFiles: List[str], Template: str, Jobs: int, Config: CompiledConfig, BufferSize: int, Fsync: bool,
+                       MapFile: bool, Engine: str) -> Iterator[BatchResult]:
+    """ Converts the ready files as a batch, turning an error that stops the whole batch, such as two files whose QIF
+    files would have the same names, into a failed result for each file it did not convert """
+    remaining = list(CsvFiles)
+    try:
+        for result in convertBatch(CsvFiles, Template, Jobs, Config, BufferSize, Fsync, MapFile, Engine):
+            remaining.remove(result.csvFile)
+            yield result
+    except Exception as err:
+        for csvFile in remaining:
+            yield BatchResult(csvFile, 0, str(err))
+    return
+
+def _stopOnSignal(Signum: int, Frame: Any) -> None:
+    """ SIGTERM handler stopping the watch the same way as Ctrl+C """
+    raise KeyboardInterrupt()
+
+def _isCandidate(Name: str) -> bool:
+    """ Tells whether a directory entry name is a CSV file to convert.  Hidden files are skipped, as glob does. """
+    return((not Name.startswith(".")) and fnmatch.fnmatch(Name, BATCH_DIRECTORY_PATTERN))
+
+def _startInotify(Directory: str) -> Optional[int]:
+    """ Starts an inotify watch on a directory, returning its file descriptor, or None where inotify is not available """
+    if (not sys.platform.startswith("linux")):
+        return(None)
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+        inotifyInit = libc.inotify_init1
+        addWatch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return(None)
+    addWatch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+    fd = inotifyInit(os.O_NONBLOCK | os.O_CLOEXEC)
+    if (fd < 0):
+        # e.g. EMFILE when the per user inotify instance limit is reached
+        return(None)
+    if (addWatch(fd, os.fsencode(Directory), _WATCH_EVENTS) < 0):
+        os.close(fd)
+        return(None)
+    return(fd)
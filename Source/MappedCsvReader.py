@@ -0,0 +1,225 @@
+#************
+# Imports
+#************
+import codecs
+import csv
+import functools
+import itertools
+import locale
+import mmap
+import os
+from typing import Any, Callable, Iterator, List, Optional
+
+#******************
+# Constants/Enums
+#******************
+
+# Encodings in which the bytes of ',', '"', CR and LF never appear inside another character, so records and fields
+# can be found in the raw bytes before anything is decoded.  Any other encoding is read through the csv module.
+MAPPABLE_ENCODINGS = ("utf-8", "ascii", "iso8859-1", "iso8859-15", "cp1252")
+
+_QUOTE = b'"'
+_CR = b"\r"
+_CRLF = b"\r\n"
+_LF = b"\n"
+
+# Mapped pages already read are released from the process every this many lines, so its resident memory
+# does not grow with the size of the file
+RELEASE_INTERVAL_LINES = 4096
+
+
+#***********
+# Classes
+#***********
+class MappedCsvReader:
+    """ Reads CSV records directly from the bytes of a memory mapped file.
+
+    Records are cut from the mapped file with mmap.readline(), so the file is never copied through a read buffer or
+    decoded as a stream.  A record without any quote character cannot hold a quoted delimiter or newline, so it is
+    decoded in one call and split on commas only up to the last column the conversion uses.  The columns after it
+    are never split into separate strings.  (Decoding only the used fields one at a time was measured at two to
+    three times the cost of decoding the whole record in one call, so records are not cut up before decoding.)
+    Records with quote characters are handed to the csv module, which pulls further lines from the file while a
+    quoted field runs on over an embedded newline.  Either way the rows are the same as csv.reader gives for the
+    file opened in text mode.  That includes a CR not followed by LF, which ends a line in universal newline mode:
+    once a line holds one, the rest of the data is cut into lines at each CR as well (see _cutLines).
+
+    Use mapCsvFile() to map a file, since it checks the file can be read this way.
+    """
+
+    def __init__(self, Data: Any, Encoding: Optional[str] = None) -> None:
+        """ Starts reading at the current position of the data.
+
+        Parameters
+        ----------
+        Data: The CSV bytes, as an mmap or any object with readline() such as io.BytesIO, positioned at the start of
+            a record.
+        Encoding: The CSV file encoding, one of MAPPABLE_ENCODINGS.  Defaults to the encoding open() would use.
+
+        Returns
+        -------
+        None
+        """
+        self.__mData = Data
+        self.__mReadline = Data.readline
+        self.__mReleasedBytes = 0
+        self.__mEncoding = csvEncoding() if (Encoding is None) else Encoding
+        # One csv reader is kept for all quoted records.  Each record is handed to it through __mQuotedLines, which
+        # the reader takes lines from with list.pop(), so no Python code runs between the reader and its input.
+        self.__mQuotedLines = []
+        self.__mQuotedReader = csv.reader(iter(self.__mQuotedLines.pop, None))
+        self.endedInQuotedField = False     # Set when the data ends inside a quoted field, as a cut up file can
+        return
+
+    def readRow(self) -> Optional[List[str]]:
+        """ Reads the next non-blank record with all of its fields, e.g. the header row.  Returns None at the end of the data. """
+        return(next(self.rows(), None))
+
+    def rows(self, ColumnCount: Optional[int] = None) -> Iterator[List[str]]:
+        """ Reads the remaining records.
+
+        Parameters
+        ----------
+        ColumnCount: Number of leading fields returned in each row.  Unquoted records are not split past it.  None
+            returns every field.
+
+        Returns
+        -------
+        Iterator[List[str]]: The rows, as lists of at most ColumnCount field values.  Blank lines are skipped.
+        """
+        encoding = self.__mEncoding
+        quotedLines = self.__mQuotedLines
+        quotedReader = self.__mQuotedReader
+        maxSplit = -1 if (ColumnCount is None) else ColumnCount
+        # Lines are taken in blocks so pages can be released between blocks without any cost per line
+        release = isinstance(self.__mData, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED")
+        blockLines = RELEASE_INTERVAL_LINES if (release) else None
+        while (True):
+            readline = self.__mReadline
+            lines = iter(readline, b"")
+            lineCount = 0
+            for line in itertools.islice(lines, blockLines):
+                lineCount = lineCount + 1
+                carriageReturn = line.find(_CR)
+                if ((carriageReturn >= 0) and (line[carriageReturn + 1:carriageReturn + 2] != _LF)):
+                    # A lone CR: the rest of the data is read again from this line, cut into lines at each CR
+                    self.__cutLines(line)
+                    break
+                if (_QUOTE in line):
+                    quotedLines.append(line.decode(encoding))
+                    try:
+                        row = next(quotedReader)
+                    except IndexError:
+                        # The reader ran out of input inside a quoted field, so the field holds a newline
+                        row = self.__readMultilineRecord(line)
+                        if (self.__mReadline is not readline):
+                            # The record ran on into a line with a lone CR
+                            yield row
+                            break
+                else:
+                    line = line.rstrip(_CRLF)
+                    if (not line):
+                        continue
+                    # Decoding the record in one call is far cheaper than decoding its fields one by one
+                    row = line.decode(encoding).split(",", maxSplit)
+                if ((ColumnCount is not None) and (len(row) > ColumnCount)):
+                    del row[ColumnCount:]
+                yield row
+            else:
+                if ((not release) or (lineCount < blockLines)):
+                    break
+                self.__releasePages()
+        return
+
+    def __releasePages(self) -> None:
+        """ Drops the mapped pages read so far from the process.  They stay in the page cache. """
+        end = (self.__mData.tell() // mmap.PAGESIZE) * mmap.PAGESIZE
+        if (end > self.__mReleasedBytes):
+            self.__mData.madvise(mmap.MADV_DONTNEED, self.__mReleasedBytes, end - self.__mReleasedBytes)
+            self.__mReleasedBytes = end
+        return
+
+    def __readMultilineRecord(self, Line: bytes) -> List[str]:
+        """ Parses a record whose quoted field runs on past its first line.
+
+        The record is parsed again with each following line added, until it parses or the file ends inside the
+        field, which the csv module takes as the end of the record.  Universal newline mode turns the CRLF line ends
+        kept inside the field into LF, so that is done here too.
+        """
+        text = _decodeLine(Line, self.__mEncoding)
+        while (True):
+            line = self.__mReadline()
+            carriageReturn = line.find(_CR)
+            if ((carriageReturn >= 0) and (line[carriageReturn + 1:carriageReturn + 2] != _LF)):
+                self.__cutLines(line)
+                line = self.__mReadline()
+            if (not line):
+                self.endedInQuotedField = True
+                self.__mQuotedLines.extend([ None, text ])
+                return(next(self.__mQuotedReader))
+            text = text + _decodeLine(line, self.__mEncoding)
+            self.__mQuotedLines.append(text)
+            try:
+                return(next(self.__mQuotedReader))
+            except IndexError:
+                pass
+
+    def __cutLines(self, Line: bytes) -> None:
+        """ Reads the rest of the data, from a line already read, in the lines universal newline mode cuts it into """
+        self.__mReadline = functools.partial(next, _cutLines(Line, self.__mReadline), b"")
+        return
+
+
+#*************
+# Functions
+#*************
+def csvEncoding() -> str:
+    """ Returns the encoding open() uses for a CSV file opened in text mode """
+    return(locale.getpreferredencoding(False))
+
+def isMappableEncoding(Encoding: str) -> bool:
+    """ Tells whether CSV files in an encoding can be read by MappedCsvReader """
+    try:
+        return(codecs.lookup(Encoding).name in MAPPABLE_ENCODINGS)
+    except LookupError:
+        return(False)
+
+def mapCsvFile(FileName: str, Encoding: Optional[str] = None) -> Optional[mmap.mmap]:
+    """ Memory maps a CSV file for MappedCsvReader.
+
+    Parameters
+    ----------
+    FileName: The CSV file name.
+    Encoding: The CSV file encoding.  Defaults to the encoding open() would use.
+
+    Returns
+    -------
+    Optional[mmap.mmap]: The read only map, positioned at the start of the file, which the caller closes.  None when the
+        file has to be read through the csv module instead: it is not a regular file (e.g. stdin or a named pipe), it is
+        empty, or its encoding needs full decoding.
+    """
+    if (not isMappableEncoding(csvEncoding() if (Encoding is None) else Encoding)):
+        return(None)
+    if ((not os.path.isfile(FileName)) or (os.path.getsize(FileName) == 0)):
+        return(None)
+    with open(FileName, "rb") as csvFile:
+        data = mmap.mmap(csvFile.fileno(), 0, access = mmap.ACCESS_READ)
+    # The file is read once from start to end, so let the kernel read ahead and drop the pages already read
+    if (hasattr(mmap, "MADV_SEQUENTIAL")):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    return(data)
+
+def _cutLines(Line: bytes, Readline: Callable[[], bytes]) -> Iterator[bytes]:
+    """ Yields a line and the lines Readline reads after it, cut at each CR, LF and CRLF and ended by LF, as universal
+    newline mode reads them.  A CRLF is never split, since Readline only ends a line at a LF. """
+    line = Line
+    while (line):
+        yield from line.replace(_CRLF, _LF).replace(_CR, _LF).splitlines(True)
+        line = Readline()
+    return
+
+def _decodeLine(Line: bytes, Encoding: str) -> str:
+    """ Decodes a line, ending it with LF """
+    if (Line.endswith(_CRLF)):
+        Line = Line[:-2] + _LF
+    return(Line.decode(Encoding))
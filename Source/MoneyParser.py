@@ -0,0 +1,300 @@
+#************
+# Imports
+#************
+import re
+from typing import List, Sequence, Tuple
+
+from ConversionErrors import MoneyFormatError
+
+#******************
+# Constants/Enums
+#******************
+
+# Maximum number of distinct money strings remembered by each of a parser's caches.  Once full, new strings are
+# still parsed but their results are not cached.  This bounds memory on files where every amount is different.
+MONEY_CACHE_SIZE = 16384
+
+# Characters removed from a money string before the fast path hands it to float().  The currency symbol, signs and
+# parenthesis are only removed from either end, and the thousands separators from anywhere.  What remains must be
+# plain ASCII digits with at most one decimal point, otherwise the regex fallback is used.  The string is stripped
+# as UTF-8 bytes, since bytes.strip() and bytes.translate() work several times faster than the str methods.
+# Whitespace is not stripped, and a sign between digits is not removed: "1 234" and "1-234" are two numbers, and the
+# regex fallback takes the first as it always has.
+_MONEY_EDGE_BYTES = b"$()-+"
+_MONEY_GROUP_BYTES = b","
+_MONEY_STRIP_BYTES = _MONEY_EDGE_BYTES + _MONEY_GROUP_BYTES
+
+# A run of _MONEY_EDGE_BYTES with other characters either side of it on the same line, which bytes.strip() keeps
+_MONEY_INNER_EDGE_REGEX = re.compile(rb"[^-$()+\n][-$()+]+[^-$()+\n]")
+
+# Every byte but the characters that make a money string negative, and the newline separating the strings of a
+# column, so deleting them leaves only each string's sign characters
+_MONEY_NOT_SIGN_BYTES = bytes(byte for byte in range(256) if byte not in b"-()\n")
+
+# Cleaned money strings joined by newlines, as for _MONEY_NOT_SIGN_BYTES.  The column takes the fast path as a whole
+# when deleting these bytes leaves nothing, no line holds two decimal points and every line has a digit (and no line
+# matched _MONEY_INNER_EDGE_REGEX before cleaning).
+_MONEY_COLUMN_BYTES = b"0123456789.\n"
+_MONEY_TWO_POINTS_REGEX = re.compile(rb"\.[0-9]*\.")
+
+# Fallback for unusual strings: the first run of digits (with optional thousands separators) followed by an
+# optional decimal point with more digits.  This covers cases when the float value is actually an integer.  Only
+# ASCII digits are matched, as the digits found are copied into the QIF fields.
+_MONEY_REGEX = re.compile(r"[\d,]*\.?\d+", re.ASCII)
+
+# Formats an integer with thousands separators
+_groupThousands = "{:,}".format
+
+# Powers of ten by exponent, for scaling fixed-point values without computing the power per value.  Longer
+# fractions than this are not found in money strings, and are scaled with a computed power.
+_POWERS_OF_TEN = [ 10 ** exponent for exponent in range(32) ]
+
+# Python's float repr switches to exponent notation outside this range of decimal exponents
+_REPR_MIN_EXPONENT = -4
+_REPR_MAX_EXPONENT = 16
+
+# Exception strings raised by this file
+ERROR_BAD_MONEY_VALUE = "Cannot find monetary value in string '{}'"
+
+
+#***********
+# Classes
+#***********
+class MoneyParser:
+    """ Converts CSV money and share quantity strings into signed float values.
+
+    CSV files will contain many strings representing floating point numbers.  These will generally
+    represent amounts of currency or shares.  Depending on the CSV file format, the strings may
+    contain additional information such as a currency symbol (e.g. $), thousands separators, or if the
+    number is negative, a minus sign.  Sometimes accounting formats are used and negative values are found
+    within parenthesis.
+
+    Common forms such as "$1,234.56", "(12.00)" and "-3.5" are handled by stripping the decoration in a single
+    C level pass and calling float() on the remainder.  Anything else falls back to a regular expression search.
+    Results are cached per string since prices and amounts recur constantly in fund statements.
+
+    The conversion pipeline does not use floats at all.  formatPrice(), formatValue() and formatQuantity() parse
+    the string into a fixed-point value (see parseFixed()) and render the QIF field text from the scaled integer,
+    so no digits are lost however many decimals a quantity has.  The rendered text is cached per string, so a
+    repeated price costs one dictionary lookup and no formatting.
+    """
+
+    def __init__(self) -> None:
+        self.__mCache = {}
+        self.__mPriceCache = {}
+        self.__mValueCache = {}
+        self.__mQuantityCache = {}
+        self.cacheMisses = 0    # Strings parsed rather than found in a cache
+        return
+
+    def parse(self, CsvFloatText: str, ForcePositive: bool = False) -> float:
+        """ Turns a CSV floating point string into a numeric float value.
+
+        Parameters
+        ----------
+        CsvFloatText: A CSV string containing a floating point value.
+        ForcePositive: When set True, the floating point value will always be returned as a positive value.
+
+        Returns
+        -------
+        float: The floating point value extracted from the string.  The value is negative if the string contains
+            a negative sign or parenthesis, unless ForcePositive is set.
+        """
+        value = self.__mCache.get(CsvFloatText)
+        if (value is None):
+            self.cacheMisses = self.cacheMisses + 1
+            value = self.__parseUncached(CsvFloatText)
+            if (len(self.__mCache) < MONEY_CACHE_SIZE):
+                self.__mCache[CsvFloatText] = value
+        return(abs(value) if ForcePositive else value)
+
+    def formatPrice(self, CsvFloatText: str) -> str:
+        """ Renders a CSV price as QIF I field text, the shortest form that reads back as the same value (e.g. 10.0) """
+        text = self.__mPriceCache.get(CsvFloatText)
+        if (text is None):
+            self.cacheMisses = self.cacheMisses + 1
+            text = _renderShortest(*_splitMoney(CsvFloatText), False)
+            if (len(self.__mPriceCache) < MONEY_CACHE_SIZE):
+                self.__mPriceCache[CsvFloatText] = text
+        return(text)
+
+    def formatValue(self, CsvFloatText: str) -> str:
+        """ Renders a CSV amount as QIF T field text, rounded to cents as a float is, with thousands separators """
+        text = self.__mValueCache.get(CsvFloatText)
+        if (text is None):
+            self.cacheMisses = self.cacheMisses + 1
+            text = _renderCents(*_splitMoney(CsvFloatText))
+            if (len(self.__mValueCache) < MONEY_CACHE_SIZE):
+                self.__mValueCache[CsvFloatText] = text
+        return(text)
+
+    def formatQuantity(self, CsvFloatText: str) -> str:
+        """ Renders a CSV share quantity as QIF Q field text, always positive, in its shortest form with thousands separators """
+        text = self.__mQuantityCache.get(CsvFloatText)
+        if (text is None):
+            self.cacheMisses = self.cacheMisses + 1
+            negative, wholeDigits, fractionDigits = _splitMoney(CsvFloatText)
+            text = _renderShortest(False, wholeDigits, fractionDigits, True)
+            if (len(self.__mQuantityCache) < MONEY_CACHE_SIZE):
+                self.__mQuantityCache[CsvFloatText] = text
+        return(text)
+
+    def formatPrices(self, CsvFloatTexts: Sequence[str]) -> List[str]:
+        """ Renders many CSV prices as formatPrice does, cleaning them all at once (see _splitMoneyColumn) """
+        return([ _renderShortest(negative, wholeDigits, fractionDigits, False)
+                 for negative, wholeDigits, fractionDigits in _splitMoneyColumn(CsvFloatTexts) ])
+
+    def formatValues(self, CsvFloatTexts: Sequence[str]) -> List[str]:
+        """ Renders many CSV amounts as formatValue does, cleaning them all at once (see _splitMoneyColumn) """
+        return([ _renderCents(negative, wholeDigits, fractionDigits) for negative, wholeDigits, fractionDigits in _splitMoneyColumn(CsvFloatTexts) ])
+
+    def formatQuantities(self, CsvFloatTexts: Sequence[str]) -> List[str]:
+        """ Renders many CSV share quantities as formatQuantity does, cleaning them all at once (see _splitMoneyColumn) """
+        return([ _renderShortest(False, wholeDigits, fractionDigits, True) for negative, wholeDigits, fractionDigits in _splitMoneyColumn(CsvFloatTexts) ])
+
+    def clearCache(self) -> None:
+        """ Forgets all cached money strings """
+        self.__mCache.clear()
+        self.__mPriceCache.clear()
+        self.__mValueCache.clear()
+        self.__mQuantityCache.clear()
+        return
+
+    @staticmethod
+    def parseFixed(CsvFloatText: str) -> Tuple[bool, int, int]:
+        """ Parses a money string into a fixed-point value, without going through a float.
+
+        Parameters
+        ----------
+        CsvFloatText: A CSV string containing a money value or share quantity.
+
+        Returns
+        -------
+        Tuple[bool, int, int]: The sign, the digits as an integer and the number of decimal places, so "-$1,234.50"
+            is (True, 123450, 2).  The sign is kept apart from the digits so a negative zero is not lost.
+        """
+        negative, wholeDigits, fractionDigits = _splitMoney(CsvFloatText)
+        return((negative, int(wholeDigits + fractionDigits), len(fractionDigits)))
+
+    @staticmethod
+    def renderFixed(Negative: bool, Digits: int, Places: int, Grouping: bool = False) -> str:
+        """ Renders a fixed-point value (see parseFixed) as formatPrice renders a price, or with Grouping, as
+        formatQuantity renders a quantity but keeping the sign, so (False, 10500, 3) is 10.5 """
+        digits = str(Digits).rjust(Places + 1, "0")
+        return(_renderShortest(Negative, digits[:len(digits) - Places], digits[len(digits) - Places:], Grouping))
+
+    @staticmethod
+    def __parseUncached(CsvFloatText: str) -> float:
+        """ Parses a money string without consulting the cache """
+
+        # Fast path: the string is only digits and a decimal point once the currency decoration is removed.
+        # bytes.isdigit() only accepts ASCII digits.
+        cleaned = CsvFloatText.encode().strip(_MONEY_EDGE_BYTES).translate(None, _MONEY_GROUP_BYTES)
+        if (cleaned.replace(b".", b"", 1).isdigit()):
+            value = float(cleaned)
+        else:
+            match = _MONEY_REGEX.search(CsvFloatText)
+            if (match is None):
+                raise MoneyFormatError(ERROR_BAD_MONEY_VALUE.format(CsvFloatText))
+            value = float(match.group().replace(",", ""))
+
+        # If the money string has a negative sign or parenthesis in it, make the value negative
+        if (("-" in CsvFloatText) or ("(" in CsvFloatText) or (")" in CsvFloatText)):
+            value = value * -1.0
+        return(value)
+
+
+#*************
+# Functions
+#*************
+def _powerOfTen(Exponent: int) -> int:
+    """ Returns 10 ** Exponent, from the table when it is there """
+    return(_POWERS_OF_TEN[Exponent] if (Exponent < len(_POWERS_OF_TEN)) else 10 ** Exponent)
+
+def _splitMoney(CsvFloatText: str) -> Tuple[bool, str, str]:
+    """ Splits a money string into its sign and the ASCII digits either side of the decimal point, e.g.
+    "-$1,234.50" is (True, "1234", "50").  Either digit string may be empty, but not both. """
+    cleaned = CsvFloatText.encode().strip(_MONEY_EDGE_BYTES).translate(None, _MONEY_GROUP_BYTES)
+    if (cleaned.replace(b".", b"", 1).isdigit()):
+        cleaned = cleaned.decode()
+    else:
+        match = _MONEY_REGEX.search(CsvFloatText)
+        if (match is None):
+            raise MoneyFormatError(ERROR_BAD_MONEY_VALUE.format(CsvFloatText))
+        cleaned = match.group().replace(",", "")
+    wholeDigits, point, fractionDigits = cleaned.partition(".")
+    negative = (("-" in CsvFloatText) or ("(" in CsvFloatText) or (")" in CsvFloatText))
+    return((negative, wholeDigits, fractionDigits))
+
+def _splitMoneyColumn(CsvFloatTexts: Sequence[str]) -> List[Tuple[bool, str, str]]:
+    """ Splits many money strings as _splitMoney does.  The strings are joined by newlines, and their decoration
+    and signs are found, and the fast path checked, by a few C level passes over the whole column rather than by
+    several calls per string.  A column that does not take the fast path as a whole is split one string at a time. """
+    joined = "\n".join(CsvFloatTexts).encode()
+    cleaned = joined.translate(None, _MONEY_STRIP_BYTES)
+    signLines = joined.translate(None, _MONEY_NOT_SIGN_BYTES).split(b"\n")
+    if ((len(signLines) != len(CsvFloatTexts)) or (_MONEY_INNER_EDGE_REGEX.search(joined) is not None)):
+        # A string holds a newline, or a sign or currency symbol between other characters
+        return([ _splitMoney(text) for text in CsvFloatTexts ])
+    if ((not cleaned.translate(None, _MONEY_COLUMN_BYTES)) and (_MONEY_TWO_POINTS_REGEX.search(cleaned) is None) and
+        all(cleaned.translate(None, b".").split(b"\n"))):
+        return([ (bool(signs), wholeDigits, fractionDigits)
+                 for signs, (wholeDigits, point, fractionDigits) in zip(signLines, (line.partition(".") for line in cleaned.decode().split("\n"))) ])
+
+    splits = []
+    cleanedLines = cleaned.split(b"\n")
+    for text, cleanedLine, signs in zip(CsvFloatTexts, cleanedLines, signLines):
+        if (cleanedLine.replace(b".", b"", 1).isdigit()):
+            wholeDigits, point, fractionDigits = cleanedLine.decode().partition(".")
+            splits.append((bool(signs), wholeDigits, fractionDigits))
+        else:
+            splits.append(_splitMoney(text))
+    return(splits)
+
+def _renderCents(Negative: bool, WholeDigits: str, FractionDigits: str) -> str:
+    """ Renders a fixed-point value rounded to two decimal places, with thousands separators.  This is the text
+    "{:,.2f}" gives for a float: an exact half cent tie is rounded by the float's binary value, as it always has
+    been, so 2.675 is 2.67 and 533.865 is 533.87. """
+    sign = "-" if Negative else ""
+    if (len(FractionDigits) <= 2):
+        # Already in cents: the digits are used as they are
+        wholeDigits = WholeDigits.lstrip("0") or "0"
+        if (len(wholeDigits) > 3):
+            wholeDigits = _groupThousands(int(wholeDigits))
+        return(sign + wholeDigits + "." + FractionDigits.ljust(2, "0"))
+
+    # Round the scaled integer to cents
+    scale = len(FractionDigits)
+    cents, remainder = divmod(int(WholeDigits + FractionDigits), _powerOfTen(scale - 2))
+    half = 5 * _powerOfTen(scale - 3)
+    if (remainder == half):
+        return(sign + "{:,.2f}".format(float(WholeDigits + "." + FractionDigits)))
+    if (remainder > half):
+        cents = cents + 1
+    whole, fraction = divmod(cents, 100)
+    return("{}{:,}.{:02d}".format(sign, whole, fraction))
+
+def _renderShortest(Negative: bool, WholeDigits: str, FractionDigits: str, Grouping: bool) -> str:
+    """ Renders a fixed-point value the way repr() (or "{:,}" with Grouping) renders a float: trailing zeros
+    dropped but at least one decimal place, and exponent notation for very small or very large values.  For values
+    with up to 15 significant digits the text is identical to the float's; longer values keep all their digits. """
+    sign = "-" if Negative else ""
+    wholeDigits = WholeDigits.lstrip("0")
+    fractionDigits = FractionDigits.rstrip("0")
+    if (wholeDigits):
+        exponent = len(wholeDigits) - 1
+    elif (fractionDigits):
+        exponent = len(fractionDigits.lstrip("0")) - len(fractionDigits) - 1
+    else:
+        return(sign + "0.0")
+
+    if ((exponent < _REPR_MIN_EXPONENT) or (exponent >= _REPR_MAX_EXPONENT)):
+        mantissa = (wholeDigits + fractionDigits).strip("0")
+        mantissa = mantissa[0] + ("." + mantissa[1:] if (len(mantissa) > 1) else "")
+        return("{}{}e{}{:02d}".format(sign, mantissa, "-" if (exponent < 0) else "+", abs(exponent)))
+
+    if (not wholeDigits):
+        wholeDigits = "0"
+    elif (Grouping and (len(wholeDigits) > 3)):
+        wholeDigits = _groupThousands(int(wholeDigits))
+    return(sign + wholeDigits + "." + (fractionDigits or "0"))
@@ -0,0 +1,254 @@
+#************
+# Imports
+#************
+import collections
+import csv
+import io
+import itertools
+import mmap
+import multiprocessing
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from CompiledConfig import CompiledConfig, RowLayout
+from ConversionErrors import ConversionError
+from MappedCsvReader import MappedCsvReader, mapCsvFile
+from MoneyParser import MoneyParser
+from QifPipeline import formatRecords, routeRecords
+from SymbolTable import RecordSymbols
+
+#******************
+# Constants/Enums
+#******************
+
+# The CSV file is cut into more chunks than workers so a slow chunk does not leave the other workers idle.
+# Chunks are kept small enough that the per chunk QIF output waiting to be written stays modest.
+CHUNKS_PER_JOB = 4
+CHUNK_MAX_BYTES = 16 * 1024 * 1024
+
+# Chunks handed to the pool per job ahead of the one being written (see mapChunks)
+CHUNKS_IN_FLIGHT_PER_JOB = 2
+
+# Records converted at a time when the rest of a file is converted without the workers (see convertParallel)
+CHUNK_RECORDS = 100000
+
+_QUOTE = b'"'
+_NEWLINE = b"\n"
+
+# The CSV file name, bound header, symbol tables and money parser of a worker, so each chunk is sent as its byte range
+_workerState = None
+
+
+#*************
+# Functions
+#*************
+def findRecordBoundaries(Data: Any, Start: int, Targets: Sequence[int]) -> List[int]:
+    """ Finds CSV record boundaries at or after a list of byte offsets.
+
+    Parameters
+    ----------
+    Data: The CSV file bytes (bytes or mmap).
+    Start: A byte offset known to be the start of a record.
+    Targets: Ascending byte offsets at or after Start.  Each is moved forward to the start of the next record.
+
+    Returns
+    -------
+    List[int]: The byte offset just past the end of the record containing each target.  Offsets past the end of
+        the data are dropped, so the list may be shorter than Targets.
+
+    Description
+    -----------
+    A newline only ends a record when it is outside a quoted field.  With CSV quoting, an escaped quote inside a
+    quoted field is written as two quote characters, so a newline is inside quotes exactly when an odd number of
+    quote characters precede it in the record stream.  The quote count is kept incrementally from Start, and the
+    counting and searching is done by C level bytes methods (mmap has no count(), so each span is sliced first).
+
+    The csv module only opens a quoted field with a quote at the start of a field, so a quote inside an unquoted
+    field (e.g. 12" pipe) is text, and throws the count out for the rest of the file.  A boundary may then fall
+    inside a quoted field.  Tracking the quote state exactly costs a Python step per quoted field, so it is left to
+    the workers instead: convertParallel() finds such a chunk from the parse of it (see _convertChunk).
+    """
+    boundaries = []
+    position = Start
+    inQuotes = False
+    for target in Targets:
+        search = max(target, position)
+        while True:
+            newline = Data.find(_NEWLINE, search)
+            if (newline < 0):
+                return(boundaries)
+            if (Data[position:newline].count(_QUOTE) % 2):
+                inQuotes = not inQuotes
+            position = newline
+            if (not inQuotes):
+                break
+            search = newline + 1
+        boundaries.append(newline + 1)
+    return(boundaries)
+
+def splitCsvFile(FileName: str, ChunkCount: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """ Reads the CSV header and splits the rest of the file into byte ranges aligned to record boundaries.
+
+    Parameters
+    ----------
+    FileName: The CSV file name.
+    ChunkCount: The desired number of chunks.  Fewer are returned for small files.
+
+    Returns
+    -------
+    Tuple[List[str], List[Tuple[int, int]]]: The CSV header field names, and the (start, end) byte range of each chunk in file order.
+    """
+    with open(FileName, "rb") as csvFile:
+        csvFile.seek(0, io.SEEK_END)
+        if (csvFile.tell() == 0):
+            return([], [])
+        with mmap.mmap(csvFile.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            size = len(data)
+            headerEnd = findRecordBoundaries(data, 0, [ 0 ])
+            headerEnd = headerEnd[0] if headerEnd else size
+            header = next(csv.reader(_decodeChunk(data[:headerEnd])), [])
+
+            targets = [ headerEnd + ((size - headerEnd) * chunkIndex // ChunkCount) for chunkIndex in range(1, ChunkCount) ]
+            starts = [ headerEnd ] + [ boundary for boundary in findRecordBoundaries(data, headerEnd, targets) if (boundary < size) ]
+            starts = sorted(set(starts))
+    return(header, list(zip(starts, starts[1:] + [ size ])))
+
+def convertParallel(FileName: str, Jobs: int, Config: CompiledConfig, MapFile: bool = False) -> Iterator[Tuple[List[str], int]]:
+    """ Converts a CSV file in a pool of worker processes.
+
+    Parameters
+    ----------
+    FileName: The CSV file name.
+    Jobs: Number of worker processes.
+    Config: The compiled conversion configuration.
+    MapFile: When set True, the workers read their chunks with MappedCsvReader, which only decodes the columns the
+        configuration uses.  Files it cannot read (see mapCsvFile) are read through the csv module.
+
+    Returns
+    -------
+    Iterator[Tuple[List[str], int]]: For each chunk in file order, the QIF text for every qifFiles entry (by index) and
+        the number of CSV records in the chunk.  Writing the text in this order gives output byte-identical to a serial run.
+    """
+    with open(FileName, "rb") as csvFile:
+        csvFile.seek(0, io.SEEK_END)
+        chunkCount = max(Jobs * CHUNKS_PER_JOB, (csvFile.tell() // CHUNK_MAX_BYTES) + 1)
+    header, chunks = splitCsvFile(FileName, chunkCount)
+    if (not chunks):
+        return
+
+    # Resolve the configured columns once here so a missing column is reported before any worker starts
+    layout = Config.bindHeader(header)
+    if (layout.dates is not None):
+        # Choose the date format from the start of the file, so every chunk reads its dates the same way
+        with open(FileName, "rt") as csvFile:
+            reader = csv.reader(csvFile)
+            next(reader)
+            layout.dates.sampleRows(reader, layout.columns[0])
+    columnCount = None
+    if (MapFile):
+        csvData = mapCsvFile(FileName)
+        if (csvData is not None):
+            csvData.close()
+            columnCount = max(Config.resolveColumns(header).values()) + 1
+    pool = multiprocessing.Pool(Jobs, initializer = _initWorker, initargs = (FileName, layout, Config.symbols, columnCount))
+    try:
+        restStart = None
+        for (start, end), (outputs, recordCount) in mapChunks(pool, _convertChunk, chunks, Jobs):
+            if (outputs is None):
+                restStart = start
+                break
+            yield (outputs, recordCount)
+    finally:
+        # Let the chunks already handed out finish, whether the run completed, a chunk raised or the caller stopped
+        pool.close()
+        pool.join()
+    if (restStart is None):
+        return
+
+    # The chunk ended inside a quoted field, so a quote in an unquoted field misled findRecordBoundaries.  The chunks
+    # before it are right, and the rest of the file, from the start of the chunk, is converted here.
+    _initWorker(FileName, layout, Config.symbols, None)
+    yield from _convertRest(restStart)
+    return
+
+def mapChunks(Pool: Any, Function: Callable[[Tuple[int, int]], Any], Chunks: List[Tuple[int, int]], Jobs: int) -> Iterator[Tuple[Tuple[int, int], Any]]:
+    """ Runs a worker function on each chunk in a pool, handing back each chunk and its result in file order.
+
+    Only CHUNKS_IN_FLIGHT_PER_JOB chunks per job are handed to the pool ahead of the result being taken, so a caller
+    that stops early, or is stopped by a chunk raising, leaves little queued.  The caller must then close() and join()
+    the pool rather than terminate() it, which can deadlock with tasks still waiting to be sent to the workers.
+    """
+    chunkIter = iter(Chunks)
+    pending = collections.deque((chunk, Pool.apply_async(Function, (chunk,)))
+                                for chunk in itertools.islice(chunkIter, Jobs * CHUNKS_IN_FLIGHT_PER_JOB))
+    while pending:
+        chunk, result = pending.popleft()
+        for nextChunk in itertools.islice(chunkIter, 1):
+            pending.append((nextChunk, Pool.apply_async(Function, (nextChunk,))))
+        yield (chunk, result.get())
+    return
+
+def _decodeChunk(Data: bytes) -> io.TextIOWrapper:
+    """ Decodes CSV bytes the same way open(..., "rt") would, including universal newline translation """
+    return(io.TextIOWrapper(io.BytesIO(Data)))
+
+def _initWorker(FileName: str, Layout: RowLayout, Symbols: RecordSymbols, ColumnCount: Optional[int]) -> None:
+    """ Stores the conversion state in a worker process.  ColumnCount is set when chunks are read by MappedCsvReader.
+    The symbol tables arrive empty, and fill in each worker. """
+    global _workerState
+    _workerState = (FileName, Layout, Symbols, MoneyParser(), ColumnCount)
+    return
+
+def _convertChunk(Chunk: Tuple[int, int]) -> Tuple[Optional[List[str]], int]:
+    """ Worker function converting the CSV records in a byte range to QIF text per output file.  Returns None for the
+    text when the range ends inside a quoted field, so is not a whole number of records. """
+    fileName, layout, symbols, moneyParser, columnCount = _workerState
+    start, end = Chunk
+    with open(fileName, "rb") as csvFile:
+        csvFile.seek(start)
+        data = csvFile.read(end - start)
+
+    if (columnCount is not None):
+        reader = MappedCsvReader(io.BytesIO(data))
+        try:
+            outputs, recordCount = next(_convertRows(reader.rows(columnCount), None))
+        except ConversionError:
+            # The cut off record read at the end of the range may be short of fields
+            if (not reader.endedInQuotedField):
+                raise
+        if (reader.endedInQuotedField):
+            return((None, 0))
+    else:
+        # strict makes the csv module raise at the end of the data inside a quoted field.  It also raises on text after
+        # a closing quote, which the serial conversion reads, so such a chunk is converted again by _convertRest too.
+        try:
+            outputs, recordCount = next(_convertRows(filter(None, csv.reader(_decodeChunk(data), strict = True)), None))
+        except csv.Error:
+            return((None, 0))
+    return((outputs, recordCount))
+
+def _convertRest(Start: int) -> Iterator[Tuple[List[str], int]]:
+    """ Converts the CSV records from a byte offset to the end of the file in this process, as the csv module reads
+    them, handing back the QIF text per output file every CHUNK_RECORDS records """
+    fileName, layout, symbols, moneyParser, columnCount = _workerState
+    # The file is opened in binary, as Start is a byte offset, and decoded as open(..., "rt") would
+    with io.TextIOWrapper(open(fileName, "rb")) as csvFile:
+        csvFile.buffer.seek(Start)
+        yield from _convertRows(filter(None, csv.reader(csvFile)), CHUNK_RECORDS)
+    return
+
+def _convertRows(Rows: Iterator[List[str]], MaxRecords: Optional[int]) -> Iterator[Tuple[List[str], int]]:
+    """ Converts CSV rows to QIF text per output file, handing it back every MaxRecords records, or once for all
+    of them when MaxRecords is None """
+    fileName, layout, symbols, moneyParser, columnCount = _workerState
+    outputs = [ [] for _ in range(layout.router.fileCount) ]
+    recordCount = 0
+    records = formatRecords(Rows, layout.columns, symbols, moneyParser, layout.dates)
+    for fileIndex, qifRecord in routeRecords(records, layout.router):
+        outputs[fileIndex].append(qifRecord)
+        recordCount = recordCount + 1
+        if (recordCount == MaxRecords):
+            yield ([ "".join(output) for output in outputs ], recordCount)
+            outputs = [ [] for _ in range(layout.router.fileCount) ]
+            recordCount = 0
+    yield ([ "".join(output) for output in outputs ], recordCount)
+    return
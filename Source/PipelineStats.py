@@ -0,0 +1,267 @@
+#************
+# Imports
+#************
+import json
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from CliDefaults import STATS_FORMAT_JSON
+from MoneyParser import MoneyParser
+from QifRouter import QifRouter
+from QifWriter import QifWriter, writeFileAtomically
+
+#******************
+# Constants/Enums
+#******************
+
+# Pipeline stages in the order records pass through them
+STAGE_READ = "read"
+STAGE_FILTER = "filter"
+STAGE_FORMAT = "format"
+STAGE_ROUTE = "route"
+STAGE_WRITE = "write"
+
+# Prefix of every Prometheus metric name
+_METRIC_PREFIX = "csvtoqif_"
+
+
+#***********
+# Classes
+#***********
+class PipelineStats:
+    """ Statistics for one conversion through the read -> format -> route pipeline.
+
+    When a PipelineStats is given to QifPipeline.convertCsvFile, each pipeline stage is wrapped in a generator that
+    reads the clock around every record it pulls from the stage before.  That measures the time spent in the stage and
+    everything upstream of it, so the time of each stage on its own is the difference from the stage before.  The
+    wrapping costs a little per record, so it is only done when statistics are asked for.
+
+    The router and money parser count their cache misses all the time, since that costs nothing on the cached path.
+    """
+
+    def __init__(self, DestinationNames: Sequence[str], Parser: MoneyParser) -> None:
+        """ Starts the statistics clock.
+
+        Parameters
+        ----------
+        DestinationNames: The qifFiles names, in order.
+        Parser: The money parser used by the conversion, whose cache misses are counted from now on.
+
+        Returns
+        -------
+        None
+        """
+        self.destinationNames = list(DestinationNames)
+        self.destinationRecords = [ 0 ] * len(self.destinationNames)
+        self.ruleAttempts = [ 0 ] * len(self.destinationNames)
+        self.actionRecords = {}
+        self.bytesRead = 0
+        self.bytesWritten = 0
+        self.moneyLookups = 0
+        self.moneyMisses = 0
+        self.wallSeconds = 0.0
+        self.__mParser = Parser
+        self.__mParserMisses = Parser.cacheMisses
+        self.__mStageOrder = []
+        self.__mInclusiveSeconds = {}
+        self.__mRouter = None
+        self.__mStart = time.perf_counter()
+        return
+
+    def countBytes(self, Lines: Iterable[str]) -> Iterator[str]:
+        """ Passes on the lines of the CSV input, counting their size in UTF-8 bytes """
+        for line in Lines:
+            self.bytesRead = self.bytesRead + len(line.encode())
+            yield line
+        return
+
+    def timeStage(self, Name: str, Items: Iterable[Any]) -> Iterator[Any]:
+        """ Passes on the items of a pipeline stage, timing how long each one takes to arrive.
+
+        Parameters
+        ----------
+        Name: The stage name, one of the STAGE_ constants.  Stages must be wrapped in pipeline order.
+        Items: The iterator returned by the stage.
+
+        Returns
+        -------
+        Iterator[Any]: The same items.
+        """
+        # Stages are recorded here rather than in the generator, which only starts when the last stage pulls a record
+        self.__mStageOrder.append(Name)
+        self.__mInclusiveSeconds[Name] = 0.0
+        return(self.__timeItems(Name, Items))
+
+    def __timeItems(self, Name: str, Items: Iterable[Any]) -> Iterator[Any]:
+        """ Generator behind timeStage """
+        clock = time.perf_counter
+        iterator = iter(Items)
+        seconds = 0.0
+        try:
+            while (True):
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds = seconds + (clock() - start)
+                    return
+                seconds = seconds + (clock() - start)
+                yield item
+        finally:
+            self.__mInclusiveSeconds[Name] = seconds
+        return
+
+    def countingParser(self, Money: MoneyParser) -> "_CountingMoney":
+        """ Wraps a money parser so its calls are counted """
+        return(_CountingMoney(self, Money))
+
+    def countActions(self, Records: Iterable[Tuple[Any, str]], ActionColumn: Any, ActionDict: Dict[str, str]) -> Iterator[Tuple[Any, str]]:
+        """ Passes on the (CSV row, QIF record) pairs of the format stage, counting records per Quicken action """
+        actionRecords = self.actionRecords
+        for row, qifRecord in Records:
+            action = ActionDict[row[ActionColumn].upper()]
+            actionRecords[action] = actionRecords.get(action, 0) + 1
+            yield (row, qifRecord)
+        return
+
+    def writeRecords(self, Records: Iterable[Tuple[int, str]], FileHandles: Sequence[QifWriter], Router: QifRouter) -> int:
+        """ Write stage: writes the routed records, counting them per destination.
+
+        Parameters
+        ----------
+        Records: (output file index, QIF record text) pairs from the route stage.
+        FileHandles: The output writers in qifFiles order.
+        Router: The bound router of the conversion, whose rule attempts are reported.
+
+        Returns
+        -------
+        int: The number of records written.
+        """
+        self.__mRouter = Router
+        for fileHandle in FileHandles:
+            fileHandle.countBytes = True
+        destinationRecords = self.destinationRecords
+        start = time.perf_counter()
+        for fileIndex, qifRecord in Records:
+            destinationRecords[fileIndex] = destinationRecords[fileIndex] + 1
+            FileHandles[fileIndex].write(qifRecord)
+        self.__mInclusiveSeconds[STAGE_WRITE] = time.perf_counter() - start
+        self.__mStageOrder.append(STAGE_WRITE)
+        return(sum(destinationRecords))
+
+    def finish(self, FileHandles: Sequence[QifWriter]) -> None:
+        """ Stops the clock once the output files are closed, and collects the counters of the other components """
+        self.wallSeconds = time.perf_counter() - self.__mStart
+        self.bytesWritten = sum(fileHandle.bytesWritten for fileHandle in FileHandles)
+        self.moneyMisses = self.__mParser.cacheMisses - self.__mParserMisses
+        if (self.__mRouter is not None):
+            self.ruleAttempts = self.__mRouter.ruleAttempts()
+        return
+
+    @property
+    def records(self) -> int:
+        """ The number of records written """
+        return(sum(self.destinationRecords))
+
+    @property
+    def stageSeconds(self) -> Dict[str, float]:
+        """ The time spent in each stage on its own, in pipeline order """
+        stageSeconds = {}
+        upstream = 0.0
+        for name in self.__mStageOrder:
+            inclusive = self.__mInclusiveSeconds[name]
+            stageSeconds[name] = max(inclusive - upstream, 0.0)
+            upstream = inclusive
+        return(stageSeconds)
+
+    def toJson(self) -> str:
+        """ Formats the statistics as a JSON document """
+        hits = self.moneyLookups - self.moneyMisses
+        stats = {
+            "records": self.records,
+            "wallSeconds": self.wallSeconds,
+            "rowsPerSecond": (self.records / self.wallSeconds) if self.wallSeconds else 0.0,
+            "bytesRead": self.bytesRead,
+            "bytesWritten": self.bytesWritten,
+            "stageSeconds": self.stageSeconds,
+            "destinations": [ { "name": name, "records": records, "regexAttempts": attempts }
+                              for name, records, attempts in zip(self.destinationNames, self.destinationRecords, self.ruleAttempts) ],
+            "actions": dict(sorted(self.actionRecords.items())),
+            "moneyCache": { "lookups": self.moneyLookups, "hits": hits, "hitRate": (hits / self.moneyLookups) if self.moneyLookups else 0.0 }
+        }
+        return(json.dumps(stats, indent = 3) + "\n")
+
+    def toPrometheus(self) -> str:
+        """ Formats the statistics in the Prometheus text exposition format, for the node exporter textfile collector """
+        hits = self.moneyLookups - self.moneyMisses
+        lines = []
+        _addMetric(lines, "records", "CSV records converted", [ ({}, self.records) ])
+        _addMetric(lines, "wall_seconds", "Wall time of the conversion", [ ({}, self.wallSeconds) ])
+        _addMetric(lines, "rows_per_second", "CSV records converted per second",
+                   [ ({}, (self.records / self.wallSeconds) if self.wallSeconds else 0.0) ])
+        _addMetric(lines, "read_bytes", "CSV bytes read", [ ({}, self.bytesRead) ])
+        _addMetric(lines, "written_bytes", "QIF bytes written", [ ({}, self.bytesWritten) ])
+        _addMetric(lines, "stage_seconds", "Time spent in each pipeline stage",
+                   [ ({ "stage": name }, seconds) for name, seconds in self.stageSeconds.items() ])
+        _addMetric(lines, "destination_records", "QIF records written to each qifFiles destination",
+                   [ ({ "destination": name }, records) for name, records in zip(self.destinationNames, self.destinationRecords) ])
+        _addMetric(lines, "rule_regex_attempts", "Values each qifFiles matchRegEx was tried against",
+                   [ ({ "destination": name }, attempts) for name, attempts in zip(self.destinationNames, self.ruleAttempts) ])
+        _addMetric(lines, "action_records", "QIF records per Quicken action",
+                   [ ({ "action": action }, records) for action, records in sorted(self.actionRecords.items()) ])
+        _addMetric(lines, "money_cache_lookups", "Money strings parsed", [ ({}, self.moneyLookups) ])
+        _addMetric(lines, "money_cache_hits", "Money strings found in the parser cache", [ ({}, hits) ])
+        return("".join(lines))
+
+    def write(self, FileName: str, Format: str, MessageStream: Any) -> None:
+        """ Writes the statistics to a file, replacing it in one step so a collector never reads a partial file.
+        A FileName of "-" prints them to MessageStream. """
+        text = self.toJson() if (Format == STATS_FORMAT_JSON) else self.toPrometheus()
+        if (FileName == "-"):
+            MessageStream.write(text)
+            return
+        writeFileAtomically(FileName, text)
+        return
+
+
+class _CountingMoney:
+    """ Stands in for a MoneyParser in the format stage, counting the money strings it is asked to render """
+
+    def __init__(self, Stats: PipelineStats, Money: MoneyParser) -> None:
+        """ Keeps the statistics to count into and the parser doing the rendering """
+        self.__mStats = Stats
+        self.__mMoney = Money
+        return
+
+    def formatPrice(self, CsvFloatText: str) -> str:
+        """ Counts a price and renders it with MoneyParser.formatPrice """
+        self.__mStats.moneyLookups = self.__mStats.moneyLookups + 1
+        return(self.__mMoney.formatPrice(CsvFloatText))
+
+    def formatValue(self, CsvFloatText: str) -> str:
+        """ Counts an amount and renders it with MoneyParser.formatValue """
+        self.__mStats.moneyLookups = self.__mStats.moneyLookups + 1
+        return(self.__mMoney.formatValue(CsvFloatText))
+
+    def formatQuantity(self, CsvFloatText: str) -> str:
+        """ Counts a share quantity and renders it with MoneyParser.formatQuantity """
+        self.__mStats.moneyLookups = self.__mStats.moneyLookups + 1
+        return(self.__mMoney.formatQuantity(CsvFloatText))
+
+
+#*************
+# Functions
+#*************
+def _addMetric(Lines: List[str], Name: str, Help: str, Samples: List[Tuple[Dict[str, str], float]]) -> None:
+    """ Appends one gauge metric and its samples in the Prometheus text format """
+    name = _METRIC_PREFIX + Name
+    Lines.append("# HELP {} {}\n".format(name, Help))
+    Lines.append("# TYPE {} gauge\n".format(name))
+    for labels, value in Samples:
+        labelText = ",".join('{}="{}"'.format(key, _escapeLabel(text)) for key, text in labels.items())
+        Lines.append("{}{} {}\n".format(name, "{" + labelText + "}" if labelText else "", repr(float(value)) if isinstance(value, float) else value))
+    return
+
+def _escapeLabel(Text: str) -> str:
+    """ Escapes a Prometheus label value """
+    return(Text.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
@@ -0,0 +1,126 @@
+#************
+# Imports
+#************
+import io
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from CliDefaults import ENGINE_ROWS
+from CompiledConfig import CompiledConfig
+from MoneyParser import MoneyParser
+from QifPipeline import abortOutputFiles, closeOutputFiles, convertCsvFile, formatRecords, readCsvRows, routeRecords
+from QifWriter import SINK_MEMORY, QifWriter, SinkSpec
+
+# The errors are part of the library interface, and are imported here so callers can take everything from this module
+from ConversionErrors import (ConfigError, ConversionError, CsvFormatError, DateFormatError, MoneyFormatError, OutputConfigError, RoutingError,
+                              UnknownActionError)
+
+
+#***********
+# Classes
+#***********
+class Converter:
+    """ CSV to QIF conversion for programs using the converter as a library.
+
+    A Converter is built once from a configuration and then converts any number of CSV files or row sources.  Nothing
+    is printed, no file is written, and every error is raised as one of the ConversionError types: ConfigError when
+    the configuration is invalid, CsvFormatError for a missing column or a short row, UnknownActionError,
+    MoneyFormatError, DateFormatError and RoutingError.  OutputConfigError is raised by the QIF writers when an output
+    cannot be written as configured.  Reading a CSV file can also raise OSError.
+
+    Example
+    -------
+    converter = Converter(json.load(cfgFile))
+    for destination, qifRecord in converter.convertRows(csv.reader(csvFile)):
+        ...
+    """
+
+    def __init__(self, Config: Any, SourceName: str = "<config>") -> None:
+        """ Compiles the configuration.
+
+        Parameters
+        ----------
+        Config: The configuration as parsed JSON (a dictionary with csvFile and qifFiles objects), or a
+            CompiledConfig.  The qifFiles sink keys are ignored, since records are handed back to the caller.
+        SourceName: Name of the configuration used in error messages.
+
+        Returns
+        -------
+        None
+        """
+        self.__mConfig = Config if isinstance(Config, CompiledConfig) else CompiledConfig(Config, SourceName)
+        self.__mMoney = MoneyParser()
+        return
+
+    @classmethod
+    def load(cls, CfgFileName: str, CacheFileName: Optional[str] = None) -> "Converter":
+        """ Builds a converter from a JSON configuration file, optionally through a config cache file (see
+        CompiledConfig.load).  A file that is not valid JSON raises ConfigError. """
+        return(cls(CompiledConfig.load(CfgFileName, CacheFileName)))
+
+    @property
+    def destinations(self) -> Sequence[str]:
+        """ The qifFiles names, in configuration order """
+        return(self.__mConfig.qifNames)
+
+    def convertRows(self, Rows: Iterable[Sequence[str]], Header: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, str]]:
+        """ Converts CSV rows lazily, one record for each row taken from the iterator.
+
+        Parameters
+        ----------
+        Rows: CSV rows as sequences of field strings, as csv.reader gives them.  Unless Header is given, the first row
+            is the header row.  Empty rows are skipped.
+        Header: The header row, when Rows holds only records.
+
+        Returns
+        -------
+        Iterator[Tuple[str, str]]: The qifFiles name each record is routed to, paired with its QIF record text, in
+            row order.  Errors are raised as the rows are reached, with the records before them already handed back.
+        """
+        rows = iter(Rows)
+        if (Header is None):
+            Header = next(rows, None)
+            if (Header is None):
+                return
+        layout = self.__mConfig.bindHeader(Header)
+        rows = filter(None, rows)
+        if (layout.dates is not None):
+            rows = layout.dates.sampleRows(rows, layout.columns[0])
+        names = self.__mConfig.qifNames
+        for fileIndex, qifRecord in routeRecords(formatRecords(rows, layout.columns, self.__mConfig.symbols, self.__mMoney, layout.dates),
+                                                 layout.router):
+            yield (names[fileIndex], qifRecord)
+        return
+
+    def convertText(self, CsvText: str) -> Iterator[Tuple[str, str]]:
+        """ Converts CSV text held in memory lazily, as convertRows does, reading line endings as a text file would """
+        header, rows = readCsvRows(io.StringIO(CsvText, newline = None))
+        if (header is None):
+            return(iter(()))
+        return(self.convertRows(rows, header))
+
+    def convertFile(self, CsvFileName: str, MapFile: bool = False, Engine: str = ENGINE_ROWS) -> Dict[str, io.StringIO]:
+        """ Converts a whole CSV file into QIF text held in memory.
+
+        Parameters
+        ----------
+        CsvFileName: The CSV file name.
+        MapFile: When set True, the file is memory mapped (see the --mmap option).
+        Engine: The conversion engine, one of ENGINES (see the --engine option).
+
+        Returns
+        -------
+        Dict[str, io.StringIO]: For each qifFiles name, in configuration order, a text stream positioned at the start
+            of its QIF text.  qifFiles entries sharing a name share a stream, which has their records in file order.
+        """
+        writers = {}
+        for name in self.__mConfig.qifNames:
+            if (name not in writers):
+                writers[name] = QifWriter(name, Spec = SinkSpec(SINK_MEMORY))
+        fileHandles = [ writers[name] for name in self.__mConfig.qifNames ]
+        try:
+            convertCsvFile(CsvFileName, fileHandles, self.__mConfig, self.__mMoney, MapFile = MapFile, Engine = Engine)
+        except BaseException:
+            abortOutputFiles(writers.values())
+            raise
+        closeOutputFiles(writers.values())
+        return({ name: io.StringIO(writer.sink.getvalue()) for name, writer in writers.items() })
@@ -0,0 +1,322 @@
+#************
+# Imports
+#************
+import csv
+import io
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from CliDefaults import ENGINE_COLUMNAR, ENGINE_ROWS, ENGINE_THREADED
+from CompiledConfig import CompiledConfig, RowLayout
+from ConversionErrors import CsvFormatError, RoutingError, UnknownActionError
+from MoneyParser import MoneyParser
+from QifRouter import QifRouter
+from QifWriter import DEFAULT_BUFFER_SIZE, STREAM_FILE_NAME, QifWriter, SinkSpec
+from SymbolTable import RecordSymbols
+
+if (TYPE_CHECKING):
+    from DateParser import DateParser
+    from PipelineStats import PipelineStats
+    from RecordAggregator import RecordAggregator
+
+#******************
+# Constants/Enums
+#******************
+
+# One QIF investment record: date, action, security, price, value, quantity and memo fields.  The money fields
+# arrive already rendered by MoneyParser, and the action as its whole N line (see RecordSymbols).
+QIF_RECORD_FORMAT = "D{}\n{}Y{}\nI{}\nT{}\nQ{}\nM{}\n^\n"
+
+# Exception strings raised by this file
+ERROR_NO_OUTPUT_FILE = "Cannot map CSV file record to an output file: {}"
+ERROR_SHORT_ROW = "CSV file record has fewer fields than the header row: {}"
+ERROR_UNKNOWN_ACTION = "CSV file record action '{}' is not in the actionCodeMap: {}"
+
+
+#*************
+# Functions
+#*************
+#
+# The conversion is a chain of generators: read -> format -> route.  Each stage pulls a single record from the
+# stage before it only when the stage after it asks for one, so no stage ever holds more than the record in flight.
+# Backpressure is therefore explicit in the call chain: when a writer blocks (e.g. a pipe reader is slow), nothing
+# further is read from the CSV input, and peak memory stays constant with respect to the input size.
+#
+def readCsvRows(CsvStream: TextIO) -> Tuple[Optional[List[str]], Iterator[List[str]]]:
+    """ Reader stage: parses CSV text into rows of field values.
+
+    Parameters
+    ----------
+    CsvStream: Text stream positioned at the CSV header row.  Any iterable of lines will do, including sys.stdin.
+
+    Returns
+    -------
+    Tuple[Optional[List[str]], Iterator[List[str]]]: The header row (None for an empty file), and an iterator of the
+        remaining rows as lists indexed by column position.  Blank lines are skipped, as csv.DictReader would.
+    """
+    reader = csv.reader(CsvStream)
+    header = next(reader, None)
+    return(header, filter(None, reader))
+
+def formatRecords(Rows: Iterable[Any], Columns: Sequence[Any], Symbols: RecordSymbols,
+                  Money: MoneyParser, Dates: Optional["DateParser"] = None) -> Iterator[Tuple[Any, str]]:
+    """ Format stage: builds the QIF record text for each CSV row.
+
+    Parameters
+    ----------
+    Rows: CSV rows from the reader stage.
+    Columns: The row indexes (see CompiledConfig.bindHeader) for the date, action, security, price, value, quantity and
+        memo columns, in that order.
+    Symbols: The symbol tables of the configuration, rendering the N line once per distinct action text (see
+        CompiledConfig.symbols).
+    Money: Parser rendering the CSV money strings as QIF field text.
+    Dates: Parser rendering the CSV dates as QIF field text (see RowLayout.dates), or None to copy them as they are.
+
+    Returns
+    -------
+    Iterator[Tuple[Any, str]]: The CSV row paired with its QIF record text.
+    """
+    dateColumn, actionColumn, securityColumn, priceColumn, valueColumn, quantityColumn, memoColumn = Columns
+    recordFormat = QIF_RECORD_FORMAT.format
+    formatDate = Dates.formatDate if (Dates is not None) else str
+    actionLine = Symbols.action.lookup
+    formatPrice = Money.formatPrice
+    formatValue = Money.formatValue
+    formatQuantity = Money.formatQuantity
+    for row in Rows:
+        try:
+            qifRecord = recordFormat(
+                            formatDate(row[dateColumn]),                # D
+                            actionLine(row[actionColumn]),              # N
+                            row[securityColumn],                        # Y
+                            formatPrice(row[priceColumn]),              # I
+                            formatValue(row[valueColumn]),              # T
+                            formatQuantity(row[quantityColumn]),        # Q
+                            row[memoColumn])                            # M
+        except IndexError:
+            raise CsvFormatError(ERROR_SHORT_ROW.format(row))
+        except KeyError:
+            raise UnknownActionError(ERROR_UNKNOWN_ACTION.format(row[actionColumn], row))
+        yield (row, qifRecord)
+    return
+
+def routeRecords(Records: Iterable[Tuple[Any, str]], Router: QifRouter) -> Iterator[Tuple[int, str]]:
+    """ Route stage: pairs each QIF record with the index of the qifFiles entry that receives it.
+
+    Parameters
+    ----------
+    Records: (CSV row, QIF record text) pairs from the format stage.
+    Router: The compiled qifFiles routing rules.
+
+    Returns
+    -------
+    Iterator[Tuple[int, str]]: The output file index paired with the QIF record text.
+    """
+    route = Router.route
+    for row, qifRecord in Records:
+        # Make sure the record goes somewhere
+        try:
+            fileIndex = route(row)
+        except IndexError:
+            raise CsvFormatError(ERROR_SHORT_ROW.format(row))
+        if (fileIndex is None):
+            raise RoutingError(ERROR_NO_OUTPUT_FILE.format(qifRecord))
+        yield (fileIndex, qifRecord)
+    return
+
+def openOutputFiles(FileNames: Sequence[str], Append: bool = False, BufferSize: int = DEFAULT_BUFFER_SIZE,
+                    Fsync: bool = False, Sinks: Optional[Sequence[SinkSpec]] = None,
+                    ResumeOffsets: Optional[Sequence[int]] = None) -> List[QifWriter]:
+    """ Opens the QIF output files for writing.
+
+    Parameters
+    ----------
+    FileNames: The output file names in qifFiles order.  STREAM_FILE_NAME selects stdout, and named pipes are opened
+        like any other file.
+    Append: When set True, records are appended to existing files rather than replacing them.
+    BufferSize: Number of characters each writer collects before writing them to its file.
+    Fsync: When set True, each file is forced to disk before it is moved into place.
+    Sinks: How each destination is stored, in the same order (see CompiledConfig.qifSinks).  By default, every
+        destination is written to a plain file.
+    ResumeOffsets: When set, the files are resumable, and each keeps the given number of bytes written by a failed
+        run (see Checkpoint).  Resumable files must be plain files.
+
+    Returns
+    -------
+    List[QifWriter]: The output writers, in the same order.  Regular files only appear under their real names when
+        closeOutputFiles is called.
+    """
+    fileHandles = []
+    try:
+        for fileIndex, fileName in enumerate(FileNames):
+            fileHandles.append(QifWriter(fileName, Append, BufferSize, Fsync, Sinks[fileIndex] if (Sinks is not None) else None,
+                                         ResumeOffsets[fileIndex] if (ResumeOffsets is not None) else None))
+    except BaseException:
+        if (ResumeOffsets is not None):
+            suspendOutputFiles(fileHandles)
+        else:
+            abortOutputFiles(fileHandles)
+        raise
+    return(fileHandles)
+
+def closeOutputFiles(FileHandles: Sequence[QifWriter]) -> None:
+    """ Finishes the files opened by openOutputFiles, moving each completed file into place """
+    for fileHandle in FileHandles:
+        fileHandle.close()
+    return
+
+def abortOutputFiles(FileHandles: Sequence[QifWriter]) -> None:
+    """ Discards the files opened by openOutputFiles after a failed conversion, keeping any previous output """
+    for fileHandle in FileHandles:
+        fileHandle.abort()
+    return
+
+def suspendOutputFiles(FileHandles: Sequence[QifWriter]) -> None:
+    """ Closes the resumable files opened by openOutputFiles after a failed conversion, keeping their text for a
+    resumed conversion """
+    for fileHandle in FileHandles:
+        fileHandle.suspend()
+    return
+
+def convertCsvFile(CsvFileName: str, FileHandles: Sequence[QifWriter], Config: CompiledConfig, Money: MoneyParser,
+                   RowFilter: Optional[Callable[[Iterable[Any], RowLayout], Iterable[Any]]] = None,
+                   Stats: Optional["PipelineStats"] = None, MapFile: bool = False, Engine: str = ENGINE_ROWS,
+                   Aggregator: Optional["RecordAggregator"] = None) -> int:
+    """ Streams a CSV file through the read -> format -> route pipeline into the QIF output files.
+
+    Parameters
+    ----------
+    CsvFileName: The CSV file name, or STREAM_FILE_NAME to read stdin.
+    FileHandles: The output writers in qifFiles order.
+    Config: The compiled conversion configuration.
+    Money: Parser rendering the CSV money strings as QIF field text.
+    RowFilter: Optional stage between the reader and format stages, taking an iterable of rows and the row layout
+        of the CSV file, and returning an iterable of rows.  It is given every field of each row.
+    Stats: Optional statistics to gather.  Every stage is then timed and counted, which slows the conversion a little.
+    MapFile: When set True, the CSV file is memory mapped and read by MappedCsvReader, which only decodes the
+        columns the configuration uses.  Files it cannot read (see mapCsvFile) are read through the csv module.
+    Engine: ENGINE_ROWS streams the rows through the format and route stages one at a time.  ENGINE_COLUMNAR converts
+        them a block at a time with ColumnarEngine, and ENGINE_THREADED reads and writes on their own threads with
+        ThreadedPipeline, which both give the same output.  Gathering Stats always uses the row by row stages.
+    Aggregator: Optional RecordAggregator merging the records of each day with the same action, security and output
+        file, which always uses the row by row stages.  It counts the records it writes.
+
+    Returns
+    -------
+    int: The number of CSV records written.
+    """
+    recordsProcessed = 0
+    csvData = None
+    if (MapFile and (CsvFileName != STREAM_FILE_NAME)):
+        # Imported here so conversions reading through the csv module do not load mmap
+        from MappedCsvReader import MappedCsvReader, mapCsvFile
+        csvData = mapCsvFile(CsvFileName)
+    csvFile = None
+    try:
+        if (csvData is not None):
+            mappedReader = MappedCsvReader(csvData)
+            header = mappedReader.readRow()
+        else:
+            csvFile = sys.stdin if (CsvFileName == STREAM_FILE_NAME) else open(CsvFileName, "rt")
+            header, rows = readCsvRows(csvFile if (Stats is None) else Stats.countBytes(csvFile))
+        if (header is None):
+            return(0)
+
+        # Resolve the configured columns to positions once, reporting any that are missing before the first record
+        layout = Config.bindHeader(header)
+        if (csvData is not None):
+            # Fields past the last configured column are skipped, unless the row filter needs whole rows
+            rows = mappedReader.rows(None if (RowFilter is not None) else (max(Config.resolveColumns(header).values()) + 1))
+            if (Stats is not None):
+                Stats.bytesRead = len(csvData)
+        if (layout.dates is not None):
+            rows = layout.dates.sampleRows(rows, layout.columns[0])
+        if (Stats is not None):
+            return(_convertRowsWithStats(rows, layout, FileHandles, Config, Money, RowFilter, Stats))
+        if ((RowFilter is not None) and ((Engine != ENGINE_THREADED) or (Aggregator is not None))):
+            # ThreadedPipeline runs the filter itself, on this thread rather than its reader thread
+            rows = RowFilter(rows, layout)
+        if (Aggregator is not None):
+            recordsProcessed = _writeAggregatedRecords(rows, layout, FileHandles, Config, Money, Aggregator)
+        elif (Engine == ENGINE_COLUMNAR):
+            # Imported here so conversions with the default engine do not load it
+            from ColumnarEngine import convertColumnar
+            recordsProcessed = convertColumnar(rows, layout, FileHandles, Config, Money)
+        elif (Engine == ENGINE_THREADED):
+            from ThreadedPipeline import convertThreaded
+            recordsProcessed = convertThreaded(rows, layout, FileHandles, Config, Money, RowFilter)
+        else:
+            recordsProcessed = writeRecords(rows, layout, FileHandles, Config, Money)
+    finally:
+        if (csvData is not None):
+            csvData.close()
+        elif ((csvFile is not None) and (csvFile is not sys.stdin)):
+            csvFile.close()
+    return(recordsProcessed)
+
+def convertCsvText(CsvText: str, FileHandles: Sequence[QifWriter], Config: CompiledConfig, Money: MoneyParser) -> int:
+    """ Converts CSV text held in memory into the QIF output files.
+
+    Parameters
+    ----------
+    CsvText: The CSV file contents, with any line endings.
+    FileHandles: The output writers in qifFiles order.
+    Config: The compiled conversion configuration.
+    Money: Parser rendering the CSV money strings as QIF field text.
+
+    Returns
+    -------
+    int: The number of CSV records written.
+    """
+    # newline = None translates the line endings as reading a file in text mode would
+    header, rows = readCsvRows(io.StringIO(CsvText, newline = None))
+    if (header is None):
+        return(0)
+    layout = Config.bindHeader(header)
+    if (layout.dates is not None):
+        rows = layout.dates.sampleRows(rows, layout.columns[0])
+    return(writeRecords(rows, layout, FileHandles, Config, Money))
+
+def writeRecords(Rows: Iterable[Any], Layout: RowLayout, FileHandles: Sequence[QifWriter], Config: CompiledConfig,
+                 Money: MoneyParser) -> int:
+    """ Runs the format and route stages over the rows, writing each record to its output file.
+
+    Parameters
+    ----------
+    Rows: CSV rows from the reader stage.
+    Layout: The row layout of the CSV file.
+    FileHandles: The output writers in qifFiles order.
+    Config: The compiled conversion configuration.
+    Money: Parser rendering the CSV money strings as QIF field text.
+
+    Returns
+    -------
+    int: The number of CSV records written.
+    """
+    recordsProcessed = 0
+    records = formatRecords(Rows, Layout.columns, Config.symbols, Money, Layout.dates)
+    for fileIndex, qifRecord in routeRecords(records, Layout.router):
+        recordsProcessed = recordsProcessed + 1
+        FileHandles[fileIndex].write(qifRecord)
+    return(recordsProcessed)
+
+def _writeAggregatedRecords(Rows: Iterable[Any], Layout: RowLayout, FileHandles: Sequence[QifWriter], Config: CompiledConfig,
+                            Money: MoneyParser, Aggregator: "RecordAggregator") -> int:
+    """ Runs the format and aggregate stages over the rows, writing each merged record to its output file """
+    rowsRead = Aggregator.rowsRead
+    for fileIndex, qifRecord in Aggregator.aggregateRecords(Rows, Layout, Config.symbols, Money):
+        FileHandles[fileIndex].write(qifRecord)
+    return(Aggregator.rowsRead - rowsRead)
+
+def _convertRowsWithStats(Rows: Iterable[Any], Layout: RowLayout, FileHandles: Sequence[QifWriter], Config: CompiledConfig,
+                          Money: MoneyParser, RowFilter: Optional[Callable[[Iterable[Any], RowLayout], Iterable[Any]]],
+                          Stats: "PipelineStats") -> int:
+    """ Runs the rest of convertCsvFile with every stage wrapped to gather statistics """
+    from PipelineStats import STAGE_FILTER, STAGE_FORMAT, STAGE_READ, STAGE_ROUTE
+    rows = Stats.timeStage(STAGE_READ, Rows)
+    if (RowFilter is not None):
+        rows = Stats.timeStage(STAGE_FILTER, RowFilter(rows, Layout))
+    records = formatRecords(rows, Layout.columns, Config.symbols, Stats.countingParser(Money), Layout.dates)
+    records = Stats.timeStage(STAGE_FORMAT, Stats.countActions(records, Layout.columns[1], Config.actionDict))
+    routed = Stats.timeStage(STAGE_ROUTE, routeRecords(records, Layout.router))
+    return(Stats.writeRecords(routed, FileHandles, Layout.router))
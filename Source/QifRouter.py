@@ -0,0 +1,204 @@
+#************
+# Imports
+#************
+import copy
+import re
+from typing import Any, Dict, List, Optional
+
+from ConversionErrors import ConfigError
+
+#******************
+# Constants/Enums
+#******************
+
+# Key names from the output file objects
+JSON_KEY_OUTPUT_FILE_MATCH_COLUMN = "matchColumn"
+JSON_KEY_OUTPUT_FILE_MATCH_REGEX = "matchRegEx"
+
+# Maximum number of column values remembered per routing segment.  Once full, new values are still routed
+# but their results are not cached.  This bounds memory on files with a unique value in every row.
+ROUTER_CACHE_SIZE = 65536
+
+# Group name prefix used to tag each rule inside a merged alternation
+_RULE_GROUP_PREFIX = "_qifRule"
+
+# Patterns containing numbered back references or conditional groups depend on their own group numbering
+# and cannot be safely embedded in a larger alternation.
+_UNMERGEABLE_REGEX = re.compile(r"\\[1-9]|\(\?\(")
+
+# Exception strings raised by this file
+ERROR_BAD_MATCH_REGEX = "Output file {} has an invalid matchRegEx '{}': {}"
+
+
+#***********
+# Classes
+#***********
+class _RouteSegment:
+    """ A run of consecutive qifFiles rules that test the same CSV column.
+
+    Rules in a segment are evaluated together.  When the rules can be merged, a single regular expression
+    alternation is evaluated per column value.  Otherwise each precompiled rule is tried in order.  Results are
+    memoized per column value.  The outcome of every evaluation that was not answered from the memo is counted, so
+    the number of times each rule was actually tried can be reported.
+    """
+
+    __slots__ = ("column", "mergeable", "merged", "rules", "cache", "outcomes")
+
+    def __init__(self, Column: Any, Mergeable: bool) -> None:
+        self.column = Column
+        self.mergeable = Mergeable
+        self.merged = None
+        self.rules = []     # List of (output file index, compiled pattern) tuples in config order
+        self.cache = {}
+        self.outcomes = {}  # Output file index (or None) to the number of evaluations with that result
+        return
+
+    def withColumn(self, Column: Any) -> "_RouteSegment":
+        """ Returns a copy of the segment testing a different column key, sharing the rules and the result cache.
+        The copy counts its evaluations separately. """
+        segment = _RouteSegment(Column, self.mergeable)
+        segment.merged = self.merged
+        segment.rules = self.rules
+        segment.cache = self.cache
+        return(segment)
+
+    def match(self, Value: str) -> Optional[int]:
+        """ Returns the output file index of the first rule in the segment matching the value, or None """
+        try:
+            return(self.cache[Value])
+        except KeyError:
+            pass
+
+        fileIndex = None
+        if (self.merged is not None):
+            match = self.merged.match(Value)
+            if (match is not None):
+                # The wrapping group of the matching rule is always the last group closed
+                fileIndex = int(match.lastgroup[len(_RULE_GROUP_PREFIX):])
+        else:
+            for ruleIndex, pattern in self.rules:
+                if (pattern.match(Value) is not None):
+                    fileIndex = ruleIndex
+                    break
+
+        self.outcomes[fileIndex] = self.outcomes.get(fileIndex, 0) + 1
+        if (len(self.cache) < ROUTER_CACHE_SIZE):
+            self.cache[Value] = fileIndex
+        return(fileIndex)
+
+
+class QifRouter:
+    """ Routes CSV records to the first qifFiles output file whose matchRegEx matches its matchColumn.
+
+    The router is built once when the configuration is loaded.  Every matchRegEx is precompiled, and consecutive
+    rules testing the same column are merged into a single alternation of named groups where possible, so a record
+    costs one regular expression evaluation per routing column.  Python alternation is ordered, so the first
+    matching rule still wins exactly as when the rules are tried one at a time.
+    """
+
+    def __init__(self, OutputFiles: List[Dict[str, Any]]) -> None:
+        """ Compiles the routing rules.
+
+        Parameters
+        ----------
+        OutputFiles: The qifFiles array from the JSON configuration file.
+
+        Returns
+        -------
+        None
+        """
+        defaultFlags = re.compile("").flags
+        self.__mFileCount = len(OutputFiles)
+        self.__mSegments = []
+        segment = None
+        for fileIndex, fileDesc in enumerate(OutputFiles):
+            column = fileDesc[JSON_KEY_OUTPUT_FILE_MATCH_COLUMN]
+            regEx = fileDesc[JSON_KEY_OUTPUT_FILE_MATCH_REGEX]
+            try:
+                pattern = re.compile(regEx)
+            except re.error as err:
+                raise ConfigError(ERROR_BAD_MATCH_REGEX.format(fileIndex, regEx, err))
+
+            # Patterns with global inline flags (e.g. "(?i)") would apply them to the whole alternation
+            mergeable = ((pattern.flags == defaultFlags) and (_UNMERGEABLE_REGEX.search(regEx) is None))
+
+            # Start a new segment when the column changes or when a rule cannot share an alternation
+            if ((segment is None) or (segment.column != column) or (not mergeable) or (not segment.mergeable)):
+                segment = _RouteSegment(column, mergeable)
+                self.__mSegments.append(segment)
+            segment.rules.append((fileIndex, pattern))
+
+        for segment in self.__mSegments:
+            segment.merged = self.__mergeRules(segment.rules)
+        return
+
+    @property
+    def fileCount(self) -> int:
+        """ The number of qifFiles entries the router was built from """
+        return(self.__mFileCount)
+
+    @property
+    def columns(self) -> List[Any]:
+        """ The distinct columns tested by the routing rules, in first use order """
+        return(list(dict.fromkeys(segment.column for segment in self.__mSegments)))
+
+    def ruleAttempts(self) -> List[int]:
+        """ Counts the regular expression evaluations made by this router for each rule.
+
+        Returns
+        -------
+        List[int]: Per qifFiles entry, the number of column values its matchRegEx was tried against.  A rule is tried
+            when every earlier rule of its segment failed, whether the segment is evaluated as one merged alternation
+            or rule by rule.  Values answered from the memoized results are not counted.
+        """
+        attempts = [ 0 ] * self.__mFileCount
+        for segment in self.__mSegments:
+            remaining = sum(segment.outcomes.values())
+            for fileIndex, pattern in segment.rules:
+                attempts[fileIndex] = attempts[fileIndex] + remaining
+                remaining = remaining - segment.outcomes.get(fileIndex, 0)
+        return(attempts)
+
+    def bind(self, Columns: Dict[Any, int]) -> "QifRouter":
+        """ Returns a copy of the router that indexes rows by position instead of by column name.
+
+        Parameters
+        ----------
+        Columns: Column name to row index, covering every matchColumn.
+
+        Returns
+        -------
+        QifRouter: The bound router.  It shares the compiled rules and memoized results with this router.
+        """
+        bound = copy.copy(self)
+        bound.__mSegments = [ segment.withColumn(Columns[segment.column]) for segment in self.__mSegments ]
+        return(bound)
+
+    def route(self, Row: Any) -> Optional[int]:
+        """ Finds the output file for a CSV record.
+
+        Parameters
+        ----------
+        Row: The CSV record, indexable by the matchColumn values given in the configuration.
+
+        Returns
+        -------
+        Optional[int]: The index of the first matching entry in the qifFiles array, or None if nothing matches.
+        """
+        for segment in self.__mSegments:
+            fileIndex = segment.match(Row[segment.column])
+            if (fileIndex is not None):
+                return(fileIndex)
+        return(None)
+
+    @staticmethod
+    def __mergeRules(Rules: list) -> Optional[re.Pattern]:
+        """ Builds a single alternation from a list of rules, or returns None if the rules cannot be merged """
+        if (len(Rules) < 2):
+            return(None)
+        alternation = "|".join("(?P<{}{}>{})".format(_RULE_GROUP_PREFIX, fileIndex, pattern.pattern) for fileIndex, pattern in Rules)
+        try:
+            return(re.compile(alternation))
+        except re.error:
+            # Typically a named group used by more than one rule
+            return(None)
@@ -0,0 +1,638 @@
+#************
+# Imports
+#************
+import os
+import stat
+import sys
+from typing import List, Optional, TextIO, Union
+
+from CliDefaults import DEFAULT_BUFFER_SIZE, STREAM_FILE_NAME
+from ConversionErrors import OutputConfigError
+
+#******************
+# Constants/Enums
+#******************
+
+# Suffix of the temporary file a QIF file is written to before it is renamed into place
+TEMP_FILE_SUFFIX = ".tmp"
+
+# Name of the temporary file a resumable QIF file is written to.  Unlike other temporary files, its name is the same
+# on every run, so a resumed conversion finds the text the failed run left in it.
+RESUME_FILE_FORMAT = "{}.resume" + TEMP_FILE_SUFFIX
+
+# Name of the journal kept while new text is appended to a QIF file.  It holds the file's size before and after the
+# append, so an append cut short by a crash is cut back off the file when it is next appended to.
+APPEND_JOURNAL_FORMAT = "{}.append" + TEMP_FILE_SUFFIX
+
+# qifFiles sink values: how the QIF text of a destination is stored
+SINK_FILE = "file"
+SINK_GZIP = "gzip"
+SINK_ZSTD = "zstd"
+SINK_MEMORY = "memory"
+SINKS = (SINK_FILE, SINK_GZIP, SINK_ZSTD, SINK_MEMORY)
+
+# File name suffixes of the compressed sinks.  A split destination's part number goes in front of them.
+SINK_SUFFIXES = { SINK_GZIP: ".gz", SINK_ZSTD: ".zst" }
+
+# Name of each part of a split destination, from the stem of the destination name, the part number and its
+# extensions: Roth.qif is split into Roth-001.qif, Roth-002.qif and so on
+SPLIT_PART_FORMAT = "{}-{:03d}{}"
+
+# Every QIF record ends with this line, and split destinations are only ever cut after it
+QIF_RECORD_END = "^\n"
+
+BYTES_PER_MEGABYTE = 1024 * 1024
+
+# gzip compression level.  The gzip module's default of 9 spent twice as long compressing as level 6, for files under 2%
+# smaller.
+GZIP_COMPRESS_LEVEL = 6
+
+# Exception strings raised by this file
+ERROR_SPLIT_NEEDS_FILE = "QIF output '{}' can only be split when it is written to regular files"
+ERROR_RESUME_NEEDS_FILE = "QIF output '{}' can only be resumed when it is written to a regular, uncompressed and unsplit file"
+ERROR_ZSTD_NOT_INSTALLED = "QIF output '{}' uses the zstd sink, which needs the zstandard package (pip install zstandard)"
+
+
+#***********
+# Classes
+#***********
+class SinkSpec:
+    """ How the QIF text of one qifFiles destination is stored: its sink, and the size its parts are split at """
+
+    __slots__ = ("sink", "splitBytes", "splitRecords")
+
+    def __init__(self, Sink: str = SINK_FILE, SplitBytes: Optional[int] = None, SplitRecords: Optional[int] = None) -> None:
+        """ Stores the specification.
+
+        Parameters
+        ----------
+        Sink: One of SINKS.
+        SplitBytes: When set, the destination is split into parts of at most this many bytes of QIF text.
+        SplitRecords: When set, the destination is split into parts of at most this many QIF records.
+
+        Returns
+        -------
+        None
+        """
+        self.sink = Sink
+        self.splitBytes = SplitBytes
+        self.splitRecords = SplitRecords
+        return
+
+    @property
+    def split(self) -> bool:
+        """ True when the destination is split into parts """
+        return((self.splitBytes is not None) or (self.splitRecords is not None))
+
+
+class FileSink:
+    """ Atomic, optionally compressed, output of QIF text to one file.
+
+    A regular output file is written to a temporary file in the same directory and only renamed over the real file by
+    close().  If the conversion fails, abort() removes the temporary file, so a crash never leaves a truncated QIF that
+    Quicken would half import, and any previous output is left untouched.  When appending, only the new text is
+    written to the temporary file, and close() adds it to the end of the existing file, so an append costs the size of
+    the new text rather than of the whole file.  A journal of the file's size (see APPEND_JOURNAL_FORMAT) lets the next
+    append cut off the text of an append a crash interrupted.  Outputs that cannot be renamed over (stdout, named
+    pipes and devices) are written directly.
+
+    A compressed file is written through a streaming gzip or zstd compressor, so its text is never held in memory.
+    Appending adds a new gzip member or zstd frame after the existing ones, which both formats read as one stream.
+
+    A resumable file is written to a temporary file whose name does not change from run to run (see resumeFileName),
+    and which is cut back to a checkpointed size when it is opened, so a resumed conversion continues the text a
+    failed run left there.  suspend() closes it after a failure without removing it.
+    """
+
+    def __init__(self, FileName: str, Append: bool = False, Fsync: bool = False, Compression: Optional[str] = None,
+                 ResumeOffset: Optional[int] = None) -> None:
+        """ Opens the output.
+
+        Parameters
+        ----------
+        FileName: The QIF file name, or STREAM_FILE_NAME for stdout.
+        Append: When set True, text is added to the end of an existing file rather than replacing it.
+        Fsync: When set True, close() forces the file contents to disk before the file is renamed into place.
+        Compression: None, SINK_GZIP or SINK_ZSTD.
+        ResumeOffset: When set, the file is resumable, and the text a failed run left in its temporary file is kept
+            up to this many bytes.  0 starts it afresh.  A resumable file must be a regular, uncompressed file.
+
+        Returns
+        -------
+        None
+        """
+        if ((ResumeOffset is not None) and ((Compression is not None) or (FileName == STREAM_FILE_NAME) or
+                                            (os.path.exists(FileName) and (not os.path.isfile(FileName))))):
+            raise OutputConfigError(ERROR_RESUME_NEEDS_FILE.format(FileName))
+        self.name = FileName
+        self.__mFsync = Fsync
+        self.__mTempFileName = None
+        self.__mStdout = (FileName == STREAM_FILE_NAME)
+        self.__mRaw = None      # The binary file under a compressed text stream
+        self.__mAppend = False  # Whether close() appends the temporary file to the existing file
+
+        binary = "b" if (Compression is not None) else "t"
+        if (self.__mStdout):
+            outputFile = sys.stdout.buffer if (Compression is not None) else sys.stdout
+        elif (os.path.exists(FileName) and (not os.path.isfile(FileName))):
+            # A named pipe or device cannot be replaced by a rename
+            outputFile = open(FileName, ("a" if Append else "w") + binary)
+        elif (ResumeOffset is not None):
+            self.__mTempFileName = resumeFileName(FileName)
+            if (ResumeOffset and os.path.isfile(self.__mTempFileName)):
+                # Drop whatever the failed run wrote after its last checkpoint
+                os.truncate(self.__mTempFileName, ResumeOffset)
+                outputFile = open(self.__mTempFileName, "a" + binary)
+            else:
+                outputFile = open(self.__mTempFileName, "w" + binary)
+            if (os.path.isfile(FileName)):
+                os.chmod(self.__mTempFileName, stat.S_IMODE(os.stat(FileName).st_mode))
+        else:
+            self.__mTempFileName = "{}.{}.{}{}".format(FileName, os.getpid(), os.urandom(4).hex(), TEMP_FILE_SUFFIX)
+            self.__mAppend = Append and os.path.isfile(FileName)
+            if (self.__mAppend):
+                _recoverAppend(FileName)
+            outputFile = open(self.__mTempFileName, "x" + binary)
+            if (os.path.isfile(FileName) and (not self.__mAppend)):
+                os.chmod(self.__mTempFileName, stat.S_IMODE(os.stat(FileName).st_mode))
+
+        self.__mFile = outputFile
+        if (Compression is not None):
+            try:
+                self.__mFile = _openCompressor(FileName, outputFile, Compression)
+            except BaseException:
+                self.abort()
+                raise
+            self.__mRaw = outputFile
+        return
+
+    def write(self, Text: str) -> None:
+        """ Writes text to the file """
+        self.__mFile.write(Text)
+        return
+
+    def flush(self) -> None:
+        """ Passes the text written so far on to the operating system.  A compressed file is left to the compressor,
+        since flushing it part way would make the compression worse. """
+        if (self.__mRaw is None):
+            self.__mFile.flush()
+        return
+
+    def finish(self) -> None:
+        """ Completes and closes the file, leaving it under its temporary name """
+        if (self.__mFile.closed):
+            return
+        outputFile = self.__mFile
+        if (self.__mRaw is not None):
+            # Closing the text stream completes the compressed data, leaving the binary file open
+            self.__mFile.close()
+            outputFile = self.__mRaw
+        if (self.__mStdout):
+            outputFile.flush()
+            return
+        if (self.__mFsync and (not self.__mAppend) and (stat.S_ISREG(os.fstat(outputFile.fileno()).st_mode))):
+            outputFile.flush()
+            os.fsync(outputFile.fileno())
+        outputFile.close()
+        return
+
+    def checkpoint(self) -> int:
+        """ Passes the text written so far on to the operating system, forcing it to disk with Fsync, and returns the
+        size of the file in bytes """
+        self.__mFile.flush()
+        if (self.__mFsync):
+            os.fsync(self.__mFile.fileno())
+        return(os.fstat(self.__mFile.fileno()).st_size)
+
+    def suspend(self) -> None:
+        """ Closes a resumable file after a failed conversion, leaving its text under the temporary name for a
+        resumed conversion to continue """
+        self.__mFile.close()
+        self.__mTempFileName = None
+        return
+
+    def close(self) -> None:
+        """ Completes the file and moves it into place """
+        self.finish()
+        if (self.__mTempFileName is None):
+            return
+        if (self.__mAppend):
+            self.__appendTempFile()
+            os.remove(self.__mTempFileName)
+        else:
+            os.replace(self.__mTempFileName, self.name)
+        self.__mTempFileName = None
+        return
+
+    def abort(self) -> None:
+        """ Discards the output after a failed conversion, leaving any previous file untouched """
+        if (self.__mStdout):
+            return
+        self.__mFile.close()
+        if (self.__mRaw is not None):
+            self.__mRaw.close()
+        if (self.__mTempFileName is not None):
+            os.remove(self.__mTempFileName)
+            self.__mTempFileName = None
+        return
+
+    @property
+    def file(self) -> TextIO:
+        """ The underlying text file """
+        return(self.__mFile)
+
+    def __appendTempFile(self) -> None:
+        """ Adds the text of the temporary file to the end of the existing file, journaling the file's size so that
+        an interrupted append can be undone """
+        # Only appending needs shutil, which is slow to import
+        import shutil
+        journalName = APPEND_JOURNAL_FORMAT.format(self.name)
+        size = os.path.getsize(self.name)
+        with open(journalName, "wt") as journalFile:
+            journalFile.write("{} {}\n".format(size, size + os.path.getsize(self.__mTempFileName)))
+            if (self.__mFsync):
+                journalFile.flush()
+                os.fsync(journalFile.fileno())
+        try:
+            with open(self.__mTempFileName, "rb") as tempFile, open(self.name, "ab") as outputFile:
+                shutil.copyfileobj(tempFile, outputFile)
+                if (self.__mFsync):
+                    outputFile.flush()
+                    os.fsync(outputFile.fileno())
+        except BaseException:
+            os.truncate(self.name, size)
+            os.remove(journalName)
+            raise
+        os.remove(journalName)
+        return
+
+
+class MemorySink:
+    """ Keeps the QIF text of a destination in memory, for programs that use the converter as a library """
+
+    def __init__(self, Name: str) -> None:
+        """ Starts an empty destination.  Name identifies it, and no file of that name is written. """
+        self.name = Name
+        self.__mTexts = []
+        return
+
+    def write(self, Text: str) -> None:
+        """ Adds text to the destination """
+        self.__mTexts.append(Text)
+        return
+
+    def flush(self) -> None:
+        """ Nothing is ever waiting to be written """
+        return
+
+    def close(self) -> None:
+        """ Completes the destination.  Its text stays available from getvalue(). """
+        return
+
+    def abort(self) -> None:
+        """ Discards the text after a failed conversion """
+        self.__mTexts.clear()
+        return
+
+    def getvalue(self) -> str:
+        """ Returns the QIF text written to the destination """
+        text = "".join(self.__mTexts)
+        self.__mTexts[:] = [ text ]
+        return(text)
+
+
+class SplitSink:
+    """ Splits a destination into numbered part files, each holding at most a set number of bytes or records.
+
+    Quicken's importer slows down badly on very large QIF files, so a destination can be written as a series of
+    smaller files that are imported one after another.  A part is only ever cut between records, and a single record
+    larger than the byte limit gets a part of its own.  Sizes are counted in UTF-8 bytes of QIF text, before any
+    compression.
+
+    Every part is written through its own FileSink and only renamed into place when the whole destination is closed,
+    so a failed conversion leaves all the previous parts untouched.  Parts left over from an earlier, longer
+    conversion are removed on close.  When appending, new records start a new part after the existing ones.
+    """
+
+    def __init__(self, FileName: str, Spec: SinkSpec, Append: bool = False, Fsync: bool = False) -> None:
+        """ Prepares the destination.  The first part is opened when the first text is written.
+
+        Parameters
+        ----------
+        FileName: The destination name the part names are made from (see splitPartName).
+        Spec: The destination's sink and split sizes.
+        Append: When set True, the existing parts are kept and new parts are numbered after them.
+        Fsync: When set True, each part is forced to disk before it is renamed into place.
+
+        Returns
+        -------
+        None
+        """
+        if ((FileName == STREAM_FILE_NAME) or (os.path.exists(FileName) and (not os.path.isfile(FileName)))):
+            raise OutputConfigError(ERROR_SPLIT_NEEDS_FILE.format(FileName))
+        self.name = FileName
+        self.__mSplitBytes = Spec.splitBytes
+        self.__mSplitRecords = Spec.splitRecords
+        self.__mCompression = Spec.sink if (Spec.sink != SINK_FILE) else None
+        self.__mAppend = Append
+        self.__mFsync = Fsync
+        self.__mParts = []      # The finished parts, waiting to be renamed into place
+        self.__mPart = None
+        self.__mPartBytes = 0
+        self.__mPartRecords = 0
+        self.__mNextPart = 1
+        if (Append):
+            while (os.path.exists(splitPartName(FileName, self.__mNextPart))):
+                self.__mNextPart = self.__mNextPart + 1
+        return
+
+    def write(self, Text: str) -> None:
+        """ Writes text to the current part, starting new parts whenever it fills up """
+        start = 0
+        while (start < len(Text)):
+            end = self.__partEnd(Text, start)
+            if (end == start):
+                # The current part is full
+                self.__mPart.finish()
+                self.__mParts.append(self.__mPart)
+                self.__mPart = None
+                self.__mPartBytes = 0
+                self.__mPartRecords = 0
+                continue
+            if (self.__mPart is None):
+                self.__openPart()
+            piece = Text[start:end]
+            self.__mPart.write(piece)
+            self.__mPartBytes = self.__mPartBytes + len(piece.encode())
+            self.__mPartRecords = self.__mPartRecords + piece.count(QIF_RECORD_END)
+            start = end
+        return
+
+    def flush(self) -> None:
+        """ Passes the text of the current part on to the operating system """
+        if (self.__mPart is not None):
+            self.__mPart.flush()
+        return
+
+    def close(self) -> None:
+        """ Completes the parts and moves them all into place """
+        if (self.__mPart is not None):
+            self.__mParts.append(self.__mPart)
+            self.__mPart = None
+        elif ((not self.__mParts) and (not self.__mAppend)):
+            # An empty destination still gets its first part, as an unsplit destination gets an empty file
+            self.__openPart()
+            self.__mParts.append(self.__mPart)
+            self.__mPart = None
+        for part in self.__mParts:
+            part.close()
+        self.__mParts.clear()
+        if (not self.__mAppend):
+            while (os.path.exists(splitPartName(self.name, self.__mNextPart))):
+                os.remove(splitPartName(self.name, self.__mNextPart))
+                self.__mNextPart = self.__mNextPart + 1
+        return
+
+    def abort(self) -> None:
+        """ Discards every part written after a failed conversion, leaving any previous parts untouched """
+        if (self.__mPart is not None):
+            self.__mParts.append(self.__mPart)
+            self.__mPart = None
+        for part in self.__mParts:
+            part.abort()
+        self.__mParts.clear()
+        return
+
+    @property
+    def partNames(self) -> List[str]:
+        """ The names of the parts written so far """
+        firstPart = self.__mNextPart - len(self.__mParts) - (self.__mPart is not None)
+        return([ splitPartName(self.name, part) for part in range(firstPart, self.__mNextPart) ])
+
+    def __openPart(self) -> None:
+        """ Opens the next part file """
+        self.__mPart = FileSink(splitPartName(self.name, self.__mNextPart), False, self.__mFsync, self.__mCompression)
+        self.__mNextPart = self.__mNextPart + 1
+        return
+
+    def __partEnd(self, Text: str, Start: int) -> int:
+        """ Returns where the text from Start must be cut for the current part not to overflow, which is Start itself
+        when the part is full.  An empty part always takes at least one record. """
+        end = len(Text)
+        if (self.__mSplitRecords is not None):
+            room = self.__mSplitRecords - self.__mPartRecords
+            if (Text.count(QIF_RECORD_END, Start) > room):
+                end = Start
+                for _ in range(room):
+                    end = Text.find(QIF_RECORD_END, end) + len(QIF_RECORD_END)
+        if (self.__mSplitBytes is not None):
+            room = self.__mSplitBytes - self.__mPartBytes
+            if (len(Text[Start:end].encode()) > room):
+                # A character is at least one byte, so every record end that fits is within room characters
+                cut = Text.rfind(QIF_RECORD_END, Start, min(end, Start + room))
+                while ((cut >= 0) and (len(Text[Start:cut + len(QIF_RECORD_END)].encode()) > room)):
+                    cut = Text.rfind(QIF_RECORD_END, Start, cut + 1)
+                end = (cut + len(QIF_RECORD_END)) if (cut >= 0) else Start
+        if ((end == Start) and (self.__mPartRecords == 0) and (self.__mPartBytes == 0)):
+            cut = Text.find(QIF_RECORD_END, Start)
+            end = (cut + len(QIF_RECORD_END)) if (cut >= 0) else len(Text)
+        return(end)
+
+
+class QifWriter:
+    """ Buffered writer for one QIF output destination.
+
+    Formatted records are accumulated in a list and joined into large chunks, so the destination's sink sees one
+    write per BufferSize characters rather than one per record.  The sink (see openSink) stores the text: an atomic,
+    optionally compressed file, a series of part files, or memory.
+    """
+
+    def __init__(self, FileName: str, Append: bool = False, BufferSize: int = DEFAULT_BUFFER_SIZE, Fsync: bool = False,
+                 Spec: Optional[SinkSpec] = None, ResumeOffset: Optional[int] = None) -> None:
+        """ Opens the output.
+
+        Parameters
+        ----------
+        FileName: The QIF file name, or STREAM_FILE_NAME for stdout.
+        Append: When set True, records are added to the end of an existing file rather than replacing it.
+        BufferSize: Number of characters collected before they are written to the file.
+        Fsync: When set True, close() forces the file contents to disk before the file is renamed into place.
+        Spec: How the destination is stored.  By default, it is written to a plain file.
+        ResumeOffset: When set, the file is resumable and keeps this many bytes from a failed run (see FileSink).
+
+        Returns
+        -------
+        None
+        """
+        self.name = FileName
+        self.__mBufferSize = BufferSize
+        self.__mPending = []
+        self.__mPendingSize = 0
+        self.__mSink = openSink(FileName, Spec, Append, Fsync, ResumeOffset)
+        self.bytesWritten = 0     # QIF text written to the file so far, counted in UTF-8 bytes when countBytes is set
+        self.countBytes = False   # Set by PipelineStats, so the text is only encoded again when it is reported
+        return
+
+    def write(self, Text: str) -> None:
+        """ Queues text for the output, writing the queue out once it reaches the buffer size """
+        self.__mPending.append(Text)
+        self.__mPendingSize = self.__mPendingSize + len(Text)
+        if (self.__mPendingSize >= self.__mBufferSize):
+            self.flush()
+        return
+
+    def flush(self) -> None:
+        """ Writes all queued text to the sink """
+        if (self.__mPending):
+            text = "".join(self.__mPending)
+            self.__mSink.write(text)
+            if (self.countBytes):
+                self.bytesWritten = self.bytesWritten + len(text.encode())
+            self.__mPending.clear()
+            self.__mPendingSize = 0
+        self.__mSink.flush()
+        return
+
+    def close(self) -> None:
+        """ Writes the remaining text and moves the finished file into place """
+        self.flush()
+        self.__mSink.close()
+        return
+
+    def abort(self) -> None:
+        """ Discards the output after a failed conversion, leaving any previous file untouched """
+        self.__mPending.clear()
+        self.__mSink.abort()
+        return
+
+    def checkpoint(self) -> int:
+        """ Writes all queued text to a resumable file and returns the size of the file in bytes """
+        self.flush()
+        return(self.__mSink.checkpoint())
+
+    def suspend(self) -> None:
+        """ Closes a resumable file after a failed conversion, keeping its text for a resumed conversion """
+        self.__mPending.clear()
+        self.__mSink.suspend()
+        return
+
+    @property
+    def sink(self) -> Union[FileSink, MemorySink, SplitSink]:
+        """ The sink storing the QIF text """
+        return(self.__mSink)
+
+    @property
+    def file(self) -> TextIO:
+        """ The underlying text file of a destination written to a single file """
+        return(self.__mSink.file)
+
+
+#*************
+# Functions
+#*************
+def openSink(FileName: str, Spec: Optional[SinkSpec] = None, Append: bool = False, Fsync: bool = False,
+             ResumeOffset: Optional[int] = None) -> Union[FileSink, MemorySink, SplitSink]:
+    """ Opens the sink storing the QIF text of one destination.
+
+    Parameters
+    ----------
+    FileName: The QIF file name, or STREAM_FILE_NAME for stdout.
+    Spec: How the destination is stored.  By default, it is written to a plain file.
+    Append: When set True, text is added to the end of an existing file, or after the existing parts.
+    Fsync: When set True, files are forced to disk before they are renamed into place.
+    ResumeOffset: When set, the destination is resumable and keeps this many bytes from a failed run (see FileSink).
+        Only a plain file destination can be resumed.
+
+    Returns
+    -------
+    Union[FileSink, MemorySink, SplitSink]: The sink.
+    """
+    if ((Spec is None) or ((Spec.sink == SINK_FILE) and (not Spec.split))):
+        return(FileSink(FileName, Append, Fsync, None, ResumeOffset))
+    if (ResumeOffset is not None):
+        raise OutputConfigError(ERROR_RESUME_NEEDS_FILE.format(FileName))
+    if (Spec.sink == SINK_MEMORY):
+        return(MemorySink(FileName))
+    if (Spec.split):
+        return(SplitSink(FileName, Spec, Append, Fsync))
+    return(FileSink(FileName, Append, Fsync, Spec.sink))
+
+def resumeFileName(FileName: str) -> str:
+    """ Returns the name of the temporary file a resumable QIF file is written to """
+    return(RESUME_FILE_FORMAT.format(FileName))
+
+def splitPartName(FileName: str, Part: int) -> str:
+    """ Returns the file name of one part of a split destination.  The part number goes in front of the extension and
+    any compression suffix, so part 2 of Roth.qif.gz is Roth-002.qif.gz. """
+    head, suffix = FileName, ""
+    for compressionSuffix in SINK_SUFFIXES.values():
+        if (FileName.endswith(compressionSuffix)):
+            head, suffix = FileName[:-len(compressionSuffix)], compressionSuffix
+    stem, extension = os.path.splitext(head)
+    return(SPLIT_PART_FORMAT.format(stem, Part, extension + suffix))
+
+def writeFileAtomically(FileName: str, Text: str, Fsync: bool = False) -> None:
+    """ Replaces a small file, such as a state or statistics file, with text.  The text is written to a temporary file
+    that is renamed over the file, so a reader never sees a partial file.  A named pipe or device is written directly.
+
+    Parameters
+    ----------
+    FileName: The file name.
+    Text: The whole contents of the file.
+    Fsync: When set True, the text is forced to disk before the file is renamed into place.
+
+    Returns
+    -------
+    None
+    """
+    if (os.path.exists(FileName) and (not os.path.isfile(FileName))):
+        with open(FileName, "wt") as outputFile:
+            outputFile.write(Text)
+        return
+    tempFileName = "{}.{}.{}{}".format(FileName, os.getpid(), os.urandom(4).hex(), TEMP_FILE_SUFFIX)
+    try:
+        with open(tempFileName, "xt") as outputFile:
+            outputFile.write(Text)
+            if (Fsync):
+                outputFile.flush()
+                os.fsync(outputFile.fileno())
+        if (os.path.isfile(FileName)):
+            os.chmod(tempFileName, stat.S_IMODE(os.stat(FileName).st_mode))
+        os.replace(tempFileName, FileName)
+    except BaseException:
+        if (os.path.exists(tempFileName)):
+            os.remove(tempFileName)
+        raise
+    return
+
+def _openCompressor(FileName: str, RawFile, Compression: str) -> TextIO:
+    """ Returns a text stream compressing into a binary file, leaving the file open when it is closed.  The text is
+    encoded and its newlines translated as open(..., "wt") would. """
+    import io
+    if (Compression == SINK_GZIP):
+        import gzip
+        # The temporary file name is not recorded in the gzip header
+        compressor = gzip.GzipFile(filename = "", mode = "wb", compresslevel = GZIP_COMPRESS_LEVEL, fileobj = RawFile)
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            raise OutputConfigError(ERROR_ZSTD_NOT_INSTALLED.format(FileName))
+        compressor = zstandard.ZstdCompressor().stream_writer(RawFile, closefd = False)
+    return(io.TextIOWrapper(compressor))
+
+def _recoverAppend(FileName: str) -> None:
+    """ Cuts the text of an append a crash interrupted off the end of a file, using the append journal left behind """
+    journalName = APPEND_JOURNAL_FORMAT.format(FileName)
+    if (not os.path.exists(journalName)):
+        return
+    try:
+        with open(journalName, "rt") as journalFile:
+            size, appendedSize = (int(field) for field in journalFile.read().split())
+    except ValueError:
+        # The journal is written before the append starts, so a crash while writing it left the file as it was
+        size = None
+    if ((size is not None) and (size <= os.path.getsize(FileName) <= appendedSize)):
+        os.truncate(FileName, size)
+    os.remove(journalName)
+    return
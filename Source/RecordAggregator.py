@@ -0,0 +1,225 @@
+#************
+# Imports
+#************
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from CompiledConfig import RowLayout
+from ConversionErrors import CsvFormatError, RoutingError
+from MoneyParser import MONEY_CACHE_SIZE, MoneyParser
+from QifPipeline import ERROR_NO_OUTPUT_FILE, ERROR_SHORT_ROW, QIF_RECORD_FORMAT, formatRecords
+from SymbolTable import RecordSymbols
+
+#******************
+# Constants/Enums
+#******************
+
+# Decimal places of the quantity weighted price of a merged record.  Quicken keeps share prices to 6 places.
+AGGREGATE_PRICE_PLACES = 6
+
+# Maximum number of groups held at once.  They are all written out when the date changes, so a statement sorted by
+# date only ever holds the groups of one day.  A day with more groups than this has them written out early, in
+# several records per group.
+AGGREGATE_MAX_GROUPS = 10000
+
+
+#***********
+# Classes
+#***********
+class RecordAggregator:
+    """ Aggregate stage: merges the records of each day that share an action, security and QIF file into one.
+
+    Fund statements often hold many rows per day for the same security and action, such as a payroll contribution
+    split across sources, and Quicken imports each QIF record slowly.  A merged record has the summed T amount and Q
+    quantity of its rows, and their quantity weighted I price, rounded to AGGREGATE_PRICE_PLACES.  Its memo is that
+    of its first row.  The amounts are summed as the cents each row's T field shows and the quantities exactly, so the
+    merged records hold the same totals as the records they replace.  A group of one row keeps its record as it was.
+
+    This is a streaming hash aggregate: the rows of a day are grouped in a dictionary, and the groups are written out,
+    in the order their first rows were read, as soon as the date changes.  In a CSV file sorted by date, in either
+    direction, every group is complete by then, and memory is bounded by the groups of one day.  In an unsorted file,
+    the rows of a day that are not next to each other are merged into separate records.
+    """
+
+    def __init__(self, MaxGroups: int = AGGREGATE_MAX_GROUPS) -> None:
+        """ Starts the counts.
+
+        Parameters
+        ----------
+        MaxGroups: Maximum number of groups held at once.
+
+        Returns
+        -------
+        None
+        """
+        self.rowsRead = 0           # CSV rows taken by aggregateRecords
+        self.recordsWritten = 0     # Merged QIF records it returned
+        self.__mMaxGroups = MaxGroups
+        self.__mFixed = {}          # Money text mapped to its signed fixed-point digits and decimal places
+        return
+
+    def aggregateRecords(self, Rows: Iterable[Any], Layout: RowLayout, Symbols: RecordSymbols,
+                         Money: MoneyParser) -> Iterator[Tuple[int, str]]:
+        """ Runs the format stage over the rows and merges the records of each group, in place of the route stage.
+
+        Parameters
+        ----------
+        Rows: CSV rows from the reader stage.
+        Layout: The row layout of the CSV file.
+        Symbols: The symbol tables of the configuration (see CompiledConfig.symbols).
+        Money: Parser rendering the CSV money strings as QIF field text.
+
+        Returns
+        -------
+        Iterator[Tuple[int, str]]: The output file index paired with the merged QIF record text.  A row that cannot be
+            converted raises the error the format and route stages raise.
+        """
+        dateColumn, actionColumn, securityColumn = Layout.columns[:3]
+        memoColumn = Layout.columns[6]
+        route = Layout.router.route
+        formatDate = Layout.dates.formatDate if (Layout.dates is not None) else str
+        actionLine = Symbols.action.lookup
+        groups = {}
+        groupDate = None
+        for row, qifRecord in formatRecords(Rows, Layout.columns, Symbols, Money, Layout.dates):
+            self.rowsRead = self.rowsRead + 1
+            try:
+                fileIndex = route(row)
+            except IndexError:
+                raise CsvFormatError(ERROR_SHORT_ROW.format(row))
+            if (fileIndex is None):
+                raise RoutingError(ERROR_NO_OUTPUT_FILE.format(qifRecord))
+
+            if ((row[dateColumn] != groupDate) or (len(groups) >= self.__mMaxGroups)):
+                yield from self.__flush(groups, Money)
+                groupDate = row[dateColumn]
+            key = (actionLine(row[actionColumn]), row[securityColumn], fileIndex)
+            group = groups.get(key)
+            if (group is None):
+                # Most groups keep a single row, so nothing is summed until a second row joins one
+                groups[key] = _Group(key, row, qifRecord)
+                continue
+            if (group.rows == 1):
+                group.start(formatDate(row[dateColumn]), group.firstRow[memoColumn], *self.__values(group.firstRow, Layout.columns, Money))
+            group.add(*self.__values(row, Layout.columns, Money))
+        yield from self.__flush(groups, Money)
+        return
+
+    def __flush(self, Groups: Dict[Tuple[str, str, int], "_Group"], Money: MoneyParser) -> Iterator[Tuple[int, str]]:
+        """ Returns the records of the groups held, in the order they were started, and forgets them """
+        for group in Groups.values():
+            self.recordsWritten = self.recordsWritten + 1
+            yield (group.key[2], group.render(Money))
+        Groups.clear()
+        return
+
+    def __values(self, Row: Any, Columns: Any, Money: MoneyParser) -> Tuple[str, int, int, int, int, int]:
+        """ Returns a row's CSV price, T field in cents, price and positive quantity, as fixed-point digits and places """
+        # The format stage has rendered the amount already, so it is usually found in the cache
+        cents = int(Money.formatValue(Row[Columns[4]]).replace(",", "").replace(".", ""))
+        price, pricePlaces = self.__fixed(Row[Columns[3]])
+        quantity, quantityPlaces = self.__fixed(Row[Columns[5]])
+        return(Row[Columns[3]], cents, price, pricePlaces, abs(quantity), quantityPlaces)
+
+    def __fixed(self, CsvFloatText: str) -> Tuple[int, int]:
+        """ Returns a money string's signed digits and decimal places (see MoneyParser.parseFixed), caching them """
+        fixed = self.__mFixed.get(CsvFloatText)
+        if (fixed is None):
+            negative, digits, places = MoneyParser.parseFixed(CsvFloatText)
+            fixed = ((-digits if negative else digits), places)
+            if (len(self.__mFixed) < MONEY_CACHE_SIZE):
+                self.__mFixed[CsvFloatText] = fixed
+        return(fixed)
+
+
+class _Group:
+    """ The rows of one day merged so far for one action, security and QIF file.  The quantity and price sums are
+    fixed-point values, kept as [digits, decimal places] pairs so that no digit is lost. """
+
+    __slots__ = ("key", "firstRow", "qifRecord", "rows", "date", "memo", "priceText", "samePrice", "cents", "quantity", "priceQuantity", "prices")
+
+    def __init__(self, Key: Tuple[str, str, int], FirstRow: Any, QifRecord: str) -> None:
+        """ Starts a group with its first row, which is summed by start when a second row joins it.
+
+        Parameters
+        ----------
+        Key: The QIF N line, the security and the output file index shared by the rows.
+        FirstRow: The first CSV row.
+        QifRecord: The QIF record of the first row.
+
+        Returns
+        -------
+        None
+        """
+        self.key = Key
+        self.firstRow = FirstRow
+        self.qifRecord = QifRecord
+        self.rows = 1
+        return
+
+    def start(self, Date: str, Memo: str, PriceText: str, Cents: int, Price: int, PricePlaces: int, Quantity: int, QuantityPlaces: int) -> None:
+        """ Starts the sums with the first row, given its QIF D field text, its memo and the values of RecordAggregator.__values """
+        self.date = Date
+        self.memo = Memo
+        self.priceText = PriceText
+        self.samePrice = True
+        self.cents = Cents
+        self.quantity = [ Quantity, QuantityPlaces ]
+        self.priceQuantity = [ Price * Quantity, PricePlaces + QuantityPlaces ]
+        self.prices = [ Price, PricePlaces ]
+        return
+
+    def add(self, PriceText: str, Cents: int, Price: int, PricePlaces: int, Quantity: int, QuantityPlaces: int) -> None:
+        """ Adds another row of the day to the sums """
+        self.rows = self.rows + 1
+        self.samePrice = self.samePrice and (PriceText == self.priceText)
+        self.cents = self.cents + Cents
+        _addFixed(self.quantity, Quantity, QuantityPlaces)
+        _addFixed(self.priceQuantity, Price * Quantity, PricePlaces + QuantityPlaces)
+        _addFixed(self.prices, Price, PricePlaces)
+        return
+
+    def render(self, Money: MoneyParser) -> str:
+        """ Returns the QIF record of the group, which is the first row's record when it has only one row """
+        if (self.rows == 1):
+            return(self.qifRecord)
+        if (self.samePrice):
+            priceText = Money.formatPrice(self.priceText)
+        else:
+            # The quantity weighted price, or the plain mean of the prices when no shares changed hands
+            if (self.quantity[0]):
+                numerator = self.priceQuantity[0] * (10 ** (self.quantity[1] + AGGREGATE_PRICE_PLACES))
+                denominator = self.quantity[0] * (10 ** self.priceQuantity[1])
+            else:
+                numerator = self.prices[0] * (10 ** AGGREGATE_PRICE_PLACES)
+                denominator = self.rows * (10 ** self.prices[1])
+            price = _divideHalfEven(numerator, denominator)
+            priceText = MoneyParser.renderFixed(price < 0, abs(price), AGGREGATE_PRICE_PLACES)
+        whole, cents = divmod(abs(self.cents), 100)
+        actionLine, security, _ = self.key
+        return(QIF_RECORD_FORMAT.format(
+                    self.date,                                                                  # D
+                    actionLine,                                                                 # N
+                    security,                                                                   # Y
+                    priceText,                                                                  # I
+                    "{}{:,}.{:02d}".format("-" if (self.cents < 0) else "", whole, cents),      # T
+                    MoneyParser.renderFixed(False, self.quantity[0], self.quantity[1], True),   # Q
+                    self.memo))                                                                 # M
+
+
+#*************
+# Functions
+#*************
+def _addFixed(Total: List[int], Digits: int, Places: int) -> None:
+    """ Adds a fixed-point value to a [digits, decimal places] total, moving the total to the finer of the two scales """
+    if (Places > Total[1]):
+        Total[0] = Total[0] * (10 ** (Places - Total[1]))
+        Total[1] = Places
+    Total[0] = Total[0] + (Digits * (10 ** (Total[1] - Places)))
+    return
+
+def _divideHalfEven(Numerator: int, Denominator: int) -> int:
+    """ Returns Numerator / Denominator rounded half to even, for a positive Denominator """
+    quotient, remainder = divmod(abs(Numerator), Denominator)
+    if (((remainder * 2) > Denominator) or (((remainder * 2) == Denominator) and (quotient & 1))):
+        quotient = quotient + 1
+    return(-quotient if (Numerator < 0) else quotient)
@@ -0,0 +1,119 @@
+#************
+# Imports
+#************
+import hashlib
+import sqlite3
+from typing import Iterable, Iterator, List, Sequence
+
+from QifRouter import QifRouter
+
+#******************
+# Constants/Enums
+#******************
+
+# Separates CSV field values when a row is hashed, so ("ab", "c") and ("a", "bc") hash differently
+_FIELD_SEPARATOR = "\x1f"
+
+# Fingerprint digest size in bytes.  A 128 bit digest makes an accidental collision across a lifetime of statements negligible.
+_DIGEST_SIZE = 16
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS fingerprints (
+                destination TEXT NOT NULL,
+                fingerprint BLOB NOT NULL,
+                PRIMARY KEY (destination, fingerprint)
+             ) WITHOUT ROWID"""
+
+# Exception strings raised by this file
+ERROR_BAD_INDEX_FILE = "Cannot open row index '{}': {}"
+
+
+#***********
+# Classes
+#***********
+class RowIndex:
+    """ Persistent index of the CSV rows already converted into each QIF destination.
+
+    Banks often export cumulative CSV files where most rows were converted by an earlier run.  The index stores a
+    fingerprint of every converted row per destination in a local SQLite database, so a rerun only emits the rows
+    it has not seen before.
+
+    A fingerprint is a hash of the row's raw field values plus its occurrence number among identical rows in the file.
+    Genuinely repeated transactions (e.g. two identical contributions on one day) are therefore each converted once,
+    rather than collapsed into one.  A row whose text changes between exports (e.g. a bank reformats its amounts) is
+    seen as new.
+
+    New fingerprints are only written to the database by commit(), which callers make after the QIF output has been
+    written and closed.  If a run fails part way, none of its rows are marked as converted.
+    """
+
+    def __init__(self, FileName: str) -> None:
+        """ Opens or creates the index database.
+
+        Parameters
+        ----------
+        FileName: The SQLite database file.
+
+        Returns
+        -------
+        None
+        """
+        try:
+            self.__mConnection = sqlite3.connect(FileName)
+            self.__mConnection.execute(_SCHEMA)
+        except sqlite3.Error as err:
+            raise Exception(ERROR_BAD_INDEX_FILE.format(FileName, err))
+        self.__mPending = []
+        self.skippedRows = 0
+        return
+
+    def filterNewRows(self, Rows: Iterable[List[str]], Router: QifRouter, DestinationNames: Sequence[str]) -> Iterator[List[str]]:
+        """ Pipeline stage passing on only the rows not already converted into their destination.
+
+        Parameters
+        ----------
+        Rows: CSV rows from the reader stage.
+        Router: The qifFiles routing rules bound to the row layout, used to find each row's destination.
+        DestinationNames: The name identifying each qifFiles entry in the index, in qifFiles order.
+
+        Returns
+        -------
+        Iterator[List[str]]: The new rows.  Rows that cannot be routed (including short rows) are passed
+            on so the later stages report them.
+        """
+        lookup = self.__mConnection.cursor()
+        occurrences = {}
+        route = Router.route
+        for row in Rows:
+            try:
+                fileIndex = route(row)
+            except IndexError:
+                fileIndex = None
+            if (fileIndex is None):
+                yield row
+                continue
+
+            # Number identical rows so each repeat has its own fingerprint
+            digest = hashlib.blake2b(_FIELD_SEPARATOR.join(row).encode(), digest_size = _DIGEST_SIZE).digest()
+            occurrence = occurrences.get(digest, 0) + 1
+            occurrences[digest] = occurrence
+            key = (DestinationNames[fileIndex], digest + occurrence.to_bytes(4, "big"))
+
+            if (lookup.execute("SELECT 1 FROM fingerprints WHERE destination = ? AND fingerprint = ?", key).fetchone() is None):
+                self.__mPending.append(key)
+                yield row
+            else:
+                self.skippedRows = self.skippedRows + 1
+        return
+
+    def commit(self) -> None:
+        """ Records the rows passed on by filterNewRows as converted """
+        with self.__mConnection:
+            self.__mConnection.executemany("INSERT OR IGNORE INTO fingerprints (destination, fingerprint) VALUES (?, ?)", self.__mPending)
+        self.__mPending.clear()
+        return
+
+    def close(self) -> None:
+        """ Closes the database without recording pending rows """
+        self.__mPending.clear()
+        self.__mConnection.close()
+        return
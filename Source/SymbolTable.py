@@ -0,0 +1,146 @@
+#************
+# Imports
+#************
+import functools
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+#******************
+# Constants/Enums
+#******************
+
+# Maximum number of distinct CSV texts each table remembers.  Statements hold a few dozen actions, securities and
+# accounts, so a table normally never fills.  Once full, the least recently used text is forgotten, so a file
+# with a different memo on every row keeps the table at this size, and the common values stay in it.
+SYMBOL_TABLE_SIZE = 4096
+
+# The QIF line rendered once per distinct action text
+QIF_ACTION_LINE = "N{}\n"
+
+# A column is no longer interned once more than 1 / INTERN_MISS_RATIO of its values in a block of rows are new to
+# the table: a column of mostly distinct values, such as a memo numbering every row, only churns the table
+INTERN_MISS_RATIO = 2
+
+
+#***********
+# Classes
+#***********
+class SymbolTable:
+    """ A bounded table mapping each distinct CSV text to one shared result.
+
+    The result is rendered the first time a text is seen and looked up afterwards, so a statement with millions of
+    rows and a few dozen distinct values renders each value once and hands out the same string object for every row.
+    Without a render function, the table interns the texts themselves: equal texts are replaced by one shared
+    object, so rows held in memory keep a single copy of each value.  The table is a least recently used cache of
+    SYMBOL_TABLE_SIZE entries (functools.lru_cache, whose lookups run in C), so it cannot grow without bound.
+
+    A table is pickled empty, with its render function, so a table sent to a worker process starts afresh there.
+    """
+
+    def __init__(self, Render: Optional[Callable[[str], str]] = None, MaxSize: int = SYMBOL_TABLE_SIZE) -> None:
+        """ Starts an empty table.
+
+        Parameters
+        ----------
+        Render: Renders a CSV text into the result kept for it, which may raise for a text that has no result.
+            Errors are not cached.  None interns the texts.
+        MaxSize: Maximum number of distinct texts remembered.
+
+        Returns
+        -------
+        None
+        """
+        self.__mRender = Render
+        self.__mMaxSize = MaxSize
+        self.lookup = functools.lru_cache(maxsize = MaxSize)(Render if (Render is not None) else _identity)
+        return
+
+    def __reduce__(self) -> Any:
+        """ Pickles the table as an empty table with the same render function and size """
+        return(SymbolTable, (self.__mRender, self.__mMaxSize))
+
+    def __len__(self) -> int:
+        """ Returns the number of texts remembered """
+        return(self.lookup.cache_info().currsize)
+
+    @property
+    def misses(self) -> int:
+        """ The number of texts rendered rather than found in the table """
+        return(self.lookup.cache_info().misses)
+
+    def clear(self) -> None:
+        """ Forgets every text """
+        self.lookup.cache_clear()
+        return
+
+
+class RecordSymbols:
+    """ The symbol tables of a configuration, shared by every CSV file converted with it.
+
+    The QIF N line of a record is rendered once per distinct CSV action text, which also skips putting the action in
+    CAPS and looking it up in the actionCodeMap on every row.  That is the only line rendered from a table: the Y and
+    M lines cost less to format from the raw text than to look up, and the router keeps its own results per value.
+    Only the threaded engine interns fields (see internColumns()), since it is the one engine holding many rows at
+    once.  The tables belong to the CompiledConfig, so batch, watch and server conversions reuse them from one CSV
+    file to the next.
+    """
+
+    def __init__(self, ActionDict: Dict[str, str], MaxSize: int = SYMBOL_TABLE_SIZE) -> None:
+        """ Starts empty tables.
+
+        Parameters
+        ----------
+        ActionDict: CSV action text in CAPS mapped to the Quicken action code.
+        MaxSize: Maximum number of distinct texts each table remembers.
+
+        Returns
+        -------
+        None
+        """
+        self.action = SymbolTable(_ActionLine(ActionDict), MaxSize)     # Raises KeyError for an action missing from ActionDict
+        self.texts = SymbolTable(None, MaxSize)
+        return
+
+    def internColumns(self, Rows: List[Any], Columns: Sequence[int]) -> List[int]:
+        """ Replaces the given fields of each row by their interned texts, so a block of rows held in memory keeps one
+        copy of each distinct value.  The rows must be lists.  A short row ends the interning of a column in the block,
+        and is left for the format stage to report.
+        Returns the columns worth interning in the next block: those whose values were mostly already in the table. """
+        intern = self.texts.lookup
+        keptColumns = []
+        for column in Columns:
+            misses = self.texts.misses
+            try:
+                for row in Rows:
+                    row[column] = intern(row[column])
+            except IndexError:
+                pass
+            if (((self.texts.misses - misses) * INTERN_MISS_RATIO) <= len(Rows)):
+                keptColumns.append(column)
+        return(keptColumns)
+
+    def clear(self) -> None:
+        """ Forgets every text """
+        self.action.clear()
+        self.texts.clear()
+        return
+
+
+class _ActionLine:
+    """ Renders the QIF N line of a CSV action.  A class rather than a closure, so the symbol tables can be pickled. """
+
+    def __init__(self, ActionDict: Dict[str, str]) -> None:
+        """ Keeps the inverted actionCodeMap """
+        self.__mActionDict = ActionDict
+        return
+
+    def __call__(self, CsvAction: str) -> str:
+        """ Returns the N line, raising KeyError for an action missing from the actionCodeMap """
+        return(QIF_ACTION_LINE.format(self.__mActionDict[CsvAction.upper()]))
+
+
+#*************
+# Functions
+#*************
+def _identity(Text: str) -> str:
+    """ The render function of an interning table """
+    return(Text)
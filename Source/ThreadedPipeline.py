@@ -0,0 +1,174 @@
+#************
+# Imports
+#************
+import queue
+import threading
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence
+
+from CompiledConfig import CompiledConfig, RowLayout
+from MoneyParser import MoneyParser
+from QifPipeline import formatRecords, routeRecords
+from QifWriter import QifWriter
+from SymbolTable import RecordSymbols
+
+#******************
+# Constants/Enums
+#******************
+
+# Rows the reader stage hands to the conversion stage at a time.  Passing a row through a queue costs about as much
+# as formatting it, so rows travel in blocks, as in ColumnarEngine.
+THREADED_BLOCK_ROWS = 1024
+
+# Blocks each queue holds.  A full queue blocks the stage feeding it, so a slow output file stops the reading rather
+# than letting the blocks pile up in memory: at most this many blocks are waiting between any two stages.
+THREADED_QUEUE_BLOCKS = 8
+
+# How often, in seconds, the reader stage blocked on a full queue checks whether the conversion has failed
+_POLL_SECONDS = 0.1
+
+# Queue item closing a stage
+_END = None
+
+
+#*************
+# Functions
+#*************
+def convertThreaded(Rows: Iterable[Any], Layout: RowLayout, FileHandles: Sequence[QifWriter], Config: CompiledConfig,
+                    Money: MoneyParser, RowFilter: Optional[Callable[[Iterable[Any], RowLayout], Iterable[Any]]] = None,
+                    BlockRows: int = THREADED_BLOCK_ROWS, QueueBlocks: int = THREADED_QUEUE_BLOCKS) -> int:
+    """ Converts CSV rows with the reading, the conversion and the writing of each output file on their own threads.
+
+    A reader thread takes the rows from the reader stage a block at a time and queues them for the calling thread,
+    which runs the format and route stages over each block and queues the QIF text of each output file for that
+    file's writer thread.  File reads and writes release the GIL, so while one thread waits on a slow disk or a
+    network mount, the others keep converting and writing.  The queues are bounded, so memory stays flat.
+
+    Every output file gets its records from a single queue in block order, so the QIF files are byte for byte those
+    of the row by row pipeline.  A row that cannot be converted raises the same error, and a failed read or write is
+    raised in the calling thread once the other threads have stopped.
+
+    Parameters
+    ----------
+    Rows: CSV rows from the reader stage.  They are only taken by the reader thread.
+    Layout: The row layout of the CSV file.
+    FileHandles: The output writers in qifFiles order.  qifFiles entries sharing a writer share its thread.
+    Config: The compiled conversion configuration.
+    Money: Parser rendering the CSV money strings as QIF field text.
+    RowFilter: Optional stage between the reader and format stages (see QifPipeline.convertCsvFile).  It runs on the
+        calling thread, as it may hold objects that can only be used there, such as RowIndex's sqlite connection.
+    BlockRows: Rows passed between the threads at a time.
+    QueueBlocks: Blocks each queue holds.
+
+    Returns
+    -------
+    int: The number of CSV records written.
+    """
+    failed = threading.Event()
+    errors = []
+    blocks = queue.Queue(QueueBlocks)
+    # The queued blocks keep one copy of each distinct action, security, memo and routing value, as long as those
+    # repeat (see RecordSymbols.internColumns)
+    internColumns = list(dict.fromkeys(Layout.columns[1:3] + Layout.columns[6:] + list(Layout.router.columns)))
+    reader = threading.Thread(target = _readBlocks, args = (Rows, BlockRows, Config.symbols, internColumns, blocks, failed, errors),
+                              name = "CSVtoQIF reader", daemon = True)
+
+    # One queue and thread per distinct writer.  Records for a shared writer are gathered in one list, so they keep
+    # their row order across the qifFiles entries sharing it.
+    writerSlots = {}
+    writerQueues = []
+    writers = []
+    for fileHandle in FileHandles:
+        if (id(fileHandle) not in writerSlots):
+            writerSlots[id(fileHandle)] = len(writerQueues)
+            writerQueues.append(queue.Queue(QueueBlocks))
+            writers.append(threading.Thread(target = _writeBlocks, args = (fileHandle, writerQueues[-1], failed, errors),
+                                            name = "CSVtoQIF writer {}".format(len(writers)), daemon = True))
+    fileSlots = [ writerSlots[id(fileHandle)] for fileHandle in FileHandles ]
+
+    recordsProcessed = 0
+    reader.start()
+    for writer in writers:
+        writer.start()
+    if (RowFilter is None):
+        queuedBlocks = iter(blocks.get, _END)
+    else:
+        # The filter sees the rows as one stream, as it would without the threads, and its output is cut into blocks again
+        filteredRows = RowFilter(_queuedRows(blocks), Layout)
+        queuedBlocks = iter(lambda: list(islice(filteredRows, BlockRows)), [])
+    try:
+        for block in queuedBlocks:
+            if (failed.is_set()):
+                break
+            outputs = [ [] for _ in writerQueues ]
+            for fileIndex, qifRecord in routeRecords(formatRecords(block, Layout.columns, Config.symbols, Money, Layout.dates), Layout.router):
+                outputs[fileSlots[fileIndex]].append(qifRecord)
+            for slot, qifRecords in enumerate(outputs):
+                if (qifRecords):
+                    writerQueues[slot].put("".join(qifRecords))
+            recordsProcessed = recordsProcessed + len(block)
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        # Let the writers finish the blocks already queued, or discard them after a failure, then wait for every thread
+        for writerQueue in writerQueues:
+            writerQueue.put(_END)
+        for writer in writers:
+            writer.join()
+        reader.join()
+    if (errors):
+        raise errors[0]
+    return(recordsProcessed)
+
+def _readBlocks(Rows: Iterable[Any], BlockRows: int, Symbols: RecordSymbols, InternColumns: List[int], Blocks: queue.Queue,
+                Failed: threading.Event, Errors: List[BaseException]) -> None:
+    """ Reader thread: queues the rows a block at a time, with the InternColumns fields interned, then _END, stopping
+    early once the conversion has failed """
+    try:
+        rows = iter(Rows)
+        block = list(islice(rows, BlockRows))
+        while (block):
+            InternColumns = Symbols.internColumns(block, InternColumns)
+            if (not _putBlock(Blocks, block, Failed)):
+                break
+            block = list(islice(rows, BlockRows))
+    except BaseException as error:
+        Errors.append(error)
+        Failed.set()
+    _putBlock(Blocks, _END, Failed)
+    return
+
+def _queuedRows(Blocks: queue.Queue) -> Iterator[Any]:
+    """ Hands back the rows of the blocks queued by the reader thread one at a time, until _END """
+    for block in iter(Blocks.get, _END):
+        yield from block
+    return
+
+def _putBlock(Blocks: queue.Queue, Block: Any, Failed: threading.Event) -> bool:
+    """ Queues a block, waiting for room unless the conversion has failed.  Returns False if it failed. """
+    while (not Failed.is_set()):
+        try:
+            Blocks.put(Block, timeout = _POLL_SECONDS)
+            return(True)
+        except queue.Full:
+            pass
+    # The conversion thread stops taking blocks after a failure, but may still be waiting for one
+    try:
+        Blocks.put_nowait(_END)
+    except queue.Full:
+        pass
+    return(False)
+
+def _writeBlocks(FileHandle: QifWriter, Blocks: queue.Queue, Failed: threading.Event, Errors: List[BaseException]) -> None:
+    """ Writer thread: writes the queued QIF text to one output file until _END, discarding it once the conversion has failed """
+    qifText = Blocks.get()
+    while (qifText is not _END):
+        if (not Failed.is_set()):
+            try:
+                FileHandle.write(qifText)
+            except BaseException as error:
+                Errors.append(error)
+                Failed.set()
+        qifText = Blocks.get()
+    return
@@ -0,0 +1,150 @@
+#************
+# Imports
+#************
+import csv
+import decimal
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import CompiledConfig
+from TestContext import ConversionErrors
+from TestContext import MoneyParser
+from TestContext import RecordAggregator
+
+class TestAggregate(unittest.TestCase):
+    """ Tests the aggregate stage merges the records of each day with the same action, security and QIF file """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    def setUp(self) -> None:
+        """ Writes a config routing two accounts to their own QIF files """
+        sys.stdout = io.StringIO()
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        tempDir = self.__mTempDir.name
+        self.__mCsvFileName = os.path.join(tempDir, "Statement.csv")
+        self.__mCfgFileName = os.path.join(tempDir, "Config.json")
+        self.__mQifNames = [ os.path.join(tempDir, "Roth.qif"), os.path.join(tempDir, "Other.qif") ]
+        self.__mCfgDict = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [ { "name": self.__mQifNames[0], "matchColumn": "Account", "matchRegEx": "Roth" },
+                          { "name": self.__mQifNames[1], "matchColumn": "Account", "matchRegEx": "Brokerage" } ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(self.__mCfgDict, cfgFile)
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeCsv(self, Rows: list) -> None:
+        """ Writes the rows under the header row """
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            csv.writer(csvFile).writerows([ self._HEADER ] + Rows)
+        return
+
+    def _run(self, *Options: str) -> list:
+        """ Runs the command line and returns the text of the QIF files """
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName ] + list(Options))
+        texts = []
+        for qifName in self.__mQifNames:
+            with open(qifName, "rt") as qifFile:
+                texts.append(qifFile.read())
+        return(texts)
+
+    def _aggregate(self, Rows: list, MaxGroups: int = RecordAggregator.AGGREGATE_MAX_GROUPS) -> list:
+        """ Runs the aggregate stage over the rows and returns the output file indexes and records """
+        config = CompiledConfig.CompiledConfig(self.__mCfgDict)
+        aggregator = RecordAggregator.RecordAggregator(MaxGroups)
+        records = list(aggregator.aggregateRecords(iter(Rows), config.bindHeader(self._HEADER), config.symbols, MoneyParser.MoneyParser()))
+        self.assertEqual((aggregator.rowsRead, aggregator.recordsWritten), (len(Rows), len(records)))
+        return(records)
+
+    def _totals(self, Text: str) -> tuple:
+        """ Returns the record count and the sums of the T and Q fields of QIF text """
+        fields = [ line for line in Text.splitlines() if (line[:1] in ("T", "Q")) ]
+        total = lambda prefix: sum(decimal.Decimal(line[1:].replace(",", "")) for line in fields if (line[0] == prefix))
+        return((Text.count("^\n"), total("T"), total("Q")))
+
+    def test_Merge(self) -> None:
+        """ Verifies same day rows are merged by action, security and QIF file, with a quantity weighted price """
+        self._writeCsv([ [ "1/5/2021", "Buy", "Fund A", "$10.00", "1.5", "(15.00)", "Pay 1", "Roth" ],
+                         [ "1/5/2021", "Buy", "Fund A", "$10.00", "2.25", "(22.50)", "Pay 2", "Roth" ],
+                         [ "1/5/2021", "BUY", "Fund A", "$12.00", "1", "(12.00)", "Pay 3", "Roth" ],
+                         [ "1/5/2021", "Sell", "Fund A", "$10.00", "-1", "10.00", "Out", "Roth" ],
+                         [ "1/5/2021", "Buy", "Fund A", "$10.00", "1", "(10.00)", "Other", "Brokerage" ],
+                         [ "1/6/2021", "Buy", "Fund A", "$11.00", "1", "(1,100.50)", "Next", "Roth" ],
+                         [ "1/6/2021", "Buy", "Fund A", "11", "0.5", "(1,100.50)", "Next 2", "Roth" ] ])
+        plain = self._run()
+        texts = self._run("--aggregate")
+        self.assertIn("7 CSV records processed\n4 QIF records written", sys.stdout.getvalue())
+        self.assertEqual(texts[0], "D1/5/2021\nNBuy\nYFund A\nI10.421053\nT-49.50\nQ4.75\nMPay 1\n^\n"
+                                   "D1/5/2021\nNSell\nYFund A\nI10.0\nT10.00\nQ1.0\nMOut\n^\n"
+                                   "D1/6/2021\nNBuy\nYFund A\nI11.0\nT-2,201.00\nQ1.5\nMNext\n^\n")
+        # A group of one row keeps its record as it was
+        self.assertEqual(texts[1], plain[1])
+        self.assertEqual(self._totals(plain[0])[1:], self._totals(texts[0])[1:])
+        return
+
+    def test_Flush(self) -> None:
+        """ Verifies groups are written out when the date changes or too many are held, so unsorted rows merge per run """
+        rows = [ [ "1/5/2021", "Buy", "Fund {}".format(row % 2), "10", "1", "10", "Memo {}".format(row), "Roth" ] for row in range(4) ]
+        rows.append([ "1/6/2021", "Buy", "Fund 0", "10", "1", "10", "Memo", "Roth" ])
+        rows.append([ "1/5/2021", "Buy", "Fund 0", "10", "1", "10", "Memo", "Brokerage" ])
+        records = self._aggregate(rows)
+        self.assertEqual([ (fileIndex, record.split("\n")[2], record.split("\n")[5]) for fileIndex, record in records ],
+                         [ (0, "YFund 0", "Q2.0"), (0, "YFund 1", "Q2.0"), (0, "YFund 0", "Q1.0"), (1, "YFund 0", "Q1.0") ])
+        self.assertEqual(len(self._aggregate(rows, MaxGroups = 1)), 6)
+
+        # Rows of the same day merge into one record per group whatever their order, and no penny or share is lost
+        rows = [ [ "2/{}/2021".format(1 + (row // 40)), ("Buy", "Sell")[row % 3 == 0], "Fund {}".format(row % 4), "{}.{:03d}".format(10 + row % 5, row),
+                   "{}.{}".format(row % 9, row % 7), "({}.{:02d})".format(row % 50, row % 100), "Memo", ("Roth", "Brokerage")[row % 2] ] for row in range(400) ]
+        self._writeCsv(rows)
+        plain = self._run()
+        texts = self._run("--aggregate")
+        for text, merged in zip(plain, texts):
+            self.assertEqual(self._totals(text)[1:], self._totals(merged)[1:])
+        self.assertEqual(sum(self._totals(text)[0] for text in texts), 10 * 2 * 4)
+        return
+
+    def test_Errors(self) -> None:
+        """ Verifies bad rows raise the errors the route stage raises, and the options that cannot aggregate are refused """
+        with self.assertRaises(ConversionErrors.UnknownActionError):
+            self._aggregate([ [ "1/5/2021", "Swap", "Fund", "10", "1", "10", "Memo", "Roth" ] ])
+        with self.assertRaises(ConversionErrors.RoutingError):
+            self._aggregate([ [ "1/5/2021", "Buy", "Fund", "10", "1", "10", "Memo", "Savings" ] ])
+        with self.assertRaises(ConversionErrors.CsvFormatError):
+            self._aggregate([ [ "1/5/2021", "Buy", "Fund", "10", "1", "10", "Memo" ] ])
+
+        self._writeCsv([ [ "1/5/2021", "Buy", "Fund", "10", "1", "10", "Memo", "Roth" ] ])
+        for options in ([ "--jobs", "2" ], [ "--engine", "columnar" ], [ "--stats", "-" ], [ "--resume" ]):
+            with self.subTest(options = options):
+                with self.assertRaisesRegex(Exception, "--aggregate cannot"):
+                    self._run("--aggregate", *options)
+        with self.assertRaisesRegex(Exception, "--aggregate cannot"):
+            CSVtoQIF.main([ self.__mCfgFileName, "--watch", self.__mTempDir.name, "--aggregate" ])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
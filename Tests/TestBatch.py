@@ -0,0 +1,113 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import BatchConverter
+from TestContext import CSVtoQIF
+
+class TestBatch(unittest.TestCase):
+    """ Tests converting a directory of CSV files with one config load """
+
+    __mStatements = [ "2021-01", "2021-02", "2021-03" ]
+
+    def setUp(self) -> None:
+        """ Writes several monthly statements and a config file routing them to two QIF files """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCsvDir = os.path.join(self.__mTempDir.name, "Statements")
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        os.makedirs(self.__mCsvDir)
+        for month, statement in enumerate(self.__mStatements):
+            self._writeStatement(os.path.join(self.__mCsvDir, statement + ".csv"), 50 + month, "Buy")
+
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [
+                { "name": "Roth.qif", "matchColumn": "Category", "matchRegEx": "Roth" },
+                { "name": "SafeHarbor.qif", "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeStatement(self, FileName: str, Rows: int, Action: str) -> None:
+        """ Writes a statement CSV file with the given number of rows, all using one action """
+        with open(FileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow([ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Category" ])
+            for row in range(Rows):
+                writer.writerow([ "1/{}/2021".format((row % 28) + 1), Action, "Fund {}".format(row % 5), "$10.00", "1.5", "$15.00",
+                                  "Contribution {}".format(row), "Roth" if (row % 2) else "Safe Harbor Match" ])
+        return
+
+    def _countRecords(self, FileName: str) -> int:
+        """ Counts the QIF records in a file """
+        with open(FileName, "rt") as qifFile:
+            return(qifFile.read().count("^\n"))
+
+    def test_OutputNames(self) -> None:
+        """ Verifies the output file name template fields """
+        names = BatchConverter.makeOutputNames("{csvDir}/{csvStem}-{qifStem}.QIF", "In/2021-01.csv", [ "Out/Roth.qif" ])
+        self.assertEqual(names, [ os.path.normpath("In/2021-01-Roth.QIF") ])
+        names = BatchConverter.makeOutputNames("{qifDir}/{csvStem}/{qifName}", "2021-01.csv", [ "Out/Roth.qif" ])
+        self.assertEqual(names, [ os.path.normpath("Out/2021-01/Roth.qif") ])
+        with self.assertRaises(Exception):
+            BatchConverter.makeOutputNames("{unknown}", "2021-01.csv", [ "Roth.qif" ])
+        return
+
+    def test_BatchDirectory(self) -> None:
+        """ Converts a directory serially and with a worker pool, checking every statement's output files """
+        for jobs in [ 1, 2 ]:
+            CSVtoQIF.main([ self.__mCsvDir, self.__mCfgFileName, "--batch", "--jobs", str(jobs) ])
+            for month, statement in enumerate(self.__mStatements):
+                rows = 50 + month
+                self.assertEqual(self._countRecords(os.path.join(self.__mCsvDir, statement + "-Roth.qif")), rows // 2)
+                self.assertEqual(self._countRecords(os.path.join(self.__mCsvDir, statement + "-SafeHarbor.qif")), rows - (rows // 2))
+        self.assertIn("3 CSV files, 153 CSV records processed, 0 failed", sys.stdout.getvalue())
+        return
+
+    def test_BatchGlobWithFailure(self) -> None:
+        """ Verifies a failing file is reported in the summary without stopping the other conversions """
+        self._writeStatement(os.path.join(self.__mCsvDir, "2021-04.csv"), 10, "Unmapped")
+        outputDir = os.path.join(self.__mTempDir.name, "Output")
+        os.makedirs(outputDir)
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ os.path.join(self.__mCsvDir, "2021-0*.csv"), self.__mCfgFileName, "--batch",
+                            "--output-template", os.path.join(outputDir, "{csvStem}-{qifName}") ])
+        self.assertIn("4 CSV files, 153 CSV records processed, 1 failed", sys.stdout.getvalue())
+        self.assertEqual(self._countRecords(os.path.join(outputDir, "2021-03-Roth.qif")), 26)
+        return
+
+    def test_OutputCollision(self) -> None:
+        """ Verifies a template that would write two statements to the same file is rejected """
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ self.__mCsvDir, self.__mCfgFileName, "--batch", "--output-template", "{csvDir}/{qifName}" ])
+        return
@@ -0,0 +1,162 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import CliDefaults
+from TestContext import ColumnarEngine
+from TestContext import CompiledConfig
+from TestContext import MoneyParser
+from TestContext import QifPipeline
+
+class TestColumnar(unittest.TestCase):
+    """ Tests the columnar conversion engine gives the output and errors of the row by row pipeline """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    # Money strings in the forms found in real exports, including ones only the regex fallback reads
+    _PRICES = [ "10.00", "$10.00", "$1,234.5678", "0.00001", "12.", "45.23 shares" ]
+    _AMOUNTS = [ "$15.00", "(1,234.56)", "-$2.675", "-0.00", "2,665.005", "USD 1,234.56" ]
+
+    def setUp(self) -> None:
+        """ Makes a temporary directory """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeConfig(self, QifFiles: list) -> str:
+        """ Writes a config file routing to the given qifFiles entries and returns its name """
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell", "ReinvDiv": "Reinvest" }
+            },
+            "qifFiles": QifFiles
+        }
+        fileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(fileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        return(fileName)
+
+    def _writeStatement(self, Rows: int, Seed: int = 0) -> str:
+        """ Writes a randomized statement with repeated and distinct money strings, mixed case actions and memos
+        holding commas and newlines, and returns its name """
+        rand = random.Random(Seed)
+        fileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(fileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(self._HEADER)
+            for row in range(Rows):
+                price = rand.choice(self._PRICES) if (rand.random() < 0.3) else "${:.2f}".format(rand.uniform(1.0, 500.0))
+                amount = rand.choice(self._AMOUNTS) if (rand.random() < 0.3) else "{:,.2f}".format(rand.uniform(-5000.0, 5000.0))
+                memo = rand.choice([ "Contribution {}".format(row), "Fee, quarterly", "Line one\nLine two" ])
+                writer.writerow([ "1/{}/2021".format((row % 28) + 1), rand.choice([ "Buy", "BUY", "sell", "Reinvest" ]),
+                                  "Fund {}".format(rand.randrange(5)), price, "{:.4f}".format(rand.uniform(-100.0, 100.0)), amount, memo,
+                                  rand.choice([ "Roth", "Safe Harbor", "Match" ]) ])
+        return(fileName)
+
+    def _convert(self, CsvFileName: str, CfgFileName: str, Engine: str, BlockRows: int = None) -> list:
+        """ Converts a statement with one engine and returns the text of each QIF file, or the error raised """
+        config = CompiledConfig.CompiledConfig.load(CfgFileName)
+        outputNames = [ os.path.join(self.__mTempDir.name, "{}-{}".format(Engine, os.path.basename(name))) for name in config.qifNames ]
+        fileHandles = QifPipeline.openOutputFiles(outputNames)
+        try:
+            if (BlockRows is None):
+                QifPipeline.convertCsvFile(CsvFileName, fileHandles, config, MoneyParser.MoneyParser(), Engine = Engine)
+            else:
+                with open(CsvFileName, "rt") as csvFile:
+                    header, rows = QifPipeline.readCsvRows(csvFile)
+                    ColumnarEngine.convertColumnar(rows, config.bindHeader(header), fileHandles, config, MoneyParser.MoneyParser(), BlockRows)
+        except Exception as err:
+            QifPipeline.abortOutputFiles(fileHandles)
+            return([ "Error: {}".format(err) ])
+        QifPipeline.closeOutputFiles(fileHandles)
+        outputs = []
+        for name in outputNames:
+            with open(name, "rt") as qifFile:
+                outputs.append(qifFile.read())
+        return(outputs)
+
+    def test_MatchesRows(self) -> None:
+        """ Verifies the columnar output is byte for byte the row by row output, with one and several routing columns """
+        csvFileName = self._writeStatement(3000)
+        for qifFiles in ([ { "name": "Roth.qif", "matchColumn": "Account", "matchRegEx": "Roth" },
+                           { "name": "Other.qif", "matchColumn": "Account", "matchRegEx": ".*" } ],
+                         [ { "name": "Roth.qif", "matchColumn": "Account", "matchRegEx": "Roth" },
+                           { "name": "Low.qif", "matchColumn": "Fund", "matchRegEx": "Fund [01]" },
+                           { "name": "Match.qif", "matchColumn": "Account", "matchRegEx": "Match" },
+                           { "name": "Other.qif", "matchColumn": "Fund", "matchRegEx": ".*" } ]):
+            with self.subTest(files = len(qifFiles)):
+                cfgFileName = self._writeConfig(qifFiles)
+                expected = self._convert(csvFileName, cfgFileName, CliDefaults.ENGINE_ROWS)
+                self.assertTrue(all(expected))
+                self.assertEqual(self._convert(csvFileName, cfgFileName, CliDefaults.ENGINE_COLUMNAR), expected)
+                self.assertEqual(self._convert(csvFileName, cfgFileName, CliDefaults.ENGINE_COLUMNAR, 7), expected)
+        return
+
+    def test_Errors(self) -> None:
+        """ Verifies a bad row fails the conversion with the error the row by row pipeline raises """
+        cfgFileName = self._writeConfig([ { "name": "Roth.qif", "matchColumn": "Account", "matchRegEx": "Roth|Match|Safe Harbor" } ])
+        for badRow in ([ "1/5/2021", "Transfer", "Fund 1", "1.00", "1", "1.00", "Memo", "Roth" ],
+                       [ "1/5/2021", "Buy", "Fund 1", "N/A", "1", "1.00", "Memo", "Roth" ],
+                       [ "1/5/2021", "Buy", "Fund 1", "1.00", "1", "1.00", "Memo", "Brokerage" ],
+                       [ "1/5/2021", "Buy", "Fund 1", "1.00" ]):
+            with self.subTest(row = badRow):
+                csvFileName = self._writeStatement(20)
+                with open(csvFileName, "at", newline = "") as csvFile:
+                    csv.writer(csvFile).writerow(badRow)
+                expected = self._convert(csvFileName, cfgFileName, CliDefaults.ENGINE_ROWS)
+                self.assertTrue(expected[0].startswith("Error: "))
+                self.assertEqual(self._convert(csvFileName, cfgFileName, CliDefaults.ENGINE_COLUMNAR), expected)
+                self.assertFalse(os.path.exists(os.path.join(self.__mTempDir.name, "columnar-Roth.qif")))
+        return
+
+    def test_CommandLine(self) -> None:
+        """ Verifies --engine columnar converts single and batch files, and is refused where it does not apply """
+        csvFileName = self._writeStatement(100)
+        qifFileName = os.path.join(self.__mTempDir.name, "All.qif")
+        cfgFileName = self._writeConfig([ { "name": qifFileName, "matchColumn": "Account", "matchRegEx": ".*" } ])
+        CSVtoQIF.main([ csvFileName, cfgFileName ])
+        with open(qifFileName, "rt") as qifFile:
+            expected = qifFile.read()
+        os.remove(qifFileName)
+        CSVtoQIF.main([ csvFileName, cfgFileName, "--engine", "columnar" ])
+        with open(qifFileName, "rt") as qifFile:
+            self.assertEqual(qifFile.read(), expected)
+        CSVtoQIF.main([ self.__mTempDir.name, cfgFileName, "--batch", "--engine", "columnar" ])
+        with open(os.path.join(self.__mTempDir.name, "Statement-All.qif"), "rt") as qifFile:
+            self.assertEqual(qifFile.read(), expected)
+
+        for options in ([ "--jobs", "2" ], [ "--stats", "-" ]):
+            with self.subTest(options = options):
+                with self.assertRaises(Exception):
+                    CSVtoQIF.main([ csvFileName, cfgFileName, "--engine", "columnar" ] + options)
+        return
+
+if __name__ == "__main__":
+    unittest.main()
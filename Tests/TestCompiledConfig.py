@@ -0,0 +1,154 @@
+#************
+# Imports
+#************
+import copy
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CompiledConfig
+from TestContext import CSVtoQIF
+
+class TestCompiledConfig(unittest.TestCase):
+    """ Tests config validation, compilation and the compiled config cache """
+
+    __mJsonConfigObj = {
+        "csvFile": {
+            "headerRowMap": {
+                "dateColumn": "Date",
+                "actionColumn": "Action",
+                "securityColumn": "Fund",
+                "priceColumn": "Price",
+                "quantityColumn": "Quantity",
+                "valueColumn": "Amount",
+                "memoColumn": "Memo"
+            },
+            "actionCodeMap": { "Buy": "Purchase", "Sell": "", "ShrsIn": "transfer in" }
+        },
+        "qifFiles": [
+            { "name": "Roth.qif", "matchColumn": "Category", "matchRegEx": "Roth" },
+            { "name": "Other.qif", "matchColumn": "Fund", "matchRegEx": "" }
+        ]
+    }
+
+    def setUp(self) -> None:
+        """ Creates a temporary directory for config and cache files """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        self.__mCacheFileName = os.path.join(self.__mTempDir.name, "Config.cache")
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Removes the temporary files """
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeConfig(self, JsonCfg) -> None:
+        """ Writes a config object to the config file """
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(JsonCfg, cfgFile)
+        return
+
+    def test_Compile(self) -> None:
+        """ Verifies the compiled columns, inverted action map and output names """
+        config = CompiledConfig.CompiledConfig(self.__mJsonConfigObj)
+        self.assertEqual(config.columns, [ "Date", "Action", "Fund", "Price", "Amount", "Quantity", "Memo" ])
+        self.assertEqual(config.actionDict, { "PURCHASE": "Buy", "TRANSFER IN": "ShrsIn" })
+        self.assertEqual(config.qifNames, [ "Roth.qif", "Other.qif" ])
+        self.assertEqual(config.routingColumns, [ "Category", "Fund" ])
+        self.assertFalse(hasattr(config, "__dict__"))
+        return
+
+    def test_MissingHeaderKeys(self) -> None:
+        """ Verifies every missing headerRowMap key is named in one error """
+        jsonCfg = copy.deepcopy(self.__mJsonConfigObj)
+        del jsonCfg["csvFile"]["headerRowMap"]["priceColumn"]
+        del jsonCfg["csvFile"]["headerRowMap"]["memoColumn"]
+        with self.assertRaisesRegex(Exception, "'priceColumn', 'memoColumn'"):
+            CompiledConfig.CompiledConfig(jsonCfg)
+        return
+
+    def test_BadStructure(self) -> None:
+        """ Verifies malformed objects and qifFiles entries are rejected """
+        jsonCfg = copy.deepcopy(self.__mJsonConfigObj)
+        del jsonCfg["qifFiles"][1]["matchRegEx"]
+        with self.assertRaisesRegex(Exception, "qifFiles entry 1 .*matchRegEx"):
+            CompiledConfig.CompiledConfig(jsonCfg)
+        with self.assertRaisesRegex(Exception, "actionCodeMap"):
+            CompiledConfig.CompiledConfig({ "csvFile": { "headerRowMap": {} }, "qifFiles": [] })
+        return
+
+    def test_ResolveColumns(self) -> None:
+        """ Verifies header names resolve to positions and missing columns are all reported """
+        config = CompiledConfig.CompiledConfig(self.__mJsonConfigObj)
+        header = [ "Category", "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Extra" ]
+        positions = config.resolveColumns(header)
+        self.assertEqual(positions["Category"], 0)
+        self.assertEqual(positions["Memo"], 7)
+        self.assertNotIn("Extra", positions)
+        with self.assertRaisesRegex(Exception, "'Price', 'Category'"):
+            config.resolveColumns([ "Date", "Action", "Fund", "Quantity", "Amount", "Memo" ])
+        return
+
+    def test_BindHeader(self) -> None:
+        """ Verifies the row layout holds the field positions in pipeline order and a router bound to positions """
+        config = CompiledConfig.CompiledConfig(self.__mJsonConfigObj)
+        layout = config.bindHeader([ "Memo", "Amount", "Quantity", "Price", "Fund", "Action", "Date", "Category" ])
+        self.assertEqual(layout.columns, [ 6, 5, 4, 3, 1, 2, 0 ])
+        self.assertEqual(layout.router.route([ "", "", "", "", "Bond", "", "", "Roth 401k" ]), 0)
+        self.assertEqual(layout.router.route([ "", "", "", "", "Bond", "", "", "Pre-Tax" ]), 1)
+        return
+
+    def test_MissingCsvColumn(self) -> None:
+        """ Verifies a conversion reports a missing CSV column up front rather than a KeyError mid-file """
+        self._writeConfig(self.__mJsonConfigObj)
+        csvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(csvFileName, "wt") as csvFile:
+            csvFile.write("Date,Action,Fund,Price,Quantity,Memo,Category\n1/1/2021,Purchase,Bond,1,1,Memo,Roth\n")
+        jsonCfg = copy.deepcopy(self.__mJsonConfigObj)
+        jsonCfg["qifFiles"] = [ { "name": os.path.join(self.__mTempDir.name, "Out.qif"), "matchColumn": "Category", "matchRegEx": "" } ]
+        self._writeConfig(jsonCfg)
+        sys.stdout = io.StringIO()
+        try:
+            with self.assertRaisesRegex(Exception, "missing the column.*'Amount'"):
+                CSVtoQIF.main([ csvFileName, self.__mCfgFileName ])
+        finally:
+            sys.stdout = sys.__stdout__
+        return
+
+    def test_Cache(self) -> None:
+        """ Verifies an unchanged config is served from the cache and a changed one is recompiled """
+        self._writeConfig(self.__mJsonConfigObj)
+        config = CompiledConfig.CompiledConfig.load(self.__mCfgFileName, self.__mCacheFileName)
+        self.assertTrue(os.path.isfile(self.__mCacheFileName))
+
+        # Replace the config with invalid JSON of the same size and modification time.  Only a cache hit can load it.
+        cfgStat = os.stat(self.__mCfgFileName)
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            cfgFile.write("x" * cfgStat.st_size)
+        os.utime(self.__mCfgFileName, ns = (cfgStat.st_atime_ns, cfgStat.st_mtime_ns))
+        cached = CompiledConfig.CompiledConfig.load(self.__mCfgFileName, self.__mCacheFileName)
+        self.assertEqual(cached.columns, config.columns)
+        self.assertEqual(cached.router.route({ "Category": "Roth", "Fund": "" }), 0)
+
+        # A real change is picked up
+        jsonCfg = copy.deepcopy(self.__mJsonConfigObj)
+        jsonCfg["qifFiles"][0]["name"] = "Changed.qif"
+        self._writeConfig(jsonCfg)
+        os.utime(self.__mCfgFileName, ns = (cfgStat.st_atime_ns, cfgStat.st_mtime_ns + 1000000000))
+        self.assertEqual(CompiledConfig.CompiledConfig.load(self.__mCfgFileName, self.__mCacheFileName).qifNames[0], "Changed.qif")
+        return
+
+    def test_BadJson(self) -> None:
+        """ Verifies invalid JSON is reported with the file name """
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            cfgFile.write("{ not json")
+        with self.assertRaisesRegex(Exception, "not valid JSON"):
+            CompiledConfig.CompiledConfig.load(self.__mCfgFileName)
+        return
@@ -8,3 +8,23 @@ import sys
 # Test files can import this module then import the modules imported below.
 sys.path.insert(0, os.path.normpath(os.path.abspath(os.path.join(os.path.dirname(__file__), '../Source'))))
 import CSVtoQIF
+import QifRouter
+import MoneyParser
+import ParallelConverter
+import BatchConverter
+import CompiledConfig
+import QifWriter
+import MappedCsvReader
+import ConversionServer
+import DirectoryWatcher
+import QifPipeline
+import ColumnarEngine
+import CsvValidator
+import ConversionErrors
+import QifConverter
+import DateParser
+import ThreadedPipeline
+import SymbolTable
+import Checkpoint
+import RecordAggregator
+import CliDefaults
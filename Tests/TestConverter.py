@@ -0,0 +1,144 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import ConversionErrors
+from TestContext import QifConverter
+from TestContext import QifWriter
+
+class TestConverter(unittest.TestCase):
+    """ Tests the Converter library interface """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    def setUp(self) -> None:
+        """ Makes a temporary directory, and a stdout that shows anything printed """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        sys.stdout = io.StringIO()
+        self.__mConfig = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [ { "name": os.path.join(self.__mTempDir.name, "Roth.qif"), "matchColumn": "Account", "matchRegEx": "Roth" },
+                          { "name": os.path.join(self.__mTempDir.name, "Match.qif"), "matchColumn": "Account", "matchRegEx": "Match" } ]
+        }
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _rows(self, Count: int) -> list:
+        """ Returns a header and Count rows alternating between the two accounts """
+        return([ self._HEADER ] + [ [ "1/{}/2021".format(row + 1), "Buy" if (row % 2) else "sell", "Fund", "$10.00", "1.5", "(15.00)",
+                                      "Memo {}".format(row), "Roth" if (row % 2) else "Match" ] for row in range(Count) ])
+
+    def test_ConvertRows(self) -> None:
+        """ Verifies rows are converted lazily into (destination, record) pairs, printing nothing """
+        converter = QifConverter.Converter(self.__mConfig)
+        roth, match = converter.destinations
+
+        def rowSource():
+            yield from self._rows(3)
+            raise AssertionError("The fourth row was read before it was needed")
+        records = converter.convertRows(rowSource())
+        self.assertEqual(next(records), (match, "D1/1/2021\nNSell\nYFund\nI10.0\nT-15.00\nQ1.5\nMMemo 0\n^\n"))
+        self.assertEqual(next(records)[0], roth)
+        self.assertEqual(next(records)[0], match)
+
+        self.assertEqual([ name for name, record in converter.convertRows(self._rows(4)[1:], Header = self._HEADER) ], [ match, roth ] * 2)
+        self.assertEqual(list(converter.convertRows([])), [])
+        self.assertEqual(sys.stdout.getvalue(), "")
+        return
+
+    def test_ConvertFile(self) -> None:
+        """ Verifies a file is converted into one stream per destination, matching the command line output, with no file written """
+        csvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(csvFileName, "wt", newline = "") as csvFile:
+            csv.writer(csvFile).writerows(self._rows(50))
+        cfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(cfgFileName, "wt") as cfgFile:
+            json.dump(self.__mConfig, cfgFile)
+
+        converter = QifConverter.Converter.load(cfgFileName)
+        for engine in CSVtoQIF.ENGINES:
+            with self.subTest(engine = engine):
+                streams = converter.convertFile(csvFileName, Engine = engine)
+                self.assertEqual(list(streams), converter.destinations)
+                self.assertEqual(sorted(os.listdir(self.__mTempDir.name)), [ "Config.json", "Statement.csv" ])
+                self.assertEqual(sys.stdout.getvalue(), "")
+
+        with open(csvFileName, "rt") as csvFile:
+            self.assertEqual(streams[converter.destinations[0]].read(),
+                             "".join(record for name, record in converter.convertText(csvFile.read()) if (name == converter.destinations[0])))
+        CSVtoQIF.main([ csvFileName, cfgFileName ])
+        for name in converter.destinations:
+            with open(name, "rt") as qifFile:
+                self.assertEqual(streams[name].getvalue(), qifFile.read())
+
+        # Entries sharing a name share a stream, with their records in file order whatever the engine
+        for qifFile in self.__mConfig["qifFiles"]:
+            qifFile["name"] = os.path.join(self.__mTempDir.name, "Same.qif")
+        converter = QifConverter.Converter(self.__mConfig)
+        expected = converter.convertFile(csvFileName)[converter.destinations[0]].getvalue()
+        self.assertEqual(expected, "".join(record for name, record in converter.convertRows(self._rows(50)[1:], Header = self._HEADER)))
+        for engine in CSVtoQIF.ENGINES:
+            with self.subTest(engine = engine, name = "Same.qif"):
+                self.assertEqual(converter.convertFile(csvFileName, Engine = engine)[converter.destinations[0]].getvalue(), expected)
+        return
+
+    def test_Errors(self) -> None:
+        """ Verifies each kind of failure raises its own ConversionError type """
+        converter = QifConverter.Converter(self.__mConfig)
+        good = self._rows(1)[1]
+        for badRow, errorType in (([ "1/5/2021", "Transfer" ] + good[2:], QifConverter.UnknownActionError),
+                                  (good[:3] + [ "N/A" ] + good[4:], QifConverter.MoneyFormatError),
+                                  (good[:7] + [ "Brokerage" ], QifConverter.RoutingError),
+                                  (good[:3], QifConverter.CsvFormatError)):
+            with self.subTest(row = badRow):
+                with self.assertRaises(errorType) as context:
+                    list(converter.convertRows([ self._HEADER, good, badRow ]))
+                self.assertIsInstance(context.exception, QifConverter.ConversionError)
+
+        with self.assertRaises(QifConverter.CsvFormatError):
+            list(converter.convertRows([ self._HEADER[:-1] ]))
+        with self.assertRaises(QifConverter.ConfigError):
+            QifConverter.Converter({ "csvFile": {} })
+        with self.assertRaises(QifConverter.ConfigError):
+            QifConverter.Converter(dict(self.__mConfig, qifFiles = [ { "name": "Bad.qif", "matchColumn": "Account", "matchRegEx": "(" } ]))
+        self.assertIs(QifConverter.ConfigError, ConversionErrors.ConfigError)
+
+        # Outputs that cannot be written as configured
+        for fileName, spec, resumeOffset in ((QifWriter.STREAM_FILE_NAME, QifWriter.SinkSpec(SplitRecords = 10), None),
+                                             (os.path.join(self.__mTempDir.name, "All.qif.gz"), QifWriter.SinkSpec(QifWriter.SINK_GZIP), 0),
+                                             (self.__mTempDir.name, None, 0)):
+            with self.subTest(fileName = fileName):
+                with self.assertRaises(QifConverter.OutputConfigError) as context:
+                    QifWriter.openSink(fileName, spec, ResumeOffset = resumeOffset)
+                self.assertIsInstance(context.exception, QifConverter.ConversionError)
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import CompiledConfig
+from TestContext import ConversionErrors
+from TestContext import CsvValidator
+from TestContext import DateParser
+from TestContext import QifConverter
+
+class TestDates(unittest.TestCase):
+    """ Tests dateFormat date normalization """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    def setUp(self) -> None:
+        """ Makes a temporary directory """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _config(self, DateFormat: str = None) -> dict:
+        """ Returns a config routing every row to All.qif, with the given dateFormat """
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [ { "name": os.path.join(self.__mTempDir.name, "All.qif"), "matchColumn": "Account", "matchRegEx": "." } ]
+        }
+        if (DateFormat is not None):
+            config["csvFile"]["dateFormat"] = DateFormat
+        return(config)
+
+    def _rows(self, Dates: list) -> list:
+        """ Returns a row for each date """
+        return([ [ date, "Buy", "Fund", "10.00", "1", "10.00", "Memo", "Roth" ] for date in Dates ])
+
+    def test_Formats(self) -> None:
+        """ Verifies explicit formats read their dates into Quicken's form and reject dates that are not real """
+        for dateFormat, text, expected in (("%Y-%m-%d", "2021-01-05", "1/5/2021"),
+                                           ("%Y-%m-%d", "2021-01-05T09:30:00", "1/5/2021"),
+                                           ("%m/%d/%Y", "12/31/1999", "12/31/1999"),
+                                           ("%m/%d/%Y", " 1/5/2021 9:30 AM", "1/5/2021"),
+                                           ("%d/%m/%y", "05/01/21", "1/5/2021"),
+                                           ("%d/%m/%y", "05/01/85", "1/5/1985"),
+                                           ("%d-%b-%y", "05-Jan-21", "1/5/2021"),
+                                           ("%d %B %Y", "5 September 2021", "9/5/2021"),
+                                           ("%b %d, %Y", "Sept 5, 2021", "9/5/2021"),
+                                           ("%Y%m%d", "20240229", "2/29/2024")):
+            with self.subTest(dateFormat = dateFormat, text = text):
+                self.assertEqual(DateParser.DateParser(dateFormat).formatDate(text), expected)
+
+        for dateFormat, text in (("%Y-%m-%d", "2021-13-05"), ("%Y-%m-%d", "2021-04-31"), ("%Y%m%d", "19000229"),
+                                 ("%m/%d/%Y", "2021-01-05"), ("%d-%b-%y", "05-Foo-21"), ("%m/%d/%Y", "")):
+            with self.subTest(dateFormat = dateFormat, text = text):
+                with self.assertRaises(ConversionErrors.DateFormatError):
+                    DateParser.DateParser(dateFormat).formatDate(text)
+
+        for dateFormat in ("%Y-%m", "%d/%m/%Y %H:%M", "%d/%d/%Y", "Date"):
+            with self.subTest(dateFormat = dateFormat):
+                with self.assertRaises(ConversionErrors.ConfigError):
+                    DateParser.DateParser(dateFormat)
+        return
+
+    def test_Detection(self) -> None:
+        """ Verifies auto detection prefers month first dates, and reads a sample holding a day above 12 day first """
+        for dates, expectedFormat, expected in ((["01/05/2021", "02/03/2021"], "%m/%d/%Y", "1/5/2021"),
+                                                (["01/05/2021", "25/03/2021"], "%d/%m/%Y", "5/1/2021"),
+                                                (["2021-01-05", "2021-03-25"], "%Y-%m-%d", "1/5/2021"),
+                                                (["05-Jan-21", "25-Mar-21"], "%d-%b-%y", "1/5/2021")):
+            with self.subTest(dates = dates):
+                parser = DateParser.DateParser(DateParser.DATE_FORMAT_AUTO)
+                self.assertIsNone(parser.format)
+                rows = list(parser.sampleRows([ [ date ] for date in dates ], 0))
+                self.assertEqual(rows, [ [ date ] for date in dates ])
+                self.assertEqual(parser.format, expectedFormat)
+                self.assertEqual(parser.formatDate(dates[0]), expected)
+
+        parser = DateParser.DateParser(DateParser.DATE_FORMAT_AUTO)
+        self.assertEqual(parser.formatDate("2021/01/05"), "1/5/2021")
+        self.assertEqual(parser.format, "%Y/%m/%d")
+        with self.assertRaises(ConversionErrors.DateFormatError):
+            DateParser.DateParser(DateParser.DATE_FORMAT_AUTO).detect([ "Yesterday", "Today" ])
+        return
+
+    def test_BlankDates(self) -> None:
+        """ Verifies auto detection skips blank dates, reading on past the sample for one that is not blank, and that
+        a blank date with no format chosen raises DateFormatError """
+        dates = [ "" ] + [ " " ] * DateParser.DATE_DETECT_ROWS + [ "25/03/2021", "01/05/2021" ]
+        parser = DateParser.DateParser(DateParser.DATE_FORMAT_AUTO)
+        rows = list(parser.sampleRows([ [ date ] for date in dates ], 0))
+        self.assertEqual(rows, [ [ date ] for date in dates ])
+        self.assertEqual(parser.format, "%d/%m/%Y")
+        self.assertEqual(parser.formatDate("01/05/2021"), "5/1/2021")
+
+        for dates in ([ "" ], [ "", " ", "" ]):
+            with self.subTest(dates = dates):
+                parser = DateParser.DateParser(DateParser.DATE_FORMAT_AUTO)
+                list(parser.sampleRows([ [ date ] for date in dates ], 0))
+                self.assertIsNone(parser.format)
+                with self.assertRaises(ConversionErrors.DateFormatError):
+                    parser.formatDate(dates[0])
+
+        # A blank date in the first row of a file fails the conversion with a ConversionError
+        cfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(cfgFileName, "wt") as cfgFile:
+            json.dump(self._config(DateParser.DATE_FORMAT_AUTO), cfgFile)
+        csvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(csvFileName, "wt", newline = "") as csvFile:
+            csv.writer(csvFile).writerows([ self._HEADER ] + self._rows([ "" ]))
+        with self.assertRaises(ConversionErrors.DateFormatError):
+            CSVtoQIF.main([ csvFileName, cfgFileName ])
+        with open(csvFileName, "at", newline = "") as csvFile:
+            csv.writer(csvFile).writerows(self._rows([ "2021-01-05" ]))
+        with self.assertRaises(ConversionErrors.DateFormatError):
+            CSVtoQIF.main([ csvFileName, cfgFileName ])
+        return
+
+    def test_Cache(self) -> None:
+        """ Verifies each distinct date is read once """
+        parser = DateParser.DateParser("%Y-%m-%d")
+        reads = []
+        renderDate = DateParser._renderDate
+        DateParser._renderDate = lambda Regex, Text: reads.append(Text) or renderDate(Regex, Text)
+        try:
+            for row in range(1000):
+                parser.formatDate("2021-01-{:02d}".format((row % 10) + 1))
+        finally:
+            DateParser._renderDate = renderDate
+        self.assertEqual(len(reads), 10)
+        return
+
+    def test_Config(self) -> None:
+        """ Verifies dateFormat is checked when the configuration loads, and leaves dates as they are when absent """
+        for dateFormat in ("%Y", 5):
+            with self.subTest(dateFormat = dateFormat):
+                with self.assertRaises(ConversionErrors.ConfigError):
+                    CompiledConfig.CompiledConfig(self._config(dateFormat))
+
+        rows = self._rows([ "2021-01-05", "Jan 5" ])
+        records = [ record for name, record in QifConverter.Converter(self._config()).convertRows(rows, self._HEADER) ]
+        self.assertEqual([ record.split("\n")[0] for record in records ], [ "D2021-01-05", "DJan 5" ])
+        records = [ record for name, record in QifConverter.Converter(self._config("%Y-%m-%d")).convertRows(rows[:1], self._HEADER) ]
+        self.assertEqual(records[0].split("\n")[0], "D1/5/2021")
+        with self.assertRaises(QifConverter.DateFormatError):
+            list(QifConverter.Converter(self._config("%Y-%m-%d")).convertRows(rows, self._HEADER))
+        return
+
+    def test_Engines(self) -> None:
+        """ Verifies every engine, serial and parallel, reads an auto detected day first file the same way """
+        cfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(cfgFileName, "wt") as cfgFile:
+            json.dump(self._config(DateParser.DATE_FORMAT_AUTO), cfgFile)
+        csvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(csvFileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(self._HEADER)
+            # Only the last sampled row shows the file is day first
+            writer.writerows(self._rows([ "{:02d}/{:02d}/2021".format((row % 12) + 1, (row % 9) + 1) for row in range(DateParser.DATE_DETECT_ROWS - 1) ]))
+            writer.writerows(self._rows([ "25/12/2021" ] + [ "{:02d}/03/2021".format((row % 28) + 1) for row in range(2000) ]))
+        qifFileName = os.path.join(self.__mTempDir.name, "All.qif")
+
+        outputs = []
+        for options in ([], [ "--engine", "columnar" ], [ "--jobs", "2" ], [ "--mmap", "--jobs", "2" ]):
+            CSVtoQIF.main([ csvFileName, cfgFileName ] + options)
+            with open(qifFileName, "rt") as qifFile:
+                outputs.append(qifFile.read())
+        self.assertTrue(outputs[0].startswith("D1/1/2021\n"))
+        self.assertIn("D12/25/2021\n", outputs[0])
+        self.assertIn("D3/28/2021\n", outputs[0])
+        for output in outputs[1:]:
+            self.assertEqual(output, outputs[0])
+
+        config = CompiledConfig.CompiledConfig(self._config("%d/%m/%Y"))
+        with open(csvFileName, "at", newline = "") as csvFile:
+            csv.writer(csvFile).writerows(self._rows([ "31/02/2021" ]))
+        for jobs in (1, 2):
+            with self.subTest(jobs = jobs):
+                report = CsvValidator.validateCsvFile(csvFileName, config, jobs)
+                self.assertEqual(report.errors, { (CsvValidator.VALIDATION_BAD_DATE, "'31/02/2021'"): [ DateParser.DATE_DETECT_ROWS + 2002 ] })
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+
+class TestIncremental(unittest.TestCase):
+    """ Tests incremental conversion of cumulative CSV exports backed by the row fingerprint index """
+
+    __mHeader = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Category" ]
+
+    def setUp(self) -> None:
+        """ Writes a config file routing to two QIF files """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCsvFileName = os.path.join(self.__mTempDir.name, "Export.csv")
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        self.__mIndexFileName = os.path.join(self.__mTempDir.name, "Index.sqlite")
+        self.__mQifNames = [ os.path.join(self.__mTempDir.name, name) for name in [ "Roth.qif", "SafeHarbor.qif" ] ]
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [
+                { "name": self.__mQifNames[0], "matchColumn": "Category", "matchRegEx": "Roth" },
+                { "name": self.__mQifNames[1], "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeExport(self, Rows: list) -> None:
+        """ Writes the cumulative export CSV file """
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(self.__mHeader)
+            writer.writerows(Rows)
+        return
+
+    def _makeRows(self, Start: int, Count: int, Action: str = "Buy") -> list:
+        """ Makes export rows with unique memos """
+        return([ [ "1/{}/2021".format((row % 28) + 1), Action, "Fund", "$10.00", "1.5", "$15.00", "Contribution {}".format(row),
+                   "Roth" if (row % 2) else "Safe Harbor Match" ] for row in range(Start, Start + Count) ])
+
+    def _readMemos(self, FileName: str) -> list:
+        """ Returns the memo of every record in a QIF file, in file order """
+        with open(FileName, "rt") as qifFile:
+            return([ line[1:].rstrip("\n") for line in qifFile if line.startswith("M") ])
+
+    def test_AppendNewRows(self) -> None:
+        """ Converts a growing export three times and checks each row is appended exactly once """
+        duplicate = self._makeRows(100, 1)
+        rows = self._makeRows(0, 10) + duplicate + duplicate
+        self._writeExport(rows)
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName ])
+        self.assertIn("12 new CSV records processed, 0 already converted", sys.stdout.getvalue())
+
+        # Identical repeated rows are distinct transactions and both are kept
+        self.assertEqual(self._readMemos(self.__mQifNames[1]).count("Contribution 100"), 2)
+
+        rows = rows + self._makeRows(10, 4)
+        self._writeExport(rows)
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName ])
+        self.assertIn("4 new CSV records processed, 12 already converted", sys.stdout.getvalue())
+
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName ])
+        self.assertIn("0 new CSV records processed, 16 already converted", sys.stdout.getvalue())
+
+        memos = self._readMemos(self.__mQifNames[0]) + self._readMemos(self.__mQifNames[1])
+        self.assertEqual(sorted(memos), sorted(row[6] for row in rows))
+        return
+
+    def test_Engines(self) -> None:
+        """ Checks the columnar and threaded engines append the same records as the row by row pipeline, with the
+        threaded engine filtering rows on the thread that opened the index """
+        duplicate = self._makeRows(5000, 1)
+        rows = self._makeRows(0, 1500) + duplicate + self._makeRows(1500, 1500) + duplicate
+        expected = None
+        for engine in ("rows", "columnar", "threaded"):
+            with self.subTest(engine = engine):
+                for qifName in self.__mQifNames + [ self.__mIndexFileName ]:
+                    if (os.path.exists(qifName)):
+                        os.remove(qifName)
+                self._writeExport(rows[:2000])
+                CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName, "--engine", engine ])
+                self._writeExport(rows)
+                CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName, "--engine", engine ])
+                self.assertIn("1002 new CSV records processed, 2000 already converted", sys.stdout.getvalue())
+                memos = [ self._readMemos(qifName) for qifName in self.__mQifNames ]
+                if (expected is None):
+                    expected = memos
+                self.assertEqual(memos, expected)
+        self.assertEqual(sorted(expected[0] + expected[1]), sorted(row[6] for row in rows))
+        return
+
+    def test_DeltaFiles(self) -> None:
+        """ Checks --delta writes only the new records of each run to delta files """
+        self._writeExport(self._makeRows(0, 6))
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName, "--delta" ])
+        self._writeExport(self._makeRows(0, 8))
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName, "--delta" ])
+
+        deltaName = os.path.join(self.__mTempDir.name, "Roth.delta.qif")
+        self.assertEqual(self._readMemos(deltaName), [ "Contribution 7" ])
+        self.assertFalse(os.path.exists(self.__mQifNames[0]))
+        return
+
+    def test_FailedRunNotRecorded(self) -> None:
+        """ Checks rows from a run that fails are converted again by the next run """
+        self._writeExport(self._makeRows(0, 4) + self._makeRows(4, 1, "Unmapped"))
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName, "--delta" ])
+
+        self._writeExport(self._makeRows(0, 5))
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--incremental", self.__mIndexFileName, "--delta" ])
+        self.assertIn("5 new CSV records processed, 0 already converted", sys.stdout.getvalue())
+        return
@@ -0,0 +1,86 @@
+#************
+# Imports
+#************
+import csv
+import io
+import os
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import MappedCsvReader
+
+class TestMappedCsvReader(unittest.TestCase):
+    """ Tests the memory mapped CSV reader against the csv module """
+
+    # Quoted fields with commas, escaped quotes and embedded LF and CRLF newlines, a quote in an unquoted field,
+    # blank lines, a short row and a last line without a newline
+    _CSV_DATA = (b'Date,Action,Memo,Amount,Extra\r\n'
+                 b'1/2/2021,Buy,plain,"1,234.50",x\r\n'
+                 b'\r\n'
+                 b'1/3/2021,Sell,"Line one\r\nLine ""two""\nend",(5.00),y\n'
+                 b'1/4/2021,Div,5" screen,2.00,z\n'
+                 b'1/5/2021,Buy\n'
+                 b'\n'
+                 b'1/6/2021,Buy,caf\xc3\xa9,"",last')
+
+    def setUp(self) -> None:
+        """ Creates a temporary directory for the CSV files """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Removes the temporary files """
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeCsv(self, Data: bytes) -> str:
+        """ Writes a CSV file and returns its name """
+        fileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(fileName, "wb") as csvFile:
+            csvFile.write(Data)
+        return(fileName)
+
+    def test_MatchesCsvModule(self):
+        """ Verifies the rows are those csv.reader gives for the file in text mode """
+        expected = list(filter(None, csv.reader(io.TextIOWrapper(io.BytesIO(self._CSV_DATA), encoding = "utf-8"))))
+        csvData = MappedCsvReader.mapCsvFile(self._writeCsv(self._CSV_DATA), "utf-8")
+        try:
+            reader = MappedCsvReader.MappedCsvReader(csvData, "utf-8")
+            self.assertEqual(reader.readRow(), expected[0])
+            self.assertEqual(list(reader.rows()), expected[1:])
+        finally:
+            csvData.close()
+        return
+
+    def test_ColumnCount(self):
+        """ Verifies only the leading fields are returned when a column count is given """
+        expected = list(filter(None, csv.reader(io.TextIOWrapper(io.BytesIO(self._CSV_DATA), encoding = "utf-8"))))
+        reader = MappedCsvReader.MappedCsvReader(io.BytesIO(self._CSV_DATA), "utf-8")
+        self.assertEqual(list(reader.rows(3)), [ row[:3] for row in expected ])
+        return
+
+    def test_LoneCarriageReturns(self):
+        """ Verifies lines ended by a CR alone, which universal newline mode ends a line at, give the csv module's rows,
+        whether the first one is in a record or in a quoted field running on from an earlier line """
+        for data in (b'a,b\r1,2\r3,"x\ry"\r\n4,5\n6,"p\nq\rr",7\r\n8,9\r',
+                     b'a,b\r\n1,"start\r\nmid\rmore",x\r2,y\r\n3,"z"',
+                     self._CSV_DATA.replace(b"\r\n", b"\r")):
+            with self.subTest(data = data):
+                expected = list(filter(None, csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding = "utf-8"))))
+                csvData = MappedCsvReader.mapCsvFile(self._writeCsv(data), "utf-8")
+                try:
+                    self.assertEqual(list(MappedCsvReader.MappedCsvReader(csvData, "utf-8").rows()), expected)
+                finally:
+                    csvData.close()
+        return
+
+    def test_Fallback(self):
+        """ Verifies files the reader cannot handle are left to the csv module """
+        self.assertIsNone(MappedCsvReader.mapCsvFile(self._writeCsv(b""), "utf-8"))
+        self.assertIsNone(MappedCsvReader.mapCsvFile(self._writeCsv(b"a,b\n"), "utf-16"))
+        self.assertIsNone(MappedCsvReader.mapCsvFile(self.__mTempDir.name, "utf-8"))
+        self.assertTrue(MappedCsvReader.isMappableEncoding("Latin-1"))
+        return
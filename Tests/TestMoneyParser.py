@@ -0,0 +1,140 @@
+#************
+# Imports
+#************
+import random
+import unittest
+import TestContext
+from TestContext import MoneyParser
+
+class TestMoneyParser(unittest.TestCase):
+    """ Unit test class to test the money string parser fast path, fallback and cache """
+
+    # String to convert, expected signed float value
+    __mListConversions = [
+        ["$1,234.56",       1234.56],
+        ["($1,234.56)",     -1234.56],
+        ["-1,234,567",      -1234567.0],
+        ["(12.00)",         -12.0],
+        ["-3.5",            -3.5],
+        ["+3.5",            3.5],
+        [" $ 45.23 ",       45.23],
+        ["12.",             12.0],
+        ["-0.00",           -0.0],
+
+        # Unusual strings handled by the regex fallback
+        ["USD 1,234.56",    1234.56],
+        ["45.23 shares",    45.23],
+        ["1.2.3",           1.2],
+
+        # Embedded whitespace ends the number, it does not join two numbers together
+        ["1 234",           1.0],
+        ["-1\t234.50",      -1.0],
+        ["$ 1 234.56",      1.0],
+
+        # So does a sign between digits
+        ["1-234",           -1.0],
+        ["12-34.5",         -12.0],
+        ["5+3",             5.0],
+        ["1,2-3",           -12.0],
+        ["$1$2",            1.0]
+        ]
+
+    # Digits other than ASCII ones (here Arabic-Indic) are not money digits, as they would be copied into the QIF text
+    __mListBadValues = [ "", "$", "-", ".", "N/A", "(,)", "\u0661\u0662" ]
+
+    def test_Conversions(self) -> None:
+        """ Verifies signed and forced positive conversions, twice to exercise the cache """
+        parser = MoneyParser.MoneyParser()
+        for attempt in range(2):
+            for testCase in self.__mListConversions:
+                msg = "Test string = '{}', attempt {}".format(testCase[0], attempt)
+                self.assertEqual(parser.parse(testCase[0]), testCase[1], msg)
+                self.assertEqual(parser.parse(testCase[0], True), abs(testCase[1]), msg)
+        return
+
+    def test_NegativeZero(self) -> None:
+        """ Verifies a negative zero keeps its sign, as the QIF output depends on it """
+        parser = MoneyParser.MoneyParser()
+        self.assertEqual("{:,.2f}".format(parser.parse("-0.00")), "-0.00")
+        self.assertEqual("{:,.2f}".format(parser.parse("-0.00", True)), "0.00")
+        return
+
+    def test_BadValues(self) -> None:
+        """ Verifies strings without a number raise an exception """
+        parser = MoneyParser.MoneyParser()
+        for badValue in self.__mListBadValues:
+            with self.assertRaises(Exception, msg = "Test string = '{}'".format(badValue)):
+                parser.parse(badValue)
+        return
+
+    def test_FixedPointFormatting(self) -> None:
+        """ Verifies the I, T and Q field text rendered from fixed-point values """
+        parser = MoneyParser.MoneyParser()
+        self.assertEqual(parser.parseFixed("-$1,234.50"), (True, 123450, 2))
+        self.assertEqual([ MoneyParser.MoneyParser.renderFixed(*fixed) for fixed in [ (False, 10500, 3), (True, 5, 6), (False, 12345678, 2, True) ] ],
+                         [ "10.5", "-5e-06", "123,456.78" ])
+        for text, price, value, quantity in [
+                ("$1,234.50",               "1234.5",               "1,234.50",         "1,234.5"),
+                ("(12.00)",                 "-12.0",                "-12.00",           "12.0"),
+                ("-0.00",                   "-0.0",                 "-0.00",            "0.0"),
+                ("0.00001",                 "1e-05",                "0.00",             "1e-05"),
+                ("12000000000000000",       "1.2e+16",              "12,000,000,000,000,000.00", "1.2e+16"),
+                ("2.675",                   "2.675",                "2.67",             "2.675"),
+                ("2.665",                   "2.665",                "2.67",             "2.665"),
+                ("533.865",                 "533.865",              "533.87",           "533.865"),
+                ("(1,000.125)",             "-1000.125",            "-1,000.12",        "1,000.125"),
+                ("0.123456789012345678",    "0.123456789012345678", "0.12",             "0.123456789012345678"),
+                ("45.23 shares",            "45.23",                "45.23",            "45.23"),
+                ("1 234.56",                "1.0",                  "1.00",             "1.0"),
+                ("1-234",                   "-1.0",                 "-1.00",            "1.0"),
+                ("12-34.5",                 "-12.0",                "-12.00",           "12.0"),
+                ("5+3",                     "5.0",                  "5.00",             "5.0"),
+                ("\u0661\u0662 3.50",       "3.5",                  "3.50",             "3.5") ]:
+            msg = "Test string = '{}'".format(text)
+            self.assertEqual(parser.formatPrice(text), price, msg)
+            self.assertEqual(parser.formatValue(text), value, msg)
+            self.assertEqual(parser.formatQuantity(text), quantity, msg)
+        for badValue in self.__mListBadValues:
+            with self.assertRaises(Exception, msg = "Test string = '{}'".format(badValue)):
+                parser.formatValue(badValue)
+        return
+
+    def test_ColumnFormatting(self) -> None:
+        """ Verifies rendering a column at once gives the text of rendering each string, for columns that take the
+        fast path as a whole, mixed columns, and columns with a newline inside a string """
+        parser = MoneyParser.MoneyParser()
+        for column in ([ "$1,234.50", "(12.00)", "-0.00", "0.00001", "2.675", "12.", "+3.5", " $ 45.23 " ],
+                       [ "$1,234.50", "45.23 shares", "1.2.3", "USD 1,234.56", "-3.5", "1 234", "7\t5" ],
+                       [ "1.00", "2\n.50", "3.25" ],
+                       [ "$1,234.50", "1-234", "12-34.5", "5+3", "-$1.00", ".-5", "(7.5)-" ],
+                       [ "7.50" ],
+                       []):
+            with self.subTest(column = column):
+                self.assertEqual(parser.formatPrices(column), [ parser.formatPrice(text) for text in column ])
+                self.assertEqual(parser.formatValues(column), [ parser.formatValue(text) for text in column ])
+                self.assertEqual(parser.formatQuantities(column), [ parser.formatQuantity(text) for text in column ])
+        for badValue in self.__mListBadValues:
+            with self.assertRaises(Exception, msg = "Test string = '{}'".format(badValue)):
+                parser.formatValues([ "1.00", badValue ])
+        return
+
+    def test_FixedPointMatchesFloat(self) -> None:
+        """ Verifies the fixed-point text matches the float formatting it replaced on a randomized corpus.
+        Values with more than 15 significant digits, which a float cannot hold, are where the two may differ and are
+        left out.  Exact half cent ties are drawn as often as the other values, since a float rounds them by its
+        binary value rather than half to even. """
+        parser = MoneyParser.MoneyParser()
+        rand = random.Random(0)
+        formats = [ "{:.2f}", "${:,.2f}", "-{:.2f}", "(${:,.2f})", "{:.4f}", "{:.0f}", "{:.6f}", "-${:,.3f}", "{:.1f}" ]
+        for _ in range(20000):
+            text = rand.choice(formats).format(10 ** rand.uniform(-6, 11))
+            if (rand.random() < 0.5):
+                text = "{}.{:02d}5".format(rand.randrange(10 ** rand.randrange(1, 10)), rand.randrange(100))
+            negative, units, scale = parser.parseFixed(text)
+            if (len(str(units).strip("0")) > 15):
+                continue
+            msg = "Test string = '{}'".format(text)
+            self.assertEqual(parser.formatPrice(text), "{}".format(parser.parse(text)), msg)
+            self.assertEqual(parser.formatQuantity(text), "{:,}".format(parser.parse(text, True)), msg)
+            self.assertEqual(parser.formatValue(text), "{:,.2f}".format(parser.parse(text)), msg)
+        return
@@ -0,0 +1,153 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import ParallelConverter
+
+class TestParallel(unittest.TestCase):
+    """ Tests the multiprocess chunked conversion against the serial conversion """
+
+    _ROWS = 2000
+
+    def setUp(self) -> None:
+        """ Writes a CSV file with quoted newlines and quotes, and a config file for it """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCsvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow([ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Category" ])
+            for row in range(self._ROWS):
+                # Every seventh memo spans lines and contains escaped quotes so chunk boundaries land inside quoted fields
+                memo = "Line one\nLine \"two\"\n{}".format(row) if ((row % 7) == 0) else "Contribution {}".format(row)
+                writer.writerow([ "1/{}/2021".format((row % 28) + 1), "Buy" if (row % 2) else "Sell", "Fund {}".format(row % 9),
+                                  "${:.2f}".format(row / 3), "{:.3f}".format(row / 7), "(${:,.2f})".format(row * 100.5), memo,
+                                  "Roth" if (row % 3) else "Safe Harbor Match" ])
+        self.__mSerialNames = self._writeConfig("Serial")
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeConfig(self, Prefix: str) -> list:
+        """ Writes the config file with output names carrying a prefix and returns those names """
+        names = [ os.path.join(self.__mTempDir.name, "{}{}.qif".format(Prefix, index)) for index in range(2) ]
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [
+                { "name": names[0], "matchColumn": "Category", "matchRegEx": "Roth" },
+                { "name": names[1], "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        return(names)
+
+    def _readFile(self, FileName: str) -> bytes:
+        """ Returns the raw contents of a file """
+        with open(FileName, "rb") as file:
+            return(file.read())
+
+    def test_RecordBoundaries(self) -> None:
+        """ Verifies newlines inside quoted fields are not treated as record boundaries """
+        data = b'a,b\n1,"x\ny"\n2,"""q""\n"\n3,z\n'
+        self.assertEqual(ParallelConverter.findRecordBoundaries(data, 0, [ 0 ]), [ 4 ])
+        self.assertEqual(ParallelConverter.findRecordBoundaries(data, 4, [ 5, 11, 13 ]), [ 12, 12, 23 ])
+        self.assertEqual(ParallelConverter.findRecordBoundaries(data, 4, [ len(data) ]), [])
+        return
+
+    def test_ChunksCoverFile(self) -> None:
+        """ Verifies the chunks are contiguous, start after the header and end at the end of the file """
+        header, chunks = ParallelConverter.splitCsvFile(self.__mCsvFileName, 16)
+        self.assertEqual(header[0], "Date")
+        self.assertGreater(len(chunks), 1)
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertEqual(previous[1], current[0])
+        self.assertEqual(chunks[-1][1], os.path.getsize(self.__mCsvFileName))
+        return
+
+    def test_ByteIdenticalOutput(self) -> None:
+        """ Verifies the QIF files from a parallel run are byte-identical to a serial run """
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName ])
+        for jobs in [ 2, 3 ]:
+            parallelNames = self._writeConfig("Jobs{}".format(jobs))
+            CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--jobs", str(jobs) ])
+            for serialName, parallelName in zip(self.__mSerialNames, parallelNames):
+                self.assertEqual(self._readFile(parallelName), self._readFile(serialName), "jobs = {}".format(jobs))
+        return
+
+    def test_LiteralQuotes(self) -> None:
+        """ Verifies a quote inside an unquoted field, which throws out the quote count findRecordBoundaries keeps,
+        still gives the serial output once a chunk ends inside a quoted field """
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            csvFile.write("Date,Action,Fund,Price,Quantity,Amount,Memo,Category\n")
+            for row in range(4000):
+                if (row in (100, 3900)):
+                    memo = '12" pipe'
+                elif ((row % 7) == 0):
+                    memo = '"line1\nline2"'
+                else:
+                    memo = "Contribution {}".format(row)
+                csvFile.write("1/{}/2021,Buy,Fund {},$10.00,1.5,($15.00),{},Roth\n".format((row % 28) + 1, row % 9, memo))
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName ])
+        self.assertEqual(self._readFile(self.__mSerialNames[0]).count(b"^\n"), 4000)
+        for options in ([ "--jobs", "4" ], [ "--mmap", "--jobs", "4" ]):
+            parallelNames = self._writeConfig("Quotes{}".format(len(options)))
+            CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName ] + options)
+            for serialName, parallelName in zip(self.__mSerialNames, parallelNames):
+                self.assertEqual(self._readFile(parallelName), self._readFile(serialName), "options = {}".format(options))
+        return
+
+    def test_StopsEarly(self) -> None:
+        """ Verifies a run that stops part way, on a chunk that raises or ends inside a quoted field, finishes rather
+        than leaving the worker pool with chunks still queued """
+        for memo, action in (("Contribution", "Transfer"), ('12" pipe', "Buy")):
+            with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+                csvFile.write("Date,Action,Fund,Price,Quantity,Amount,Memo,Category\n")
+                for row in range(3000):
+                    csvFile.write("1/{}/2021,{},Fund {},$10.00,1.5,($15.00),{},Roth\n".format((row % 28) + 1, action if (row == 100) else "Buy",
+                                                                                             row % 9, memo if (row == 100) else '"a\nb"'))
+            for _ in range(5):
+                # Run in a fresh process, so a hung pool fails the test instead of hanging the suite
+                result = subprocess.run([ sys.executable, CSVtoQIF.__file__, self.__mCsvFileName, self.__mCfgFileName, "--jobs", "3" ],
+                                        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, timeout = 60)
+                self.assertEqual(result.returncode != 0, action == "Transfer", "memo = {}".format(memo))
+        return
+
+    def test_MappedReaderOutput(self) -> None:
+        """ Verifies the QIF files are byte-identical when the CSV file is read through a memory map """
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName ])
+        for jobs in [ 1, 2 ]:
+            mappedNames = self._writeConfig("Mapped{}".format(jobs))
+            CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--mmap", "--jobs", str(jobs) ])
+            for serialName, mappedName in zip(self.__mSerialNames, mappedNames):
+                self.assertEqual(self._readFile(mappedName), self._readFile(serialName), "jobs = {}".format(jobs))
+        return
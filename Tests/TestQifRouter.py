@@ -0,0 +1,102 @@
+#************
+# Imports
+#************
+import re
+import unittest
+
+import TestContext
+from TestContext import QifRouter
+
+class TestQifRouter(unittest.TestCase):
+    """ Unit test class to test the precompiled qifFiles routing engine """
+
+    # Rules interleave two columns and mix mergeable and unmergeable patterns to exercise segment ordering
+    __mOutputFiles = [
+        { "name": "0.qif", "matchColumn": "Category", "matchRegEx": "Roth" },
+        { "name": "1.qif", "matchColumn": "Category", "matchRegEx": "Ro" },
+        { "name": "2.qif", "matchColumn": "Fund", "matchRegEx": "(?i)index" },
+        { "name": "3.qif", "matchColumn": "Category", "matchRegEx": "(a)\\1" },
+        { "name": "4.qif", "matchColumn": "Category", "matchRegEx": "Safe (Harbor|Match)" },
+        { "name": "5.qif", "matchColumn": "Fund", "matchRegEx": "" }
+        ]
+
+    __mRows = [
+        { "Category": "Roth 401k",          "Fund": "Bond" },
+        { "Category": "Rollover",           "Fund": "Bond" },
+        { "Category": "Safe Harbor Match",  "Fund": "INDEX 500" },
+        { "Category": "aardvark",           "Fund": "Bond" },
+        { "Category": "Safe Match",         "Fund": "Bond" },
+        { "Category": "Pre-Tax",            "Fund": "Bond" },
+        { "Category": "Roth",               "Fund": "Index" }
+        ]
+
+    def _referenceRoute(self, OutputFiles: list, Row: dict):
+        """ Routes a row the way the original loop did, one uncompiled re.match per rule """
+        for fileIndex, fileDesc in enumerate(OutputFiles):
+            if (re.match(fileDesc["matchRegEx"], Row[fileDesc["matchColumn"]]) is not None):
+                return(fileIndex)
+        return(None)
+
+    def test_FirstMatchWins(self) -> None:
+        """ Verifies routing decisions match the rule by rule reference for every test row, including memoized repeats """
+        router = QifRouter.QifRouter(self.__mOutputFiles)
+        for attempt in range(2):
+            for row in self.__mRows:
+                msg = "Row = {}, attempt {}".format(row, attempt)
+                self.assertEqual(router.route(row), self._referenceRoute(self.__mOutputFiles, row), msg)
+        return
+
+    def test_NoMatch(self) -> None:
+        """ Verifies None is returned when no rule matches """
+        outputFiles = self.__mOutputFiles[:2]
+        router = QifRouter.QifRouter(outputFiles)
+        self.assertIsNone(router.route({ "Category": "Pre-Tax" }))
+        return
+
+    def test_DuplicateNamedGroups(self) -> None:
+        """ Verifies rules that cannot share an alternation still route in order """
+        outputFiles = [
+            { "name": "0.qif", "matchColumn": "Category", "matchRegEx": "(?P<kind>Roth)" },
+            { "name": "1.qif", "matchColumn": "Category", "matchRegEx": "(?P<kind>Safe)" }
+            ]
+        router = QifRouter.QifRouter(outputFiles)
+        self.assertEqual(router.route({ "Category": "Roth" }), 0)
+        self.assertEqual(router.route({ "Category": "Safe" }), 1)
+        return
+
+    def test_BadRegEx(self) -> None:
+        """ Verifies an invalid matchRegEx is reported when the router is built """
+        with self.assertRaises(Exception):
+            QifRouter.QifRouter([ { "name": "0.qif", "matchColumn": "Category", "matchRegEx": "(Roth" } ])
+        return
+
+    def test_Columns(self) -> None:
+        """ Verifies the distinct routing columns are reported in first use order """
+        router = QifRouter.QifRouter(self.__mOutputFiles)
+        self.assertEqual(router.columns, [ "Category", "Fund" ])
+        return
+
+    def test_Bind(self) -> None:
+        """ Verifies a router bound to column positions routes list rows like the original routes dictionaries """
+        router = QifRouter.QifRouter(self.__mOutputFiles)
+        bound = router.bind({ "Category": 1, "Fund": 0 })
+        for row in self.__mRows:
+            self.assertEqual(bound.route([ row["Fund"], row["Category"] ]), router.route(row), "Row = {}".format(row))
+        return
+
+    def test_RuleAttempts(self) -> None:
+        """ Verifies each rule counts the uncached values tried against it, for merged and unmerged segments """
+        outputFiles = [
+            { "name": "0.qif", "matchColumn": "Category", "matchRegEx": "Roth" },
+            { "name": "1.qif", "matchColumn": "Category", "matchRegEx": "Safe" },
+            { "name": "2.qif", "matchColumn": "Fund", "matchRegEx": "(?i)bond" },
+            { "name": "3.qif", "matchColumn": "Fund", "matchRegEx": "(?i)stock" }
+        ]
+        router = QifRouter.QifRouter(outputFiles)
+        for category, fund in [ ("Roth", "Bond"), ("Roth", "Bond"), ("Safe", "Bond"), ("Other", "Bond"), ("Other2", "Stock") ]:
+            router.route({ "Category": category, "Fund": fund })
+
+        # Three distinct categories reach the Safe rule, and "Bond" is only evaluated once before it is cached
+        self.assertEqual(router.ruleAttempts(), [ 4, 3, 2, 1 ])
+        self.assertEqual(router.bind({ "Category": 0, "Fund": 1 }).ruleAttempts(), [ 0, 0, 0, 0 ])
+        return
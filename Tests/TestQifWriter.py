@@ -0,0 +1,255 @@
+#************
+# Imports
+#************
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import QifWriter
+
+class TestQifWriter(unittest.TestCase):
+    """ Tests the buffered, atomic QIF output writer """
+
+    def setUp(self) -> None:
+        """ Creates a temporary directory for the output files """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mQifFileName = os.path.join(self.__mTempDir.name, "Roth.qif")
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _readQif(self) -> str:
+        """ Returns the contents of the QIF file """
+        with open(self.__mQifFileName, "rt") as qifFile:
+            return(qifFile.read())
+
+    def test_Buffering(self):
+        """ Verifies text is held until the buffer fills, and the file only appears under its name on close """
+        writer = QifWriter.QifWriter(self.__mQifFileName, BufferSize = 10)
+        writer.write("^\n")
+        self.assertEqual(os.path.getsize(writer.file.name), 0)
+        writer.write("D1/1/2021\n^\n")
+        self.assertEqual(os.path.getsize(writer.file.name), 14)
+        self.assertFalse(os.path.exists(self.__mQifFileName))
+        writer.close()
+        self.assertEqual(self._readQif(), "^\nD1/1/2021\n^\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [ "Roth.qif" ])
+
+    def test_AbortKeepsPreviousFile(self):
+        """ Verifies an aborted conversion leaves the earlier file untouched and no temporary file behind """
+        with open(self.__mQifFileName, "wt") as qifFile:
+            qifFile.write("old\n")
+        writer = QifWriter.QifWriter(self.__mQifFileName, BufferSize = 1)
+        writer.write("new\n")
+        writer.abort()
+        self.assertEqual(self._readQif(), "old\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [ "Roth.qif" ])
+
+    def test_WriteFileAtomically(self):
+        """ Verifies a small file is replaced whole, keeping its permissions, and is left as it was on failure """
+        QifWriter.writeFileAtomically(self.__mQifFileName, "First\n")
+        os.chmod(self.__mQifFileName, 0o600)
+        QifWriter.writeFileAtomically(self.__mQifFileName, "Second\n", Fsync = True)
+        self.assertEqual(self._readQif(), "Second\n")
+        self.assertEqual(os.stat(self.__mQifFileName).st_mode & 0o777, 0o600)
+        with self.assertRaises(TypeError):
+            QifWriter.writeFileAtomically(self.__mQifFileName, None)
+        self.assertEqual(self._readQif(), "Second\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [ "Roth.qif" ])
+
+    def test_Append(self):
+        """ Verifies appending writes only the new records to the temporary file, adds them after the earlier ones with
+        fsync on close, and cuts off the text of an append a crash interrupted """
+        with open(self.__mQifFileName, "wt") as qifFile:
+            qifFile.write("old\n")
+        writer = QifWriter.QifWriter(self.__mQifFileName, Append = True, Fsync = True, BufferSize = 1)
+        writer.write("new\n")
+        self.assertEqual(os.path.getsize(writer.file.name), 4)
+        writer.close()
+        self.assertEqual(self._readQif(), "old\nnew\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [ "Roth.qif" ])
+
+        # A crash part way through appending "lost\n" left its journal behind
+        with open(self.__mQifFileName, "at") as qifFile:
+            qifFile.write("lo")
+        with open(QifWriter.APPEND_JOURNAL_FORMAT.format(self.__mQifFileName), "wt") as journalFile:
+            journalFile.write("8 13\n")
+        writer = QifWriter.QifWriter(self.__mQifFileName, Append = True)
+        writer.write("more\n")
+        writer.abort()
+        self.assertEqual(self._readQif(), "old\nnew\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [ "Roth.qif" ])
+
+    def test_Stdout(self):
+        """ Verifies stdout is written directly and left open """
+        writer = QifWriter.QifWriter(QifWriter.STREAM_FILE_NAME)
+        writer.write("^\n")
+        writer.close()
+        self.assertEqual(sys.stdout.getvalue(), "^\n")
+        self.assertFalse(sys.stdout.closed)
+
+    def test_DeviceNotReplaced(self):
+        """ Verifies an output that is not a regular file (a device or named pipe) is written in place, not renamed over """
+        writer = QifWriter.QifWriter(os.devnull)
+        self.assertEqual(writer.file.name, os.devnull)
+        writer.write("^\n")
+        writer.close()
+        self.assertFalse(os.path.isfile(os.devnull))
+
+    def test_FailedConversionKeepsOutput(self):
+        """ Verifies a conversion failing part way leaves the previous QIF output in place """
+        csvFileName = os.path.join(self.__mTempDir.name, "Export.csv")
+        cfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(csvFileName, "wt") as csvFile:
+            csvFile.write("Date,Action,Fund,Price,Quantity,Amount,Memo,Category\n")
+            csvFile.write("1/1/2021,Buy,Bond,1,1,1,Memo,Roth\n")
+            csvFile.write("1/2/2021,Buy,Bond,1,1,1,Memo,Unknown\n")
+        config = {
+            "csvFile": {
+                "headerRowMap": { "dateColumn": "Date", "actionColumn": "Action", "securityColumn": "Fund", "priceColumn": "Price",
+                                  "quantityColumn": "Quantity", "valueColumn": "Amount", "memoColumn": "Memo" },
+                "actionCodeMap": { "Buy": "Buy" }
+            },
+            "qifFiles": [ { "name": self.__mQifFileName, "matchColumn": "Category", "matchRegEx": "Roth" } ]
+        }
+        with open(cfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        with open(self.__mQifFileName, "wt") as qifFile:
+            qifFile.write("old\n")
+
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ csvFileName, cfgFileName, "--buffer-size", "1" ])
+        self.assertEqual(self._readQif(), "old\n")
+        self.assertEqual(sorted(os.listdir(self.__mTempDir.name)), [ "Config.json", "Export.csv", "Roth.qif" ])
+
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ csvFileName, cfgFileName, "--buffer-size", "0" ])
+
+    def test_GzipSink(self):
+        """ Verifies a gzip destination decompresses to the plain text, written atomically and appended as a new member """
+        qifFileName = self.__mQifFileName + ".gz"
+        writer = QifWriter.QifWriter(qifFileName, BufferSize = 10, Spec = QifWriter.SinkSpec(QifWriter.SINK_GZIP))
+        writer.write("D1/1/2021\n^\n")
+        writer.write("D1/2/2021\n^\n")
+        self.assertFalse(os.path.exists(qifFileName))
+        writer.close()
+        writer = QifWriter.QifWriter(qifFileName, Append = True, Fsync = True, Spec = QifWriter.SinkSpec(QifWriter.SINK_GZIP))
+        writer.write("D1/3/2021\n^\n")
+        writer.close()
+        with gzip.open(qifFileName, "rt") as qifFile:
+            self.assertEqual(qifFile.read(), "D1/1/2021\n^\nD1/2/2021\n^\nD1/3/2021\n^\n")
+
+        writer = QifWriter.QifWriter(qifFileName, Spec = QifWriter.SinkSpec(QifWriter.SINK_GZIP))
+        writer.write("D1/4/2021\n^\n")
+        writer.abort()
+        with gzip.open(qifFileName, "rt") as qifFile:
+            self.assertEqual(qifFile.read(), "D1/1/2021\n^\nD1/2/2021\n^\nD1/3/2021\n^\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [ "Roth.qif.gz" ])
+
+    def test_MemorySink(self):
+        """ Verifies a memory destination keeps its text and writes no file """
+        writer = QifWriter.QifWriter(self.__mQifFileName, BufferSize = 1, Spec = QifWriter.SinkSpec(QifWriter.SINK_MEMORY))
+        writer.write("D1/1/2021\n^\n")
+        writer.write("D1/2/2021\n^\n")
+        writer.close()
+        self.assertEqual(writer.sink.getvalue(), "D1/1/2021\n^\nD1/2/2021\n^\n")
+        self.assertEqual(os.listdir(self.__mTempDir.name), [])
+
+    def test_SplitSink(self):
+        """ Verifies a split destination is cut between records by record count and by size, and only appears on close """
+        records = [ "D1/{}/2021\nMNote {}\n^\n".format(day, "\u00e9" * day) for day in range(1, 11) ]
+
+        writer = QifWriter.QifWriter(self.__mQifFileName, BufferSize = 50, Spec = QifWriter.SinkSpec(SplitRecords = 3))
+        for record in records:
+            writer.write(record)
+        self.assertEqual(os.listdir(self.__mTempDir.name).count("Roth-001.qif"), 0)
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.__mTempDir.name)), [ "Roth-001.qif", "Roth-002.qif", "Roth-003.qif", "Roth-004.qif" ])
+        for part in range(4):
+            with open(QifWriter.splitPartName(self.__mQifFileName, part + 1), "rt") as qifFile:
+                self.assertEqual(qifFile.read(), "".join(records[part * 3:(part + 1) * 3]))
+
+        # Parts of at most 60 bytes, with a record of more than 60 bytes in a part of its own.  The earlier fourth part is removed.
+        writer = QifWriter.QifWriter(self.__mQifFileName, Spec = QifWriter.SinkSpec(SplitBytes = 60))
+        writer.write("".join(records))
+        writer.close()
+        parts = []
+        for name in sorted(os.listdir(self.__mTempDir.name)):
+            with open(os.path.join(self.__mTempDir.name, name), "rt", encoding = "utf-8") as qifFile:
+                parts.append(qifFile.read())
+        self.assertEqual("".join(parts), "".join(records))
+        for part in parts:
+            self.assertTrue(part.endswith("^\n"))
+            self.assertTrue((len(part.encode()) <= 60) or (part.count("^\n") == 1))
+        self.assertEqual(len(parts), 7)
+
+        # Appending starts a new part, and an abort leaves the existing parts alone
+        writer = QifWriter.QifWriter(self.__mQifFileName, Append = True, Spec = QifWriter.SinkSpec(SplitRecords = 3))
+        writer.write(records[0])
+        writer.close()
+        self.assertTrue(os.path.exists(QifWriter.splitPartName(self.__mQifFileName, 8)))
+        writer = QifWriter.QifWriter(self.__mQifFileName, BufferSize = 1, Spec = QifWriter.SinkSpec(SplitRecords = 1))
+        for record in records:
+            writer.write(record)
+        writer.abort()
+        self.assertEqual(len(os.listdir(self.__mTempDir.name)), 8)
+
+        # A shorter conversion removes the parts left over from the longer ones
+        writer = QifWriter.QifWriter(self.__mQifFileName, Spec = QifWriter.SinkSpec(SplitRecords = 5))
+        writer.write("".join(records))
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.__mTempDir.name)), [ "Roth-001.qif", "Roth-002.qif" ])
+
+        self.assertEqual(QifWriter.splitPartName("Out/Roth.qif.gz", 12), "Out/Roth-012.qif.gz")
+        with self.assertRaises(Exception):
+            QifWriter.QifWriter(QifWriter.STREAM_FILE_NAME, Spec = QifWriter.SinkSpec(SplitRecords = 3))
+
+    def test_ConfigSinks(self):
+        """ Verifies qifFiles entries choose their sinks, and a conversion writes split, compressed parts """
+        csvFileName = os.path.join(self.__mTempDir.name, "Export.csv")
+        cfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(csvFileName, "wt") as csvFile:
+            csvFile.write("Date,Action,Fund,Price,Quantity,Amount,Memo,Category\n")
+            for day in range(1, 6):
+                csvFile.write("1/{}/2021,Buy,Bond,1,1,1,Memo,Roth\n".format(day))
+        qifFile = { "name": self.__mQifFileName + ".gz", "matchColumn": "Category", "matchRegEx": "Roth", "sink": "gzip", "splitRecords": 2 }
+        config = {
+            "csvFile": {
+                "headerRowMap": { "dateColumn": "Date", "actionColumn": "Action", "securityColumn": "Fund", "priceColumn": "Price",
+                                  "quantityColumn": "Quantity", "valueColumn": "Amount", "memoColumn": "Memo" },
+                "actionCodeMap": { "Buy": "Buy" }
+            },
+            "qifFiles": [ qifFile ]
+        }
+        with open(cfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        CSVtoQIF.main([ csvFileName, cfgFileName ])
+        texts = []
+        for part in range(1, 4):
+            with gzip.open(QifWriter.splitPartName(qifFile["name"], part), "rt") as partFile:
+                texts.append(partFile.read())
+        self.assertEqual([ text.count("^\n") for text in texts ], [ 2, 2, 1 ])
+        self.assertTrue(texts[0].startswith("D1/1/2021\nNBuy\n"))
+
+        for badKeys in ({ "sink": "bzip2" }, { "splitRecords": 0 }, { "splitMegabytes": "1" }, { "splitRecords": True },
+                        { "sink": "memory", "splitRecords": 10 }):
+            with self.subTest(keys = badKeys):
+                config["qifFiles"] = [ dict({ key: qifFile[key] for key in ("name", "matchColumn", "matchRegEx") }, **badKeys) ]
+                with self.assertRaises(Exception):
+                    TestContext.CompiledConfig.CompiledConfig(config)
+
+if __name__ == "__main__":
+    unittest.main()
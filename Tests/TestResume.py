@@ -0,0 +1,176 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import Checkpoint
+from TestContext import ConversionErrors
+from TestContext import QifWriter
+
+class TestResume(unittest.TestCase):
+    """ Tests checkpointed conversions resume where a failed run stopped, and bad rows can be set aside """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    def setUp(self) -> None:
+        """ Writes a CSV file and a config routing two accounts to their own QIF files """
+        sys.stdout = io.StringIO()
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        tempDir = self.__mTempDir.name
+        self.__mCsvFileName = os.path.join(tempDir, "Statement.csv")
+        self.__mCfgFileName = os.path.join(tempDir, "Config.json")
+        self.__mQifNames = [ os.path.join(tempDir, "Roth.qif"), os.path.join(tempDir, "Other.qif") ]
+        self.__mRejectedName = os.path.join(tempDir, "Rejected.csv")
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump({
+                "csvFile": {
+                    "headerRowMap": {
+                        "dateColumn": "Date",
+                        "actionColumn": "Action",
+                        "securityColumn": "Fund",
+                        "priceColumn": "Price",
+                        "quantityColumn": "Quantity",
+                        "valueColumn": "Amount",
+                        "memoColumn": "Memo"
+                    },
+                    "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" },
+                    "dateFormat": "auto"
+                },
+                "qifFiles": [ { "name": self.__mQifNames[0], "matchColumn": "Account", "matchRegEx": "Roth" },
+                              { "name": self.__mQifNames[1], "matchColumn": "Account", "matchRegEx": ".*" } ]
+            }, cfgFile)
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeCsv(self, Count: int, BadRows: dict = None) -> None:
+        """ Writes Count rows, some with quoted memos spanning lines, replacing the rows in BadRows by their values """
+        if (BadRows is None):
+            BadRows = {}
+        rows = [ [ "2021-01-{:02d}".format((row % 28) + 1), "Buy" if (row % 3) else "Sell", "Fund {}".format(row % 5), "$10.00", "1.5",
+                   "({}.00)".format(row), "Memo\n{}".format(row) if (row % 7 == 0) else "Memo {}".format(row), ("Roth", "Brokerage")[row % 2] ]
+                 for row in range(Count) ]
+        for row, badRow in BadRows.items():
+            rows[row] = badRow
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            csv.writer(csvFile).writerows([ self._HEADER ] + rows)
+        return
+
+    def _run(self, *Options: str) -> list:
+        """ Runs the command line and returns the text of the QIF files """
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName ] + list(Options))
+        texts = []
+        for qifName in self.__mQifNames:
+            with open(qifName, "rt") as qifFile:
+                texts.append(qifFile.read())
+        return(texts)
+
+    def _leftovers(self) -> list:
+        """ Returns the checkpoint and temporary files left in the directory """
+        return(sorted(name for name in os.listdir(self.__mTempDir.name) if (name.endswith(QifWriter.TEMP_FILE_SUFFIX) or name.endswith(".checkpoint"))))
+
+    def test_Resume(self) -> None:
+        """ Verifies a failed run keeps its output to the last checkpoint, and the resumed run completes the files a
+        single run writes, with a bad row set aside """
+        badRow = [ "2021-01-05", "Transfer", "Fund", "$1.00", "1", "1.00", "Memo", "Roth" ]
+        self._writeCsv(1000)
+        with open(self.__mCsvFileName, "rt") as csvFile:
+            lines = csvFile.readlines()
+        expected = self._run()
+        os.remove(self.__mQifNames[0])
+
+        self._writeCsv(1000, { 750: badRow })
+        with self.assertRaisesRegex(ConversionErrors.UnknownActionError, "Transfer"):
+            self._run("--resume", "--checkpoint-rows", "100", "--buffer-size", "1")
+        self.assertFalse(os.path.exists(self.__mQifNames[0]))
+        self.assertEqual(self._leftovers(), [ "Other.qif.resume.tmp", "Roth.qif.resume.tmp", "Statement.csv.checkpoint" ])
+        with open(Checkpoint.checkpointFileName(self.__mCsvFileName), "rt") as checkpointFile:
+            self.assertEqual(json.load(checkpointFile)["recordsProcessed"], 700)
+
+        # The resumed run converts from row 700, setting the bad row aside, and matches a run over the good rows
+        texts = self._run("--resume", "--checkpoint-rows", "100", "--skip-bad-rows", self.__mRejectedName)
+        self.assertIn("Resuming from checkpoint", sys.stdout.getvalue())
+        self.assertIn("999 CSV records processed", sys.stdout.getvalue())
+        self.assertIn("1 bad CSV rows written", sys.stdout.getvalue())
+        self.assertEqual(self._leftovers(), [])
+        with open(self.__mRejectedName, "rt", newline = "") as rejectedFile:
+            rejectedRows = list(csv.reader(rejectedFile))
+        self.assertEqual(rejectedRows[0], self._HEADER + [ Checkpoint.REJECTED_ERROR_COLUMN ])
+        self.assertEqual(rejectedRows[1][:-1], badRow)
+        self.assertIn("actionCodeMap", rejectedRows[1][-1])
+
+        good = "".join(line for line in lines if ("(750.00)" not in line))
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            csvFile.write(good)
+        self.assertEqual(texts, self._run())
+        self.assertNotEqual(texts, expected)
+        return
+
+    def test_StartOver(self) -> None:
+        """ Verifies a checkpoint is ignored once the CSV file or an output file no longer matches it """
+        self._writeCsv(500, { 450: [ "2021-01-05", "Buy", "Fund", "bad", "1", "1.00", "Memo", "Roth" ] })
+        for _ in range(2):
+            with self.assertRaises(ConversionErrors.MoneyFormatError):
+                self._run("--resume", "--checkpoint-rows", "100")
+        checkpoint = Checkpoint.Checkpoint(Checkpoint.checkpointFileName(self.__mCsvFileName), self.__mCsvFileName, self.__mCfgFileName, self.__mQifNames)
+        self.assertEqual((checkpoint.recordsProcessed, checkpoint.csvOffset is not None), (400, True))
+
+        # The second run resumed, and an output file cut short, as by a power failure, makes the next run start over
+        self.assertIn("after 400 CSV rows", sys.stdout.getvalue())
+        with open(QifWriter.resumeFileName(self.__mQifNames[1]), "r+b") as qifFile:
+            qifFile.truncate(checkpoint.outputOffsets[1] - 1)
+        checkpoint = Checkpoint.Checkpoint(Checkpoint.checkpointFileName(self.__mCsvFileName), self.__mCsvFileName, self.__mCfgFileName, self.__mQifNames)
+        self.assertFalse(checkpoint.resumed)
+
+        self._writeCsv(500)
+        sys.stdout = io.StringIO()
+        texts = self._run("--resume", "--checkpoint-rows", "100")
+        self.assertNotIn("Resuming", sys.stdout.getvalue())
+        self.assertEqual(texts, self._run())
+        self.assertEqual(self._leftovers(), [])
+        return
+
+    def test_SkipBadRows(self) -> None:
+        """ Verifies every kind of bad row is set aside, from stdin as well, and fails nothing else """
+        badRows = { 3: [ "2021-01-05", "Buy" ], 10: [ "2021-01-05", "Sell", "Fund", "$x", "1", "1.00", "Memo", "Roth" ],
+                    11: [ "2021-02-30", "Sell", "Fund", "$1", "1", "1.00", "Memo", "Roth" ],
+                    12: [ "2021-01-05", "Swap", "Fund", "$1", "1", "1.00", "Memo", "Roth" ] }
+        self._writeCsv(20, badRows)
+        texts = self._run("--skip-bad-rows", self.__mRejectedName)
+        self.assertEqual(sum(text.count("^\n") for text in texts), 16)
+        with open(self.__mRejectedName, "rt", newline = "") as rejectedFile:
+            rejectedRows = list(csv.reader(rejectedFile))
+        self.assertEqual([ row[:-1] for row in rejectedRows[1:] ], [ badRows[row] for row in sorted(badRows) ])
+
+        with open(self.__mCsvFileName, "rt") as csvFile:
+            sys.stdin = csvFile
+            try:
+                CSVtoQIF.main([ "-", self.__mCfgFileName, "--skip-bad-rows", self.__mRejectedName ])
+            finally:
+                sys.stdin = sys.__stdin__
+        self.assertIn("16 CSV records processed", sys.stdout.getvalue())
+
+        for options in ([ "--engine", "columnar" ], [ "--jobs", "2" ], [ "--mmap" ], [ "--batch" ]):
+            with self.subTest(options = options):
+                with self.assertRaisesRegex(Exception, "--resume and --skip-bad-rows"):
+                    self._run("--resume", *options)
+        with self.assertRaisesRegex(Exception, "not a stream"):
+            CSVtoQIF.main([ "-", self.__mCfgFileName, "--resume" ])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+#************
+# Imports
+#************
+import csv
+import http.client
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import ConversionServer
+
+class _UnixConnection(http.client.HTTPConnection):
+    """ HTTP connection over a Unix socket """
+
+    def __init__(self, SocketPath: str) -> None:
+        super().__init__("localhost")
+        self.__mSocketPath = SocketPath
+        return
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.__mSocketPath)
+        return
+
+
+class TestServer(unittest.TestCase):
+    """ Tests the conversion server against the command line conversion """
+
+    _ROWS = 500
+
+    def setUp(self) -> None:
+        """ Writes a statement and a config in the config directory """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCsvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        self.__mQifNames = [ os.path.join(self.__mTempDir.name, "Roth.qif"), os.path.join(self.__mTempDir.name, "SafeHarbor.qif") ]
+        with open(self.__mCsvFileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow([ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Category" ])
+            for row in range(self._ROWS):
+                memo = "Line one\nLine \"two\"" if ((row % 11) == 0) else "Contribution {}".format(row)
+                writer.writerow([ "1/{}/2021".format((row % 28) + 1), "Buy" if (row % 2) else "Sell", "Fund {}".format(row % 9),
+                                  "${:.2f}".format(row / 3), "{:.3f}".format(row / 7), "(${:,.2f})".format(row * 100.5), memo,
+                                  "Roth" if (row % 3) else "Safe Harbor Match" ])
+        self._writeConfig("Roth")
+        self.__mServer = None
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Stops any server, restores stdout and removes the temporary files """
+        if (self.__mServer is not None):
+            self.__mServer.shutdown()
+            self.__mThread.join()
+            self.__mServer.close()
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeConfig(self, RothRegEx: str) -> None:
+        """ Writes Config.json, routing the rows matching RothRegEx to Roth.qif """
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [
+                { "name": self.__mQifNames[0], "matchColumn": "Category", "matchRegEx": RothRegEx },
+                { "name": self.__mQifNames[1], "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+            ]
+        }
+        with open(os.path.join(self.__mTempDir.name, "Config.json"), "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        return
+
+    def _startServer(self, Address: str = "0") -> ConversionServer.ConversionServer:
+        """ Starts a server with one worker on a background thread """
+        self.__mServer = ConversionServer.ConversionServer(Address, self.__mTempDir.name, DataDir = self.__mTempDir.name)
+        self.__mThread = threading.Thread(target = self.__mServer.serveForever)
+        self.__mThread.start()
+        return(self.__mServer)
+
+    def _request(self, Method: str, Path: str, Body: object = None) -> tuple:
+        """ Sends a request to the TCP server and returns the status and decoded response """
+        host, port = self.__mServer.address.split(":")
+        connection = http.client.HTTPConnection(host, int(port))
+        return(self._send(connection, Method, Path, Body))
+
+    def _send(self, Connection: http.client.HTTPConnection, Method: str, Path: str, Body: object) -> tuple:
+        """ Sends a request on a connection and returns the status and decoded response """
+        Connection.request(Method, Path, None if (Body is None) else json.dumps(Body))
+        response = Connection.getresponse()
+        result = (response.status, json.loads(response.read()))
+        Connection.close()
+        return(result)
+
+    def _readOutputs(self) -> list:
+        """ Reads the QIF files and removes them """
+        outputs = []
+        for qifName in self.__mQifNames:
+            with open(qifName, "rt") as qifFile:
+                outputs.append(qifFile.read())
+            os.remove(qifName)
+        return(outputs)
+
+    def test_CsvFileJob(self) -> None:
+        """ Verifies a csvFile job writes the same QIF files as the command line """
+        CSVtoQIF.main([ self.__mCsvFileName, os.path.join(self.__mTempDir.name, "Config.json") ])
+        expected = self._readOutputs()
+
+        self._startServer()
+        for _ in range(2):
+            status, response = self._request("POST", "/convert", { "config": "Config", "csvFile": self.__mCsvFileName })
+            self.assertEqual((status, response), (200, { "records": self._ROWS }))
+            self.assertEqual(self._readOutputs(), expected)
+
+        status, response = self._request("GET", "/status")
+        self.assertEqual(status, 200)
+        self.assertEqual((response["completedJobs"], response["recordsProcessed"]), (2, 2 * self._ROWS))
+        return
+
+    def test_CsvTextJob(self) -> None:
+        """ Verifies a csvText job converts the CSV sent in the request, with CRLF line ends """
+        CSVtoQIF.main([ self.__mCsvFileName, os.path.join(self.__mTempDir.name, "Config.json") ])
+        expected = self._readOutputs()
+        with open(self.__mCsvFileName, "rt", newline = "") as csvFile:
+            csvText = csvFile.read()
+
+        self._startServer()
+        status, response = self._request("POST", "/convert", { "config": "Config", "csvText": csvText })
+        self.assertEqual((status, response), (200, { "records": self._ROWS }))
+        self.assertEqual(self._readOutputs(), expected)
+        return
+
+    def test_ConfigChange(self) -> None:
+        """ Verifies the warm config is compiled again once its file changes """
+        self._startServer()
+        self._request("POST", "/convert", { "config": "Config", "csvFile": self.__mCsvFileName })
+        self.assertGreater(self._readOutputs()[0].count("^\n"), 0)
+
+        # Route every row to Roth.qif.  The size of the file changes, so the change is seen whatever the clock resolution.
+        self._writeConfig("Roth|Safe Harbor")
+        self._request("POST", "/convert", { "config": "Config", "csvFile": self.__mCsvFileName })
+        self.assertEqual(self._readOutputs()[0].count("^\n"), self._ROWS)
+        return
+
+    def test_BadJobs(self) -> None:
+        """ Verifies bad jobs are refused without affecting the server """
+        self._startServer()
+        badJobs = [ [ "Config" ],
+                    { "csvFile": self.__mCsvFileName },
+                    { "config": "../Config", "csvFile": self.__mCsvFileName },
+                    { "config": "Config" },
+                    { "config": "Config", "csvFile": self.__mCsvFileName, "csvText": "" },
+                    { "config": "Config", "csvText": "", "outputTemplate": "{qifName}" },
+                    { "config": "Config", "csvFile": "-" },
+                    { "config": 1, "csvFile": self.__mCsvFileName } ]
+        for job in badJobs:
+            self.assertEqual(self._request("POST", "/convert", job)[0], 400, job)
+        self.assertEqual(self._request("POST", "/convert", { "config": "Missing", "csvFile": self.__mCsvFileName })[0], 422)
+        self.assertEqual(self._request("POST", "/convert", { "config": "Config", "csvFile": "Missing.csv" })[0], 422)
+        self.assertEqual(self._request("GET", "/jobs")[0], 404)
+
+        # Files outside the data directory can be neither read nor written
+        for csvFile in ("/etc/passwd", "../Statement.csv", os.path.join(self.__mTempDir.name, "..", "Statement.csv")):
+            self.assertEqual(self._request("POST", "/convert", { "config": "Config", "csvFile": csvFile })[0], 400, csvFile)
+        os.symlink("/etc", os.path.join(self.__mTempDir.name, "Etc"))
+        self.assertEqual(self._request("POST", "/convert", { "config": "Config", "csvFile": "Etc/passwd" })[0], 400)
+        for template in ("/tmp/{qifName}", "{csvDir}/../{qifName}", "Etc/{qifName}"):
+            status, response = self._request("POST", "/convert", { "config": "Config", "csvFile": "Statement.csv", "outputTemplate": template })
+            self.assertEqual(status, 422, template)
+            self.assertIn("outside the server's data directory", response["error"])
+
+        # A Content-Length that is not a number of bytes is refused rather than dropping the connection or blocking
+        for length in ("abc", "-1", "1_0"):
+            connection = http.client.HTTPConnection(*self.__mServer.address.split(":"))
+            connection.putrequest("POST", "/convert")
+            connection.putheader("Content-Length", length)
+            connection.endheaders()
+            response = connection.getresponse()
+            self.assertEqual((response.status, "Content-Length" in json.loads(response.read())["error"]), (400, True), length)
+            connection.close()
+
+        status, response = self._request("POST", "/convert", { "config": "Config", "csvFile": self.__mCsvFileName })
+        self.assertEqual((status, response), (200, { "records": self._ROWS }))
+        self.assertEqual(self._request("GET", "/status")[1]["failedJobs"], 5)
+        return
+
+    def test_UnixSocket(self) -> None:
+        """ Verifies the server takes jobs on a Unix socket, replacing a stale socket and removing its own """
+        socketPath = os.path.join(self.__mTempDir.name, "Server.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socketPath)
+        stale.close()
+
+        server = self._startServer(socketPath)
+        status, response = self._send(_UnixConnection(socketPath), "POST", "/convert",
+                                      { "config": "Config", "csvFile": self.__mCsvFileName, "outputTemplate": "{csvDir}/{csvStem}-{qifName}" })
+        self.assertEqual((status, response), (200, { "records": self._ROWS }))
+        self.assertTrue(os.path.isfile(os.path.join(self.__mTempDir.name, "Statement-Roth.qif")))
+        with self.assertRaises(Exception):
+            ConversionServer.ConversionServer(socketPath, self.__mTempDir.name)
+
+        server.shutdown()
+        self.__mThread.join()
+        server.close()
+        self.__mServer = None
+        self.assertFalse(os.path.exists(socketPath))
+        return
+
+    def test_CommandLine(self) -> None:
+        """ Verifies the files are required without --serve, and refused with it """
+        sys.stderr = io.StringIO()
+        try:
+            with self.assertRaises(SystemExit):
+                CSVtoQIF.main([])
+        finally:
+            sys.stderr = sys.__stderr__
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ "--serve", "0", self.__mCsvFileName, "Config.json" ])
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ "--serve", "0", "--batch" ])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
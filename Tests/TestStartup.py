@@ -0,0 +1,127 @@
+#************
+# Imports
+#************
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+
+class TestStartup(unittest.TestCase):
+    """ Tests the start up cost of CSVtoQIF against Tests/StartupBaseline.json.
+
+    The baseline is recorded by Bench/BenchStartup.py --write-baseline.  It lists the CSVtoQIF modules each kind of
+    run imports, the standard library modules known to be slow to import that no run may import, and the most modules
+    each run may import beyond a bare Python.  None of these depend on the Python version or the machine's load, so
+    new imports fail the tests under any Python, and have to be made lazily or added to the baseline on purpose.  The
+    wall time of each run is only checked loosely against a bare Python, to catch a start up that becomes many times
+    slower without failing on a loaded machine.
+    """
+
+    _BASELINE_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "StartupBaseline.json")
+    _MAX_SLOWDOWN = 15
+    _TIMED_RUNS = 3
+
+    def setUp(self) -> None:
+        """ Writes a small statement and its config file """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCsvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(self.__mCsvFileName, "wt") as csvFile:
+            csvFile.write("Date,Action,Fund,Price,Quantity,Amount,Memo\n")
+            for row in range(20):
+                csvFile.write("1/{}/2021,Buy,Fund {},$10.00,1.5,$15.00,Contribution\n".format(row + 1, row % 3))
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy" }
+            },
+            "qifFiles": [
+                { "name": os.path.join(self.__mTempDir.name, "Roth.qif"), "matchColumn": "Fund", "matchRegEx": ".*" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        with open(self._BASELINE_FILE_NAME, "rt") as baselineFile:
+            self.__mBaseline = json.load(baselineFile)
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Removes the temporary files """
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _runs(self) -> dict:
+        """ Returns the command of each kind of run recorded in the baseline """
+        program = [ sys.executable, CSVtoQIF.__file__ ]
+        return({ "version": program + [ "-v" ], "help": program + [ "-h" ], "convert": program + [ self.__mCsvFileName, self.__mCfgFileName ] })
+
+    def _importedModules(self, Command: list) -> set:
+        """ Runs a Python command with -X importtime and returns the names of the modules it imported """
+        stderr = subprocess.run([ Command[0], "-X", "importtime" ] + Command[1:], cwd = self.__mTempDir.name, check = True,
+                                stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True).stderr
+        return({ line.split("|")[2].strip() for line in stderr.splitlines() if line.startswith("import time:") and ("|" in line) } - { "package" })
+
+    def _addedModules(self) -> dict:
+        """ Returns the modules each kind of run imports beyond a bare Python """
+        bareModules = self._importedModules([ sys.executable, "-c", "pass" ])
+        return({ name: self._importedModules(command) - bareModules for name, command in self._runs().items() })
+
+    def _bestTime(self, Command: list) -> float:
+        """ Returns the shortest wall time of a few runs of a command, which is the least affected by other load """
+        bestTime = None
+        for _ in range(self._TIMED_RUNS):
+            startTime = time.perf_counter()
+            subprocess.run(Command, cwd = self.__mTempDir.name, check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            runTime = time.perf_counter() - startTime
+            if ((bestTime is None) or (runTime < bestTime)):
+                bestTime = runTime
+        return(bestTime)
+
+    def test_ImportSet(self) -> None:
+        """ Verifies no run imports a CSVtoQIF module missing from the baseline, or a slow standard library module """
+        sourceModules = { os.path.splitext(name)[0] for name in os.listdir(os.path.dirname(CSVtoQIF.__file__)) if name.endswith(".py") }
+        heavyModules = set(self.__mBaseline["heavyModules"])
+        for name, modules in self._addedModules().items():
+            with self.subTest(run = name):
+                added = (modules & sourceModules) - set(self.__mBaseline["modules"][name])
+                self.assertFalse(added, "CSVtoQIF {} now imports {}".format(name, ", ".join(sorted(added))))
+                heavy = modules & heavyModules
+                self.assertFalse(heavy, "CSVtoQIF {} now imports {}".format(name, ", ".join(sorted(heavy))))
+        return
+
+    def test_ModuleCount(self) -> None:
+        """ Verifies each run imports no more modules than its budget, which stands in for its start up time """
+        for name, modules in self._addedModules().items():
+            with self.subTest(run = name):
+                self.assertLessEqual(len(modules), self.__mBaseline["maxAddedModules"][name],
+                                     "CSVtoQIF {} now imports {} modules: {}".format(name, len(modules), ", ".join(sorted(modules))))
+        return
+
+    def test_WallTime(self) -> None:
+        """ Verifies each run starts no more than _MAX_SLOWDOWN times slower than a bare Python """
+        bareTime = self._bestTime([ sys.executable, "-c", "pass" ])
+        for name, command in self._runs().items():
+            with self.subTest(run = name):
+                runTime = self._bestTime(command)
+                self.assertLessEqual(runTime, bareTime * self._MAX_SLOWDOWN,
+                                     "CSVtoQIF {} took {:.3f}s, and a bare Python {:.3f}s".format(name, runTime, bareTime))
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#************
+# Imports
+#************
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+
+class TestStats(unittest.TestCase):
+    """ Tests the --stats and --profile options """
+
+    __mRows = [
+        "1/1/2021,Buy,Bond,$10.00,1,$10.00,First,Roth",
+        "1/2/2021,Buy,Bond,$10.00,2,$20.00,Second,Roth",
+        "1/3/2021,Sell,Stock,$5.00,4,($20.00),Third,Safe Harbor",
+    ]
+
+    def setUp(self) -> None:
+        """ Writes a CSV file and a config file routing to two QIF files """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCsvFileName = os.path.join(self.__mTempDir.name, "Export.csv")
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        self.__mStatsFileName = os.path.join(self.__mTempDir.name, "Stats.out")
+        self.__mQifNames = [ os.path.join(self.__mTempDir.name, name) for name in [ "Roth.qif", "SafeHarbor.qif" ] ]
+        config = {
+            "csvFile": {
+                "headerRowMap": { "dateColumn": "Date", "actionColumn": "Action", "securityColumn": "Fund", "priceColumn": "Price",
+                                  "quantityColumn": "Quantity", "valueColumn": "Amount", "memoColumn": "Memo" },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [
+                { "name": self.__mQifNames[0], "matchColumn": "Category", "matchRegEx": "Roth" },
+                { "name": self.__mQifNames[1], "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        with open(self.__mCsvFileName, "wt") as csvFile:
+            csvFile.write("Date,Action,Fund,Price,Quantity,Amount,Memo,Category\n")
+            csvFile.write("\n".join(self.__mRows) + "\n")
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and stderr and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def test_JsonStats(self) -> None:
+        """ Verifies the JSON statistics count the records, bytes, destinations, actions and money lookups """
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--stats", self.__mStatsFileName ])
+        with open(self.__mStatsFileName, "rt") as statsFile:
+            stats = json.load(statsFile)
+
+        self.assertEqual(stats["records"], 3)
+        self.assertEqual(stats["bytesRead"], os.path.getsize(self.__mCsvFileName))
+        self.assertEqual(stats["bytesWritten"], sum(os.path.getsize(name) for name in self.__mQifNames))
+        self.assertEqual(list(stats["stageSeconds"]), [ "read", "format", "route", "write" ])
+        self.assertEqual([ destination["records"] for destination in stats["destinations"] ], [ 2, 1 ])
+        self.assertEqual(stats["actions"], { "Buy": 2, "Sell": 1 })
+        self.assertEqual(stats["moneyCache"]["lookups"], 9)
+        self.assertGreaterEqual(stats["moneyCache"]["hits"], 1)
+        return
+
+    def test_PrometheusStats(self) -> None:
+        """ Verifies the Prometheus textfile output has typed gauges with escaped labels """
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--stats", self.__mStatsFileName, "--stats-format", "prometheus" ])
+        with open(self.__mStatsFileName, "rt") as statsFile:
+            lines = statsFile.read().splitlines()
+
+        self.assertIn("# TYPE csvtoqif_records gauge", lines)
+        self.assertIn("csvtoqif_records 3", lines)
+        self.assertIn('csvtoqif_action_records{action="Sell"} 1', lines)
+        self.assertIn('csvtoqif_destination_records{{destination="{}"}} 2'.format(self.__mQifNames[0].replace("\\", "\\\\")), lines)
+        for line in lines:
+            if (not line.startswith("#")):
+                float(line.rsplit(" ", 1)[1])
+        return
+
+    def test_StatsOptions(self) -> None:
+        """ Verifies --stats is rejected for the batch and parallel conversions """
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--stats", self.__mStatsFileName, "--jobs", "2" ])
+        return
+
+    def test_Profile(self) -> None:
+        """ Verifies --profile writes the cProfile statistics and prints a summary to stderr """
+        profileFileName = os.path.join(self.__mTempDir.name, "Profile.out")
+        sys.stderr = io.StringIO()
+        CSVtoQIF.main([ self.__mCsvFileName, self.__mCfgFileName, "--profile", profileFileName ])
+        self.assertTrue(os.path.getsize(profileFileName) > 0)
+        self.assertIn("Peak traced memory", sys.stderr.getvalue())
+        self.assertTrue(os.path.isfile(self.__mQifNames[1]))
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#************
+# Imports
+#************
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+
+class _SyntheticCsvStream:
+    """ Stands in for stdin, generating CSV lines on demand so the whole input never exists in memory """
+
+    _HEADER = "Date,Action,Fund,Price,Quantity,Amount,Memo,Category\n"
+    _ROW_FORMAT = "{}/{}/2021,Buy,Fund {},${}.{:02d},{}.125,\"${:,}.50\",Contribution {},{}\n"
+
+    def __init__(self, Rows: int) -> None:
+        self.__mRows = Rows
+        return
+
+    def __iter__(self):
+        yield self._HEADER
+        for row in range(self.__mRows):
+            # Prices and funds come from small pools like a real statement, while every memo is unique
+            yield self._ROW_FORMAT.format((row % 12) + 1, (row % 28) + 1, row % 40, row % 100, row % 97, row % 50,
+                                          (row % 1000) * 1000, row, "Roth" if (row % 3) else "Safe Harbor Match")
+        return
+
+
+class _CountingSink(io.TextIOBase):
+    """ Stands in for stdout, counting QIF records without keeping them """
+
+    def __init__(self) -> None:
+        self.records = 0
+        return
+
+    def write(self, Text: str) -> int:
+        self.records = self.records + Text.count("^\n")
+        return(len(Text))
+
+
+class TestStreaming(unittest.TestCase):
+    """ Tests reading CSV data from stdin and streaming QIF data to stdout and named pipes """
+
+    # Rows in the synthetic stream.  Set the CSVTOQIF_STREAM_TEST_ROWS environment variable to 10000000 for the full size run.
+    _STREAM_ROWS = int(os.environ.get("CSVTOQIF_STREAM_TEST_ROWS", "50000"))
+
+    # Peak traced Python memory allowed during the conversion, independent of the row count
+    _MEMORY_CEILING_BYTES = 8 * 1024 * 1024
+
+    def setUp(self) -> None:
+        """ Writes a config file routing one destination to stdout and one to a second file name """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        self.__mSafeHarborFileName = os.path.join(self.__mTempDir.name, "SafeHarbor.qif")
+        self._writeConfig("-", os.devnull)
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores the standard streams and removes the temporary files """
+        sys.stdin = sys.__stdin__
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeConfig(self, RothName: str, SafeHarborName: str) -> None:
+        """ Writes the test config file with the given output names for the two destinations """
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [
+                { "name": RothName, "matchColumn": "Category", "matchRegEx": "Roth" },
+                { "name": SafeHarborName, "matchColumn": "Category", "matchRegEx": "Safe Harbor" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        return
+
+    def test_BoundedMemory(self) -> None:
+        """ Streams a synthetic CSV from stdin to stdout and checks peak memory stays under a fixed ceiling """
+        sink = _CountingSink()
+        sys.stdin = _SyntheticCsvStream(self._STREAM_ROWS)
+        sys.stdout = sink
+        sys.stderr = io.StringIO()
+
+        tracemalloc.start()
+        try:
+            CSVtoQIF.main([ "-", self.__mCfgFileName ])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        # Two out of three rows are routed to stdout.  Status messages must not be mixed into the QIF data.
+        self.assertEqual(sink.records, self._STREAM_ROWS - len(range(0, self._STREAM_ROWS, 3)))
+        self.assertIn("{} CSV records processed".format(self._STREAM_ROWS), sys.stderr.getvalue())
+        self.assertLess(peak, self._MEMORY_CEILING_BYTES)
+        return
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "Named pipes are not supported on this platform")
+    def test_NamedPipeOutput(self) -> None:
+        """ Streams QIF data into a named pipe read by another thread """
+        pipeName = os.path.join(self.__mTempDir.name, "Roth.fifo")
+        os.mkfifo(pipeName)
+        self._writeConfig(pipeName, self.__mSafeHarborFileName)
+
+        received = []
+        def readPipe():
+            with open(pipeName, "rt") as pipe:
+                received.append(pipe.read())
+            return
+        reader = threading.Thread(target = readPipe)
+        reader.start()
+
+        sys.stdin = _SyntheticCsvStream(300)
+        sys.stdout = io.StringIO()
+        CSVtoQIF.main([ "-", self.__mCfgFileName ])
+        reader.join()
+
+        self.assertEqual(received[0].count("^\n"), 200)
+        with open(self.__mSafeHarborFileName, "rt") as qifFile:
+            self.assertEqual(qifFile.read().count("^\n"), 100)
+        return
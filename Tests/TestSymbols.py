@@ -0,0 +1,99 @@
+#************
+# Imports
+#************
+import pickle
+import unittest
+
+import TestContext
+from TestContext import CompiledConfig
+from TestContext import QifConverter
+from TestContext import SymbolTable
+
+class TestSymbols(unittest.TestCase):
+    """ Tests the symbol tables rendering and interning repeated CSV values """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    def _copy(self, Text: str) -> str:
+        """ Returns an equal string that is a different object, as the csv module makes for every field """
+        return((Text + ".")[:-1])
+
+    def test_Table(self) -> None:
+        """ Verifies a table renders each text once, hands out one shared result, and keeps its size bound """
+        renders = []
+        table = SymbolTable.SymbolTable(lambda text: renders.append(text) or "Y{}\n".format(text), MaxSize = 3)
+        first = table.lookup(self._copy("Fund A"))
+        self.assertEqual(first, "YFund A\n")
+        self.assertIs(table.lookup(self._copy("Fund A")), first)
+        for text in ("Fund B", "Fund C", "Fund A", "Fund D"):
+            table.lookup(text)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(renders, [ "Fund A", "Fund B", "Fund C", "Fund D" ])
+        table.lookup("Fund B")
+        self.assertEqual(renders[-1], "Fund B")
+        self.assertEqual(table.misses, 5)
+
+        interned = SymbolTable.SymbolTable()
+        text = self._copy("Account 01")
+        self.assertIs(interned.lookup(text), text)
+        self.assertIs(interned.lookup(self._copy("Account 01")), text)
+        interned.clear()
+        self.assertEqual(len(interned), 0)
+        return
+
+    def test_Actions(self) -> None:
+        """ Verifies the action table renders N lines in any case, raises KeyError for unknown actions, and pickles empty """
+        symbols = SymbolTable.RecordSymbols({ "BUY": "Buy", "SELL": "ShrsOut" })
+        self.assertEqual(symbols.action.lookup("buy"), "NBuy\n")
+        self.assertEqual(symbols.action.lookup("Sell"), "NShrsOut\n")
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                symbols.action.lookup("Transfer")
+        self.assertEqual(len(symbols.action), 2)
+
+        copy = pickle.loads(pickle.dumps(symbols))
+        self.assertEqual(len(copy.action), 0)
+        self.assertEqual(copy.action.lookup("BUY"), "NBuy\n")
+        return
+
+    def test_InternColumns(self) -> None:
+        """ Verifies repeated fields are interned, and a column of mostly new values is dropped after a block """
+        symbols = SymbolTable.RecordSymbols({})
+        block = [ [ self._copy("Roth"), "Memo {}".format(row) ] for row in range(100) ] + [ [ "Short" ] ]
+        columns = symbols.internColumns(block, [ 0, 1 ])
+        self.assertEqual(columns, [ 0 ])
+        self.assertTrue(all(row[0] is block[0][0] for row in block[:100]))
+        self.assertEqual(block[-1], [ "Short" ])
+        return
+
+    def test_SharedAcrossFiles(self) -> None:
+        """ Verifies the tables belong to the configuration, so a second file renders nothing new """
+        config = CompiledConfig.CompiledConfig({
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [ { "name": "All.qif", "matchColumn": "Account", "matchRegEx": "." } ]
+        })
+        csvText = "\n".join([ ",".join(self._HEADER) ] + [ "1/5/2021,{},Fund,10,1,10,Memo,Roth".format(("Buy", "SELL")[row % 2]) for row in range(50) ])
+        converter = QifConverter.Converter(config)
+        records = [ record for name, record in converter.convertText(csvText) ]
+        self.assertEqual(records[1], "D1/5/2021\nNSell\nYFund\nI10.0\nT10.00\nQ1.0\nMMemo\n^\n")
+        self.assertEqual(config.symbols.action.misses, 2)
+        self.assertEqual(len(list(QifConverter.Converter(config).convertText(csvText))), 50)
+        self.assertEqual(config.symbols.action.misses, 2)
+
+        cached = pickle.loads(pickle.dumps(config))
+        self.assertEqual(len(cached.symbols.action), 0)
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import CompiledConfig
+from TestContext import ConversionErrors
+from TestContext import MoneyParser
+from TestContext import QifPipeline
+from TestContext import ThreadedPipeline
+
+class _SlowWriter:
+    """ Output writer taking a while over each write, as a file on a slow network mount would, and failing on request """
+
+    def __init__(self, FailOnWrite: int = None) -> None:
+        """ Starts an empty output """
+        self.texts = []
+        self.threads = set()
+        self.__mFailOnWrite = FailOnWrite
+        return
+
+    def write(self, Text: str) -> None:
+        """ Keeps the text after a short wait """
+        time.sleep(0.001)
+        if (len(self.texts) == self.__mFailOnWrite):
+            raise OSError("Disk full")
+        self.threads.add(threading.current_thread().name)
+        self.texts.append(Text)
+        return
+
+class TestThreaded(unittest.TestCase):
+    """ Tests the threaded engine gives the output and errors of the row by row pipeline """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    # Routes three accounts to their own output files
+    _CONFIG = {
+        "csvFile": {
+            "headerRowMap": {
+                "dateColumn": "Date",
+                "actionColumn": "Action",
+                "securityColumn": "Fund",
+                "priceColumn": "Price",
+                "quantityColumn": "Quantity",
+                "valueColumn": "Amount",
+                "memoColumn": "Memo"
+            },
+            "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+        },
+        "qifFiles": [ { "name": "Roth.qif", "matchColumn": "Account", "matchRegEx": "Roth" },
+                      { "name": "Match.qif", "matchColumn": "Account", "matchRegEx": "Match" },
+                      { "name": "Other.qif", "matchColumn": "Account", "matchRegEx": ".*" } ]
+    }
+
+    def setUp(self) -> None:
+        """ Compiles the config """
+        sys.stdout = io.StringIO()
+        self.__mThreads = threading.active_count()
+        self.__mConfig = CompiledConfig.CompiledConfig(self._CONFIG)
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout """
+        sys.stdout = sys.__stdout__
+        super().tearDown()
+        return
+
+    def _rows(self, Count: int) -> list:
+        """ Returns Count rows spread unevenly over the three accounts """
+        return([ [ "1/{}/2021".format((row % 28) + 1), "Buy" if (row % 3) else "Sell", "Fund {}".format(row % 5), "$10.00", "1.5",
+                   "({}.00)".format(row), "Memo {}".format(row), ("Roth", "Match", "Roth", "Brokerage", "Match")[row % 5] ] for row in range(Count) ])
+
+    def _convertRows(self, Rows: list, FileHandles: list) -> int:
+        """ Converts rows with the row by row pipeline """
+        return(QifPipeline.writeRecords(Rows, self.__mConfig.bindHeader(self._HEADER), FileHandles, self.__mConfig, MoneyParser.MoneyParser()))
+
+    def _convertThreaded(self, Rows: list, FileHandles: list, BlockRows: int = 7, QueueBlocks: int = 2) -> int:
+        """ Converts rows with the threaded engine, using small blocks and queues so the threads wait on each other """
+        return(ThreadedPipeline.convertThreaded(iter(Rows), self.__mConfig.bindHeader(self._HEADER), FileHandles, self.__mConfig,
+                                                MoneyParser.MoneyParser(), BlockRows = BlockRows, QueueBlocks = QueueBlocks))
+
+    def test_MatchesRows(self) -> None:
+        """ Verifies each output gets the row by row output, in order, from its own writer thread """
+        rows = self._rows(500)
+        expected = [ _SlowWriter() for _ in range(3) ]
+        self.assertEqual(self._convertRows(rows, expected), 500)
+        writers = [ _SlowWriter() for _ in range(3) ]
+        self.assertEqual(self._convertThreaded(rows, writers), 500)
+        for writer, expectedWriter in zip(writers, expected):
+            self.assertEqual("".join(writer.texts), "".join(expectedWriter.texts))
+            self.assertEqual(len(writer.threads), 1)
+            self.assertNotIn(threading.current_thread().name, writer.threads)
+        self.assertEqual(len(set.union(*(writer.threads for writer in writers))), 3)
+
+        # Entries sharing a writer keep their records in row order
+        shared = _SlowWriter()
+        self.assertEqual(self._convertThreaded(rows, [ shared, _SlowWriter(), shared ]), 500)
+        expectedShared = _SlowWriter()
+        self._convertRows(rows, [ expectedShared, _SlowWriter(), expectedShared ])
+        self.assertEqual("".join(shared.texts), "".join(expectedShared.texts))
+        self.assertEqual(self._convertThreaded([], writers), 0)
+        self.assertEqual(threading.active_count(), self.__mThreads)
+        return
+
+    def test_Errors(self) -> None:
+        """ Verifies row, read and write errors are raised in the calling thread once every other thread has stopped """
+        rows = self._rows(200)
+        with self.assertRaisesRegex(ConversionErrors.UnknownActionError, "Transfer"):
+            self._convertThreaded(rows[:150] + [ [ "1/5/2021", "Transfer" ] + rows[0][2:] ] + rows[150:], [ _SlowWriter() for _ in range(3) ])
+
+        def failingRows():
+            yield from rows
+            raise csv.Error("Bad quoting")
+        with self.assertRaisesRegex(csv.Error, "Bad quoting"):
+            self._convertThreaded(failingRows(), [ _SlowWriter() for _ in range(3) ])
+
+        writers = [ _SlowWriter(), _SlowWriter(FailOnWrite = 3), _SlowWriter() ]
+        with self.assertRaisesRegex(OSError, "Disk full"):
+            self._convertThreaded(rows * 10, writers)
+        self.assertLess(sum(len(writer.texts) for writer in writers), 200)
+        self.assertEqual(threading.active_count(), self.__mThreads)
+        return
+
+    def test_CommandLine(self) -> None:
+        """ Verifies --engine threaded writes the files the rows engine does, and is refused where it does not apply """
+        with tempfile.TemporaryDirectory() as tempDir:
+            csvFileName = os.path.join(tempDir, "Statement.csv")
+            with open(csvFileName, "wt", newline = "") as csvFile:
+                csv.writer(csvFile).writerows([ self._HEADER ] + self._rows(3000))
+            cfgFileName = os.path.join(tempDir, "Config.json")
+            with open(cfgFileName, "wt") as cfgFile:
+                json.dump(dict(self._CONFIG, qifFiles = [ { "name": os.path.join(tempDir, "Roth.qif"), "matchColumn": "Account", "matchRegEx": "Roth" },
+                                                          { "name": os.path.join(tempDir, "Other.qif"), "matchColumn": "Account", "matchRegEx": ".*" } ]),
+                          cfgFile)
+            outputs = []
+            for options in ([], [ "--engine", "threaded" ], [ "--engine", "threaded", "--mmap" ]):
+                CSVtoQIF.main([ csvFileName, cfgFileName ] + options)
+                outputs.append([])
+                for name in ("Roth.qif", "Other.qif"):
+                    with open(os.path.join(tempDir, name), "rt") as qifFile:
+                        outputs[-1].append(qifFile.read())
+            self.assertEqual(outputs[1], outputs[0])
+            self.assertEqual(outputs[2], outputs[0])
+
+            for options in ([ "--jobs", "2" ], [ "--stats", "-" ]):
+                with self.subTest(options = options):
+                    with self.assertRaisesRegex(Exception, "--engine threaded"):
+                        CSVtoQIF.main([ csvFileName, cfgFileName, "--engine", "threaded" ] + options)
+        return
+
+if __name__ == "__main__":
+    unittest.main()
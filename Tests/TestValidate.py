@@ -0,0 +1,163 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import TestContext
+from TestContext import CSVtoQIF
+from TestContext import CompiledConfig
+from TestContext import CsvValidator
+
+class TestValidate(unittest.TestCase):
+    """ Tests the --validate pass reports every bad row of a CSV file and stops the conversion """
+
+    _HEADER = [ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo", "Account" ]
+
+    def setUp(self) -> None:
+        """ Makes a temporary directory """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeConfig(self) -> str:
+        """ Writes a config file routing the Roth and Match accounts to one QIF file and returns its name """
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy", "Sell": "Sell" }
+            },
+            "qifFiles": [ { "name": os.path.join(self.__mTempDir.name, "All.qif"), "matchColumn": "Account", "matchRegEx": "Roth|Match" } ]
+        }
+        fileName = os.path.join(self.__mTempDir.name, "Config.json")
+        with open(fileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        return(fileName)
+
+    def _writeStatement(self, Rows: list) -> str:
+        """ Writes a statement with the given rows after the header and returns its name """
+        fileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(fileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(self._HEADER)
+            writer.writerows(Rows)
+        return(fileName)
+
+    def _goodRow(self, Memo: str = "Memo") -> list:
+        """ Returns a row that converts """
+        return([ "1/5/2021", "Buy", "Fund 1", "$10.00", "1.5", "15.00", Memo, "Roth" ])
+
+    def test_Report(self) -> None:
+        """ Verifies every error is reported with its line number, grouped by kind and value, serially and in parallel """
+        rows = [ self._goodRow("Line one\nLine two") ] * 3                                                            # lines 2 to 7
+        rows = rows + [ [ "1/5/2021", "Transfer", "Fund 1", "1.00", "1", "1.00", "Memo", "Roth" ],             # line 8
+                        [ "1/5/2021", "Buy", "Fund 1", "N/A", "1", "(bad)", "Memo", "Roth" ],                  # line 9
+                        [ "1/5/2021", "Buy", "Fund 1", "1.00", "1", "1.00", "Memo", "Brokerage" ],             # line 10
+                        [ "1/5/2021", "Buy", "Fund 1" ],                                                       # line 11
+                        [],                                                                                    # line 12
+                        [ "1/5/2021", "transfer", "Fund 1", "1.00", "1", "1.00", "Memo, again\n", "Match" ] ]  # lines 13 and 14
+        rows = rows + ([ self._goodRow() ] * 200) + [ [ "1/5/2021", "Transfer", "Fund 1", "1.00", "1", "1.00", "Memo", "Roth" ] ]
+        csvFileName = self._writeStatement(rows)
+        config = CompiledConfig.CompiledConfig.load(self._writeConfig())
+
+        for jobs in (1, 2):
+            with self.subTest(jobs = jobs):
+                report = CsvValidator.validateCsvFile(csvFileName, config, jobs)
+                self.assertEqual(report.rowsChecked, 209)
+                self.assertEqual(report.errorCount, 7)
+                self.assertEqual(report.errors, {
+                    (CsvValidator.VALIDATION_UNKNOWN_ACTION, "'Transfer'"): [ 8, 215 ],
+                    (CsvValidator.VALIDATION_BAD_MONEY, "Price 'N/A'"): [ 9 ],
+                    (CsvValidator.VALIDATION_BAD_MONEY, "Amount '(bad)'"): [ 9 ],
+                    (CsvValidator.VALIDATION_NO_OUTPUT_FILE, "Account 'Brokerage'"): [ 10 ],
+                    (CsvValidator.VALIDATION_SHORT_ROW, "3 of 8 fields"): [ 11 ],
+                    (CsvValidator.VALIDATION_UNKNOWN_ACTION, "'transfer'"): [ 13 ] })
+                self.assertEqual(report.kindCounts(), { CsvValidator.VALIDATION_SHORT_ROW: 1, CsvValidator.VALIDATION_UNKNOWN_ACTION: 3,
+                                                        CsvValidator.VALIDATION_BAD_MONEY: 2, CsvValidator.VALIDATION_NO_OUTPUT_FILE: 1 })
+
+        stream = io.StringIO()
+        report.write(stream, MaxLines = 1)
+        self.assertIn("209 CSV records checked, 7 errors", stream.getvalue())
+        self.assertIn("\nActions missing from actionCodeMap: 3\n  'Transfer': 2 rows, lines 8, ... 1 more\n", stream.getvalue())
+        return
+
+    def test_LiteralQuotes(self) -> None:
+        """ Verifies a quote inside an unquoted field, which can put a chunk boundary inside a quoted field, gives the
+        serial report in parallel """
+        rows = []
+        for row in range(4000):
+            if (row == 100):
+                rows.append('1/5/2021,Buy,Fund 1,$10.00,1.5,15.00,12" pipe,Roth\n')
+            elif (row == 3000):
+                rows.append('1/5/2021,Transfer,Fund 1,$10.00,1.5,15.00,Memo,Roth\n')
+            elif ((row % 7) == 0):
+                rows.append('1/5/2021,Buy,Fund 1,$10.00,1.5,15.00,"line1\nline2",Roth\n')
+            else:
+                rows.append("1/5/2021,Buy,Fund 1,$10.00,1.5,15.00,Memo,Roth\n")
+        csvFileName = os.path.join(self.__mTempDir.name, "Statement.csv")
+        with open(csvFileName, "wt", newline = "") as csvFile:
+            csvFile.write(",".join(self._HEADER) + "\n")
+            csvFile.writelines(rows)
+        config = CompiledConfig.CompiledConfig.load(self._writeConfig())
+
+        serial = CsvValidator.validateCsvFile(csvFileName, config)
+        self.assertEqual(serial.rowsChecked, 4000)
+        self.assertEqual(list(serial.errors), [ (CsvValidator.VALIDATION_UNKNOWN_ACTION, "'Transfer'") ])
+        for jobs in (2, 4):
+            with self.subTest(jobs = jobs):
+                report = CsvValidator.validateCsvFile(csvFileName, config, jobs)
+                self.assertEqual(report.rowsChecked, serial.rowsChecked)
+                self.assertEqual(report.errors, serial.errors)
+        return
+
+    def test_CommandLine(self) -> None:
+        """ Verifies --validate writes nothing when it finds errors, converts a clean file, and is refused where it does not apply """
+        cfgFileName = self._writeConfig()
+        qifFileName = os.path.join(self.__mTempDir.name, "All.qif")
+        csvFileName = self._writeStatement([ self._goodRow(), [ "1/5/2021", "Transfer", "Fund 1", "1.00", "1", "1.00", "Memo", "Roth" ] ])
+        with self.assertRaisesRegex(Exception, "1 errors found"):
+            CSVtoQIF.main([ csvFileName, cfgFileName, "--validate" ])
+        self.assertIn("'Transfer': 1 rows, lines 3", sys.stdout.getvalue())
+        self.assertFalse(os.path.exists(qifFileName))
+
+        csvFileName = self._writeStatement([ self._goodRow() ] * 5)
+        CSVtoQIF.main([ csvFileName, cfgFileName ])
+        with open(qifFileName, "rt") as qifFile:
+            expected = qifFile.read()
+        os.remove(qifFileName)
+        CSVtoQIF.main([ csvFileName, cfgFileName, "--validate", "-j", "2" ])
+        self.assertIn("5 CSV records validated", sys.stdout.getvalue())
+        with open(qifFileName, "rt") as qifFile:
+            self.assertEqual(qifFile.read(), expected)
+
+        for options in ([ "--batch" ], [ "--serve", "127.0.0.1:0" ], [ "--watch", self.__mTempDir.name ]):
+            with self.subTest(options = options):
+                with self.assertRaises(Exception):
+                    CSVtoQIF.main([ csvFileName, cfgFileName, "--validate" ] + options)
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ "-", cfgFileName, "--validate" ])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
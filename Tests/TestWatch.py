@@ -0,0 +1,197 @@
+#************
+# Imports
+#************
+import csv
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import TestContext
+from TestContext import BatchConverter
+from TestContext import CSVtoQIF
+from TestContext import CompiledConfig
+from TestContext import DirectoryWatcher
+
+class TestWatch(unittest.TestCase):
+    """ Tests finding and converting the CSV files that land in a watched directory """
+
+    _DEBOUNCE = 0.3
+    _POLL = 0.1
+
+    def setUp(self) -> None:
+        """ Makes the watched directory and a config file outside it """
+        self.__mTempDir = tempfile.TemporaryDirectory()
+        self.__mWatchDir = os.path.join(self.__mTempDir.name, "Downloads")
+        self.__mCfgFileName = os.path.join(self.__mTempDir.name, "Config.json")
+        os.makedirs(self.__mWatchDir)
+        config = {
+            "csvFile": {
+                "headerRowMap": {
+                    "dateColumn": "Date",
+                    "actionColumn": "Action",
+                    "securityColumn": "Fund",
+                    "priceColumn": "Price",
+                    "quantityColumn": "Quantity",
+                    "valueColumn": "Amount",
+                    "memoColumn": "Memo"
+                },
+                "actionCodeMap": { "Buy": "Buy" }
+            },
+            "qifFiles": [
+                { "name": "Roth.qif", "matchColumn": "Fund", "matchRegEx": ".*" }
+            ]
+        }
+        with open(self.__mCfgFileName, "wt") as cfgFile:
+            json.dump(config, cfgFile)
+        sys.stdout = io.StringIO()
+        super().setUp()
+        return
+
+    def tearDown(self) -> None:
+        """ Restores stdout and removes the temporary files """
+        sys.stdout = sys.__stdout__
+        self.__mTempDir.cleanup()
+        super().tearDown()
+        return
+
+    def _writeStatement(self, Name: str, Rows: int) -> str:
+        """ Writes a statement into the watched directory and returns its path """
+        fileName = os.path.join(self.__mWatchDir, Name)
+        with open(fileName, "wt", newline = "") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow([ "Date", "Action", "Fund", "Price", "Quantity", "Amount", "Memo" ])
+            for row in range(Rows):
+                writer.writerow([ "1/{}/2021".format((row % 28) + 1), "Buy", "Fund", "$10.00", "1.5", "$15.00", "Contribution {}".format(row) ])
+        return(fileName)
+
+    def _watcher(self, Inotify: bool) -> DirectoryWatcher.DirectoryWatcher:
+        """ Starts a watcher on the watched directory """
+        return(DirectoryWatcher.DirectoryWatcher(self.__mWatchDir, None, self._DEBOUNCE, self._POLL, Inotify))
+
+    def test_ConvertsOnce(self) -> None:
+        """ Verifies each CSV file is handed out once, also after a restart, and again once it changes """
+        config = CompiledConfig.CompiledConfig.load(self.__mCfgFileName)
+        for inotify in (True, False):
+            with self.subTest(inotify = inotify):
+                for name in os.listdir(self.__mWatchDir):
+                    os.remove(os.path.join(self.__mWatchDir, name))
+                csvFileName = self._writeStatement("2021-01.csv", 10)
+                watcher = self._watcher(inotify)
+                self.assertEqual(watcher.usesInotify, inotify)
+                self.assertEqual(watcher.waitForFiles(5.0), [ csvFileName ])
+                for result in BatchConverter.convertBatch([ csvFileName ], BatchConverter.DEFAULT_OUTPUT_TEMPLATE, 1, config):
+                    watcher.markConverted(result.csvFile, result.recordsProcessed, result.error)
+                self.assertTrue(os.path.isfile(os.path.join(self.__mWatchDir, "2021-01-Roth.qif")))
+
+                # A file landing while the watcher runs is found too
+                secondFileName = self._writeStatement("2021-02.csv", 10)
+                self.assertEqual(watcher.waitForFiles(5.0), [ secondFileName ])
+                watcher.markConverted(secondFileName, 10)
+                self.assertEqual(watcher.waitForFiles(3 * self._DEBOUNCE), [])
+                watcher.close()
+
+                watcher = self._watcher(inotify)
+                self.assertEqual(watcher.waitForFiles(3 * self._DEBOUNCE), [])
+                self._writeStatement("2021-01.csv", 20)
+                self.assertEqual(watcher.waitForFiles(5.0), [ csvFileName ])
+                watcher.close()
+        return
+
+    def test_Debounce(self) -> None:
+        """ Verifies a file still being written is not handed out, and other directory entries are ignored """
+        for inotify in (True, False):
+            with self.subTest(inotify = inotify):
+                for name in os.listdir(self.__mWatchDir):
+                    os.remove(os.path.join(self.__mWatchDir, name))
+                self._writeStatement(".Partial.csv", 10)
+                self._writeStatement("Notes.txt", 10)
+                watcher = self._watcher(inotify)
+                csvFileName = os.path.join(self.__mWatchDir, "Slow.csv")
+                with open(csvFileName, "wt") as csvFile:
+                    start = time.monotonic()
+                    while ((time.monotonic() - start) < 4 * self._DEBOUNCE):
+                        csvFile.write("Line\n")
+                        csvFile.flush()
+                        self.assertEqual(watcher.waitForFiles(self._DEBOUNCE / 4), [])
+                    finalSize = csvFile.tell()
+                self.assertEqual(watcher.waitForFiles(5.0), [ csvFileName ])
+                self.assertEqual(os.path.getsize(csvFileName), finalSize)
+                watcher.close()
+        return
+
+    def test_WatchCommand(self) -> None:
+        """ Verifies --watch converts a file that lands while it runs, and stops cleanly on SIGTERM """
+        command = [ sys.executable, CSVtoQIF.__file__, "--watch", self.__mWatchDir, self.__mCfgFileName, "--debounce", str(self._DEBOUNCE) ]
+        with subprocess.Popen(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True) as watch:
+            try:
+                # Wait for the watch to start before the file lands
+                line = watch.stdout.readline()
+                while (line and (not line.startswith("Watching"))):
+                    line = watch.stdout.readline()
+                self._writeStatement("2021-03.csv", 25)
+                self.assertEqual(watch.stdout.readline().strip(), "{}: 25 CSV records processed".format(os.path.join(self.__mWatchDir, "2021-03.csv")))
+                watch.send_signal(signal.SIGTERM)
+                output = watch.communicate(timeout = 10)[0]
+            finally:
+                if (watch.poll() is None):
+                    watch.kill()
+        self.assertEqual(watch.returncode, 0)
+        self.assertIn("1 CSV files converted, 0 failed", output)
+        self.assertTrue(os.path.isfile(os.path.join(self.__mWatchDir, "2021-03-Roth.qif")))
+        with open(os.path.join(self.__mWatchDir, DirectoryWatcher.DEFAULT_STATE_FILE_NAME), "rt") as stateFile:
+            self.assertEqual(json.load(stateFile)["files"]["2021-03.csv"]["records"], 25)
+        return
+
+    def test_BatchErrors(self) -> None:
+        """ Verifies files whose QIF files would collide are recorded as failed without stopping the watch, and a bad
+        template is refused before the watch starts """
+        command = [ sys.executable, CSVtoQIF.__file__, "--watch", self.__mWatchDir, self.__mCfgFileName, "--debounce", str(self._DEBOUNCE),
+                    "--output-template", "{csvDir}/{qifName}" ]
+        # The colliding files are there before the watch starts, so its first scan finds them both and they are ready
+        # in the same batch, rather than each debouncing on its own
+        self._writeStatement("2021-04.csv", 5)
+        self._writeStatement("2021-05.csv", 5)
+        with subprocess.Popen(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True) as watch:
+            try:
+                line = watch.stdout.readline()
+                while (line and (not line.startswith("Watching"))):
+                    line = watch.stdout.readline()
+                for name in ("2021-04.csv", "2021-05.csv"):
+                    self.assertTrue(watch.stdout.readline().startswith("{}: FAILED: Output file".format(os.path.join(self.__mWatchDir, name))))
+                self._writeStatement("2021-06.csv", 5)
+                self.assertEqual(watch.stdout.readline().strip(), "{}: 5 CSV records processed".format(os.path.join(self.__mWatchDir, "2021-06.csv")))
+                watch.send_signal(signal.SIGTERM)
+                output = watch.communicate(timeout = 10)[0]
+            finally:
+                if (watch.poll() is None):
+                    watch.kill()
+        self.assertIn("1 CSV files converted, 2 failed", output)
+        with open(os.path.join(self.__mWatchDir, DirectoryWatcher.DEFAULT_STATE_FILE_NAME), "rt") as stateFile:
+            self.assertIn("error", json.load(stateFile)["files"]["2021-04.csv"])
+
+        with self.assertRaisesRegex(Exception, "Bad output template"):
+            CSVtoQIF.main([ "--watch", self.__mWatchDir, self.__mCfgFileName, "--output-template", "{csvName}.qif" ])
+        return
+
+    def test_CommandLine(self) -> None:
+        """ Verifies --watch needs the config file and takes no CSV file """
+        sys.stderr = io.StringIO()
+        try:
+            with self.assertRaises(SystemExit):
+                CSVtoQIF.main([ "--watch", self.__mWatchDir ])
+        finally:
+            sys.stderr = sys.__stderr__
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ "--watch", self.__mWatchDir, "Statement.csv", self.__mCfgFileName ])
+        with self.assertRaises(Exception):
+            CSVtoQIF.main([ "--watch", os.path.join(self.__mWatchDir, "Missing"), self.__mCfgFileName ])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
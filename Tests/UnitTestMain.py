@@ -3,8 +3,29 @@
 #************
 import unittest
 from TestFloatConversion import TestFloatConversion
+from TestAggregate import TestAggregate
+from TestBatch import TestBatch
 from TestCLI import TestCLI
+from TestColumnar import TestColumnar
+from TestCompiledConfig import TestCompiledConfig
+from TestConverter import TestConverter
+from TestDates import TestDates
+from TestIncremental import TestIncremental
 from TestIntegration import TestIntegration
+from TestMappedCsvReader import TestMappedCsvReader
+from TestMoneyParser import TestMoneyParser
+from TestParallel import TestParallel
+from TestQifRouter import TestQifRouter
+from TestQifWriter import TestQifWriter
+from TestResume import TestResume
+from TestServer import TestServer
+from TestStartup import TestStartup
+from TestStats import TestStats
+from TestStreaming import TestStreaming
+from TestSymbols import TestSymbols
+from TestThreaded import TestThreaded
+from TestValidate import TestValidate
+from TestWatch import TestWatch
 
 # The TestContext namespace will have imported into it modules from other folders we are testing
 from TestContext import CSVtoQIF